@@ -31,6 +31,9 @@ def create_app(config_name='default'):
     app.config.from_object(configuration)
     app.config['ACTIVE_CONFIG_NAME'] = config_name
 
+    from app.utils.json_encoding import FastJSONProvider
+    app.json = FastJSONProvider(app)
+
     # Initialize extensions with app
     db.init_app(app)
     jwt.init_app(app)
@@ -53,22 +56,26 @@ def create_app(config_name='default'):
         cors_origins = ['*']
     socketio.init_app(app, cors_allowed_origins=cors_origins)
 
+    # Registered first so it runs last and compresses the final response
+    from app.utils.compression import init_compression
+    init_compression(app)
+
     # CORS ayarları - Frontend ile backend arasında iletişim için
     CORS(app, origins=cors_origins,
          allow_headers=['Content-Type', 'Authorization'],
          methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
          supports_credentials=True)
     
-    # Initialize security and analytics middleware
-    from app.utils.security import init_security_middleware, rate_limit
-    from app.utils.analytics import init_analytics_middleware
-    from app.utils.bigquery_logger import init_bigquery_middleware
-    from app.middleware.analytics_middleware import analytics_middleware
-    
-    init_security_middleware(app)
-    init_analytics_middleware(app)
-    init_bigquery_middleware(app)
-    analytics_middleware.init_app(app)
+    # Initialize security middleware and request instrumentation
+    from app.utils.security import init_security_middleware, rate_limit
+    from app.middleware.instrumentation import init_instrumentation
+    from app.utils.metrics import init_metrics
+    from app.utils.lifecycle import init_lifecycle
+    
+    init_security_middleware(app)
+    init_instrumentation(app)
+    init_metrics(app)
+    init_lifecycle(app)
     
     # Import models
     from app.models import user, craftsman, customer, category, quote, payment, notification, job, message, review, support_ticket, appointment
@@ -101,6 +108,7 @@ def create_app(config_name='default'):
     from app.routes.airbnb_api import airbnb_api
     from app.routes.marketplace import marketplace_bp
     from app.routes.cloud_scheduler import scheduler_bp
+    from app.routes.metrics import metrics_bp
     # from app.routes.enhanced_analytics import enhanced_analytics_bp
     
     app.register_blueprint(profile_bp, url_prefix='/api/profile')
@@ -127,6 +135,7 @@ def create_app(config_name='default'):
     app.register_blueprint(airbnb_api, url_prefix='/api/airbnb')
     app.register_blueprint(marketplace_bp, url_prefix='/api/marketplace')
     app.register_blueprint(scheduler_bp)  # No prefix - direct /cron/ endpoints
+    app.register_blueprint(metrics_bp)  # /metrics for Prometheus
     # app.register_blueprint(enhanced_analytics_bp)  # Enhanced analytics API (temporarily disabled)
     
     # Production and Mobile APIs
@@ -277,33 +286,33 @@ def create_app(config_name='default'):
     # Get all craftsmen endpoint (for CraftsmanListPage)
     @app.route('/api/craftsmen', methods=['GET'])
     def get_craftsmen():
-        from app.models.craftsman import Craftsman
         from app.models.user import User
+        from app.utils.craftsman_query import CraftsmanQuery
         
         try:
             page = request.args.get('page', 1, type=int)
             per_page = request.args.get('per_page', 10, type=int)
             
-            craftsmen = Craftsman.query.join(User).filter(User.is_active == True).paginate(
-                page=page, per_page=per_page, error_out=False
-            )
+            # Card rows plus the contact columns, projected in one SELECT
+            craftsman_query = CraftsmanQuery(extra_columns=(User.email, User.phone))
+            craftsmen = craftsman_query.page(page, per_page)
             
             result = []
-            for craftsman in craftsmen.items:
+            for row in craftsmen['items']:
                 result.append({
-                    'id': craftsman.id,
-                    'name': f"{craftsman.user.first_name} {craftsman.user.last_name}",
-                    'business_name': craftsman.business_name,
-                    'description': craftsman.description,
-                    'city': craftsman.city,
-                    'district': craftsman.district,
-                    'hourly_rate': str(craftsman.hourly_rate) if craftsman.hourly_rate else None,
-                    'average_rating': craftsman.average_rating,
-                    'total_reviews': craftsman.total_reviews,
-                    'is_available': craftsman.is_available,
+                    'id': row.id,
+                    'name': f"{row.first_name} {row.last_name}",
+                    'business_name': row.business_name,
+                    'description': row.description,
+                    'city': row.city,
+                    'district': row.district,
+                    'hourly_rate': str(row.hourly_rate) if row.hourly_rate else None,
+                    'average_rating': row.average_rating,
+                    'total_reviews': row.total_reviews,
+                    'is_available': row.is_available,
                     'user': {
-                        'email': craftsman.user.email,
-                        'phone': craftsman.user.phone
+                        'email': row.email,
+                        'phone': row.phone
                     }
                 })
             
@@ -312,10 +321,11 @@ def create_app(config_name='default'):
                 'data': {
                     'craftsmen': result,
                     'pagination': {
-                        'page': craftsmen.page,
-                        'pages': craftsmen.pages,
-                        'per_page': craftsmen.per_page,
-                        'total': craftsmen.total
+                        'page': craftsmen['pagination']['page'],
+                        'pages': craftsmen['pagination']['pages'],
+                        'per_page': craftsmen['pagination']['per_page'],
+                        'total': craftsmen['pagination']['total'],
+                        'approximate': craftsmen['pagination']['approximate']
                     }
                 }
             }), 200
@@ -326,8 +336,12 @@ def create_app(config_name='default'):
                 'message': 'Bir hata oluştu'
             }), 500
     
+    # Profile endpoints answer conditional GETs from a cheap version lookup
+    from app.utils.conditional import conditional_get, craftsman_profile_version
+    
     # Get single craftsman endpoint
     @app.route('/api/craftsmen/<int:craftsman_id>', methods=['GET'])
+    @conditional_get(craftsman_profile_version)
     def get_craftsman(craftsman_id):
         from app.models.craftsman import Craftsman
         
@@ -373,6 +387,7 @@ def create_app(config_name='default'):
     
     # Get craftsman business profile with completed jobs and portfolio
     @app.route('/api/craftsmen/<int:craftsman_id>/business-profile', methods=['GET'])
+    @conditional_get(lambda craftsman_id: craftsman_profile_version(craftsman_id, with_activity=True))
     def get_craftsman_business_profile(craftsman_id):
         from app.models.craftsman import Craftsman
         from app.models.job import Job, JobStatus
@@ -389,8 +404,8 @@ def create_app(config_name='default'):
             
             # Get completed jobs
             completed_jobs = Job.query.filter_by(
-                assigned_craftsman_id=craftsman.id,
-                status=JobStatus.COMPLETED.value
+                craftsman_id=craftsman.user_id,
+                status=JobStatus.COMPLETED
             ).order_by(Job.completed_at.desc()).limit(10).all()
             
             # Get reviews
@@ -428,7 +443,7 @@ def create_app(config_name='default'):
                         'description': job.description,
                         'category': job.category,
                         'completed_at': job.completed_at.isoformat() if job.completed_at else None,
-                        'location': job.location
+                        'location': ', '.join(part for part in (job.district, job.city) if part) or None
                     } for job in completed_jobs
                 ],
                 'recent_reviews': [
@@ -0,0 +1,285 @@
+"""
+Single-pass request instrumentation
+
+Requests used to go through four sets of hooks (security, basic analytics,
+BigQuery and the analytics middleware). Between them they timed the request
+twice, generated several UUIDs, parsed the User-Agent three times and queued
+three to five BigQuery rows per request (page view, API activity,
+performance metric, middleware activity, business event).
+
+``RequestInstrumentation`` computes the request context once in
+``before_request``, builds one consolidated event in ``after_request`` and
+hands it to each registered sink. The event carries everything the separate
+rows used to: the page-view fields (url, referrer), API fields (status,
+content length, query params), timing and the business event derived from
+the endpoint (login/registration attempts, job creation, payments, messages,
+searches). Unhandled exceptions are recorded on the event and logged to the
+error table once. Query counts and DB time come from app.utils.query_profiler.
+"""
+
+import logging
+import time
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import current_app, g, got_request_exception, request
+
+from app.utils.query_profiler import DEFAULT_N_PLUS_ONE_THRESHOLD, current_profile, endpoint_query_stats
+
+logger = logging.getLogger(__name__)
+
+# A sink receives the finished event dict; it must not raise
+Sink = Callable[[Dict[str, Any]], None]
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+MAX_REQUEST_ID_LENGTH = 64
+
+# Endpoints that are not worth an event
+SKIP_ENDPOINTS = frozenset({'static', 'health_check', 'metrics.prometheus_metrics'})
+
+
+@lru_cache(maxsize=512)
+def classify_user_agent(user_agent: str) -> Tuple[str, str]:
+    """``(platform, device_type)`` for a User-Agent string.
+
+    Clients send the same few User-Agents over and over, so results are
+    memoized.
+    """
+    agent = user_agent.lower()
+    if 'android' in agent:
+        platform = 'android'
+    elif 'iphone' in agent or 'ipad' in agent:
+        platform = 'ios'
+    elif 'mobile' in agent:
+        platform = 'mobile_web'
+    else:
+        platform = 'web'
+
+    if 'mobile' in agent or 'android' in agent or 'iphone' in agent:
+        device_type = 'mobile'
+    elif 'tablet' in agent or 'ipad' in agent:
+        device_type = 'tablet'
+    else:
+        device_type = 'desktop'
+    return platform, device_type
+
+
+def client_ip() -> str:
+    """Real client IP, honouring the proxy headers App Engine sets"""
+    forwarded_for = request.headers.get('X-Forwarded-For')
+    if forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return request.headers.get('X-Real-IP') or request.remote_addr or 'unknown'
+
+
+class RequestContext:
+    """Per-request facts computed once in before_request (``g.request_context``)"""
+
+    __slots__ = ('request_id', 'correlation_id', 'session_id', 'started', 'timestamp', 'user_agent',
+                 'ip_address', 'platform', 'device_type', 'error')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timestamp = datetime.utcnow()
+        # Row ids and the sampling key; never taken from the client, which may
+        # reuse an X-Request-ID
+        self.request_id = uuid.uuid4().hex
+        # The client's X-Request-ID, echoed back and recorded for correlation
+        correlation_id = request.headers.get(REQUEST_ID_HEADER, '')[:MAX_REQUEST_ID_LENGTH]
+        self.correlation_id = correlation_id or self.request_id
+        # Anonymous clients without a session header get one session per request
+        self.session_id = request.headers.get('X-Session-ID') or self.request_id
+        self.user_agent = request.headers.get('User-Agent', '')
+        self.ip_address = client_ip()
+        self.platform, self.device_type = classify_user_agent(self.user_agent)
+        self.error: Optional[BaseException] = None
+
+
+def current_context() -> Optional[RequestContext]:
+    return getattr(g, 'request_context', None)
+
+
+def _business_event(endpoint: str, method: str, success: bool) -> Optional[Dict[str, Any]]:
+    """The business action an endpoint represents, if any"""
+    if 'auth' in endpoint:
+        if 'login' in endpoint:
+            return {'action_type': 'login_attempt', 'action_category': 'auth',
+                    'details': {'login_method': 'email'}}
+        if 'register' in endpoint:
+            return {'action_type': 'registration_attempt', 'action_category': 'auth',
+                    'details': {'user_type': getattr(g, 'registration_user_type', 'unknown')}}
+    elif 'job' in endpoint:
+        if method == 'POST' and success:
+            return {'action_type': 'job_create', 'action_category': 'job',
+                    'details': {'job_id': getattr(g, 'created_job_id', None),
+                                'category': getattr(g, 'job_category', None)}}
+    elif 'search' in endpoint:
+        if method == 'GET':
+            return {'action_type': 'search', 'action_category': 'search',
+                    'details': {'search_query': request.args.get('q', ''),
+                                'search_type': request.args.get('type', 'general')}}
+    elif 'payment' in endpoint:
+        if method == 'POST' and success:
+            return {'action_type': 'payment_initiate', 'action_category': 'payment',
+                    'details': {'payment_id': getattr(g, 'payment_id', None),
+                                'amount': getattr(g, 'payment_amount', None),
+                                'method': getattr(g, 'payment_method', None)}}
+    elif 'message' in endpoint:
+        if method == 'POST' and success:
+            return {'action_type': 'message_send', 'action_category': 'communication',
+                    'details': {'message_id': getattr(g, 'message_id', None),
+                                'recipient_id': getattr(g, 'recipient_id', None),
+                                'message_type': getattr(g, 'message_type', 'text')}}
+    return None
+
+
+class RequestInstrumentation:
+    """One before/after hook pair feeding pluggable sinks"""
+
+    def __init__(self, app=None):
+        self.sinks: List[Sink] = []
+        if app is not None:
+            self.init_app(app)
+
+    def add_sink(self, sink: Sink):
+        if sink not in self.sinks:
+            self.sinks.append(sink)
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        got_request_exception.connect(self._record_exception, app, weak=False)
+        logger.info("Request instrumentation initialized (%s sinks)", len(self.sinks))
+
+    def before_request(self):
+        if request.endpoint in SKIP_ENDPOINTS:
+            return
+        context = g.request_context = RequestContext()
+        # Older helpers read these directly from g
+        g.request_id = context.request_id
+        g.session_id = context.session_id
+        g.platform = context.platform
+        g.device_type = context.device_type
+
+    def _record_exception(self, sender, exception, **extra):
+        context = current_context()
+        if context is not None:
+            context.error = exception
+
+    def build_event(self, context: RequestContext, response) -> Dict[str, Any]:
+        endpoint = request.endpoint or 'unknown'
+        status_code = response.status_code
+        success = 200 <= status_code < 400
+        duration = time.perf_counter() - context.started
+        event = {
+            'request_id': context.request_id,
+            'correlation_id': context.correlation_id,
+            'session_id': context.session_id,
+            'timestamp': context.timestamp,
+            'duration_ms': int(duration * 1000),
+            'duration_seconds': duration,
+            'method': request.method,
+            'endpoint': endpoint,
+            'path': request.path,
+            'url': request.url,
+            'referrer': request.referrer,
+            'query_params': request.args.to_dict(),
+            'has_json_body': request.is_json,
+            'user_agent': context.user_agent,
+            'ip_address': context.ip_address,
+            'platform': context.platform,
+            'device_type': context.device_type,
+            'user_id': getattr(g, 'current_user_id', None),
+            'user_type': getattr(g, 'user_type', None),
+            'location_city': getattr(g, 'user_city', None),
+            'status_code': status_code,
+            'success': success,
+            'content_length': response.content_length,
+            'business_event': _business_event(endpoint, request.method, success),
+            'error': None,
+            'db_query_count': 0,
+            'db_time_ms': 0.0,
+            'n_plus_one': [],
+        }
+        profile = current_profile()
+        if profile is not None:
+            event['db_query_count'] = profile.count
+            event['db_time_ms'] = round(profile.time_ms, 2)
+            event['n_plus_one'] = profile.repeated(
+                current_app.config.get('QUERY_PROFILER_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+            )
+        if context.error is not None:
+            event['error'] = {'type': type(context.error).__name__, 'message': str(context.error)}
+        return event
+
+    def after_request(self, response):
+        context = current_context()
+        if context is None:
+            return response
+        response.headers.setdefault(REQUEST_ID_HEADER, context.correlation_id)
+        if current_app.config.get('QUERY_PROFILER_HEADERS'):
+            self._set_profiler_headers(response, context)
+        if not self.sinks:
+            return response
+
+        event = self.build_event(context, response)
+        for sink in self.sinks:
+            try:
+                sink(event)
+            except Exception as exc:
+                logger.error("Instrumentation sink %s failed: %s", getattr(sink, '__name__', sink), exc)
+        return response
+
+    @staticmethod
+    def _set_profiler_headers(response, context: RequestContext):
+        profile = current_profile()
+        count, db_ms = (profile.count, profile.time_ms) if profile is not None else (0, 0.0)
+        total_ms = (time.perf_counter() - context.started) * 1000
+        response.headers['X-Query-Count'] = str(count)
+        response.headers['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{count} queries", app;dur={total_ms:.1f}'
+        )
+
+
+def log_sink(event: Dict[str, Any]):
+    """One application log line per request"""
+    logger.info(
+        "Request: %s %s - Status: %s - Duration: %.3fs",
+        event['method'], event['path'], event['status_code'], event['duration_ms'] / 1000,
+    )
+
+
+def n_plus_one_sink(event: Dict[str, Any]):
+    """Warn about statements repeated often enough to look like N+1 queries"""
+    for repeated in event['n_plus_one']:
+        logger.warning(
+            "Possible N+1 in %s: %s executions (%.1f ms) of %s",
+            event['endpoint'], repeated['count'], repeated['time_ms'], repeated['statement'],
+        )
+
+
+def bigquery_sink(event: Dict[str, Any]):
+    """BigQuery activity and performance rows per request, plus an error row on exceptions"""
+    from app.utils.bigquery_logger import bigquery_logger
+
+    if not bigquery_logger.enabled:
+        return
+    bigquery_logger.log_request_event(event)
+
+
+instrumentation = RequestInstrumentation()
+
+
+def init_instrumentation(app):
+    """Attach the instrumentation pipeline with the default sinks"""
+    from app.utils.bigquery_logger import bigquery_logger
+
+    bigquery_logger.configure_sampling(app.config)
+    instrumentation.add_sink(log_sink)
+    instrumentation.add_sink(n_plus_one_sink)
+    instrumentation.add_sink(endpoint_query_stats)
+    instrumentation.add_sink(bigquery_sink)
+    instrumentation.init_app(app)
+    return instrumentation
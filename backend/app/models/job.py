@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from sqlalchemy import Column, Integer, String, Text, Float, Boolean, DateTime, ForeignKey, Enum as SQLEnum, JSON
+from sqlalchemy import Column, Integer, String, Text, Float, Boolean, DateTime, ForeignKey, Enum as SQLEnum, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from app import db
@@ -50,6 +50,14 @@ class WarrantyStatus(enum.Enum):
 
 class Job(db.Model):
     __tablename__ = 'jobs'
+    # db.create_all() does not add indexes to an existing table: run
+    # upgrade_job_schema.py on databases created before them
+    __table_args__ = (
+        # Open job listings: status filter ordered by newest first
+        Index('idx_job_status_created', 'status', 'created_at'),
+        # A craftsman's completed jobs (business profile and its version)
+        Index('idx_job_craftsman_status_updated', 'craftsman_id', 'status', 'updated_at'),
+    )
 
     id = Column(Integer, primary_key=True)
     title = Column(String(200), nullable=False)
@@ -127,10 +135,29 @@ class Job(db.Model):
     time_entries = relationship("TimeEntry", back_populates="job", cascade="all, delete-orphan")
     warranty_claims = relationship("WarrantyClaim", back_populates="job", cascade="all, delete-orphan")
     progress_updates = relationship("JobProgressUpdate", back_populates="job", cascade="all, delete-orphan")
+    skills = relationship("JobSkill", back_populates="job", cascade="all, delete-orphan", order_by="JobSkill.name")
 
     def __repr__(self):
         return f'<Job {self.id}: {self.title}>'
 
+    @property
+    def required_skills(self):
+        """Skill names required for the job, backed by the job_skills index"""
+        return [skill.name for skill in self.skills]
+
+    @required_skills.setter
+    def required_skills(self, names):
+        entries = {}
+        for name in names or []:
+            normalized = JobSkill.normalize(name)
+            if normalized and normalized not in entries:
+                entries[normalized] = str(name).strip()
+        existing = {skill.skill: skill for skill in self.skills}
+        self.skills = [
+            existing.get(normalized) or JobSkill(skill=normalized, name=name)
+            for normalized, name in entries.items()
+        ]
+
     @property
     def total_cost(self):
         """Calculate total job cost"""
@@ -219,9 +246,33 @@ class Job(db.Model):
             'craftsman': self.craftsman.to_dict() if self.craftsman else None,
             'materials': [material.to_dict() for material in self.materials],
             'time_entries': [entry.to_dict() for entry in self.time_entries],
-            'progress_updates': [update.to_dict() for update in self.progress_updates]
+            'progress_updates': [update.to_dict() for update in self.progress_updates],
+            'required_skills': self.required_skills
         }
 
+class JobSkill(db.Model):
+    """Normalized job <-> skill index used by job search filters"""
+    __tablename__ = 'job_skills'
+    __table_args__ = (
+        # Skill lookups return job ids without touching the jobs table
+        Index('idx_job_skill_skill_job', 'skill', 'job_id'),
+    )
+
+    job_id = Column(Integer, ForeignKey('jobs.id', ondelete='CASCADE'), primary_key=True)
+    skill = Column(String(100), primary_key=True)  # normalized (Turkish-folded) form
+    name = Column(String(100), nullable=False)  # as entered
+
+    job = relationship("Job", back_populates="skills")
+
+    def __repr__(self):
+        return f'<JobSkill {self.job_id}: {self.skill}>'
+
+    @staticmethod
+    def normalize(name):
+        """Case/diacritic-insensitive key so 'Su Tesisatı' matches 'su tesisati'"""
+        from app.utils.search_index import tokenize
+        return ' '.join(tokenize(str(name) if name is not None else ''))[:100]
+
 class JobMaterial(db.Model):
     __tablename__ = 'job_materials'
 
@@ -4,6 +4,10 @@ from datetime import datetime
 class Review(db.Model):
     """Reviews for craftsmen"""
     __tablename__ = 'reviews'
+    __table_args__ = (
+        # A craftsman's reviews (profile listings and their version lookup)
+        db.Index('idx_review_craftsman_updated', 'craftsman_id', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import user, craftsman, customer, category, quote, payment, notification, job, message, review
 from app import db
+from app.utils.craftsman_query import CraftsmanQuery
 from datetime import datetime
 import json
 
@@ -29,37 +30,23 @@ def get_craftsmen():
         min_rating = request.args.get('min_rating', type=float)
         max_price = request.args.get('max_price', type=float)
         location = request.args.get('location')
-        
-        # Base query
-        query = craftsman.Craftsman.query.join(user.User)
-        
-        # Apply filters
-        if category_id:
-            query = query.filter(craftsman.Craftsman.category_id == category_id)
-        
-        if search:
-            query = query.filter(
-                db.or_(
-                    user.User.first_name.ilike(f'%{search}%'),
-                    user.User.last_name.ilike(f'%{search}%'),
-                    craftsman.Craftsman.specialization.ilike(f'%{search}%')
-                )
-            )
-        
-        if min_rating:
-            query = query.filter(craftsman.Craftsman.rating >= min_rating)
-        
-        if max_price:
-            query = query.filter(craftsman.Craftsman.hourly_rate <= max_price)
-        
-        if location:
-            query = query.filter(user.User.city.ilike(f'%{location}%'))
-        
-        craftsmen = query.all()
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 50, type=int), 100)
+        
+        # Filters are compiled by the shared craftsman query engine
+        craftsman_query = CraftsmanQuery({
+            'category_id': category_id,
+            'q': search,
+            'min_rating': min_rating,
+            'max_price': max_price,
+            'city': location,
+        }, sort_by='recommended', projection='entity')
+        result = craftsman_query.page(max(page, 1), max(per_page, 1))
         
         return jsonify({
             'success': True,
-            'data': [craftsman_obj.to_dict() for craftsman_obj in craftsmen]
+            'data': [craftsman_obj.to_dict() for craftsman_obj in result['items']],
+            'pagination': result['pagination']
         }), 200
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
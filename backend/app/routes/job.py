@@ -1,109 +1,171 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import and_, select
+from sqlalchemy.orm import joinedload, selectinload
 from app.utils.auth_utils import get_current_user_id
 from app import db
-from app.models.job import Job, JobStatus, JobPriority
+from app.models.job import Job, JobStatus, JobPriority, JobSkill
 from app.models.user import User
 from app.models.customer import Customer
 from app.models.craftsman import Craftsman
 from app.models.category import Category
 from app.models.notification import Notification
+from app.utils.validators import PaginationHelper
+from app.utils.count_cache import cached_count
+from app.utils.geo_index import bounding_box, haversine_km, parse_coordinates
 from datetime import datetime
 import logging
 
 job_bp = Blueprint('job', __name__)
 
+# Relationships serialized by Job.to_dict, loaded in bulk for list pages
+JOB_LIST_OPTIONS = (
+    joinedload(Job.customer),
+    joinedload(Job.craftsman),
+    selectinload(Job.materials),
+    selectinload(Job.time_entries),
+    selectinload(Job.progress_updates),
+    selectinload(Job.warranty_claims),
+    selectinload(Job.skills),
+)
+
+# Query parameters that change a job listing (and therefore its cached total)
+JOB_FILTER_FIELDS = (
+    'status', 'category_id', 'city', 'district', 'urgency', 'min_budget', 'max_budget',
+)
+
+
+def _open_jobs_filter():
+    """Jobs still waiting for a craftsman"""
+    return and_(Job.status == JobStatus.PENDING, Job.craftsman_id.is_(None))
+
+
+def _apply_job_filters(query, args):
+    """Compile the shared job list/search filters into the SQL query
+
+    Raises ValueError for unknown status, urgency or category values.
+    """
+    status = args.get('status')
+    if status:
+        try:
+            query = query.filter(Job.status == JobStatus(status))
+        except ValueError:
+            raise ValueError(f'Invalid status: {status}')
+    
+    category_id = args.get('category_id', type=int)
+    if category_id:
+        category = db.session.get(Category, category_id)
+        if not category:
+            raise ValueError('Invalid category')
+        names = [name for name in (category.name, category.name_en, category.slug) if name]
+        query = query.filter(Job.category.in_(names))
+    
+    city = args.get('city')
+    if city:
+        query = query.filter(Job.city.ilike(f'%{city}%'))
+    
+    district = args.get('district')
+    if district:
+        query = query.filter(Job.district.ilike(f'%{district}%'))
+    
+    urgency = args.get('urgency')
+    if urgency:
+        try:
+            query = query.filter(Job.priority == JobPriority(urgency))
+        except ValueError:
+            raise ValueError(f'Invalid urgency: {urgency}')
+    
+    min_budget = args.get('min_budget', type=float)
+    if min_budget:
+        query = query.filter(Job.estimated_cost >= min_budget)
+    
+    max_budget = args.get('max_budget', type=float)
+    if max_budget:
+        query = query.filter(Job.estimated_cost <= max_budget)
+    
+    # Any of the requested skills; resolved on the (skill, job_id) index
+    skills = sorted({JobSkill.normalize(skill) for skill in args.getlist('skills')} - {''})
+    if skills:
+        query = query.filter(Job.id.in_(
+            select(JobSkill.job_id).where(JobSkill.skill.in_(skills))
+        ))
+    
+    return query
+
+
+def _job_filter_signature(args, **extra):
+    """Filter values identifying a cached job count"""
+    filters = {field: args.get(field) for field in JOB_FILTER_FIELDS}
+    filters['skills'] = ','.join(sorted({JobSkill.normalize(skill) for skill in args.getlist('skills')}))
+    filters.update(extra)
+    return filters
+
+
+def _paginate_jobs(query, namespace, filters, page, per_page):
+    """Serialized newest-first page of jobs, keyset-paginated when ``cursor`` is passed
+
+    ``filters`` identifies the cached total; pass None to count exactly.
+    Raises ValueError for malformed cursors.
+    """
+    if 'cursor' in request.args:
+        # Keyset mode for infinite scroll, newest first
+        jobs_page = PaginationHelper.paginate_keyset(
+            query.options(*JOB_LIST_OPTIONS), [(Job.created_at, 'desc')], Job.id, per_page,
+            cursor=request.args.get('cursor'),
+            include_total=request.args.get('include_total', 'false').lower() == 'true'
+        )
+    else:
+        query = query.order_by(Job.created_at.desc(), Job.id.desc())
+        if filters is None:
+            total, approximate = query.order_by(None).count(), False
+        else:
+            total, approximate = cached_count(namespace, filters, query, ('jobs', 'job_skills'))
+        jobs_page = PaginationHelper.paginate_query(
+            query.options(*JOB_LIST_OPTIONS), page, per_page, total=total, approximate=approximate
+        )
+    return jobs_page['items'], jobs_page['pagination']
+
 @job_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_jobs():
     """Get jobs with filtering options"""
     try:
         user_id = get_current_user_id()
-        user = User.query.get(user_id)
+        user = db.session.get(User, user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get filter parameters
-        status = request.args.get('status')
-        category_id = request.args.get('category_id', type=int)
-        city = request.args.get('city')
-        district = request.args.get('district')
-        urgency = request.args.get('urgency')
-        min_budget = request.args.get('min_budget', type=float)
-        max_budget = request.args.get('max_budget', type=float)
-        skills = request.args.getlist('skills')  # Can pass multiple skills
-        
         # Pagination
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         
-        # Base query
+        # Base query; jobs reference customers and craftsmen by user id
+        show_assigned = request.args.get('assigned', 'false').lower() == 'true'
         if user.user_type == 'customer':
-            customer = Customer.query.filter_by(user_id=user_id).first()
-            query = Job.query.filter_by(customer_id=customer.id)
+            query = Job.query.filter(Job.customer_id == user_id)
+        elif show_assigned:
+            query = Job.query.filter(Job.craftsman_id == user_id)
         else:
-            # For craftsmen, show available jobs or assigned jobs
-            craftsman = Craftsman.query.filter_by(user_id=user_id).first()
-            show_assigned = request.args.get('assigned', 'false').lower() == 'true'
-            
-            if show_assigned:
-                query = Job.query.filter_by(assigned_craftsman_id=craftsman.id)
-            else:
-                query = Job.query.filter(Job.status == JobStatus.OPEN.value)
-        
-        # Apply filters
-        if status:
-            query = query.filter(Job.status == status)
-        
-        if category_id:
-            query = query.filter(Job.category_id == category_id)
-        
-        if city:
-            query = query.filter(Job.city.ilike(f'%{city}%'))
-        
-        if district:
-            query = query.filter(Job.district.ilike(f'%{district}%'))
-        
-        if urgency:
-            query = query.filter(Job.urgency == urgency)
-        
-        if min_budget:
-            query = query.filter(Job.budget_min >= min_budget)
-        
-        if max_budget:
-            query = query.filter(Job.budget_max <= max_budget)
-        
-        # Order by creation date (newest first)
-        query = query.order_by(Job.created_at.desc())
-        
-        # Paginate
-        jobs_pagination = query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
-        
-        jobs = jobs_pagination.items
-        
-        # Filter by skills if provided (post-query filtering for JSON field)
-        if skills:
-            filtered_jobs = []
-            for job in jobs:
-                if job.required_skills:
-                    if any(skill in job.required_skills for skill in skills):
-                        filtered_jobs.append(job)
-            jobs = filtered_jobs
+            # For craftsmen, show jobs still waiting for a craftsman
+            query = Job.query.filter(_open_jobs_filter())
+        
+        # Every filter, skills included, is applied in SQL before paginating
+        # so pages come back full
+        try:
+            query = _apply_job_filters(query, request.args)
+            jobs, pagination = _paginate_jobs(
+                query, 'jobs',
+                _job_filter_signature(request.args, user_id=user_id, assigned=show_assigned),
+                page, per_page
+            )
+        except ValueError as e:
+            return jsonify({'error': True, 'message': str(e)}), 400
         
         return jsonify({
             'success': True,
-            'jobs': [job.to_dict() for job in jobs],
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': jobs_pagination.total,
-                'pages': jobs_pagination.pages,
-                'has_next': jobs_pagination.has_next,
-                'has_prev': jobs_pagination.has_prev
-            }
+            'jobs': jobs,
+            'pagination': pagination
         }), 200
         
     except Exception as e:
@@ -515,71 +577,51 @@ def cancel_job():
 
 @job_bp.route('/search', methods=['GET'])
 def search_jobs():
-    """Advanced job search with location and skills"""
+    """Advanced job search with location and skills
+
+    All filters are compiled into one query over open jobs; a lat/lng radius
+    is prefiltered with a bounding box in SQL and refined with haversine.
+    """
     try:
-        # Location-based search
-        city = request.args.get('city')
-        district = request.args.get('district')
         lat = request.args.get('lat', type=float)
         lng = request.args.get('lng', type=float)
         radius = request.args.get('radius', 10, type=float)  # Default 10km radius
+        coordinates = parse_coordinates(lat, lng)
         
-        # Skill-based search
-        skills = request.args.getlist('skills')
-        
-        # Other filters
-        category_id = request.args.get('category_id', type=int)
-        urgency = request.args.get('urgency')
-        min_budget = request.args.get('min_budget', type=float)
-        max_budget = request.args.get('max_budget', type=float)
-        
-        jobs = []
-        
-        # Location-based search
-        if city or district or (lat and lng):
-            location_jobs = Job.get_jobs_by_location(
-                city=city, 
-                district=district, 
-                radius_km=radius, 
-                lat=lat, 
-                lng=lng
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
+        
+        try:
+            query = _apply_job_filters(Job.query.filter(_open_jobs_filter()), request.args)
+        except ValueError as e:
+            return jsonify({'error': True, 'message': str(e)}), 400
+        
+        if coordinates:
+            min_lat, max_lat, min_lng, max_lng = bounding_box(*coordinates, radius)
+            boxed = query.with_entities(Job.id, Job.latitude, Job.longitude).filter(
+                Job.latitude.between(min_lat, max_lat),
+                Job.longitude.between(min_lng, max_lng)
             )
-            jobs.extend(location_jobs)
-        
-        # Skill-based search
-        if skills:
-            skill_jobs = Job.get_jobs_by_skills(skills)
-            if jobs:
-                # Intersection of location and skill results
-                job_ids = [j.id for j in jobs]
-                jobs = [j for j in skill_jobs if j.id in job_ids]
-            else:
-                jobs = skill_jobs
-        
-        # If no specific search criteria, get all open jobs
-        if not jobs and not any([city, district, lat, lng, skills]):
-            jobs = Job.query.filter(Job.status == JobStatus.OPEN.value).all()
-        
-        # Apply additional filters
-        if category_id:
-            jobs = [j for j in jobs if j.category_id == category_id]
-        
-        if urgency:
-            jobs = [j for j in jobs if j.urgency == urgency]
-        
-        if min_budget:
-            jobs = [j for j in jobs if j.budget_min and j.budget_min >= min_budget]
-        
-        if max_budget:
-            jobs = [j for j in jobs if j.budget_max and j.budget_max <= max_budget]
-        
-        # Sort by creation date (newest first)
-        jobs.sort(key=lambda x: x.created_at, reverse=True)
+            query = query.filter(Job.id.in_([
+                row.id for row in boxed
+                if haversine_km(*coordinates, row.latitude, row.longitude) <= radius
+            ]))
+        
+        try:
+            # Per-location searches are counted exactly instead of cached
+            jobs, pagination = _paginate_jobs(
+                query, 'jobs.search',
+                None if coordinates else _job_filter_signature(request.args),
+                page, per_page
+            )
+        except ValueError as e:
+            return jsonify({'error': True, 'message': str(e)}), 400
         
         return jsonify({
             'success': True,
-            'jobs': [job.to_dict() for job in jobs],
-            'total': len(jobs)
+            'jobs': jobs,
+            'total': pagination['total'],
+            'pagination': pagination
         }), 200
         
     except Exception as e:
@@ -587,4 +629,4 @@ def search_jobs():
         return jsonify({
             'error': True,
             'message': 'Internal server error'
-        }), 500
\ No newline at end of file
+        }), 500
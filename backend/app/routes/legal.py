@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, current_app, request, jsonify, send_file
 from flask_jwt_extended import get_jwt_identity
 from app.utils.legal import (
     LegalDocumentManager, 
@@ -7,7 +7,10 @@ from app.utils.legal import (
     LegalValidator,
     ConsentType,
     DataProcessingPurpose,
-    LEGAL_DOCUMENT_VERSIONS
+    LEGAL_DOCUMENT_VERSIONS,
+    DOCUMENT_ENCODINGS,
+    rendered_legal_document,
+    rendered_legal_document_index
 )
 from app.utils.security import rate_limit, require_auth
 import io
@@ -16,346 +19,98 @@ from datetime import datetime
 
 legal_bp = Blueprint('legal', __name__)
 
-@legal_bp.route('/documents/terms-of-service', methods=['GET'])
-@rate_limit(max_requests=30)
-def get_terms_of_service():
-    """Get current terms of service"""
+# Documents only change with a version bump; let clients and proxies keep
+# them for a day and revalidate with the ETag afterwards
+DOCUMENT_CACHE_CONTROL = 'public, max-age=86400'
+
+
+def _precompressed_response(document):
+    """Serve a precompressed document, picking the encoding from Accept-Encoding"""
+    encoding = request.accept_encodings.best_match(DOCUMENT_ENCODINGS, default='identity')
+    matched = document.matched_encodings(request.headers.get('If-None-Match', ''))
+    if matched:
+        # A 304 carries the ETag of the variant the client holds
+        if encoding not in matched:
+            encoding = matched[0]
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(document.bodies[encoding], mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.headers['ETag'] = document.etag(encoding)
+    response.headers['Cache-Control'] = DOCUMENT_CACHE_CONTROL
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def _legal_document_response(document_id, error_message):
     try:
-        # Read from file
-        import os
-        # Try multiple paths for App Engine compatibility
-        possible_paths = [
-            os.path.join(os.path.dirname(__file__), '../../legal_documents/kullanim_kosullari.md'),
-            os.path.join(os.getcwd(), 'legal_documents/kullanim_kosullari.md'),
-            'legal_documents/kullanim_kosullari.md'
-        ]
-        
-        file_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                file_path = path
-                break
-        
-        if not file_path:
-            return jsonify({
-                'success': False,
-                'message': 'Legal document not found'
-            }), 404
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
+        return _precompressed_response(rendered_legal_document(document_id))
+    except FileNotFoundError:
         return jsonify({
-            'success': True,
-            'data': {
-                'title': 'Kullanım Koşulları',
-                'content': content,
-                'version': '1.0',
-                'last_updated': '2025-01-01',
-                'type': 'terms_of_service'
-            }
-        })
+            'success': False,
+            'message': 'Legal document not found'
+        }), 404
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'Terms retrieval failed: {str(e)}'
+            'message': f'{error_message}: {str(e)}'
         }), 500
 
+@legal_bp.route('/documents/terms-of-service', methods=['GET'])
+@rate_limit(max_requests=30)
+def get_terms_of_service():
+    """Get current terms of service"""
+    return _legal_document_response('terms_of_service', 'Terms retrieval failed')
+
 @legal_bp.route('/documents/user-agreement', methods=['GET'])
 @rate_limit(max_requests=30)
 def get_user_agreement():
     """Get user agreement (bireysel hesap sözleşmesi)"""
-    try:
-        import os
-        file_path = os.path.join(os.path.dirname(__file__), '../../legal_documents/bireysel_hesap_sozlesmesi.md')
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'title': 'Bireysel Hesap Sözleşmesi',
-                'content': content,
-                'version': '1.0',
-                'last_updated': '2025-01-01',
-                'type': 'user_agreement'
-            }
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'User agreement retrieval failed: {str(e)}'
-        }), 500
+    return _legal_document_response('user_agreement', 'User agreement retrieval failed')
 
 @legal_bp.route('/documents/cookie-policy', methods=['GET'])
 @rate_limit(max_requests=30)
 def get_cookie_policy():
     """Get cookie policy"""
-    try:
-        import os
-        file_path = os.path.join(os.path.dirname(__file__), '../../legal_documents/cerez_politikasi.md')
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'title': 'Çerez Politikası',
-                'content': content,
-                'version': '1.0',
-                'last_updated': '2025-01-01',
-                'type': 'cookie_policy'
-            }
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Cookie policy retrieval failed: {str(e)}'
-        }), 500
+    return _legal_document_response('cookie_policy', 'Cookie policy retrieval failed')
 
 @legal_bp.route('/documents/cookie-preferences', methods=['GET'])
 @rate_limit(max_requests=30)
 def get_cookie_preferences():
     """Get cookie preferences summary"""
-    try:
-        import os
-        file_path = os.path.join(os.path.dirname(__file__), '../../legal_documents/cerez_tercihleri_ozet.md')
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'title': 'Çerez Tercihleri',
-                'content': content,
-                'version': '1.0',
-                'last_updated': '2025-01-01',
-                'type': 'cookie_preferences'
-            }
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Cookie preferences retrieval failed: {str(e)}'
-        }), 500
+    return _legal_document_response('cookie_preferences', 'Cookie preferences retrieval failed')
 
 @legal_bp.route('/documents/privacy-policy', methods=['GET'])
 @rate_limit(max_requests=30)
 def get_privacy_policy():
     """Get current privacy policy"""
-    try:
-        import os
-        # Try multiple paths for App Engine compatibility
-        possible_paths = [
-            os.path.join(os.path.dirname(__file__), '../../legal_documents/gizlilik_politikasi.md'),
-            os.path.join(os.getcwd(), 'legal_documents/gizlilik_politikasi.md'),
-            'legal_documents/gizlilik_politikasi.md'
-        ]
-        
-        file_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                file_path = path
-                break
-        
-        if not file_path:
-            return jsonify({
-                'success': False,
-                'message': 'Privacy policy not found'
-            }), 404
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'title': 'Gizlilik Politikası',
-                'content': content,
-                'version': '1.0',
-                'last_updated': '2025-01-01',
-                'type': 'privacy_policy'
-            }
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Privacy policy retrieval failed: {str(e)}'
-        }), 500
+    return _legal_document_response('privacy_policy', 'Privacy policy retrieval failed')
 
 @legal_bp.route('/documents/corporate-agreement', methods=['GET'])
 @rate_limit(max_requests=30)
 def get_corporate_agreement():
     """Get corporate account agreement"""
-    try:
-        import os
-        file_path = os.path.join(os.path.dirname(__file__), '../../legal_documents/kurumsal_hesap_sozlesmesi.md')
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'title': 'Kurumsal Hesap Sözleşmesi',
-                'content': content,
-                'version': '1.0',
-                'last_updated': '2025-01-01',
-                'type': 'corporate_agreement'
-            }
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Corporate agreement retrieval failed: {str(e)}'
-        }), 500
+    return _legal_document_response('corporate_agreement', 'Corporate agreement retrieval failed')
 
 @legal_bp.route('/documents/listing-rules', methods=['GET'])
 @rate_limit(max_requests=30)
 def get_listing_rules():
     """Get listing rules and prohibited content"""
-    try:
-        import os
-        file_path = os.path.join(os.path.dirname(__file__), '../../legal_documents/ilan_verme_kurallari.md')
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'title': 'İlan Verme Kuralları ve Yasaklı İlanlar',
-                'content': content,
-                'version': '1.0',
-                'last_updated': '2025-01-01',
-                'type': 'listing_rules'
-            }
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'Listing rules retrieval failed: {str(e)}'
-        }), 500
+    return _legal_document_response('listing_rules', 'Listing rules retrieval failed')
 
 @legal_bp.route('/documents/kvkk-summary', methods=['GET'])
 @rate_limit(max_requests=30)
 def get_kvkk_summary():
     """Get KVKK summary and data protection info"""
-    try:
-        import os
-        file_path = os.path.join(os.path.dirname(__file__), '../../legal_documents/kvkk_aydinlatma_metni.md')
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'title': 'KVKK Aydınlatma Metni',
-                'content': content,
-                'version': '1.0',
-                'last_updated': '2025-01-01',
-                'type': 'kvkk_summary'
-            }
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'message': f'KVKK summary retrieval failed: {str(e)}'
-        }), 500
+    return _legal_document_response('kvkk_summary', 'KVKK summary retrieval failed')
 
 @legal_bp.route('/documents/all', methods=['GET'])
 @rate_limit(max_requests=10)
 def get_all_legal_documents():
     """Get all legal documents list"""
     try:
-        documents = [
-            {
-                'id': 'terms_of_service',
-                'title': 'Kullanım Koşulları',
-                'description': 'Portal kullanım şartları ve kuralları',
-                'endpoint': '/api/legal/documents/terms-of-service',
-                'required_for': ['registration', 'usage'],
-                'version': '1.0',
-                'last_updated': '2025-01-01'
-            },
-            {
-                'id': 'user_agreement',
-                'title': 'Bireysel Hesap Sözleşmesi',
-                'description': 'Bireysel kullanıcılar için hesap sözleşmesi',
-                'endpoint': '/api/legal/documents/user-agreement',
-                'required_for': ['individual_registration'],
-                'version': '1.0',
-                'last_updated': '2025-01-01'
-            },
-            {
-                'id': 'corporate_agreement',
-                'title': 'Kurumsal Hesap Sözleşmesi',
-                'description': 'Hizmet veren ustalar için kurumsal sözleşme',
-                'endpoint': '/api/legal/documents/corporate-agreement',
-                'required_for': ['craftsman_registration'],
-                'version': '1.0',
-                'last_updated': '2025-01-01'
-            },
-            {
-                'id': 'privacy_policy',
-                'title': 'Gizlilik Politikası',
-                'description': 'Kişisel verilerin işlenmesi ve gizlilik koşulları',
-                'endpoint': '/api/legal/documents/privacy-policy',
-                'required_for': ['registration', 'data_processing'],
-                'version': '1.0',
-                'last_updated': '2025-01-01'
-            },
-            {
-                'id': 'cookie_policy',
-                'title': 'Çerez Politikası',
-                'description': 'Çerez kullanımı ve veri işleme detayları',
-                'endpoint': '/api/legal/documents/cookie-policy',
-                'required_for': ['website_usage', 'app_usage'],
-                'version': '1.0',
-                'last_updated': '2025-01-01'
-            },
-            {
-                'id': 'cookie_preferences',
-                'title': 'Çerez Tercihleri',
-                'description': 'Çerez tercih yönetimi ve özet bilgi',
-                'endpoint': '/api/legal/documents/cookie-preferences',
-                'required_for': ['cookie_management'],
-                'version': '1.0',
-                'last_updated': '2025-01-01'
-            },
-            {
-                'id': 'listing_rules',
-                'title': 'İlan Verme Kuralları',
-                'description': 'İlan yayınlama kuralları ve yasaklı içerikler',
-                'endpoint': '/api/legal/documents/listing-rules',
-                'required_for': ['job_posting', 'service_listing'],
-                'version': '1.0',
-                'last_updated': '2025-01-01'
-            },
-            {
-                'id': 'kvkk_summary',
-                'title': 'KVKK Aydınlatma Özeti',
-                'description': 'Kişisel veri işleme özet bilgilendirmesi',
-                'endpoint': '/api/legal/documents/kvkk-summary',
-                'required_for': ['data_subject_rights'],
-                'version': '1.0',
-                'last_updated': '2025-01-01'
-            }
-        ]
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'documents': documents,
-                'total_count': len(documents),
-                'compliance_framework': 'KVKK (Turkish GDPR)',
-                'last_updated': '2025-01-01'
-            }
-        })
+        return _precompressed_response(rendered_legal_document_index())
     except Exception as e:
         return jsonify({
             'success': False,
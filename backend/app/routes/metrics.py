@@ -0,0 +1,37 @@
+"""Prometheus scrape endpoint (see app.utils.metrics)"""
+
+import hmac
+
+from flask import Blueprint, Response, current_app, request
+
+from app.utils import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def _is_served() -> bool:
+    """Off when disabled, or when a token is required (deployed) but none is configured"""
+    if not current_app.config.get('METRICS_ENABLED', True):
+        return False
+    return bool(current_app.config.get('METRICS_TOKEN')) or not current_app.config.get('METRICS_REQUIRE_TOKEN')
+
+
+def _is_authorized_scrape() -> bool:
+    """Scrapers send ``Authorization: Bearer <METRICS_TOKEN>`` when a token is configured"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return True
+    supplied = request.headers.get('Authorization', '')
+    return hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {token}'.encode('utf-8'))
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latency histograms and runtime gauges in the Prometheus text format"""
+    if not _is_served():
+        return Response('Not found', status=404, mimetype='text/plain')
+    if not _is_authorized_scrape():
+        return Response('Unauthorized', status=401, mimetype='text/plain',
+                        headers={'WWW-Authenticate': 'Bearer'})
+    return Response(metrics.render(metrics.collect()), content_type=metrics.CONTENT_TYPE,
+                    headers={'Cache-Control': 'no-store'})
@@ -14,7 +14,7 @@ import json
 from app import db
 from app.models.user import User
 from app.models.customer import Customer
-from app.models.craftsman import Craftsman
+from app.models.craftsman import Craftsman, craftsman_categories
 from app.models.category import Category
 from app.models.job import Job
 from app.models.quote import Quote
@@ -23,6 +23,7 @@ from app.models.payment import Payment
 from app.models.notification import Notification
 from app.models.message import Message
 from app.utils.security import rate_limit
+from app.utils.geo_index import get_geo_index, parse_coordinates
 
 # Create blueprint
 mobile_api = Blueprint('mobile_api', __name__)
@@ -390,53 +391,67 @@ def incremental_sync():
 
 @mobile_api.route('/location/nearby-craftsmen', methods=['POST'])
 def nearby_craftsmen():
-    """Find craftsmen near user location"""
+    """Find craftsmen near user location
+
+    Candidates come from the grid index (only cells overlapping the search
+    circle are scanned) with exact haversine distances. ``limit`` switches to
+    a k-nearest query bounded by ``radius``.
+    """
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         latitude = data.get('latitude')
         longitude = data.get('longitude')
         radius = data.get('radius', 10)  # km
         category_id = data.get('category_id')
+        limit = data.get('limit')  # k nearest
         
-        if not latitude or not longitude:
+        coordinates = parse_coordinates(latitude, longitude)
+        if coordinates is None:
             return jsonify({
                 'success': False,
                 'message': 'Location coordinates required',
                 'code': 'MISSING_LOCATION'
             }), 400
         
-        # Haversine formula for distance calculation
-        # Note: This is a simplified version. For production, consider using PostGIS
-        query = db.session.query(Craftsman).join(User)
+        try:
+            radius = float(radius)
+            limit = int(limit) if limit else None
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'message': 'Invalid radius or limit',
+                'code': 'INVALID_LOCATION_QUERY'
+            }), 400
         
+        accept = None
         if category_id:
-            query = query.join(Craftsman.categories).filter(Category.id == category_id)
+            category_craftsmen = {
+                row.craftsman_id for row in db.session.query(craftsman_categories.c.craftsman_id).filter(
+                    craftsman_categories.c.category_id == category_id
+                )
+            }
+            accept = category_craftsmen.__contains__
         
-        craftsmen = query.filter(
-            and_(
-                Craftsman.is_available == True,
-                User.is_active == True,
-                User.latitude.isnot(None),
-                User.longitude.isnot(None)
-            )
-        ).all()
+        geo_index = get_geo_index()
+        if limit:
+            matches = geo_index.nearest(*coordinates, limit, max_radius_km=radius, accept=accept)
+        else:
+            matches = geo_index.within_radius(*coordinates, radius, accept=accept)
         
-        # Calculate distances and filter by radius
-        nearby_craftsmen = []
-        for craftsman in craftsmen:
-            if craftsman.user.latitude and craftsman.user.longitude:
-                # Simple distance calculation (you should use proper geospatial functions)
-                lat_diff = float(craftsman.user.latitude) - latitude
-                lon_diff = float(craftsman.user.longitude) - longitude
-                distance = (lat_diff**2 + lon_diff**2)**0.5 * 111  # Rough km conversion
-                
-                if distance <= radius:
-                    craftsman_data = craftsman.to_dict(include_user=True)
-                    craftsman_data['distance'] = round(distance, 2)
-                    nearby_craftsmen.append(craftsman_data)
+        # Load only the matched rows and keep the distance order
+        craftsmen = {
+            craftsman.id: craftsman
+            for craftsman in Craftsman.query.filter(Craftsman.id.in_([cid for cid, _ in matches])).all()
+        } if matches else {}
         
-        # Sort by distance
-        nearby_craftsmen.sort(key=lambda x: x['distance'])
+        nearby_craftsmen = []
+        for craftsman_id, distance in matches:
+            craftsman = craftsmen.get(craftsman_id)
+            if craftsman is None:
+                continue
+            craftsman_data = craftsman.to_dict(include_user=True)
+            craftsman_data['distance'] = round(distance, 2)
+            nearby_craftsmen.append(craftsman_data)
         
         return jsonify({
             'success': True,
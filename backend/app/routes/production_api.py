@@ -22,6 +22,7 @@ from app.models.payment import Payment
 from app.models.notification import Notification
 from app.models.message import Message
 from app.utils.security import rate_limit
+from app.utils.craftsman_query import CraftsmanQuery, categories_for
 
 # Create blueprint
 production_api = Blueprint('production_api', __name__)
@@ -221,69 +222,45 @@ def search_craftsmen():
         max_price = request.args.get('max_price', type=float)
         is_verified = request.args.get('is_verified', type=bool)
         is_available = request.args.get('is_available', type=bool, default=True)
+        sort_by = request.args.get('sort_by', '').strip()
+        radius = request.args.get('radius', type=float)
         
         # Pagination
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 20, type=int), 50)  # Max 50 per page
         
-        # Build query
-        query_builder = db.session.query(Craftsman).join(User)
-        
-        # Apply filters
-        if is_available:
-            query_builder = query_builder.filter(Craftsman.is_available == True)
-        
-        query_builder = query_builder.filter(User.is_active == True)
-        
-        if query:
-            search_filter = or_(
-                User.first_name.ilike(f'%{query}%'),
-                User.last_name.ilike(f'%{query}%'),
-                Craftsman.business_name.ilike(f'%{query}%'),
-                Craftsman.description.ilike(f'%{query}%')
-            )
-            query_builder = query_builder.filter(search_filter)
-        
-        if category_id:
-            query_builder = query_builder.join(Craftsman.categories).filter(Category.id == category_id)
-        
-        if city:
-            query_builder = query_builder.filter(User.city.ilike(f'%{city}%'))
-        
-        if district:
-            query_builder = query_builder.filter(User.district.ilike(f'%{district}%'))
-        
-        if min_rating:
-            query_builder = query_builder.filter(Craftsman.average_rating >= min_rating)
-        
-        if max_price:
-            query_builder = query_builder.filter(Craftsman.hourly_rate <= max_price)
-        
-        if is_verified:
-            query_builder = query_builder.filter(Craftsman.is_verified == True)
-        
-        # Order by rating and verification status
-        query_builder = query_builder.order_by(
-            desc(Craftsman.is_verified),
-            desc(Craftsman.average_rating),
-            desc(Craftsman.total_reviews)
-        )
-        
-        # Execute pagination
-        pagination = query_builder.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
+        # Filters and the recommended ordering are compiled by the shared
+        # craftsman query engine; distance sorting uses the geo index
+        craftsman_query = CraftsmanQuery(
+            {
+                'q': query,
+                'category_id': category_id,
+                'city': city,
+                'district': district,
+                'min_rating': min_rating,
+                'max_price': max_price,
+                'is_verified': True if is_verified else None,
+                'is_available': True if is_available else None,
+            },
+            sort_by='distance' if sort_by == 'distance' else 'recommended',
+            latitude=request.args.get('latitude'),
+            longitude=request.args.get('longitude'),
+            radius_km=radius,
+            projection='entity',
         )
+        pagination = craftsman_query.page(page, per_page)
         
-        # Format results
+        # Format results; categories for the whole page come from one query
+        page_categories = categories_for(craftsman.id for craftsman in pagination['items'])
         craftsmen = []
-        for craftsman in pagination.items:
+        for craftsman in pagination['items']:
             craftsman_data = craftsman.to_dict(include_user=True)
             
             # Add category information
-            categories = [cat.to_dict() for cat in craftsman.categories]
-            craftsman_data['categories'] = categories
+            craftsman_data['categories'] = [cat.to_dict() for cat in page_categories.get(craftsman.id, [])]
+            
+            if craftsman.id in craftsman_query.distances:
+                craftsman_data['distance'] = round(craftsman_query.distances[craftsman.id], 2)
             
             craftsmen.append(craftsman_data)
         
@@ -294,10 +271,11 @@ def search_craftsmen():
                 'pagination': {
                     'page': page,
                     'per_page': per_page,
-                    'total': pagination.total,
-                    'pages': pagination.pages,
-                    'has_next': pagination.has_next,
-                    'has_prev': pagination.has_prev
+                    'total': pagination['pagination']['total'],
+                    'pages': pagination['pagination']['pages'],
+                    'has_next': pagination['pagination']['has_next'],
+                    'has_prev': pagination['pagination']['has_prev'],
+                    'approximate': pagination['pagination']['approximate']
                 }
             }
         }), 200
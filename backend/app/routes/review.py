@@ -5,6 +5,8 @@ from ..models.craftsman import Craftsman
 from ..models.customer import Customer
 from ..models.quote import Quote
 from ..schemas.review import ReviewSchema
+from ..utils.validators import PaginationHelper
+from ..utils.count_cache import cached_count
 from datetime import datetime
 import logging
 
@@ -30,13 +32,41 @@ def get_reviews():
         if rating:
             query = query.filter_by(rating=rating)
             
-        reviews = query.order_by(Review.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        if 'cursor' in request.args:
+            # Keyset mode for infinite scroll: no OFFSET scan, total optional
+            try:
+                reviews_page = PaginationHelper.paginate_keyset(
+                    query, [(Review.created_at, 'desc')], Review.id, per_page,
+                    cursor=request.args.get('cursor'),
+                    include_total=request.args.get('include_total', 'false').lower() == 'true',
+                    serialize=False
+                )
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            review_items = reviews_page['items']
+            pagination = reviews_page['pagination']
+        else:
+            total, approximate = cached_count(
+                'reviews',
+                {'craftsman_id': craftsman_id, 'customer_id': customer_id, 'rating': rating},
+                query, ('reviews',)
+            )
+            reviews = query.order_by(Review.created_at.desc()).paginate(
+                page=page, per_page=per_page, error_out=False, count=False
+            )
+            reviews.total = total
+            review_items = reviews.items
+            pagination = {
+                'page': page,
+                'pages': reviews.pages,
+                'per_page': per_page,
+                'total': reviews.total,
+                'approximate': approximate
+            }
         
         # Build safe review data without complex relationships
         reviews_data = []
-        for review in reviews.items:
+        for review in review_items:
             review_data = {
                 'id': review.id,
                 'customer_id': review.customer_id,
@@ -63,12 +93,7 @@ def get_reviews():
         return jsonify({
             'success': True,
             'reviews': reviews_data,
-            'pagination': {
-                'page': page,
-                'pages': reviews.pages,
-                'per_page': per_page,
-                'total': reviews.total
-            }
+            'pagination': pagination
         }), 200
         
     except Exception as e:
@@ -1,12 +1,14 @@
 from flask import Blueprint, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from sqlalchemy import or_, and_
-from app import db
+from sqlalchemy import and_
 from app.models.craftsman import Craftsman
-from app.models.user import User
 from app.utils.validators import (
-    validate_query_params, SearchSchema, ResponseHelper, PaginationHelper
+    validate_query_params, SearchSchema, ResponseHelper
 )
+from app.utils.facets import get_facet_store
+from app.utils.craftsman_query import CraftsmanQuery, card_from_row
+from app.utils.conditional import conditional_get, craftsman_profile_version
+from app.utils.suggest import get_suggestion_index, SUGGESTION_TYPES, DEFAULT_LIMIT, MAX_LIMIT
 import json
 
 search_bp = Blueprint('search', __name__)
@@ -36,17 +38,39 @@ def get_categories():
     except Exception as e:
         return ResponseHelper.server_error('Kategoriler getirilemedi', str(e))
 
+@search_bp.route('/suggest', methods=['GET'])
+def suggest():
+    """Autocomplete suggestions for the search box, served from memory"""
+    try:
+        q = request.args.get('q', '').strip()
+        limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+        types = [t for t in request.args.get('types', '').split(',') if t.strip()]
+        
+        errors = {}
+        if not 1 <= limit <= MAX_LIMIT:
+            errors['limit'] = [f'1 ile {MAX_LIMIT} arasında olmalıdır']
+        unknown = [t for t in types if t not in SUGGESTION_TYPES]
+        if unknown:
+            errors['types'] = [f"Geçersiz tür: {', '.join(unknown)}"]
+        if errors:
+            return ResponseHelper.validation_error(errors)
+        
+        suggestions = get_suggestion_index().suggest(q, limit=limit, types=types or None) if q else []
+        
+        return ResponseHelper.success(
+            data={'query': q, 'suggestions': suggestions},
+            message='Öneriler getirildi'
+        )
+        
+    except Exception as e:
+        return ResponseHelper.server_error('Öneriler getirilemedi', str(e))
+
 @search_bp.route('/locations', methods=['GET'])
 def get_locations():
     """Get available locations/cities"""
     try:
-        # Get unique cities from craftsmen
-        cities = db.session.query(Craftsman.city).distinct().filter(
-            Craftsman.city.isnot(None)
-        ).all()
-        
-        city_list = [city[0] for city in cities if city[0]]
-        city_list.sort()
+        # Get unique cities from the precomputed facet counts
+        city_list = get_facet_store().cities()
         
         # Add some default cities if empty
         if not city_list:
@@ -68,138 +92,52 @@ def get_locations():
 def search_craftsmen(validated_data):
     """Search craftsmen with filters and pagination"""
     try:
-        query = db.session.query(Craftsman).join(User).filter(
-            User.is_active == True,
-            Craftsman.is_available == True
+        # Filters, sorting and the projection are compiled by the shared
+        # craftsman query engine; the list is always limited to available
+        # craftsmen. Distance sorting is nearest first unless asked otherwise
+        craftsman_query = CraftsmanQuery(
+            dict(validated_data, is_available=True),
+            sort_by=validated_data.get('sort_by', 'rating'),
+            sort_order=validated_data.get('sort_order', 'desc'),
+            latitude=validated_data.get('latitude'),
+            longitude=validated_data.get('longitude'),
+            radius_km=validated_data.get('radius'),
+            distance_order=request.args.get('sort_order', 'asc'),
         )
-        
-        # Apply search filters
-        if validated_data.get('q'):
-            search_term = f"%{validated_data['q']}%"
-            query = query.filter(
-                or_(
-                    User.first_name.ilike(search_term),
-                    User.last_name.ilike(search_term),
-                    Craftsman.business_name.ilike(search_term),
-                    Craftsman.description.ilike(search_term),
-                    Craftsman.skills.ilike(search_term)
-                )
-            )
-        
-        if validated_data.get('category'):
-            query = query.filter(
-                Craftsman.skills.ilike(f"%{validated_data['category']}%")
-            )
-        
-        if validated_data.get('city'):
-            query = query.filter(Craftsman.city == validated_data['city'])
-        
-        # Apply advanced filters
-        if validated_data.get('min_rating'):
-            query = query.filter(Craftsman.average_rating >= validated_data['min_rating'])
-        
-        if validated_data.get('max_rating'):
-            query = query.filter(Craftsman.average_rating <= validated_data['max_rating'])
-        
-        if validated_data.get('min_price'):
-            query = query.filter(Craftsman.hourly_rate >= validated_data['min_price'])
-        
-        if validated_data.get('max_price'):
-            query = query.filter(Craftsman.hourly_rate <= validated_data['max_price'])
-        
-        if validated_data.get('is_verified') is not None:
-            query = query.filter(Craftsman.is_verified == validated_data['is_verified'])
-        
-        if validated_data.get('has_portfolio') is not None:
-            if validated_data['has_portfolio']:
-                query = query.filter(Craftsman.portfolio_images.isnot(None))
-            else:
-                query = query.filter(Craftsman.portfolio_images.is_(None))
-        
-        if validated_data.get('district'):
-            query = query.filter(Craftsman.district == validated_data['district'])
-
-        # Apply sorting
-        sort_by = validated_data.get('sort_by', 'rating')
-        sort_order = validated_data.get('sort_order', 'desc')
-        
-        if sort_by == 'rating':
-            if sort_order == 'asc':
-                query = query.order_by(Craftsman.average_rating.asc())
-            else:
-                query = query.order_by(Craftsman.average_rating.desc())
-        elif sort_by == 'price':
-            if sort_order == 'asc':
-                query = query.order_by(Craftsman.hourly_rate.asc())
-            else:
-                query = query.order_by(Craftsman.hourly_rate.desc())
-        elif sort_by == 'reviews':
-            if sort_order == 'asc':
-                query = query.order_by(Craftsman.total_reviews.asc())
-            else:
-                query = query.order_by(Craftsman.total_reviews.desc())
-        elif sort_by == 'name':
-            if sort_order == 'asc':
-                query = query.order_by(User.first_name.asc(), User.last_name.asc())
-            else:
-                query = query.order_by(User.first_name.desc(), User.last_name.desc())
-        elif sort_by == 'distance':
-            # For now, just order by city
-            query = query.order_by(Craftsman.city)
-        else:
-            query = query.order_by(Craftsman.created_at.desc())
+        matched_ids = craftsman_query.matched_ids
         
         # Apply pagination
         page = validated_data.get('page', 1)
         per_page = validated_data.get('per_page', 20)
         
-        paginated_result = PaginationHelper.paginate_query(query, page, per_page)
+        if 'cursor' in validated_data:
+            # Keyset mode: deep pages cost the same as the first one
+            try:
+                paginated_result = craftsman_query.keyset(
+                    per_page, cursor=validated_data['cursor'],
+                    include_total=validated_data.get('include_total', False)
+                )
+            except ValueError as e:
+                return ResponseHelper.validation_error({'cursor': [str(e)]})
+        else:
+            paginated_result = craftsman_query.page(page, per_page)
         
-        # Format craftsmen data
-        craftsmen_data = []
-        print(f"🔍 Processing {len(paginated_result['items'])} craftsmen from query")
-        for craftsman_dict in paginated_result['items']:
-            craftsman = Craftsman.query.get(craftsman_dict['id'])
-            if craftsman:
-                # Parse skills from JSON
-                skills_list = []
-                try:
-                    if craftsman.skills:
-                        skills_list = json.loads(craftsman.skills) if isinstance(craftsman.skills, str) else craftsman.skills
-                except (json.JSONDecodeError, TypeError):
-                    skills_list = []
-                
-                # Parse portfolio images from JSON
-                portfolio_list = []
-                try:
-                    if craftsman.portfolio_images:
-                        portfolio_list = json.loads(craftsman.portfolio_images) if isinstance(craftsman.portfolio_images, str) else craftsman.portfolio_images
-                except (json.JSONDecodeError, TypeError):
-                    portfolio_list = []
-
-                craftsmen_data.append({
-                    'id': craftsman.id,
-                    'name': craftsman.user.full_name if craftsman.user else 'Unknown',
-                    'business_name': craftsman.business_name,
-                    'description': craftsman.description,
-                    'city': craftsman.city,
-                    'district': craftsman.district,
-                    'hourly_rate': float(craftsman.hourly_rate) if craftsman.hourly_rate else 0,
-                    'average_rating': float(craftsman.average_rating) if craftsman.average_rating else 0,
-                    'total_reviews': craftsman.total_reviews or 0,
-                    'is_available': craftsman.is_available,
-                    'is_verified': craftsman.is_verified,
-                    'avatar': None,  # Remove avatar since files don't exist
-                    'specialties': skills_list,  # Use skills instead of specialties
-                    'portfolio_images': [],  # Remove portfolio images to prevent loading errors
-                })
+        # Rows are already projected with the user columns joined in, so the
+        # page is hydrated without loading ORM objects or re-fetching rows
+        craftsmen_data = [card_from_row(row) for row in paginated_result['items']]
+        
+        response_data = {
+            'craftsmen': craftsmen_data,
+            'pagination': paginated_result['pagination']
+        }
+        
+        # Facet counts for the current query are computed from the in-memory
+        # facet store; they need the text matches as an id set
+        if validated_data.get('include_facets') and (matched_ids is not None or not craftsman_query.text_filtered):
+            response_data['facets'] = get_facet_store().facet_counts(matched_ids, validated_data)
         
-        print(f"🔍 Returning {len(craftsmen_data)} craftsmen")
         return ResponseHelper.success(
-            data={
-                'craftsmen': craftsmen_data,
-                'pagination': paginated_result['pagination']
-            },
+            data=response_data,
             message=f'{len(craftsmen_data)} usta bulundu'
         )
         
@@ -207,6 +145,7 @@ def search_craftsmen(validated_data):
         return ResponseHelper.server_error('Arama sırasında hata oluştu', str(e))
 
 @search_bp.route('/craftsmen/<int:craftsman_id>', methods=['GET'])
+@conditional_get(craftsman_profile_version)
 def get_craftsman_detail(craftsman_id):
     """Get detailed craftsman information"""
     try:
@@ -271,14 +210,8 @@ def get_districts():
         if not city:
             return ResponseHelper.validation_error('City parameter is required')
         
-        # Get unique districts for the city
-        districts = db.session.query(Craftsman.district).distinct().filter(
-            Craftsman.city == city,
-            Craftsman.district.isnot(None)
-        ).all()
-        
-        district_list = [district[0] for district in districts if district[0]]
-        district_list.sort()
+        # Get unique districts for the city from the facet counts
+        district_list = get_facet_store().districts(city)
         
         return ResponseHelper.success(
             data=district_list,
@@ -292,45 +225,24 @@ def get_districts():
 def get_search_filters():
     """Get available search filters with ranges"""
     try:
-        # Get price range
-        price_stats = db.session.query(
-            db.func.min(Craftsman.hourly_rate).label('min_price'),
-            db.func.max(Craftsman.hourly_rate).label('max_price'),
-            db.func.avg(Craftsman.hourly_rate).label('avg_price')
-        ).filter(
-            Craftsman.hourly_rate.isnot(None),
-            Craftsman.hourly_rate > 0
-        ).first()
-        
-        # Get rating range
-        rating_stats = db.session.query(
-            db.func.min(Craftsman.average_rating).label('min_rating'),
-            db.func.max(Craftsman.average_rating).label('max_rating'),
-            db.func.avg(Craftsman.average_rating).label('avg_rating')
-        ).filter(
-            Craftsman.average_rating.isnot(None),
-            Craftsman.average_rating > 0
-        ).first()
-        
-        # Get verification stats
-        verified_count = Craftsman.query.filter_by(is_verified=True).count()
-        total_count = Craftsman.query.count()
-        
-        # Get portfolio stats
-        portfolio_count = Craftsman.query.filter(
-            Craftsman.portfolio_images.isnot(None)
-        ).count()
+        # Ranges and counts come from the incrementally maintained facet store
+        summary = get_facet_store().summary()
+        price_stats = summary['price_range'] or {}
+        rating_stats = summary['rating_range'] or {}
+        verified_count = summary['verified']
+        total_count = summary['total']
+        portfolio_count = summary['with_portfolio']
         
         filters = {
             'price_range': {
-                'min': float(price_stats.min_price) if price_stats.min_price else 0,
-                'max': float(price_stats.max_price) if price_stats.max_price else 1000,
-                'avg': float(price_stats.avg_price) if price_stats.avg_price else 100,
+                'min': price_stats.get('min', 0),
+                'max': price_stats.get('max', 1000),
+                'avg': price_stats.get('avg', 100),
             },
             'rating_range': {
-                'min': float(rating_stats.min_rating) if rating_stats.min_rating else 0,
-                'max': float(rating_stats.max_rating) if rating_stats.max_rating else 5,
-                'avg': float(rating_stats.avg_rating) if rating_stats.avg_rating else 0,
+                'min': rating_stats.get('min', 0),
+                'max': rating_stats.get('max', 5),
+                'avg': rating_stats.get('avg', 0),
             },
             'verification_stats': {
                 'verified_count': verified_count,
@@ -342,6 +254,7 @@ def get_search_filters():
                 'without_portfolio': total_count - portfolio_count,
                 'portfolio_rate': (portfolio_count / total_count * 100) if total_count > 0 else 0,
             },
+            'facets': summary['facets'],
             'sort_options': [
                 {'value': 'rating', 'label': 'Puan'},
                 {'value': 'price', 'label': 'Fiyat'},
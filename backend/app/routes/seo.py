@@ -1,32 +1,48 @@
-from flask import Blueprint, Response, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request, send_file
 from app.utils.seo import SEOManager, SEOOptimizer
+from app.utils.sitemap import get_sitemap_store
 from app.models.craftsman import Craftsman
 from app.models.user import User
 from app.utils.security import rate_limit
 
 seo_bp = Blueprint('seo', __name__)
 
-@seo_bp.route('/sitemap.xml', methods=['GET'])
-@rate_limit(max_requests=30)
-def get_sitemap():
-    """Generate and serve dynamic sitemap"""
+# Sitemap files are built on the first request and then regenerated in the
+# background; crawlers get whatever is on disk, with Last-Modified/ETag so
+# unchanged shards cost a 304
+SITEMAP_MAX_AGE = 3600
+
+
+def _serve_sitemap_file(resolve):
+    store = get_sitemap_store(current_app)
+    static_urls = SEOManager.static_sitemap_urls()
     try:
-        sitemap_xml = SEOManager.generate_sitemap_xml()
-        return Response(
-            sitemap_xml,
-            mimetype='application/xml',
-            headers={
-                'Cache-Control': 'public, max-age=3600',  # Cache for 1 hour
-                'Content-Type': 'application/xml; charset=utf-8'
-            }
-        )
+        store.ensure_built(static_urls)
     except Exception as e:
-        print(f"Error generating sitemap: {e}")
+        current_app.logger.error(f"Sitemap build failed: {e}")
         return Response(
             '<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"></urlset>',
             mimetype='application/xml',
-            status=500
+            status=503,
+            headers={'Retry-After': '60'}
         )
+    store.ensure_fresh(current_app._get_current_object(), static_urls)
+    path = resolve(store)
+    if path is None:
+        return Response('Not found', status=404, mimetype='text/plain')
+    return send_file(path, mimetype='application/xml', conditional=True, max_age=SITEMAP_MAX_AGE)
+
+@seo_bp.route('/sitemap.xml', methods=['GET'])
+@rate_limit(max_requests=30)
+def get_sitemap():
+    """Serve the sitemap index"""
+    return _serve_sitemap_file(lambda store: store.index_path())
+
+@seo_bp.route('/sitemaps/<name>.xml', methods=['GET'])
+@rate_limit(max_requests=60)
+def get_sitemap_shard(name):
+    """Serve one sitemap shard"""
+    return _serve_sitemap_file(lambda store: store.shard_path(name))
 
 @seo_bp.route('/robots.txt', methods=['GET'])
 @rate_limit(max_requests=30)
@@ -1,44 +1,26 @@
-from sqlalchemy import and_, or_
+from sqlalchemy import and_
 from ..models.craftsman import Craftsman
-from ..models.user import User
 from ..models.category import Category
 from ..models.review import Review
 from .. import db
+from ..utils.craftsman_query import CraftsmanQuery
 
 class CraftsmanService:
     @staticmethod
     def get_all(page=1, per_page=10, filters=None):
         """Get all craftsmen with pagination and filters"""
-        query = Craftsman.query.join(User).filter(User.is_active == True)
+        filters = dict(filters or {})
+        filters['q'] = filters.pop('search', None)
+        if not filters.get('is_available'):
+            filters.pop('is_available', None)
         
-        if filters:
-            if filters.get('category_id'):
-                query = query.filter(Craftsman.categories.any(Category.id == filters['category_id']))
-            
-            if filters.get('city'):
-                query = query.filter(Craftsman.city.ilike(f"%{filters['city']}%"))
-            
-            if filters.get('district'):
-                query = query.filter(Craftsman.district.ilike(f"%{filters['district']}%"))
-            
-            if filters.get('is_available'):
-                query = query.filter(Craftsman.is_available == filters['is_available'])
-            
-            if filters.get('min_rating'):
-                query = query.filter(Craftsman.average_rating >= filters['min_rating'])
-            
-            if filters.get('search'):
-                search_term = f"%{filters['search']}%"
-                query = query.filter(
-                    or_(
-                        Craftsman.business_name.ilike(search_term),
-                        Craftsman.description.ilike(search_term),
-                        User.first_name.ilike(search_term),
-                        User.last_name.ilike(search_term)
-                    )
-                )
-        
-        return query.paginate(page=page, per_page=per_page, error_out=False)
+        craftsman_query = CraftsmanQuery(filters, projection='entity')
+        total, _ = craftsman_query.count()
+        pagination = craftsman_query.ordered().paginate(
+            page=page, per_page=per_page, error_out=False, count=False
+        )
+        pagination.total = total
+        return pagination
     
     @staticmethod
     def get_by_id(craftsman_id):
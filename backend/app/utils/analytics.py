@@ -10,11 +10,10 @@ fail gracefully when data is missing.
 from __future__ import annotations
 
 import logging
-import time
 from datetime import datetime, timedelta
 from typing import Any, Dict, Optional
 
-from flask import current_app, g, request
+from flask import current_app
 from sqlalchemy import func
 
 from app import db
@@ -22,34 +21,6 @@ from app import db
 logger = logging.getLogger(__name__)
 
 
-# ---------------------------------------------------------------------------
-# Request middleware
-# ---------------------------------------------------------------------------
-def init_analytics_middleware(app) -> None:
-    """Attach very light-weight request timing hooks."""
-
-    @app.before_request
-    def analytics_before_request() -> None:  # pragma: no cover - flask hook
-        g.analytics_start_time = time.time()
-        g.request_count = getattr(g, "request_count", 0) + 1
-
-    @app.after_request
-    def analytics_after_request(response):  # pragma: no cover - flask hook
-        if hasattr(g, "analytics_start_time"):
-            duration = time.time() - g.analytics_start_time
-            logger.info(
-                "Request: %s %s - Status: %s - Duration: %.3fs",
-                request.method,
-                request.path,
-                response.status_code,
-                duration,
-            )
-
-        return response
-
-    logger.info("Basic analytics middleware initialized")
-
-
 # ---------------------------------------------------------------------------
 # Analytics helpers used by API routes
 # ---------------------------------------------------------------------------
@@ -331,7 +302,6 @@ class DashboardData:
 
 
 __all__ = [
-    "init_analytics_middleware",
     "AnalyticsTracker",
     "BusinessMetrics",
     "CostCalculator",
@@ -0,0 +1,213 @@
+"""Parallel per-table streaming inserts with retry and dead-lettering.
+
+The BigQuery worker used to insert table after table on its own thread: one
+slow table held up every other one, and a failed insert was logged and its
+rows lost. ``ParallelFlusher`` instead
+
+* inserts each table's rows as its own task on a small bounded thread pool,
+  so tables proceed independently;
+* backs a table off after a failed insert (exponential, jittered). While a
+  table is backing off its rows are not attempted but requeued, so the
+  other tables keep flowing. Requeueing goes through the spool, so these
+  per-table retry queues survive restarts like any other row;
+* tells poison rows from transient failures. Rows BigQuery rejects as
+  invalid are dead-lettered at once, and the rest of their request, which
+  BigQuery only "stopped", is resent. Rows that keep failing are
+  dead-lettered after ``max_attempts``.
+
+Dead-lettered rows are appended, with the reason, to
+``<dead_letter_dir>/<table>.ndjson``.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.json_encoding import dumps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BACKOFF_SECONDS = 5
+MAX_BACKOFF_SECONDS = 10 * 60
+
+# insert(table, rows, row_ids) -> per-row errors, like insert_rows_json
+Insert = Callable[[str, List[dict], List[str]], List[dict]]
+# requeue(item) -> False if the item could not be requeued
+Requeue = Callable[[Dict[str, Any]], bool]
+
+
+class _TableOutcome:
+    __slots__ = ('inserted', 'failed', 'poison', 'error')
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed: List[dict] = []
+        self.poison: List[tuple] = []  # (item, reasons)
+        self.error: Optional[Exception] = None
+
+
+class ParallelFlusher:
+    """Ships ``{'table', 'data', 'row_id', 'attempts'}`` items table by table"""
+
+    def __init__(self, insert: Insert, requeue: Requeue, dead_letter_dir: str,
+                 max_workers: int = DEFAULT_MAX_WORKERS, chunk_rows: int = 50,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self._insert = insert
+        self._requeue = requeue
+        self.dead_letter_dir = dead_letter_dir
+        self.chunk_rows = chunk_rows
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='bigquery-flush')
+        # After shutdown() tables are inserted one by one on the calling thread
+        self._closed = False
+        self._lock = threading.Lock()
+        # table -> (consecutive failures, monotonic time of the next attempt)
+        self._backoff: Dict[str, tuple] = {}
+        self._counters = {'inserted': 0, 'requeued': 0, 'deferred': 0, 'dead_lettered': 0, 'lost': 0}
+
+    def flush(self, items: List[dict]):
+        """Insert ``items``; failures are requeued or dead-lettered, never raised"""
+        by_table: Dict[str, List[dict]] = {}
+        for item in items:
+            # Ids keep retries of the same row de-duplicated by BigQuery
+            item.setdefault('row_id', uuid.uuid4().hex)
+            by_table.setdefault(item['table'], []).append(item)
+
+        now = self._clock()
+        ready = {}
+        for table, table_items in by_table.items():
+            backoff = self._backoff.get(table)
+            if backoff is not None and backoff[1] > now:
+                self._requeue_all(table_items, count='deferred')
+            else:
+                ready[table] = table_items
+
+        if len(ready) == 1 or self._closed:
+            outcomes = {table: self._insert_table(table, table_items) for table, table_items in ready.items()}
+        else:
+            futures = {table: self._executor.submit(self._insert_table, table, table_items)
+                       for table, table_items in ready.items()}
+            outcomes = {table: future.result() for table, future in futures.items()}
+
+        for table, outcome in outcomes.items():
+            self._settle(table, outcome)
+
+    def _insert_table(self, table: str, items: List[dict]) -> _TableOutcome:
+        outcome = _TableOutcome()
+        for start in range(0, len(items), self.chunk_rows):
+            chunk = items[start:start + self.chunk_rows]
+            if outcome.error is not None:
+                # The table is failing; do not hammer it with the rest
+                outcome.failed.extend(chunk)
+                continue
+            try:
+                self._insert_chunk(table, chunk, outcome)
+            except Exception as e:
+                outcome.error = e
+                outcome.failed.extend(chunk)
+        return outcome
+
+    def _insert_chunk(self, table: str, chunk: List[dict], outcome: _TableOutcome):
+        errors = self._insert(table, [item['data'] for item in chunk], [item['row_id'] for item in chunk])
+        if not errors:
+            outcome.inserted += len(chunk)
+            return
+
+        # An invalid row fails the whole request; BigQuery reports the
+        # others with reason "stopped", and those can be sent again
+        poison = {}
+        for entry in errors:
+            reasons = entry.get('errors') or []
+            if any(reason.get('reason') != 'stopped' for reason in reasons):
+                poison[entry['index']] = reasons
+        if not poison:
+            raise RuntimeError(f'insert errors without invalid rows: {errors}')
+        outcome.poison.extend((chunk[index], reasons) for index, reasons in poison.items())
+        resend = [item for index, item in enumerate(chunk) if index not in poison]
+        if resend:
+            self._insert_chunk(table, resend, outcome)
+
+    def _settle(self, table: str, outcome: _TableOutcome):
+        with self._lock:
+            self._counters['inserted'] += outcome.inserted
+        if outcome.poison:
+            self._dead_letter(table, outcome.poison)
+
+        if outcome.error is None:
+            self._backoff.pop(table, None)
+            return
+        failures = self._backoff.get(table, (0, 0.0))[0] + 1
+        delay = min(MAX_BACKOFF_SECONDS, self.backoff_seconds * 2 ** (failures - 1)) * random.uniform(0.5, 1.0)
+        self._backoff[table] = (failures, self._clock() + delay)
+        logger.warning("BigQuery insert into %s failed (%s in a row), backing off %.0fs: %s",
+                       table, failures, delay, outcome.error)
+
+        retry, exhausted = [], []
+        for item in outcome.failed:
+            item['attempts'] = item.get('attempts', 0) + 1
+            if item['attempts'] >= self.max_attempts:
+                exhausted.append((item, [{'reason': 'max_attempts', 'message': str(outcome.error)}]))
+            else:
+                retry.append(item)
+        if exhausted:
+            self._dead_letter(table, exhausted)
+        self._requeue_all(retry, count='requeued')
+
+    def _requeue_all(self, items: List[dict], count: str):
+        lost = sum(1 for item in items if not self._requeue(item))
+        with self._lock:
+            self._counters[count] += len(items) - lost
+            self._counters['lost'] += lost
+        if lost:
+            logger.error("Dropped %s BigQuery rows that could not be requeued", lost)
+
+    def _dead_letter(self, table: str, rejected: List[tuple]):
+        """Append ``(item, reasons)`` pairs to the table's dead-letter file"""
+        dead_lettered_at = datetime.utcnow().isoformat()
+        lines = b''.join(dumps({
+            'row': item['data'],
+            'row_id': item['row_id'],
+            'attempts': item.get('attempts', 0),
+            'errors': reasons,
+            'dead_lettered_at': dead_lettered_at,
+        }) + b'\n' for item, reasons in rejected)
+        try:
+            os.makedirs(self.dead_letter_dir, exist_ok=True)
+            # A single O_APPEND write keeps lines from several processes whole
+            fd = os.open(os.path.join(self.dead_letter_dir, f'{table}.ndjson'),
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, lines)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.error("Could not dead-letter %s %s rows: %s", len(rejected), table, e)
+        with self._lock:
+            self._counters['dead_lettered'] += len(rejected)
+        logger.warning("Dead-lettered %s %s rows, e.g. %s", len(rejected), table, rejected[0][1])
+
+    def backing_off(self) -> List[str]:
+        now = self._clock()
+        return sorted(table for table, (_, next_attempt) in list(self._backoff.items()) if next_attempt > now)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats['backing_off'] = self.backing_off()
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        """Stop the pool; ``flush()`` keeps working, serially (e.g. for a final drain)"""
+        self._closed = True
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,346 @@
+"""Batch load jobs for high-volume BigQuery tables.
+
+Streaming inserts (``insert_rows_json``) are billed per row and cost a
+request per 50 rows. For tables listed in ``BIGQUERY_LOAD_JOB_TABLES`` the
+BigQuery worker instead stages rows from the spool into gzipped NDJSON files,
+one open file per table, and ships each file with a single load job, which
+is free.
+
+No table is loaded this way by default. To enable it, list the tables
+(comma separated) in the environment, e.g. under ``env_variables`` in
+``app.yaml``::
+
+    BIGQUERY_LOAD_JOB_TABLES: user_activity_logs,performance_metrics
+
+Rows of those tables then reach BigQuery once their file is sealed, not
+within a flush interval. The sink needs the disk spool (it is skipped when
+the spool cannot be opened) and stages files under ``<spool dir>/load-jobs``.
+Staged files are handled as follows:
+
+* a file is sealed once it reaches its table's ``max_bytes`` or is
+  ``max_age_seconds`` old (``BIGQUERY_LOAD_JOB_THRESHOLDS`` overrides the
+  defaults per table);
+* every ``stage()`` call appends one complete gzip member and fsyncs it
+  before the spool segment the rows came from is deleted. A member torn by a
+  crash is cut off before the file is loaded;
+* load jobs get deterministic ids, so a job resubmitted after a crash comes
+  back as a conflict, and the existing job is picked up instead of loading
+  the file twice;
+* failed submissions and jobs are retried with exponential backoff; after
+  ``max_attempts`` the file is moved to ``failed/`` and left for inspection;
+* staging directories follow the spool's per-process locking, so files of
+  an exited process are loaded by the next live worker. ``drain()`` seals
+  and submits everything at shutdown; files whose jobs have not finished by
+  then are left for that worker.
+
+``FakeLoadJobClient`` implements the part of the BigQuery client used here,
+for exercising the sink offline.
+"""
+
+import gzip
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from app.utils.json_encoding import dumps, loads
+from app.utils.telemetry_spool import ProcessDirectory
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 30 * 60
+DEFAULT_MAX_ATTEMPTS = 10
+
+_STAGED_SUFFIX = '.ndjson.gz'
+_JOB_ID_UNSAFE = re.compile(r'[^A-Za-z0-9_-]')
+
+
+class TableThreshold(NamedTuple):
+    max_bytes: int = 16 * 1024 * 1024  # compressed
+    max_age_seconds: float = 300
+
+
+def parse_thresholds(value) -> Dict[str, TableThreshold]:
+    """``{"user_activity_logs": {"max_bytes": ..., "max_age_seconds": ...}}`` (JSON or dict)"""
+    if not value:
+        return {}
+    if isinstance(value, str):
+        value = json.loads(value)
+    return {table: TableThreshold(**settings) for table, settings in value.items()}
+
+
+def valid_gzip_length(data: bytes) -> int:
+    """Length of the leading run of complete gzip members in ``data``"""
+    offset = 0
+    while offset < len(data):
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            decompressor.decompress(data[offset:])
+        except zlib.error:
+            break
+        if not decompressor.eof:
+            break
+        offset = len(data) - len(decompressor.unused_data)
+    return offset
+
+
+def _is_conflict(error: Exception) -> bool:
+    # google.api_core.exceptions.Conflict, without importing it
+    return getattr(error, 'code', None) == 409
+
+
+class _StagedFile:
+    __slots__ = ('path', 'table', 'size', 'rows', 'opened_at', 'sealed', 'attempts',
+                 'next_attempt_at', 'job', 'job_id', 'orphaned')
+
+    def __init__(self, path: str, table: str, opened_at: float, orphaned: bool = False):
+        self.path = path
+        self.table = table
+        self.size = 0
+        self.rows = 0
+        self.opened_at = opened_at
+        self.sealed = orphaned
+        self.attempts = 0
+        self.next_attempt_at = 0.0
+        self.job = None
+        self.job_id: Optional[str] = None
+        self.orphaned = orphaned
+
+
+class LoadJobSink:
+    """Stages rows per table and ships the files as BigQuery load jobs"""
+
+    def __init__(self, client, dataset_id: str, directory: str, tables: Iterable[str],
+                 thresholds: Optional[Dict[str, TableThreshold]] = None, job_config: Any = None,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+                 clock: Callable[[], float] = time.time):
+        self.client = client
+        self.dataset_id = dataset_id
+        self.tables = frozenset(tables)
+        self.thresholds = thresholds or {}
+        self.job_config = job_config
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._clock = clock
+        self._process_directory = ProcessDirectory(directory)
+        self.directory = self._process_directory.path
+        self.failed_directory = os.path.join(directory, 'failed')
+
+        self._lock = threading.Lock()
+        self._open: Dict[str, _StagedFile] = {}
+        self._files: Dict[str, _StagedFile] = {}
+        self._sequence = 0
+        self._counters = {'staged_rows': 0, 'loaded_files': 0, 'loaded_rows': 0, 'retries': 0, 'failed_files': 0}
+
+    def handles(self, table: str) -> bool:
+        return table in self.tables
+
+    def threshold(self, table: str) -> TableThreshold:
+        return self.thresholds.get(table) or TableThreshold()
+
+    def stage(self, table: str, rows: List[dict]):
+        """Append ``rows`` to the table's open file; durable when this returns"""
+        if not rows:
+            return
+        member = gzip.compress(b''.join(dumps(row) + b'\n' for row in rows), mtime=0)
+        with self._lock:
+            staged = self._open.get(table)
+            if staged is None:
+                self._sequence += 1
+                path = os.path.join(self.directory, f'{table}.{self._sequence:08d}{_STAGED_SUFFIX}')
+                staged = self._open[table] = self._files[path] = _StagedFile(path, table, self._clock())
+            with open(staged.path, 'ab') as f:
+                f.write(member)
+                f.flush()
+                os.fsync(f.fileno())
+            staged.size += len(member)
+            staged.rows += len(rows)
+            self._counters['staged_rows'] += len(rows)
+            if staged.size >= self.threshold(table).max_bytes:
+                self._seal(staged)
+
+    def _seal(self, staged: _StagedFile):
+        staged.sealed = True
+        self._open.pop(staged.table, None)
+
+    def tick(self, adopt: bool = True):
+        """Poll running jobs, seal files past their age and submit what is due"""
+        now = self._clock()
+        with self._lock:
+            for staged in list(self._open.values()):
+                if now - staged.opened_at >= self.threshold(staged.table).max_age_seconds:
+                    self._seal(staged)
+            if adopt:
+                self._adopt_orphaned(now)
+            files = [staged for staged in self._files.values() if staged.sealed]
+
+        for staged in files:
+            try:
+                if staged.job is not None:
+                    self._poll(staged)
+                elif staged.next_attempt_at <= now:
+                    self._submit(staged)
+            except Exception as e:
+                self._retry_later(staged, e)
+
+    def drain(self, deadline: float) -> dict:
+        """Seal every open file and load what can be loaded by ``deadline`` (time.monotonic())"""
+        loaded_before = self.stats()['loaded_rows']
+        with self._lock:
+            for staged in list(self._open.values()):
+                self._seal(staged)
+        while True:
+            self.tick(adopt=False)
+            with self._lock:
+                pending = list(self._files.values())
+            # Files waiting out a backoff will not be tried again before the deadline
+            if not pending or time.monotonic() >= deadline or \
+                    all(staged.job is None and staged.next_attempt_at > self._clock() for staged in pending):
+                break
+            time.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+        return {
+            'loaded_rows': self.stats()['loaded_rows'] - loaded_before,
+            'pending_files': len(pending),
+            'pending_rows': sum(staged.rows or 0 for staged in pending),
+        }
+
+    def _adopt_orphaned(self, now: float):
+        for directory in self._process_directory.orphaned():
+            names = [name for name in os.listdir(directory) if name.endswith(_STAGED_SUFFIX)]
+            if not names:
+                self._process_directory.release(directory)
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                if path in self._files:
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+                length = valid_gzip_length(data)
+                if length < len(data):
+                    logger.warning("Cutting %s torn bytes off %s", len(data) - length, path)
+                    with open(path, 'r+b') as f:
+                        f.truncate(length)
+                staged = _StagedFile(path, name.split('.', 1)[0], now, orphaned=True)
+                staged.size = length
+                staged.rows = None  # unknown until loaded
+                self._files[path] = staged
+
+    def _job_id(self, staged: _StagedFile) -> str:
+        directory, name = os.path.split(staged.path)
+        job_id = f'ustam_load_{os.path.basename(directory)}_{name[:-len(_STAGED_SUFFIX)]}_{staged.attempts}'
+        return _JOB_ID_UNSAFE.sub('_', job_id)
+
+    def _submit(self, staged: _StagedFile):
+        if staged.size == 0:
+            self._finish(staged)
+            return
+        staged.job_id = self._job_id(staged)
+        try:
+            with open(staged.path, 'rb') as f:
+                staged.job = self.client.load_table_from_file(
+                    f, f'{self.dataset_id}.{staged.table}', job_id=staged.job_id, job_config=self.job_config
+                )
+        except Exception as e:
+            if not _is_conflict(e):
+                raise
+            # Submitted before a crash or a lost response: follow that job
+            staged.job = self.client.get_job(staged.job_id)
+        logger.debug("Submitted load job %s for %s", staged.job_id, staged.path)
+        self._poll(staged)
+
+    def _poll(self, staged: _StagedFile):
+        if not staged.job.done():
+            return
+        job, staged.job = staged.job, None
+        job.result()  # raises if the job failed
+        self._finish(staged)
+        logger.debug("Load job %s loaded %s", staged.job_id, staged.path)
+
+    def _finish(self, staged: _StagedFile):
+        try:
+            os.unlink(staged.path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._files.pop(staged.path, None)
+            self._counters['loaded_files'] += 1
+            self._counters['loaded_rows'] += staged.rows or 0
+
+    def _retry_later(self, staged: _StagedFile, error: Exception):
+        staged.job = None
+        staged.attempts += 1
+        if staged.attempts >= self.max_attempts:
+            logger.error("Giving up on load job for %s after %s attempts: %s", staged.path, staged.attempts, error)
+            directory, name = os.path.split(staged.path)
+            os.makedirs(self.failed_directory, exist_ok=True)
+            os.replace(staged.path, os.path.join(self.failed_directory, f'{os.path.basename(directory)}-{name}'))
+            with self._lock:
+                self._files.pop(staged.path, None)
+                self._counters['failed_files'] += 1
+            return
+        delay = min(MAX_BACKOFF_SECONDS, self.backoff_seconds * 2 ** (staged.attempts - 1))
+        delay *= random.uniform(0.8, 1.2)
+        staged.next_attempt_at = self._clock() + delay
+        with self._lock:
+            self._counters['retries'] += 1
+        logger.warning("Load job for %s failed (attempt %s), retrying in %.0fs: %s",
+                       staged.path, staged.attempts, delay, error)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['staged_files'] = len(self._files)
+            stats['staged_bytes'] = sum(staged.size for staged in self._files.values())
+        return stats
+
+
+class FakeLoadJob:
+    def __init__(self, job_id: str, error: Optional[Exception] = None):
+        self.job_id = job_id
+        self.error = error
+
+    def done(self) -> bool:
+        return True
+
+    def result(self, timeout=None):
+        if self.error is not None:
+            raise self.error
+        return self
+
+
+class FakeConflict(Exception):
+    code = 409
+
+
+class FakeLoadJobClient:
+    """In-memory stand-in for the load-job subset of the BigQuery client."""
+
+    def __init__(self):
+        self.tables: Dict[str, List[dict]] = {}
+        self.jobs: Dict[str, FakeLoadJob] = {}
+        self.submit_errors: List[Exception] = []
+        self.job_errors: List[Exception] = []
+
+    def load_table_from_file(self, file_obj, destination, job_id=None, job_config=None, **kwargs):
+        if job_id in self.jobs:
+            raise FakeConflict(f'Already Exists: Job {job_id}')
+        if self.submit_errors:
+            raise self.submit_errors.pop(0)
+        if self.job_errors:
+            job = self.jobs[job_id] = FakeLoadJob(job_id, self.job_errors.pop(0))
+            return job
+        data = gzip.decompress(file_obj.read())
+        rows = [loads(line) for line in data.splitlines() if line]
+        self.tables.setdefault(str(destination).rsplit('.', 1)[-1], []).extend(rows)
+        job = self.jobs[job_id] = FakeLoadJob(job_id)
+        return job
+
+    def get_job(self, job_id):
+        return self.jobs[job_id]
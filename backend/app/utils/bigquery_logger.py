@@ -4,7 +4,7 @@ Streams logs and analytics data to BigQuery in real-time
 """
 
 import os
-import json
+import tempfile
 import uuid
 from datetime import datetime
 from typing import Dict, Any, Optional
@@ -14,6 +14,14 @@ import threading
 import queue
 import time
 
+from app.middleware.instrumentation import classify_user_agent, current_context
+from app.utils.bigquery_flush import ParallelFlusher
+from app.utils.bigquery_load_jobs import LoadJobSink, parse_thresholds
+from app.utils.json_encoding import dumps_text
+from app.utils.telemetry_collector import CollectorClient
+from app.utils.telemetry_sampling import TelemetrySampler
+from app.utils.telemetry_spool import DiskSpool, live_processes, read_segment
+
 try:  # Optional BigQuery dependency
     from google.cloud import bigquery  # type: ignore
     try:
@@ -46,11 +54,53 @@ class BigQueryLogger:
             self._configured_flag = 'false'
         self.enabled = False
 
-        # Streaming buffer
+        # Rows are spooled to disk (app.utils.telemetry_spool); the in-memory
+        # queue is the fallback when the spool is disabled or cannot be opened.
+        # The default directory is in instance memory on App Engine, hence
+        # the small cap
+        self.spool: Optional[DiskSpool] = None
+        self.spool_dir = os.environ.get(
+            'BIGQUERY_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'ustam-bigquery-spool')
+        )
+        self.spool_max_bytes = int(os.environ.get('BIGQUERY_SPOOL_MAX_MB', 32)) * 1024 * 1024
+        # Whether the spool goes away with the instance (App Engine standard's
+        # /tmp); rows spilled there by its last process are reported as lost
+        self.spool_ephemeral = os.environ.get(
+            'BIGQUERY_SPOOL_EPHEMERAL', 'true' if os.environ.get('GAE_ENV', '').startswith('standard') else 'false'
+        ).strip().lower() == 'true'
+        # High-volume tables shipped with load jobs instead of streaming inserts
+        # (app.utils.bigquery_load_jobs); needs the spool
+        self.load_sink: Optional[LoadJobSink] = None
+        self.load_job_tables = [
+            table.strip() for table in os.environ.get('BIGQUERY_LOAD_JOB_TABLES', '').split(',') if table.strip()
+        ]
         self.log_queue = queue.Queue(maxsize=1000)
         self.batch_size = 50
         self.flush_interval = 30  # seconds
 
+        # Per-table parallel inserts (app.utils.bigquery_flush); rows that fail
+        # go back through the spool, or wait in _retries without one
+        self.flusher: Optional[ParallelFlusher] = None
+        self.flush_workers = int(os.environ.get('BIGQUERY_FLUSH_WORKERS', 4))
+        self.dead_letter_dir = os.environ.get('BIGQUERY_DEAD_LETTER_DIR') or os.path.join(
+            self.spool_dir or tempfile.gettempdir(), 'dead-letter'
+        )
+        self._retries = []
+
+        # Forward rows to the cross-worker collector process instead of
+        # shipping them from this one (app.utils.telemetry_collector)
+        self.collector_socket = os.environ.get('BIGQUERY_COLLECTOR_SOCKET') or None
+        self.collector: Optional[CollectorClient] = None
+
+        # Set by shutdown(): rows are refused and the worker thread winds down
+        self.accepting = True
+        self.refused = 0
+        self._stopping = threading.Event()
+        self._worker_thread: Optional[threading.Thread] = None
+
+        # Replaced from app config by configure_sampling()
+        self.sampler = TelemetrySampler()
+
         # Start background worker when conditions allow
         self._bootstrap()
 
@@ -76,6 +126,13 @@ class BigQueryLogger:
                 logger.info("%s Provide credentials to enable logging.", message)
             return
 
+        if self.collector_socket:
+            # The collector holds the client and ships for every worker
+            self.collector = CollectorClient(self.collector_socket, self._open_spool)
+            self.enabled = True
+            logger.info(f"BigQuery rows forwarded to the telemetry collector at {self.collector_socket}")
+            return
+
         if not self._initialize_client():
             # _initialize_client logs the reason and ensures self.enabled is False
             return
@@ -125,13 +182,52 @@ class BigQueryLogger:
         self.client = None
         return False
 
+    def _open_spool(self) -> Optional[DiskSpool]:
+        if not self.spool_dir:
+            return None
+        try:
+            return DiskSpool(self.spool_dir, max_bytes=self.spool_max_bytes)
+        except OSError as e:
+            logger.warning(f"BigQuery spool unavailable at {self.spool_dir}, buffering in memory: {e}")
+            return None
+
+    def _open_load_sink(self) -> Optional[LoadJobSink]:
+        if not self.load_job_tables:
+            return None
+        try:
+            thresholds = parse_thresholds(os.environ.get('BIGQUERY_LOAD_JOB_THRESHOLDS'))
+            job_config = bigquery.LoadJobConfig(
+                source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+                write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+                ignore_unknown_values=True,
+            )
+            sink = LoadJobSink(self.client, self.dataset_id, os.path.join(self.spool_dir, 'load-jobs'),
+                               self.load_job_tables, thresholds, job_config)
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"BigQuery load jobs unavailable, streaming every table: {e}")
+            return None
+        logger.info(f"BigQuery load jobs enabled for: {', '.join(self.load_job_tables)}")
+        return sink
+
     def _start_background_worker(self):
         """Start background worker for batch processing"""
+        self.spool = self._open_spool()
+        self.flusher = ParallelFlusher(
+            self._insert_rows, self._requeue, self.dead_letter_dir,
+            max_workers=self.flush_workers, chunk_rows=self.batch_size,
+        )
+        if self.spool is not None:
+            self.load_sink = self._open_load_sink()
+            self._worker_thread = threading.Thread(target=self._spool_worker, daemon=True)
+            self._worker_thread.start()
+            logger.info(f"BigQuery background worker started (spooling to {self.spool.directory})")
+            return
+
         def worker():
             batch = []
             last_flush = time.time()
             
-            while True:
+            while not self._stopping.is_set():
                 try:
                     # Get item from queue with timeout
                     try:
@@ -142,57 +238,245 @@ class BigQueryLogger:
                     
                     # Flush if batch is full or time interval passed
                     current_time = time.time()
+                    interval_passed = current_time - last_flush >= self.flush_interval
                     should_flush = (
                         len(batch) >= self.batch_size or 
-                        (batch and current_time - last_flush >= self.flush_interval)
+                        ((batch or self._retries) and interval_passed)
                     )
                     
                     if should_flush:
+                        if interval_passed:
+                            # Failed rows wait for the next interval, like a backoff
+                            batch.extend(self._retries)
+                            self._retries = []
                         self._flush_batch(batch)
                         batch = []
                         last_flush = current_time
                         
                 except Exception as e:
                     logger.error(f"BigQuery worker error: {e}")
-                    time.sleep(5)  # Wait before retrying
+                    self._stopping.wait(5)  # Wait before retrying
+            # Left for shutdown() to flush or spill
+            self._retries.extend(batch)
         
         # Start worker thread
-        worker_thread = threading.Thread(target=worker, daemon=True)
-        worker_thread.start()
+        self._worker_thread = threading.Thread(target=worker, daemon=True)
+        self._worker_thread.start()
         logger.info("BigQuery background worker started")
 
+    def _spool_worker(self):
+        """Seal, ship and delete spool segments; fsyncs are batched here"""
+        while not self._stopping.is_set():
+            try:
+                self.spool.sync()
+                self.spool.rotate(older_than=self.flush_interval)
+                if self.load_sink is not None:
+                    self.load_sink.tick()
+                for segment in self.spool.ready_segments():
+                    if self._stopping.is_set():
+                        break
+                    self._ship_segment(segment)
+                self._stopping.wait(1)
+            except Exception as e:
+                logger.error(f"BigQuery worker error: {e}")
+                self._stopping.wait(5)
+
+    def _ship_segment(self, segment) -> int:
+        """Ship a segment's rows and delete it; failed rows were requeued to the spool"""
+        batch = []
+        for offset, record in read_segment(segment.path):
+            # Stable row ids let BigQuery de-duplicate rows shipped twice;
+            # requeued rows keep the id (and attempt count) they were given
+            record.setdefault('row_id', f'{segment.key}:{offset}')
+            batch.append(record)
+        staged: Dict[str, list] = {}
+        if self.load_sink is not None:
+            streamed = []
+            for item in batch:
+                if self.load_sink.handles(item['table']):
+                    staged.setdefault(item['table'], []).append(item['data'])
+                else:
+                    streamed.append(item)
+        else:
+            streamed = batch
+        # Stream first: if staging fails the segment is shipped again, and
+        # re-streamed rows are de-duplicated by row id, staged ones would not be
+        self._flush_batch(streamed)
+        for table_name, rows in staged.items():
+            self.load_sink.stage(table_name, rows)
+        self.spool.commit(segment, len(batch))
+        return len(batch)
+
     def _flush_batch(self, batch):
-        """Flush batch of logs to BigQuery"""
+        """Flush batch of logs to BigQuery, each table in parallel"""
         if not batch or not self.enabled or not self.client:
             return
-        
-        # Group by table
-        tables_data = {}
-        for item in batch:
-            table_name = item['table']
-            if table_name not in tables_data:
-                tables_data[table_name] = []
-            tables_data[table_name].append(item['data'])
-        
-        # Insert to each table
-        for table_name, rows in tables_data.items():
+        self.flusher.flush(batch)
+
+    def _insert_rows(self, table_name: str, rows, row_ids):
+        table_ref = self.client.dataset(self.dataset_id).table(table_name)
+        # Tolerate columns (e.g. sample_rate) not yet added to older tables
+        errors = self.client.insert_rows_json(table_ref, rows, row_ids=row_ids, ignore_unknown_values=True)
+        if not errors:
+            logger.debug(f"Successfully inserted {len(rows)} rows to {table_name}")
+        return errors
+
+    def _requeue(self, item: Dict[str, Any]) -> bool:
+        """Put a row the flusher could not insert back in line"""
+        if self.spool is not None:
+            return self.spool.append(item)
+        if len(self._retries) >= self.log_queue.maxsize:
+            return False
+        self._retries.append(item)
+        return True
+
+    def shutdown(self, deadline: float) -> Optional[Dict[str, Any]]:
+        """Stop taking rows and ship what is buffered until ``deadline`` (time.monotonic()).
+
+        Rows not shipped by then are spilled to the spool directory, unlocked,
+        where the next process to start (or a sibling worker) ships them. On
+        an ephemeral spool with no other process left to do that, they are
+        reported as ``lost`` instead. Registered with the shutdown manager
+        (app.utils.lifecycle).
+        """
+        if not self.enabled:
+            return None
+        self.accepting = False
+        self._stopping.set()
+        if self.collector is not None:
+            self.collector.close()
+            stats = self.collector.stats()
+            return self._account_for_spill({
+                'forwarded': stats['forwarded'], 'spilled': stats['spooled'], 'dropped': stats['dropped'],
+                'refused': self.refused,
+            })
+
+        if self._worker_thread is not None:
+            # An idle worker notices the stop within a second
+            self._worker_thread.join(timeout=max(1.0, deadline - time.monotonic()))
+        if self._worker_thread is not None and self._worker_thread.is_alive():
+            # Still inside an insert; draining alongside it would ship rows twice
+            logger.warning("BigQuery worker still busy at the shutdown deadline")
+            self.flusher.shutdown(wait=False)
+            if self.spool is not None:
+                self.spool.close()
+                report = {'flushed': 0, 'spilled': 'spool left on disk', 'refused': self.refused}
+            else:
+                spilled, dropped = self._spill(self._take_queued())
+                report = {'flushed': 0, 'spilled': spilled, 'dropped': dropped, 'refused': self.refused}
+            return self._account_for_spill(report)
+
+        self.flusher.shutdown()
+        before = self.flusher.stats()
+        if self.spool is not None:
+            report = self._drain_spool(deadline)
+        else:
+            report = self._drain_queue(deadline)
+        after = self.flusher.stats()
+        report['flushed'] = after['inserted'] - before['inserted'] + report.pop('loaded_rows', 0)
+        report['dead_lettered'] = after['dead_lettered'] - before['dead_lettered']
+        report['refused'] = self.refused
+        return self._account_for_spill(report)
+
+    def _account_for_spill(self, report: Dict[str, Any]) -> Dict[str, Any]:
+        """Report spilled rows as lost when nobody is left to ship them"""
+        if not self.spool_ephemeral or not (report.get('spilled') or report.get('load_job_files_pending')):
+            return report
+        own = [self.spool.directory] if self.spool is not None else []
+        if self.spool_dir and live_processes(self.spool_dir, exclude=own) > 0:
+            return report  # a sibling worker (or the collector) adopts them
+        if 'spilled' in report:
+            report['lost'] = report.pop('spilled')
+        if 'load_job_files_pending' in report:
+            report['lost_load_job_files'] = report.pop('load_job_files_pending')
+        logger.error("No process left on this instance to ship spilled BigQuery rows; "
+                     "they go with the instance: %s", report)
+        return report
+
+    def _drain_spool(self, deadline: float) -> Dict[str, Any]:
+        self.spool.rotate()
+        for segment in self.spool.ready_segments():
+            if time.monotonic() >= deadline:
+                break
+            if not segment.orphaned:  # an exited process's rows can wait for the next one
+                self._ship_segment(segment)
+        report = {'loaded_rows': 0}
+        if self.load_sink is not None:
+            load = self.load_sink.drain(deadline)
+            report['loaded_rows'] = load['loaded_rows']
+            report['load_job_files_pending'] = load['pending_files']
+        # Rows requeued by failed inserts went to a fresh segment
+        self.spool.rotate()
+        report['spilled'] = sum(
+            1 for segment in self.spool.ready_segments() if not segment.orphaned
+            for _ in read_segment(segment.path)
+        )
+        self.spool.hand_over()
+        return report
+
+    def _take_queued(self) -> list:
+        pending = []
+        while True:
             try:
-                table_ref = self.client.dataset(self.dataset_id).table(table_name)
-                errors = self.client.insert_rows_json(table_ref, rows)
-                
-                if errors:
-                    logger.error(f"BigQuery insert errors for {table_name}: {errors}")
-                else:
-                    logger.debug(f"Successfully inserted {len(rows)} rows to {table_name}")
-                    
-            except Exception as e:
-                logger.error(f"Failed to insert to {table_name}: {e}")
+                pending.append(self.log_queue.get_nowait())
+            except queue.Empty:
+                return pending
+
+    def _spill(self, items: list):
+        """Write rows to an unlocked spool directory; (spilled, dropped)"""
+        spilled = 0
+        if items:
+            spool = self._open_spool()
+            if spool is not None:
+                spilled = sum(1 for item in items if spool.append(item))
+                spool.hand_over()
+        if spilled < len(items):
+            logger.error(f"Dropped {len(items) - spilled} BigQuery rows at shutdown")
+        return spilled, len(items) - spilled
+
+    def _drain_queue(self, deadline: float) -> Dict[str, Any]:
+        pending, self._retries = self._retries, []
+        pending.extend(self._take_queued())
+        sent = 0
+        while sent < len(pending) and time.monotonic() < deadline:
+            chunk = pending[sent:sent + self.batch_size * 10]
+            self._flush_batch(chunk)
+            sent += len(chunk)
+        # What was not attempted, plus what failed and was requeued
+        leftover = pending[sent:] + self._retries
+        self._retries = []
+        spilled, dropped = self._spill(leftover)
+        return {'spilled': spilled, 'dropped': dropped}
+
+    def configure_sampling(self, config):
+        """Load sampling rules (TELEMETRY_* settings) from app config"""
+        self.sampler = TelemetrySampler.from_config(config)
+
+    def _sample_rate(self, table_name: str, endpoint: Optional[str] = None,
+                     duration_ms: Optional[int] = None, error: bool = False) -> Optional[float]:
+        """Rate a row for ``table_name`` is kept at, or None to skip building it"""
+        if not self.enabled:
+            return None
+        context = current_context() if request else None
+        key = context.request_id if context is not None else uuid.uuid4().hex
+        if endpoint is None and request:
+            endpoint = request.endpoint
+        return self.sampler.sample(key, endpoint, table_name, duration_ms, error)
 
     def _queue_log(self, table_name: str, data: Dict[str, Any]):
         """Queue log data for batch processing"""
         if not self.enabled:
             return
+        if not self.accepting:
+            self.refused += 1
+            return
         
+        if self.collector is not None:
+            self.collector.send({'table': table_name, 'data': data})
+            return
+        if self.spool is not None:
+            self.spool.append({'table': table_name, 'data': data})
+            return
         try:
             self.log_queue.put({
                 'table': table_name,
@@ -201,12 +485,19 @@ class BigQueryLogger:
         except queue.Full:
             logger.warning("BigQuery log queue is full, dropping log entry")
 
+    def accept_forwarded(self, record: Dict[str, Any]):
+        """Queue a row forwarded by a worker process (telemetry collector side)"""
+        self._queue_log(record['table'], record['data'])
+
     def log_user_activity(self, action_type: str, action_category: str, 
                          user_id: Optional[int] = None, success: bool = True,
                          duration_ms: Optional[int] = None, 
                          action_details: Optional[Dict] = None,
                          error_message: Optional[str] = None):
         """Log user activity"""
+        sample_rate = self._sample_rate('user_activity_logs', duration_ms=duration_ms, error=not success)
+        if sample_rate is None:
+            return
         data = {
             'log_id': str(uuid.uuid4()),
             'user_id': user_id,
@@ -218,21 +509,123 @@ class BigQueryLogger:
             'ip_address': request.remote_addr if request else None,
             'device_type': self._detect_device_type(),
             'platform': self._detect_platform(),
-            'action_details': json.dumps(action_details) if action_details else None,
+            'action_details': dumps_text(action_details) if action_details else None,
             'timestamp': datetime.utcnow().isoformat() + 'Z',
             'duration_ms': duration_ms,
             'success': success,
             'error_message': error_message,
             'location_city': getattr(g, 'user_city', None),
-            'location_country': 'TR'
+            'location_country': 'TR',
+            'sample_rate': sample_rate
         }
         
         self._queue_log('user_activity_logs', data)
 
+    def log_request_event(self, event: Dict[str, Any]):
+        """Log one consolidated request event (see app.middleware.instrumentation).
+
+        The activity row lands in user_activity_logs; a business event, when
+        the endpoint has one, sets its action type and category, and
+        everything else (status, url, referrer, query params) goes into
+        action_details. A performance_metrics row carries the timing and the
+        query profile. Each table is sampled at its own rate but on the same
+        request id, so a request kept in the sparser table is kept in both.
+        """
+        error = event['error']
+        failed = error is not None or event['status_code'] >= 500
+        activity_rate = self.sampler.sample(
+            event['request_id'], event['endpoint'], 'user_activity_logs', event['duration_ms'], error=failed
+        )
+        if activity_rate is not None:
+            self._queue_log('user_activity_logs', self._request_activity_row(event, activity_rate))
+        performance_rate = self.sampler.sample(
+            event['request_id'], event['endpoint'], 'performance_metrics', event['duration_ms'], error=failed
+        )
+        if performance_rate is not None:
+            self._queue_log('performance_metrics', {
+                'metric_id': event['request_id'],
+                'timestamp': event['timestamp'].isoformat() + 'Z',
+                'endpoint': event['endpoint'],
+                'response_time_ms': event['duration_ms'],
+                'memory_usage_mb': None,
+                'cpu_usage_percent': None,
+                'database_query_time_ms': int(round(event['db_time_ms'])),
+                'database_query_count': event['db_query_count'],
+                'cache_hit_rate': None,
+                'concurrent_users': None,
+                'platform': event['platform'],
+                'user_type': event['user_type'],
+                'success': event['success'],
+                'error_count': 1 if failed else 0,
+                'sample_rate': performance_rate
+            })
+
+        if error is not None:
+            self.log_error(
+                error_type=error['type'],
+                error_level='CRITICAL' if error['type'] in ('DatabaseError', 'ConnectionError') else 'ERROR',
+                error_message=error['message'],
+                user_id=event['user_id'],
+                endpoint=event['endpoint'],
+                request_data={'method': event['method'], 'url': event['url'], 'request_id': event['request_id'],
+                              'correlation_id': event['correlation_id']}
+            )
+
+    def _request_activity_row(self, event: Dict[str, Any], sample_rate: float) -> Dict[str, Any]:
+        business_event = event['business_event']
+        details = {
+            'endpoint': event['endpoint'],
+            'method': event['method'],
+            'status_code': event['status_code'],
+            'content_length': event['content_length'],
+            'request_id': event['request_id'],
+            'correlation_id': event['correlation_id'],
+            'url': event['url'],
+            'referrer': event['referrer'],
+            'query_params': event['query_params'],
+            'has_json_body': event['has_json_body'],
+        }
+        if business_event is not None:
+            action_type, action_category = business_event['action_type'], business_event['action_category']
+            details.update(business_event['details'])
+        else:
+            action_type, action_category = event['method'].lower(), 'api'
+
+        error = event['error']
+        if error is not None:
+            error_message = f"{error['type']}: {error['message']}"
+        elif not event['success']:
+            error_message = f"HTTP {event['status_code']}"
+        else:
+            error_message = None
+
+        return {
+            'log_id': event['request_id'],
+            'user_id': event['user_id'],
+            'session_id': event['session_id'],
+            'action_type': action_type,
+            'action_category': action_category,
+            'page_url': event['url'],
+            'user_agent': event['user_agent'],
+            'ip_address': event['ip_address'],
+            'device_type': event['device_type'],
+            'platform': event['platform'],
+            'action_details': dumps_text(details),
+            'timestamp': event['timestamp'].isoformat() + 'Z',
+            'duration_ms': event['duration_ms'],
+            'success': event['success'],
+            'error_message': error_message,
+            'location_city': event['location_city'],
+            'location_country': 'TR',
+            'sample_rate': sample_rate
+        }
+
     def log_error(self, error_type: str, error_level: str, error_message: str,
                   user_id: Optional[int] = None, endpoint: Optional[str] = None,
                   error_stack: Optional[str] = None, request_data: Optional[Dict] = None):
-        """Log application errors"""
+        """Log application errors (never sampled)"""
+        if not self.enabled:
+            return
         data = {
             'error_id': str(uuid.uuid4()),
             'timestamp': datetime.utcnow().isoformat() + 'Z',
@@ -245,12 +638,12 @@ class BigQueryLogger:
             'endpoint': endpoint or (request.endpoint if request else None),
             'http_method': request.method if request else None,
             'http_status': getattr(g, 'response_status', None),
-            'request_data': json.dumps(request_data) if request_data else None,
+            'request_data': dumps_text(request_data) if request_data else None,
             'user_agent': request.headers.get('User-Agent') if request else None,
             'ip_address': request.remote_addr if request else None,
             'platform': self._detect_platform(),
             'app_version': '1.0.0',  # Get from config
-            'device_info': json.dumps(self._get_device_info()),
+            'device_info': dumps_text(self._get_device_info()),
             'resolved': False,
             'resolution_notes': None
         }
@@ -263,6 +656,10 @@ class BigQueryLogger:
                               database_query_time_ms: Optional[int] = None,
                               success: bool = True, error_count: int = 0):
         """Log performance metrics"""
+        sample_rate = self._sample_rate('performance_metrics', endpoint, response_time_ms,
+                                        error=not success or error_count > 0)
+        if sample_rate is None:
+            return
         data = {
             'metric_id': str(uuid.uuid4()),
             'timestamp': datetime.utcnow().isoformat() + 'Z',
@@ -276,7 +673,8 @@ class BigQueryLogger:
             'platform': self._detect_platform(),
             'user_type': getattr(g, 'user_type', None),
             'success': success,
-            'error_count': error_count
+            'error_count': error_count,
+            'sample_rate': sample_rate
         }
         
         self._queue_log('performance_metrics', data)
@@ -288,13 +686,16 @@ class BigQueryLogger:
                            clicked_position: Optional[int] = None,
                            user_id: Optional[int] = None):
         """Log search analytics"""
+        sample_rate = self._sample_rate('search_analytics', duration_ms=response_time_ms)
+        if sample_rate is None:
+            return
         data = {
             'search_id': str(uuid.uuid4()),
             'user_id': user_id,
             'session_id': getattr(g, 'session_id', None),
             'search_query': search_query,
             'search_type': search_type,
-            'filters_applied': json.dumps(filters_applied) if filters_applied else None,
+            'filters_applied': dumps_text(filters_applied) if filters_applied else None,
             'results_count': results_count,
             'page_number': filters_applied.get('page', 1) if filters_applied else 1,
             'results_per_page': filters_applied.get('per_page', 10) if filters_applied else 10,
@@ -304,7 +705,8 @@ class BigQueryLogger:
             'location_city': filters_applied.get('city') if filters_applied else None,
             'location_district': filters_applied.get('district') if filters_applied else None,
             'platform': self._detect_platform(),
-            'timestamp': datetime.utcnow().isoformat() + 'Z'
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'sample_rate': sample_rate
         }
         
         self._queue_log('search_analytics', data)
@@ -332,7 +734,7 @@ class BigQueryLogger:
             'currency': 'TL',
             'status': status,
             'provider': provider,
-            'provider_response': json.dumps(provider_response) if provider_response else None,
+            'provider_response': dumps_text(provider_response) if provider_response else None,
             'failure_reason': failure_reason,
             'processing_time_ms': processing_time_ms,
             'ip_address': request.remote_addr if request else None,
@@ -348,27 +750,19 @@ class BigQueryLogger:
         """Detect device type from user agent"""
         if not request:
             return None
-        
-        user_agent = request.headers.get('User-Agent', '').lower()
-        if 'mobile' in user_agent or 'android' in user_agent or 'iphone' in user_agent:
-            return 'mobile'
-        elif 'tablet' in user_agent or 'ipad' in user_agent:
-            return 'tablet'
-        else:
-            return 'desktop'
+        context = current_context()
+        if context is not None:
+            return context.device_type
+        return classify_user_agent(request.headers.get('User-Agent', ''))[1]
 
     def _detect_platform(self) -> Optional[str]:
         """Detect platform from user agent or headers"""
         if not request:
             return None
-        
-        user_agent = request.headers.get('User-Agent', '').lower()
-        if 'android' in user_agent:
-            return 'android'
-        elif 'iphone' in user_agent or 'ipad' in user_agent:
-            return 'ios'
-        else:
-            return 'web'
+        context = current_context()
+        if context is not None:
+            return context.platform
+        return classify_user_agent(request.headers.get('User-Agent', ''))[0]
 
     def _get_device_info(self) -> Dict[str, Any]:
         """Get device information"""
@@ -429,38 +823,6 @@ def log_performance(func):
     
     return wrapper
 
-# Middleware for automatic user activity logging
-def init_bigquery_middleware(app):
-    """Initialize BigQuery logging middleware"""
-    
-    @app.before_request
-    def before_request():
-        g.start_time = time.time()
-        g.session_id = request.headers.get('X-Session-ID', str(uuid.uuid4()))
-    
-    @app.after_request
-    def after_request(response):
-        if hasattr(g, 'start_time'):
-            duration_ms = int((time.time() - g.start_time) * 1000)
-            
-            # Log user activity
-            bigquery_logger.log_user_activity(
-                action_type=request.method,
-                action_category='API',
-                user_id=getattr(g, 'current_user_id', None),
-                success=200 <= response.status_code < 400,
-                duration_ms=duration_ms,
-                action_details={
-                    'endpoint': request.endpoint,
-                    'status_code': response.status_code,
-                    'content_length': response.content_length
-                }
-            )
-        
-        return response
-    
-    logger.info("BigQuery middleware initialized")
-
 # Convenience functions for common logging scenarios
 def log_user_login(user_id: int, success: bool, error_message: Optional[str] = None):
     """Log user login attempt"""
@@ -0,0 +1,451 @@
+"""Bounded application cache with single-flight loading and a shared tier.
+
+``CacheManager`` used to be a class-level dict with no size limit, no locking
+and only lazy TTL checks, and ``cache_response`` stored whole Flask response
+objects keyed by ``hash(str(args))``. This module replaces both:
+
+* ``LocalLRU`` is a size-bounded, thread-safe LRU whose entries also expire
+  after a TTL;
+* ``Cache`` puts an optional shared backend (Redis, or ``FakeRedis`` in
+  tests) behind the local tier and loads missing keys single-flight: when
+  several threads miss the same key at once, one of them runs the loader and
+  the others wait for its result;
+* hits, misses, evictions, expirations and loads are counted for ``stats()``.
+
+Values written to the shared tier must be JSON serializable; anything else
+stays process-local.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from flask import Response, current_app, has_request_context, request
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_KEY_PREFIX = 'ustam:cache:'
+
+# After a shared backend error, requests skip it for this long
+SHARED_RETRY_SECONDS = 30
+
+# How long a waiting thread trusts an in-flight load before loading itself
+LOAD_WAIT_SECONDS = 30
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe LRU of at most ``max_entries`` items with per-entry TTL."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max(1, int(max_entries))
+        self._clock = clock
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, default=_MISSING):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        expires_at = self._clock() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FakeRedis:
+    """In-memory stand-in for the subset of the redis client the cache uses."""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._data: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def ping(self):
+        return True
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= self._clock():
+                del self._data[name]
+                return None
+            return entry[0]
+
+    def set(self, name, value, ex=None):
+        with self._lock:
+            self._data[name] = (value, self._clock() + ex if ex else None)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(1 for name in names if self._data.pop(name, None) is not None)
+
+    def scan_iter(self, match=None):
+        prefix = match[:-1] if match and match.endswith('*') else match
+        with self._lock:
+            names = list(self._data)
+        return iter([name for name in names if prefix is None or name.startswith(prefix)])
+
+
+class RedisBackend:
+    """Shared cache tier on a Redis (or ``FakeRedis``) client.
+
+    Values are stored as JSON under ``prefix`` together with their expiry,
+    so other processes keep a local copy no longer than the shared one.
+    Backend errors are logged and treated as misses; the backend is then
+    skipped for ``SHARED_RETRY_SECONDS``.
+    """
+
+    def __init__(self, client, prefix: str = DEFAULT_KEY_PREFIX):
+        self.client = client
+        self.prefix = prefix
+        self.errors = 0
+        self._retry_at = 0.0
+
+    @property
+    def available(self) -> bool:
+        return time.time() >= self._retry_at
+
+    def _failed(self, action: str, exc: Exception):
+        self.errors += 1
+        self._retry_at = time.time() + SHARED_RETRY_SECONDS
+        logger.warning("Shared cache %s failed, using the local cache only: %s", action, exc)
+
+    def get(self, key: str, default=_MISSING):
+        """``(value, remaining_ttl)`` for ``key``, or ``default``."""
+        if not self.available:
+            return default
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception as exc:  # pragma: no cover - network dependency
+            self._failed('read', exc)
+            return default
+        if raw is None:
+            return default
+        try:
+            envelope = json.loads(raw)
+            value, expires_at = envelope['v'], envelope['e']
+        except (TypeError, ValueError, KeyError):
+            return default
+        if expires_at is None:
+            return value, None
+        remaining = expires_at - time.time()
+        return (value, remaining) if remaining > 0 else default
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        if not self.available:
+            return
+        try:
+            raw = json.dumps({'v': value, 'e': time.time() + ttl if ttl else None}, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return  # Not shareable; the local tier still has it
+        try:
+            self.client.set(self.prefix + key, raw, ex=max(1, int(math.ceil(ttl))) if ttl else None)
+        except Exception as exc:  # pragma: no cover - network dependency
+            self._failed('write', exc)
+
+    def delete(self, key: str):
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception as exc:  # pragma: no cover - network dependency
+            self._failed('delete', exc)
+
+    def clear(self):
+        try:
+            names = list(self.client.scan_iter(match=self.prefix + '*'))
+            if names:
+                self.client.delete(*names)
+        except Exception as exc:  # pragma: no cover - network dependency
+            self._failed('clear', exc)
+
+
+class _Flight:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class Cache:
+    """Local LRU tier, optional shared tier and single-flight loading."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, default_ttl: float = DEFAULT_TTL_SECONDS,
+                 shared: Optional[RedisBackend] = None):
+        self.default_ttl = default_ttl
+        self.local = LocalLRU(max_entries)
+        self.shared = shared
+        self._flights: Dict[str, _Flight] = {}
+        self._flights_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._counters = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'loads': 0, 'load_errors': 0, 'coalesced': 0}
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._counters[name] += 1
+
+    def _lookup(self, key: str):
+        value = self.local.get(key)
+        if value is not _MISSING:
+            self._count('hits')
+            return value
+        if self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not _MISSING:
+                self._count('shared_hits')
+                value, remaining = entry
+                self.local.set(key, value, remaining)
+                return value
+        self._count('misses')
+        return _MISSING
+
+    def get(self, key: str, default=None):
+        value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def set(self, key: str, value, ttl: Optional[float] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+
+    def delete(self, key: str):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: Optional[float] = None):
+        """Cached value for ``key``, calling ``loader`` at most once per miss.
+
+        Concurrent callers missing the same key wait for the first caller's
+        load; if it raises, they all see the exception.
+        """
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return value
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self._count('coalesced')
+            if flight.done.wait(LOAD_WAIT_SECONDS):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.value
+            return loader()
+
+        try:
+            self._count('loads')
+            flight.value = loader()
+            self.set(key, flight.value, ttl)
+            return flight.value
+        except BaseException as exc:
+            self._count('load_errors')
+            flight.error = exc
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['shared_hits'] + counters['misses']
+        counters.update({
+            'size': len(self.local),
+            'max_entries': self.local.max_entries,
+            'evictions': self.local.evictions,
+            'expirations': self.local.expirations,
+            'hit_rate': round((counters['hits'] + counters['shared_hits']) / lookups, 4) if lookups else None,
+            'shared': self.shared is not None,
+            'shared_errors': self.shared.errors if self.shared is not None else 0,
+        })
+        return counters
+
+
+_cache: Optional[Cache] = None
+_cache_lock = threading.Lock()
+
+
+def _build_cache(app=None) -> Cache:
+    config = app.config if app is not None else {}
+    redis_url = config.get('CACHE_REDIS_URL') or os.environ.get('CACHE_REDIS_URL')
+
+    shared = None
+    if redis_url and redis:
+        try:
+            client = redis.Redis.from_url(redis_url)
+            client.ping()
+            shared = RedisBackend(client, config.get('CACHE_KEY_PREFIX', DEFAULT_KEY_PREFIX))
+            logger.info("Application cache using a shared Redis tier at %s", redis_url)
+        except Exception as exc:  # pragma: no cover - network dependency
+            logger.warning("Failed to connect to Redis for caching: %s", exc)
+    elif redis_url and not redis:
+        logger.warning(
+            "Redis URL provided for caching but redis package is not installed. "
+            "Using the local cache only."
+        )
+
+    return Cache(
+        max_entries=int(config.get('CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+        default_ttl=float(config.get('CACHE_DEFAULT_TTL_SECONDS', DEFAULT_TTL_SECONDS)),
+        shared=shared,
+    )
+
+
+def get_cache() -> Cache:
+    """The process-wide cache, configured from the current app on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    app = current_app._get_current_object()  # type: ignore[attr-defined]
+                except RuntimeError:
+                    app = None
+                _cache = _build_cache(app)
+    return _cache
+
+
+def configure_cache(cache: Optional[Cache]):
+    """Replace the process-wide cache (e.g. with a ``FakeRedis`` backed one in tests)."""
+    global _cache
+    with _cache_lock:
+        _cache = cache
+
+
+class CacheManager:
+    """Key/value access to the process-wide cache."""
+
+    @classmethod
+    def get(cls, key):
+        """Get cached value if not expired"""
+        return get_cache().get(key)
+
+    @classmethod
+    def set(cls, key, value, ttl=DEFAULT_TTL_SECONDS):
+        """Set cached value with TTL"""
+        get_cache().set(key, value, ttl)
+
+    @classmethod
+    def delete(cls, key):
+        """Delete cached value"""
+        get_cache().delete(key)
+
+    @classmethod
+    def clear(cls):
+        """Clear all cache"""
+        get_cache().clear()
+
+
+def _call_key(f, args, kwargs) -> str:
+    return f"call:{f.__module__}.{f.__qualname__}:{json.dumps([repr(arg) for arg in args])}:" \
+           f"{json.dumps({key: repr(value) for key, value in kwargs.items()}, sort_keys=True)}"
+
+
+def _request_key(f) -> str:
+    query = sorted(request.args.items(multi=True))
+    return f"view:{f.__module__}.{f.__qualname__}:{request.path}?{json.dumps(query, ensure_ascii=False)}"
+
+
+def cache_response(ttl=DEFAULT_TTL_SECONDS):
+    """Decorator to cache API responses.
+
+    Inside a request, successful GET responses are cached per path and query
+    string as status/body/mimetype (not as response objects); requests
+    carrying credentials are never cached. Outside a request the return value
+    is memoized per call arguments.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            cache = get_cache()
+            if not has_request_context():
+                return cache.get_or_load(_call_key(f, args, kwargs), lambda: f(*args, **kwargs), ttl)
+
+            if request.method != 'GET' or request.headers.get('Authorization'):
+                return f(*args, **kwargs)
+
+            produced = []
+
+            def load():
+                response = current_app.make_response(f(*args, **kwargs))
+                produced.append(response)
+                if response.status_code != 200 or response.direct_passthrough:
+                    raise _Uncacheable()
+                return {
+                    'status': response.status_code,
+                    'body': response.get_data(as_text=True),
+                    'mimetype': response.mimetype,
+                }
+
+            try:
+                payload = cache.get_or_load(_request_key(f), load, ttl)
+            except _Uncacheable:
+                if produced:
+                    return produced[0]
+                return f(*args, **kwargs)  # Another request's load was not cacheable
+            if produced:
+                return produced[0]
+            return Response(payload['body'], status=payload['status'], mimetype=payload['mimetype'])
+
+        return decorated_function
+    return decorator
+
+
+class _Uncacheable(Exception):
+    """Raised inside a load to hand a non-cacheable response back uncached."""
@@ -0,0 +1,294 @@
+"""Response compression negotiated from Accept-Encoding.
+
+None of the JSON APIs used to be compressed, although search, full_sync and
+dashboard payloads run to hundreds of KB over cellular links. An
+``after_request`` stage now compresses responses when:
+
+* the client accepts ``br`` (if the brotli package is installed) or ``gzip``;
+* the mimetype is on the allowlist (JSON, text, XML, JS, SVG) - images,
+  archives and other already-compressed files pass through untouched, as
+  does anything that already carries a ``Content-Encoding`` (e.g. the
+  precompressed legal documents) or ``Cache-Control: no-transform``;
+* the body is at least ``COMPRESSION_MIN_SIZE`` bytes; smaller bodies gain
+  less than the header overhead.
+
+Buffered bodies up to ``CACHE_MAX_BODY`` bytes keep their compressed form in
+a small LRU keyed by content digest, so repeated payloads (cached listings,
+sitemap shards) are compressed once. Streamed responses and bodies above
+``STREAM_MIN_SIZE`` are compressed incrementally as they are written.
+Compressed/skipped counts, bytes in and out and the resulting ratio are
+available from ``stats()``.
+"""
+
+import gzip
+import hashlib
+import logging
+import threading
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+from flask import request
+
+from app.utils.cache import LocalLRU
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_GZIP_LEVEL = 6
+# Quality 4-5 is brotli's sweet spot for dynamic content; 11 is for static assets
+DEFAULT_BROTLI_QUALITY = 5
+
+DEFAULT_MIMETYPES = (
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/xhtml+xml',
+    'application/rss+xml',
+    'application/manifest+json',
+    'image/svg+xml',
+    'text/html',
+    'text/plain',
+    'text/css',
+    'text/csv',
+    'text/xml',
+    'text/javascript',
+)
+
+# Buffered bodies at least this large are compressed while being written
+STREAM_MIN_SIZE = 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BODY = 512 * 1024
+
+# Statuses whose body must not be re-encoded (no body, or a byte range)
+_SKIP_STATUSES = (204, 206, 304)
+
+
+def _available_encodings():
+    # Server preference order for ties in the client's q-values
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class _Compressor:
+    """Incremental compressor with a uniform compress/flush interface."""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == 'br':
+            self._engine = brotli.Compressor(quality=brotli_quality)
+            self._compress = self._engine.process
+            self._finish = self._engine.finish
+        else:
+            # wbits=31 writes a gzip header and trailer around the deflate stream
+            self._engine = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._compress = self._engine.compress
+            self._finish = self._engine.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+def compress_bytes(data: bytes, encoding: str, gzip_level: int = DEFAULT_GZIP_LEVEL,
+                   brotli_quality: int = DEFAULT_BROTLI_QUALITY) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.compressed = 0
+        self.streamed = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.by_encoding: Dict[str, int] = {}
+        self.skipped: Dict[str, int] = {}
+
+    def skip(self, reason: str):
+        with self._lock:
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int, streamed: bool = False, cache_hit: bool = False):
+        with self._lock:
+            self.compressed += 1
+            self.streamed += int(streamed)
+            self.cache_hits += int(cache_hit)
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.by_encoding[encoding] = self.by_encoding.get(encoding, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'compressed': self.compressed,
+                'streamed': self.streamed,
+                'cache_hits': self.cache_hits,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+                'by_encoding': dict(self.by_encoding),
+                'skipped': dict(self.skipped),
+            }
+
+
+_stats = _Stats()
+
+
+def stats() -> dict:
+    """Compression counters for this process; ``ratio`` is bytes out / bytes in."""
+    return _stats.snapshot()
+
+
+class ResponseCompressor:
+    """The after_request compression stage; see the module docstring."""
+
+    def __init__(self, min_size: int = DEFAULT_MIN_SIZE, mimetypes: Iterable[str] = DEFAULT_MIMETYPES,
+                 gzip_level: int = DEFAULT_GZIP_LEVEL, brotli_quality: int = DEFAULT_BROTLI_QUALITY,
+                 stream_min_size: int = STREAM_MIN_SIZE):
+        self.min_size = int(min_size)
+        self.mimetypes = frozenset(mimetypes)
+        self.gzip_level = int(gzip_level)
+        self.brotli_quality = int(brotli_quality)
+        self.stream_min_size = int(stream_min_size)
+        self.encodings = _available_encodings()
+        self._cache = LocalLRU(CACHE_MAX_ENTRIES)
+
+    def _skip_reason(self, response) -> Optional[str]:
+        if request.method == 'HEAD' or response.status_code < 200 or response.status_code in _SKIP_STATUSES:
+            return 'status'
+        if 'Content-Encoding' in response.headers or 'Content-Range' in response.headers:
+            return 'encoded'
+        if 'no-transform' in response.headers.get('Cache-Control', ''):
+            return 'no_transform'
+        if response.mimetype not in self.mimetypes:
+            return 'mimetype'
+        return None
+
+    def process(self, response):
+        reason = self._skip_reason(response)
+        if reason is not None:
+            if reason != 'status':
+                _stats.skip(reason)
+            return response
+
+        # Compressible types vary on Accept-Encoding whichever encoding this client gets
+        response.vary.add('Accept-Encoding')
+
+        content_length = response.content_length
+        if content_length is not None and content_length < self.min_size:
+            _stats.skip('small')
+            return response
+
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            _stats.skip('not_accepted')
+            return response
+
+        if response.is_streamed or (content_length or 0) >= self.stream_min_size:
+            self._compress_streamed(response, encoding)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                _stats.skip('small')
+                return response
+            response.set_data(self._compress_buffered(data, encoding))
+
+        response.headers['Content-Encoding'] = encoding
+        # The encoded bytes differ from the identity representation
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _compress_buffered(self, data: bytes, encoding: str) -> bytes:
+        key = None
+        if len(data) <= CACHE_MAX_BODY:
+            key = encoding + ':' + hashlib.blake2b(data, digest_size=16).hexdigest()
+            compressed = self._cache.get(key, None)
+            if compressed is not None:
+                _stats.record(encoding, len(data), len(compressed), cache_hit=True)
+                return compressed
+
+        compressed = compress_bytes(data, encoding, self.gzip_level, self.brotli_quality)
+        if key is not None:
+            self._cache.set(key, compressed)
+        _stats.record(encoding, len(data), len(compressed))
+        return compressed
+
+    def _compress_streamed(self, response, encoding: str):
+        source = response.response
+        if hasattr(source, 'close'):
+            # Our generator replaces the body, so close the original (e.g. a file) ourselves
+            response.call_on_close(source.close)
+        if isinstance(source, (list, tuple)):
+            source = self._chunked(source)
+        response.response = self._stream(source, encoding)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+
+    @staticmethod
+    def _chunked(parts) -> Iterator[bytes]:
+        for part in parts:
+            for offset in range(0, len(part), STREAM_CHUNK_SIZE):
+                yield part[offset:offset + STREAM_CHUNK_SIZE]
+
+    def _stream(self, source, encoding: str) -> Iterator[bytes]:
+        compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+        bytes_in = bytes_out = 0
+        for chunk in source:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            bytes_in += len(chunk)
+            output = compressor.compress(chunk)
+            if output:
+                bytes_out += len(output)
+                yield output
+        output = compressor.finish()
+        bytes_out += len(output)
+        _stats.record(encoding, bytes_in, bytes_out, streamed=True)
+        yield output
+
+
+def init_compression(app):
+    """Register the compression stage.
+
+    Call before other middleware: after_request hooks run in reverse
+    registration order, so this one then sees the final body and headers.
+    """
+    if not app.config.get('COMPRESSION_ENABLED', True):
+        logger.info("Response compression disabled")
+        return None
+
+    mimetypes = app.config.get('COMPRESSION_MIMETYPES') or DEFAULT_MIMETYPES
+    if isinstance(mimetypes, str):
+        mimetypes = [mimetype.strip() for mimetype in mimetypes.split(',') if mimetype.strip()]
+    compressor = ResponseCompressor(
+        min_size=app.config.get('COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE),
+        mimetypes=mimetypes,
+        gzip_level=app.config.get('COMPRESSION_GZIP_LEVEL', DEFAULT_GZIP_LEVEL),
+        brotli_quality=app.config.get('COMPRESSION_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY),
+    )
+
+    @app.after_request
+    def compress_response(response):
+        try:
+            return compressor.process(response)
+        except Exception as exc:  # pragma: no cover - never fail a request over compression
+            logger.error("Response compression failed: %s", exc)
+            return response
+
+    logger.info("Response compression initialized (%s)", ', '.join(compressor.encodings))
+    return compressor
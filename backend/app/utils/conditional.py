@@ -0,0 +1,131 @@
+"""Conditional GET support (ETag / Last-Modified / 304) for profile endpoints.
+
+Craftsman profiles are re-opened constantly by the mobile app, and every hit
+used to rebuild and reserialize the whole profile including recent jobs and
+reviews. A profile's version is now read with one cheap query - the
+craftsman and user ``updated_at`` plus, for the business profile, the latest
+review and completed job timestamps and counts - and ``conditional_get``
+answers ``If-None-Match`` / ``If-Modified-Since`` with a 304 before the view
+runs its heavy queries.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Callable, NamedTuple, Optional
+
+from flask import make_response, request
+from sqlalchemy import func, select
+
+from app import db
+from app.models.craftsman import Craftsman
+from app.models.job import Job, JobStatus
+from app.models.review import Review
+from app.models.user import User
+
+# Bump when a profile's JSON shape changes so clients refetch
+REPRESENTATION_VERSION = 1
+
+# Clients may keep a copy but must revalidate it before every use
+CACHE_CONTROL = 'no-cache'
+
+
+class ResourceVersion(NamedTuple):
+    etag: str
+    last_modified: Optional[datetime]
+
+
+def make_version(namespace: str, *parts) -> ResourceVersion:
+    """Weak ETag over ``parts``; the newest datetime among them is Last-Modified."""
+    digest = hashlib.sha1(
+        '|'.join([namespace, str(REPRESENTATION_VERSION)] + [str(part) for part in parts]).encode('utf-8')
+    ).hexdigest()[:20]
+    timestamps = [part for part in parts if isinstance(part, datetime)]
+    last_modified = max(timestamps).replace(tzinfo=timezone.utc, microsecond=0) if timestamps else None
+    return ResourceVersion(f'W/"{digest}"', last_modified)
+
+
+def craftsman_profile_version(craftsman_id: int, with_activity: bool = False) -> Optional[ResourceVersion]:
+    """Version of a craftsman profile, or None if there is no such craftsman.
+
+    ``with_activity`` adds the latest review and completed job (timestamps and
+    counts, so deletions change the version too).
+    """
+    columns = [Craftsman.updated_at, User.updated_at, User.is_active]
+    if with_activity:
+        columns += [
+            select(func.max(Review.updated_at)).where(Review.craftsman_id == Craftsman.id).scalar_subquery(),
+            select(func.count(Review.id)).where(Review.craftsman_id == Craftsman.id).scalar_subquery(),
+            select(func.max(Job.updated_at)).where(
+                Job.craftsman_id == Craftsman.user_id, Job.status == JobStatus.COMPLETED
+            ).scalar_subquery(),
+            select(func.count(Job.id)).where(
+                Job.craftsman_id == Craftsman.user_id, Job.status == JobStatus.COMPLETED
+            ).scalar_subquery(),
+        ]
+    row = db.session.query(*columns).select_from(Craftsman).join(
+        User, User.id == Craftsman.user_id
+    ).filter(Craftsman.id == craftsman_id).first()
+    if row is None:
+        return None
+    return make_version(f'craftsman:{craftsman_id}:{int(with_activity)}', *row)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # Weak comparison (RFC 9110 8.8.3.2): opaque tags equal, W/ ignored
+    if header.strip() == '*':
+        return True
+    wanted = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
+
+
+def is_not_modified(version: ResourceVersion) -> bool:
+    """Whether the request's validators still match ``version``.
+
+    ``If-None-Match`` takes precedence; ``If-Modified-Since`` is only used
+    when no ETag was sent.
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return _etag_matches(if_none_match, version.etag)
+    if_modified_since = request.if_modified_since
+    if if_modified_since and version.last_modified:
+        return version.last_modified <= if_modified_since
+    return False
+
+
+def set_validators(response, version: ResourceVersion):
+    response.headers['ETag'] = version.etag
+    if version.last_modified:
+        response.last_modified = version.last_modified
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def conditional_get(version_of: Callable[..., Optional[ResourceVersion]]):
+    """Decorator answering conditional GETs from ``version_of(**view_args)``.
+
+    When the version cannot be determined (e.g. unknown id) the view runs
+    normally and produces its own error response. Successful responses get
+    ``ETag``, ``Last-Modified`` and ``Cache-Control`` headers.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            version = version_of(**kwargs)
+            if version is None:
+                return f(*args, **kwargs)
+            if is_not_modified(version):
+                return set_validators(make_response('', 304), version)
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                set_validators(response, version)
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,124 @@
+"""Cached row counts for paginated listing endpoints.
+
+Paginated endpoints used to run an exact ``COUNT(*)`` on every page request.
+Totals are now cached per normalized filter signature with a TTL, and
+invalidated as soon as this process commits a write to one of the tables the
+count depends on. Writes made by other processes are bounded by the TTL,
+which is why responses served from the cache are flagged as approximate.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 60
+MAX_ENTRIES = 2048
+
+_PENDING_TABLES_KEY = 'count_cache_pending_tables'
+
+_lock = threading.Lock()
+_entries: Dict[str, Tuple[int, float, Tuple[int, ...], Tuple[str, ...]]] = {}
+_table_generations: Dict[str, int] = {}
+
+
+def count_signature(namespace: str, filters: Optional[dict] = None) -> str:
+    """Build a stable cache key from an endpoint namespace and its filters.
+
+    Empty filter values are dropped and keys are sorted, so requests that only
+    differ in parameter order, pagination or blank parameters share an entry.
+    """
+    items = sorted(
+        (key, str(value)) for key, value in (filters or {}).items()
+        if value is not None and value != '' and value != []
+    )
+    return namespace + '?' + '&'.join(f"{key}={value}" for key, value in items)
+
+
+def _ttl() -> int:
+    try:
+        return int(current_app.config.get('COUNT_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+    except RuntimeError:
+        return DEFAULT_TTL_SECONDS
+
+
+def _generations(tables: Tuple[str, ...]) -> Tuple[int, ...]:
+    return tuple(_table_generations.get(table, 0) for table in tables)
+
+
+def cached_count(namespace: str, filters: Optional[dict], query,
+                 tables: Iterable[str]) -> Tuple[int, bool]:
+    """Return ``(total, approximate)`` for ``query``.
+
+    ``approximate`` is True when the total was served from the cache rather
+    than counted for this request.
+    """
+    key = count_signature(namespace, filters)
+    tables = tuple(sorted(tables))
+    now = time.time()
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            total, expires_at, generations, _ = entry
+            if expires_at > now and generations == _generations(tables):
+                return total, True
+            del _entries[key]
+        generations = _generations(tables)
+
+    total = query.order_by(None).count()
+
+    with _lock:
+        # A write committed while we were counting makes this total stale
+        if generations == _generations(tables):
+            if len(_entries) >= MAX_ENTRIES:
+                _entries.pop(next(iter(_entries)))
+            _entries[key] = (total, now + _ttl(), generations, tables)
+
+    return total, False
+
+
+def invalidate_tables(*tables: str):
+    """Drop cached counts that depend on any of ``tables``."""
+    with _lock:
+        for table in tables:
+            _table_generations[table] = _table_generations.get(table, 0) + 1
+        for key in [key for key, entry in _entries.items() if set(entry[3]) & set(tables)]:
+            del _entries[key]
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def stats() -> dict:
+    with _lock:
+        return {'entries': len(_entries), 'max_entries': MAX_ENTRIES}
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_written_tables(session, flush_context):
+    tables = session.info.setdefault(_PENDING_TABLES_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            tables.add(table)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_written_tables(session):
+    tables = session.info.pop(_PENDING_TABLES_KEY, None)
+    if tables:
+        invalidate_tables(*tables)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_written_tables(session):
+    session.info.pop(_PENDING_TABLES_KEY, None)
@@ -0,0 +1,293 @@
+"""Base class for in-process views derived from craftsman rows.
+
+Search indexes and facet counts both keep a per-craftsman projection of a few
+``craftsmen``/``users`` columns in memory. This module owns the shared
+plumbing so each view only has to say which columns it needs and how to apply
+a change:
+
+* the view is built lazily from one projected ``craftsmen JOIN users`` query;
+* ORM flushes in this process are captured by session events and applied to
+  every built view once the transaction commits;
+* writes made by other processes (other gunicorn workers, scripts) are picked
+  up by a periodic delta sync on ``updated_at``. Deletions leave no
+  ``updated_at`` behind, so the sync also compares the count and sum of ids
+  with the database; on a mismatch the id lists are reconciled, dropping
+  deleted craftsmen and loading rows the delta missed.
+"""
+
+import logging
+from abc import ABC, abstractmethod
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, func, inspect, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.base import NO_VALUE
+
+from app import db
+from app.models.craftsman import Craftsman
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Seconds between delta syncs picking up writes made by other processes
+SYNC_INTERVAL_SECONDS = 30
+
+_PENDING_KEY = 'craftsman_projection_pending'
+_RECONCILE_CHUNK = 500
+_projections: List['CraftsmanProjection'] = []
+
+
+class CraftsmanProjection(ABC):
+    """In-memory view over selected craftsman and user columns.
+
+    Subclasses declare ``craftsman_columns``/``user_columns`` and implement
+    ``_apply``, ``_discard`` and ``_reset``. ``_apply`` receives ``None`` for
+    the side of the document that did not change.
+    """
+
+    name = 'craftsman projection'
+    craftsman_columns: Tuple[str, ...] = ()
+    user_columns: Tuple[str, ...] = ()
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._craftsman_ids: Set[int] = set()
+        self._user_to_craftsman: Dict[int, int] = {}
+        self._craftsman_to_user: Dict[int, int] = {}
+        self._built_for = None
+        self._synced_at = 0.0
+        self._high_water_mark = None
+        _projections.append(self)
+
+    # ------------------------------------------------------------------
+    # Subclass hooks
+    # ------------------------------------------------------------------
+    @abstractmethod
+    def _apply(self, craftsman_id: int, craftsman_values: Optional[dict], user_values: Optional[dict]):
+        """Insert or update the view's entry for ``craftsman_id``."""
+
+    @abstractmethod
+    def _discard(self, craftsman_id: int):
+        """Drop ``craftsman_id`` from the view."""
+
+    @abstractmethod
+    def _reset(self):
+        """Empty the view."""
+
+    def _begin_rebuild(self):
+        """Called before a full load; views can switch to bulk mode here."""
+
+    def _finish_rebuild(self):
+        """Called after a full load, also when it failed half way."""
+
+    # ------------------------------------------------------------------
+    # Mutation
+    # ------------------------------------------------------------------
+    @property
+    def is_built(self) -> bool:
+        return self._built_for is not None
+
+    @property
+    def size(self) -> int:
+        return len(self._craftsman_ids)
+
+    def craftsman_ids_for_users(self, user_ids: Iterable[int]) -> Set[int]:
+        with self._lock:
+            return {self._user_to_craftsman[user_id] for user_id in user_ids if user_id in self._user_to_craftsman}
+
+    def user_ids_for(self, craftsman_ids: Iterable[int]) -> Dict[int, int]:
+        with self._lock:
+            return {
+                craftsman_id: self._craftsman_to_user[craftsman_id]
+                for craftsman_id in craftsman_ids if craftsman_id in self._craftsman_to_user
+            }
+
+    def apply(self, craftsman_id: int, user_id: Optional[int] = None,
+              craftsman_values: Optional[dict] = None, user_values: Optional[dict] = None):
+        """Insert or update a craftsman; either side of the document may be omitted."""
+        with self._lock:
+            if user_id is not None:
+                self._user_to_craftsman[user_id] = craftsman_id
+                self._craftsman_to_user[craftsman_id] = user_id
+            self._craftsman_ids.add(craftsman_id)
+            self._apply(craftsman_id, craftsman_values, user_values)
+
+    def apply_user(self, user_id: int, user_values: dict):
+        """Update the user side of the craftsman owned by ``user_id``, if any."""
+        with self._lock:
+            craftsman_id = self._user_to_craftsman.get(user_id)
+            if craftsman_id is not None:
+                self._apply(craftsman_id, None, user_values)
+
+    def remove(self, craftsman_id: int):
+        """Drop a craftsman from the view."""
+        with self._lock:
+            if craftsman_id not in self._craftsman_ids:
+                return
+            self._discard(craftsman_id)
+            self._craftsman_ids.discard(craftsman_id)
+            user_id = self._craftsman_to_user.pop(craftsman_id, None)
+            if user_id is not None:
+                self._user_to_craftsman.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self._craftsman_ids.clear()
+            self._user_to_craftsman.clear()
+            self._craftsman_to_user.clear()
+            self._built_for = None
+            self._synced_at = 0.0
+            self._high_water_mark = None
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+    def _document_query(self):
+        columns = [Craftsman.id, Craftsman.user_id, Craftsman.updated_at]
+        columns += [getattr(Craftsman, column) for column in self.craftsman_columns]
+        columns += [getattr(User, column).label(f'user_{column}') for column in self.user_columns]
+        columns.append(User.updated_at.label('user_updated_at'))
+        return db.session.query(*columns).join(User, User.id == Craftsman.user_id)
+
+    def _load_rows(self, rows: Iterable):
+        for row in rows:
+            self.apply(
+                row.id,
+                user_id=row.user_id,
+                craftsman_values={column: getattr(row, column) for column in self.craftsman_columns},
+                user_values={column: getattr(row, f'user_{column}') for column in self.user_columns},
+            )
+            stamp = max(filter(None, [row.updated_at, row.user_updated_at]), default=None)
+            if stamp and (self._high_water_mark is None or stamp > self._high_water_mark):
+                self._high_water_mark = stamp
+
+    def rebuild(self):
+        """Load every craftsman with a single projected query."""
+        started = time.time()
+        with self._lock:
+            self.clear()
+            self._begin_rebuild()
+            try:
+                self._load_rows(self._document_query().yield_per(1000))
+            finally:
+                self._finish_rebuild()
+            self._built_for = str(db.engine.url)
+            self._synced_at = time.time()
+            logger.info(
+                "%s built: %s craftsmen in %.1f ms",
+                self.name, len(self._craftsman_ids), (time.time() - started) * 1000
+            )
+
+    def _is_fresh(self) -> bool:
+        """Built for the current database and synced within the interval (no lock needed)."""
+        return self._built_for == str(db.engine.url) and time.time() - self._synced_at < SYNC_INTERVAL_SECONDS
+
+    def sync(self, force: bool = False):
+        """Build the view on first use and apply writes made by other processes."""
+        if not force and self._is_fresh():
+            return
+        with self._lock:
+            if self._built_for != str(db.engine.url):
+                self.rebuild()
+                return
+            if not force and time.time() - self._synced_at < SYNC_INTERVAL_SECONDS:
+                return
+
+            self._synced_at = time.time()
+            if self._high_water_mark is not None:
+                self._load_rows(self._document_query().filter(or_(
+                    Craftsman.updated_at > self._high_water_mark,
+                    User.updated_at > self._high_water_mark,
+                )))
+            count, id_sum = db.session.query(
+                func.count(Craftsman.id), func.coalesce(func.sum(Craftsman.id), 0)
+            ).join(User, User.id == Craftsman.user_id).one()
+            if (count, id_sum) != (len(self._craftsman_ids), sum(self._craftsman_ids)):
+                self._reconcile_ids()
+
+    def _reconcile_ids(self):
+        """Drop craftsmen deleted elsewhere and load rows the delta sync missed."""
+        current = {
+            row.id for row in db.session.query(Craftsman.id).join(User, User.id == Craftsman.user_id)
+        }
+        deleted = self._craftsman_ids - current
+        for craftsman_id in deleted:
+            self.remove(craftsman_id)
+        missing = sorted(current - self._craftsman_ids)
+        for start in range(0, len(missing), _RECONCILE_CHUNK):
+            self._load_rows(self._document_query().filter(
+                Craftsman.id.in_(missing[start:start + _RECONCILE_CHUNK])
+            ))
+        logger.info("%s reconciled: %s deleted, %s missing", self.name, len(deleted), len(missing))
+
+
+# ----------------------------------------------------------------------
+# Incremental maintenance from ORM writes
+# ----------------------------------------------------------------------
+def _loaded(obj, attribute):
+    """Value of a relationship only if it is already loaded (no lazy load)."""
+    value = inspect(obj).attrs[attribute].loaded_value
+    return None if value is NO_VALUE else value
+
+
+def _columns(side: str) -> Set[str]:
+    return {column for projection in _projections for column in getattr(projection, side)}
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_projection_changes(session, flush_context):
+    if not _projections:
+        return
+    pending = session.info.setdefault(_PENDING_KEY, [])
+    craftsman_columns = _columns('craftsman_columns')
+    user_columns = _columns('user_columns')
+
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Craftsman) and obj.id is not None:
+            user = _loaded(obj, 'user')
+            pending.append((
+                'craftsman', obj.id, obj.user_id,
+                {column: getattr(obj, column) for column in craftsman_columns},
+                {column: getattr(user, column) for column in user_columns} if user is not None else None,
+            ))
+        elif isinstance(obj, User) and obj.id is not None and obj in session.dirty:
+            pending.append(('user', obj.id, {column: getattr(obj, column) for column in user_columns}))
+
+    for obj in session.deleted:
+        if isinstance(obj, Craftsman) and obj.id is not None:
+            pending.append(('remove', obj.id))
+
+
+def _subset(values: Optional[dict], columns: Tuple[str, ...]) -> Optional[dict]:
+    return None if values is None else {column: values[column] for column in columns}
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_projection_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+
+    for projection in _projections:
+        if not projection.is_built:
+            continue
+        for change in pending:
+            if change[0] == 'craftsman':
+                _, craftsman_id, user_id, craftsman_values, user_values = change
+                projection.apply(
+                    craftsman_id, user_id=user_id,
+                    craftsman_values=_subset(craftsman_values, projection.craftsman_columns),
+                    user_values=_subset(user_values, projection.user_columns),
+                )
+            elif change[0] == 'user':
+                projection.apply_user(change[1], _subset(change[2], projection.user_columns))
+            elif change[0] == 'remove':
+                projection.remove(change[1])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_projection_changes(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,405 @@
+"""Shared query engine for craftsman listings.
+
+``/api/search/craftsmen``, ``/api/v2/search/craftsmen``, the airbnb listing,
+``/api/craftsmen`` and ``CraftsmanService.get_all`` each built their own
+craftsman query with their own text matching, category handling (two of them
+referenced a ``Craftsman.categories`` relationship that does not exist),
+loading strategy and counting. They now describe what they want as a filter
+spec and this module compiles it:
+
+* filters are normalized (blank values dropped, types coerced) so equivalent
+  requests from any endpoint share a plan, a count cache entry and the same
+  SQL;
+* a plan - the predicate builders and sort keys for one combination of
+  filters - is looked up once per shape. The SQL itself is left to
+  SQLAlchemy's compiled statement cache: values are always bound parameters
+  (``IN`` lists expand), so requests of one shape share a cache entry;
+* text filters go through the inverted search index, distance sorting
+  through the geo index and categories through ``craftsman_categories``.
+  Small id sets become an ``IN`` list; large ones (broad queries) are bound
+  as a single array/JSON parameter the database expands, so they keep using
+  the index instead of an ``ILIKE`` scan;
+* results are either projected card rows (one SELECT, no ORM objects) or
+  craftsman entities with their user loaded by the same join, and the
+  categories of a page are loaded in one query.
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, any_, bindparam, func, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import contains_eager
+
+from app import db
+from app.models.category import Category
+from app.models.craftsman import Craftsman, craftsman_categories
+from app.models.user import User
+from app.utils.count_cache import cached_count
+from app.utils.geo_index import distance_column, parse_coordinates, rank_by_distance
+from app.utils.search_index import match_craftsman_ids
+from app.utils.validators import PaginationHelper
+
+logger = logging.getLogger(__name__)
+
+# Columns needed to render a search result card; selected directly so a page
+# costs one SELECT (plus the count) instead of one ORM load per row
+CARD_COLUMNS = (
+    Craftsman.id,
+    Craftsman.business_name,
+    Craftsman.description,
+    Craftsman.city,
+    Craftsman.district,
+    Craftsman.hourly_rate,
+    Craftsman.average_rating,
+    Craftsman.total_reviews,
+    Craftsman.is_available,
+    Craftsman.is_verified,
+    Craftsman.skills,
+    User.first_name,
+    User.last_name,
+)
+
+PROJECTIONS = ('card', 'entity')
+
+# Sort keys per sort option, in the requested sort order
+SORT_COLUMNS = {
+    'rating': (Craftsman.average_rating,),
+    'price': (Craftsman.hourly_rate,),
+    'reviews': (Craftsman.total_reviews,),
+    'name': (User.first_name, User.last_name),
+    'created': (Craftsman.created_at,),
+}
+# Sort options that carry their own directions and ignore sort_order
+FIXED_SORTS = {
+    'recommended': (
+        (Craftsman.is_verified, 'desc'),
+        (Craftsman.average_rating, 'desc'),
+        (Craftsman.total_reviews, 'desc'),
+    ),
+    # Distance without coordinates groups by city, A to Z
+    'distance': ((Craftsman.city, 'asc'),),
+}
+
+# Count cache namespace shared by every endpoint: a normalized spec has the
+# same total wherever it comes from
+COUNT_NAMESPACE = 'craftsman_query'
+
+MAX_CACHED_PLANS = 256
+
+# Id sets up to this size are bound one parameter per id (``IN`` list)
+INLINE_ID_LIMIT = 1000
+
+
+def _text(value) -> Optional[str]:
+    value = str(value).strip() if value is not None else ''
+    return value or None
+
+
+def _int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _bound(value) -> Optional[float]:
+    # Zero bounds never narrowed a listing (and the facet counts agree)
+    try:
+        return float(value) or None
+    except (TypeError, ValueError):
+        return None
+
+
+def _bool(value) -> Optional[bool]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+# Filter name -> normalizer; the order is the order predicates are applied
+FILTER_FIELDS: Dict[str, Callable] = {
+    'q': _text,
+    'category': _text,
+    'category_id': _int,
+    'city': _text,
+    'district': _text,
+    'min_rating': _bound,
+    'max_rating': _bound,
+    'min_price': _bound,
+    'max_price': _bound,
+    'is_verified': _bool,
+    'has_portfolio': _bool,
+    'is_available': _bool,
+}
+
+
+def normalize_filters(filters: Optional[dict]) -> Dict[str, object]:
+    """Known filters with blank values dropped and types coerced."""
+    normalized = {}
+    for name, normalize in FILTER_FIELDS.items():
+        value = normalize((filters or {}).get(name))
+        if value is not None:
+            normalized[name] = value
+    return normalized
+
+
+def id_filter(column, ids: Iterable[int]):
+    """``column IN ids`` that stays one bound parameter for large id sets.
+
+    PostgreSQL gets ``= ANY(:ids)`` with an integer array, SQLite a
+    ``json_each`` over a JSON array; either way the statement text does not
+    grow with the match count and stays under the bind-parameter limits.
+    """
+    ids = sorted(ids)
+    if len(ids) <= INLINE_ID_LIMIT:
+        return column.in_(ids)
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return column == any_(bindparam('matched_ids', ids, type_=ARRAY(Integer)))
+    if dialect == 'sqlite':
+        matched = func.json_each(json.dumps(ids)).table_valued('value')
+        return column.in_(select(matched.c.value))
+    return column.in_(ids)
+
+
+def _text_clause(value: str):
+    term = f'%{value}%'
+    return or_(
+        User.first_name.ilike(term),
+        User.last_name.ilike(term),
+        Craftsman.business_name.ilike(term),
+        Craftsman.description.ilike(term),
+        Craftsman.skills.ilike(term),
+    )
+
+
+def _category_clause(category_id: int):
+    return Craftsman.id.in_(
+        select(craftsman_categories.c.craftsman_id).where(craftsman_categories.c.category_id == category_id)
+    )
+
+
+def _portfolio_clause(has_portfolio: bool):
+    if has_portfolio:
+        return Craftsman.portfolio_images.isnot(None)
+    return Craftsman.portfolio_images.is_(None)
+
+
+# Filter name -> builder turning its (normalized) value into a WHERE clause.
+# q/category only use these when the search index cannot answer them.
+_PREDICATES: Dict[str, Callable] = {
+    'q': _text_clause,
+    'category': lambda value: Craftsman.skills.ilike(f'%{value}%'),
+    'category_id': _category_clause,
+    'city': lambda value: Craftsman.city == value,
+    'district': lambda value: Craftsman.district == value,
+    'min_rating': lambda value: Craftsman.average_rating >= value,
+    'max_rating': lambda value: Craftsman.average_rating <= value,
+    'min_price': lambda value: Craftsman.hourly_rate >= value,
+    'max_price': lambda value: Craftsman.hourly_rate <= value,
+    'is_verified': lambda value: Craftsman.is_verified == value,
+    'has_portfolio': _portfolio_clause,
+    'is_available': lambda value: Craftsman.is_available == value,
+}
+
+TEXT_FILTERS = ('q', 'category')
+
+
+class QueryPlan:
+    """Predicate builders and sort keys for one shape of craftsman query."""
+
+    __slots__ = ('shape', 'predicates', 'sort_keys', 'tables')
+
+    def __init__(self, shape: tuple):
+        fields, text_indexed, sort_by, sort_order, by_distance = shape
+        self.shape = shape
+        self.predicates: List[Tuple[str, Callable]] = [
+            (name, _PREDICATES[name]) for name in fields
+            if not (text_indexed and name in TEXT_FILTERS)
+        ]
+
+        if by_distance:
+            # The distance column only exists per request; see CraftsmanQuery
+            self.sort_keys = []
+        elif sort_by in FIXED_SORTS:
+            self.sort_keys = list(FIXED_SORTS[sort_by])
+        elif sort_by in SORT_COLUMNS:
+            self.sort_keys = [(column, sort_order) for column in SORT_COLUMNS[sort_by]]
+        elif sort_by:
+            self.sort_keys = [(Craftsman.created_at, 'desc')]
+        else:
+            self.sort_keys = []
+
+        self.tables = ('craftsmen', 'users') + (('craftsman_categories',) if 'category_id' in fields else ())
+
+
+_plans: 'OrderedDict[tuple, QueryPlan]' = OrderedDict()
+_plans_lock = threading.Lock()
+
+
+def plan_for(shape: tuple) -> QueryPlan:
+    """Return the memoized plan for ``shape``, building it on first use."""
+    with _plans_lock:
+        plan = _plans.get(shape)
+        if plan is not None:
+            _plans.move_to_end(shape)
+            return plan
+    plan = QueryPlan(shape)
+    with _plans_lock:
+        _plans[shape] = plan
+        while len(_plans) > MAX_CACHED_PLANS:
+            _plans.popitem(last=False)
+    return plan
+
+
+def card_from_row(row) -> dict:
+    """Build a search result card from a projected row"""
+    skills_list = []
+    try:
+        if row.skills:
+            skills_list = json.loads(row.skills) if isinstance(row.skills, str) else row.skills
+    except (json.JSONDecodeError, TypeError):
+        skills_list = []
+
+    card = {
+        'id': row.id,
+        'name': f"{row.first_name} {row.last_name}",
+        'business_name': row.business_name,
+        'description': row.description,
+        'city': row.city,
+        'district': row.district,
+        'hourly_rate': float(row.hourly_rate) if row.hourly_rate else 0,
+        'average_rating': float(row.average_rating) if row.average_rating else 0,
+        'total_reviews': row.total_reviews or 0,
+        'is_available': row.is_available,
+        'is_verified': row.is_verified,
+        'avatar': None,  # Remove avatar since files don't exist
+        'specialties': skills_list,  # Use skills instead of specialties
+        'portfolio_images': [],  # Remove portfolio images to prevent loading errors
+    }
+    if 'distance' in row._fields:
+        card['distance'] = round(row.distance, 2) if row.distance is not None else None
+    return card
+
+
+def categories_for(craftsman_ids: Iterable[int]) -> Dict[int, List[Category]]:
+    """Categories of each craftsman in ``craftsman_ids``, loaded in one query."""
+    craftsman_ids = list(craftsman_ids)
+    grouped: Dict[int, List[Category]] = defaultdict(list)
+    if not craftsman_ids:
+        return grouped
+    rows = db.session.query(craftsman_categories.c.craftsman_id, Category).join(
+        Category, Category.id == craftsman_categories.c.category_id
+    ).filter(craftsman_categories.c.craftsman_id.in_(craftsman_ids)).order_by(Category.sort_order, Category.id)
+    for craftsman_id, category in rows:
+        grouped[craftsman_id].append(category)
+    return grouped
+
+
+class CraftsmanQuery:
+    """A craftsman listing described by filters, sort and projection.
+
+    ``projection`` is ``'card'`` (rows with ``CARD_COLUMNS`` plus
+    ``extra_columns``) or ``'entity'`` (``Craftsman`` objects with their user
+    populated from the join). Inactive users are never listed.
+    ``sort_by='distance'`` with coordinates restricts the listing to the
+    nearest craftsmen within ``radius_km`` and orders by distance (nearest
+    first unless ``distance_order`` says otherwise).
+    """
+
+    def __init__(self, filters: Optional[dict] = None, sort_by: Optional[str] = None,
+                 sort_order: str = 'desc', latitude=None, longitude=None,
+                 radius_km: Optional[float] = None, projection: str = 'card',
+                 extra_columns: Tuple = (), distance_order: str = 'asc'):
+        if projection not in PROJECTIONS:
+            raise ValueError(f'Unknown projection: {projection}')
+        self.filters = normalize_filters(filters)
+        self.projection = projection
+        self.extra_columns = tuple(extra_columns)
+
+        # Text filters are answered by the inverted index when it can narrow
+        # the candidates; otherwise they fall back to ILIKE predicates
+        self.matched_ids = match_craftsman_ids(self.filters.get('q'), self.filters.get('category'))
+        text_indexed = self.matched_ids is not None
+
+        coordinates = parse_coordinates(latitude, longitude)
+        self.by_distance = sort_by == 'distance' and coordinates is not None
+        self.distances: Dict[int, float] = {}
+        self._distance = None
+        if self.by_distance:
+            matches = rank_by_distance(coordinates, radius_km, self.matched_ids)
+            self.distances = dict(matches)
+            self.matched_ids = set(self.distances)
+            self._distance = distance_column(matches)
+
+        self.plan = plan_for((
+            tuple(self.filters), text_indexed, sort_by,
+            sort_order if sort_order in ('asc', 'desc') else 'desc', self.by_distance,
+        ))
+        self.sort_keys = [(self._distance, distance_order)] if self.by_distance else self.plan.sort_keys
+
+    @property
+    def text_filtered(self) -> bool:
+        return any(name in self.filters for name in TEXT_FILTERS)
+
+    # ------------------------------------------------------------------
+    # Query building
+    # ------------------------------------------------------------------
+    def _filtered(self, *columns):
+        query = db.session.query(*columns).select_from(Craftsman).join(
+            User, User.id == Craftsman.user_id
+        ).filter(User.is_active == True)
+        if self.matched_ids is not None:
+            query = query.filter(id_filter(Craftsman.id, self.matched_ids))
+        for name, predicate in self.plan.predicates:
+            query = query.filter(predicate(self.filters[name]))
+        return query
+
+    def query(self):
+        """The filtered query in the requested projection, without ordering."""
+        if self.projection == 'entity':
+            query = self._filtered(Craftsman).options(contains_eager(Craftsman.user))
+        else:
+            query = self._filtered(*CARD_COLUMNS, *self.extra_columns)
+            if self._distance is not None:
+                query = query.add_columns(self._distance)
+        return query
+
+    def ordered(self):
+        """``query()`` ordered by the sort keys with the id as tiebreaker."""
+        tiebreaker_direction = self.sort_keys[-1][1] if self.sort_keys else 'asc'
+        return self.query().order_by(*[
+            column.asc() if direction == 'asc' else column.desc()
+            for column, direction in self.sort_keys + [(Craftsman.id, tiebreaker_direction)]
+        ])
+
+    def count(self) -> Tuple[int, bool]:
+        """``(total, approximate)``; distance searches are counted exactly."""
+        id_query = self._filtered(Craftsman.id)
+        if self.by_distance:
+            # Per-location results are not worth caching
+            return id_query.count(), False
+        return cached_count(COUNT_NAMESPACE, self.filters, id_query, self.plan.tables)
+
+    # ------------------------------------------------------------------
+    # Pagination
+    # ------------------------------------------------------------------
+    def page(self, page: int = 1, per_page: int = 20) -> dict:
+        """Offset page: ``items`` (rows or entities) and a pagination block."""
+        total, approximate = self.count()
+        return PaginationHelper.paginate_query(
+            self.ordered(), page, per_page, total=total, approximate=approximate, serialize=False
+        )
+
+    def keyset(self, per_page: int = 20, cursor: Optional[str] = None, include_total: bool = False) -> dict:
+        """Cursor page; raises ValueError for malformed cursors."""
+        return PaginationHelper.paginate_keyset(
+            self.query(), self.sort_keys, Craftsman.id, per_page,
+            cursor=cursor, include_total=include_total, serialize=False
+        )
@@ -96,71 +96,6 @@ class QueryOptimizer:
             f"specialties LIKE '{search_pattern}' COLLATE NOCASE"
         )
 
-class CacheManager:
-    """Simple caching for frequently accessed data"""
-    
-    _cache = {}
-    _cache_ttl = {}
-    
-    @classmethod
-    def get(cls, key):
-        """Get cached value if not expired"""
-        import time
-        
-        if key not in cls._cache:
-            return None
-            
-        if key in cls._cache_ttl and time.time() > cls._cache_ttl[key]:
-            cls.delete(key)
-            return None
-            
-        return cls._cache[key]
-    
-    @classmethod
-    def set(cls, key, value, ttl=300):  # 5 minutes default
-        """Set cached value with TTL"""
-        import time
-        
-        cls._cache[key] = value
-        cls._cache_ttl[key] = time.time() + ttl
-    
-    @classmethod
-    def delete(cls, key):
-        """Delete cached value"""
-        cls._cache.pop(key, None)
-        cls._cache_ttl.pop(key, None)
-    
-    @classmethod
-    def clear(cls):
-        """Clear all cache"""
-        cls._cache.clear()
-        cls._cache_ttl.clear()
-
-# Decorator for caching API responses
-def cache_response(ttl=300):
-    """Decorator to cache API responses"""
-    def decorator(f):
-        from functools import wraps
-        
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            # Create cache key from function name and args
-            cache_key = f"{f.__name__}:{hash(str(args) + str(kwargs))}"
-            
-            # Try to get from cache
-            cached_result = CacheManager.get(cache_key)
-            if cached_result:
-                return cached_result
-            
-            # Execute function and cache result
-            result = f(*args, **kwargs)
-            CacheManager.set(cache_key, result, ttl)
-            
-            return result
-        
-        return decorated_function
-    return decorator
-
 # Database health check
 def check_database_health():
     """Check database connection and performance"""
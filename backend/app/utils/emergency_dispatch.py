@@ -0,0 +1,128 @@
+"""Emergency dispatch: pick the craftsmen an emergency request is sent to.
+
+Broadcasts used to notify every active craftsman inside a lat/lng box whose
+longitude span was computed with ``abs(latitude)`` instead of
+``cos(latitude)``, without looking at skills. Dispatch now works off the
+in-process indexes:
+
+* candidates come from the geo index, which expands rings of grid cells
+  around the emergency until it has enough craftsmen (or hits the radius);
+* craftsmen whose skills match the emergency type are picked first, and only
+  if there are too few of them are the nearest generalists added;
+* unavailable craftsmen and those already handling an emergency are skipped;
+* the fan-out is capped so a broadcast reaches 10-20 craftsmen.
+"""
+
+import logging
+from typing import Dict, List, Optional, Set
+
+from app import db
+from app.models.job import EmergencyService
+from app.utils.geo_index import get_geo_index, parse_coordinates
+from app.utils.search_index import craftsman_search_index, fold_turkish
+
+logger = logging.getLogger(__name__)
+
+# Most craftsmen one emergency is sent to
+MAX_FAN_OUT = 20
+# Below this many skill matches, the nearest other craftsmen are added
+MIN_CANDIDATES = 10
+DEFAULT_RADIUS_KM = 50
+
+# Emergency statuses during which the assigned craftsman counts as busy
+ACTIVE_EMERGENCY_STATUSES = ('assigned', 'en_route', 'in_progress')
+
+# Emergency type -> skill keywords, prefix matched against indexed skills;
+# every word of a keyword must match
+EMERGENCY_SKILL_KEYWORDS = {
+    'plumbing': ['su tesisat', 'sihhi tesisat', 'kombi', 'dogalgaz', 'plumb'],
+    'water_leak': ['su tesisat', 'sihhi tesisat', 'sizinti', 'plumb'],
+    'electrical': ['elektrik', 'aydinlatma', 'electric'],
+    'gas': ['dogalgaz', 'kombi', 'gaz'],
+    'heating': ['kombi', 'dogalgaz', 'isitma', 'kalorifer'],
+    'hvac': ['klima', 'havalandirma', 'hvac'],
+    'locksmith': ['cilingir', 'kilit', 'lock'],
+    'glass': ['cam', 'glass'],
+    'appliance': ['beyaz', 'esya', 'appliance'],
+    'roofing': ['cati', 'izolasyon', 'roof'],
+}
+
+
+def skill_matches(emergency_type: Optional[str]) -> Optional[Set[int]]:
+    """Craftsman ids whose skills fit ``emergency_type``.
+
+    Unknown types are matched on their own words. Returns None when the type
+    gives nothing to match on, meaning every craftsman qualifies.
+    """
+    if not emergency_type:
+        return None
+    keywords = EMERGENCY_SKILL_KEYWORDS.get(fold_turkish(emergency_type).strip(), [emergency_type])
+
+    craftsman_search_index.sync()
+    matched: Set[int] = set()
+    for keyword in keywords:
+        matched |= craftsman_search_index.search(keyword, skills_only=True)
+    return matched
+
+
+def busy_craftsmen() -> Set[int]:
+    """User ids of craftsmen currently assigned to an unfinished emergency."""
+    rows = db.session.query(EmergencyService.craftsman_id).filter(
+        EmergencyService.status.in_(ACTIVE_EMERGENCY_STATUSES),
+        EmergencyService.craftsman_id.isnot(None)
+    ).distinct()
+    return {row.craftsman_id for row in rows}
+
+
+def select_dispatch_candidates(latitude, longitude, emergency_type: Optional[str] = None,
+                               radius_km: float = DEFAULT_RADIUS_KM,
+                               limit: int = MAX_FAN_OUT) -> List[Dict]:
+    """Ranked craftsmen to notify for an emergency at ``latitude``/``longitude``.
+
+    Returns dicts with ``craftsman_id``, ``user_id``, ``distance_km`` and
+    ``skill_match``; skill matches come first, each group nearest first.
+    """
+    coordinates = parse_coordinates(latitude, longitude)
+    if coordinates is None:
+        return []
+    limit = max(1, min(limit, MAX_FAN_OUT))
+
+    geo_index = get_geo_index()
+    skilled = skill_matches(emergency_type)
+    busy = geo_index.craftsman_ids_for_users(busy_craftsmen())
+
+    if skilled is None:
+        ranked = [(match, False) for match in geo_index.nearest(
+            *coordinates, limit, max_radius_km=radius_km,
+            accept=lambda craftsman_id: craftsman_id not in busy
+        )]
+    else:
+        ranked = [(match, True) for match in geo_index.nearest(
+            *coordinates, limit, max_radius_km=radius_km,
+            accept=lambda craftsman_id: craftsman_id in skilled and craftsman_id not in busy
+        )]
+        wanted = min(MIN_CANDIDATES, limit)
+        if len(ranked) < wanted:
+            chosen = {craftsman_id for (craftsman_id, _), _ in ranked}
+            ranked += [(match, False) for match in geo_index.nearest(
+                *coordinates, wanted - len(ranked), max_radius_km=radius_km,
+                accept=lambda craftsman_id: craftsman_id not in chosen and craftsman_id not in busy
+            )]
+
+    user_ids = geo_index.user_ids_for(craftsman_id for (craftsman_id, _), _ in ranked)
+
+    candidates = [
+        {
+            'craftsman_id': craftsman_id,
+            'user_id': user_ids[craftsman_id],
+            'distance_km': round(distance, 2),
+            'skill_match': skill_match,
+        }
+        for (craftsman_id, distance), skill_match in ranked
+        if craftsman_id in user_ids
+    ]
+    logger.info(
+        "Emergency dispatch (%s): %s candidates, %s skill matches",
+        emergency_type, len(candidates), sum(1 for candidate in candidates if candidate['skill_match'])
+    )
+    return candidates
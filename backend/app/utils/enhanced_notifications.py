@@ -845,8 +845,9 @@ class EmergencyNotificationManager:
     """Specialized emergency notification system"""
     
     @staticmethod
-    def broadcast_emergency(emergency_service_id: int, max_radius_km: float = 50) -> Dict:
-        """Broadcast emergency to nearby craftsmen"""
+    def broadcast_emergency(emergency_service_id: int, max_radius_km: float = 50,
+                            max_craftsmen: int = 20) -> Dict:
+        """Broadcast emergency to the nearest craftsmen with matching skills"""
         try:
             from app.models.job import EmergencyService
             
@@ -856,7 +857,8 @@ class EmergencyNotificationManager:
             
             # Find nearby craftsmen
             nearby_craftsmen = EmergencyNotificationManager._find_nearby_craftsmen(
-                emergency.latitude, emergency.longitude, max_radius_km, emergency.emergency_type
+                emergency.latitude, emergency.longitude, max_radius_km, emergency.emergency_type,
+                limit=max_craftsmen
             )
             
             if not nearby_craftsmen:
@@ -911,25 +913,20 @@ class EmergencyNotificationManager:
     
     @staticmethod
     def _find_nearby_craftsmen(latitude: float, longitude: float, 
-                             radius_km: float, emergency_type: str) -> List[User]:
-        """Find craftsmen near emergency location"""
+                             radius_km: float, emergency_type: str, limit: int = 20) -> List[User]:
+        """Find craftsmen near emergency location, best candidates first"""
         try:
-            # Simple distance calculation (for production, use PostGIS)
-            lat_range = radius_km / 111.0
-            lng_range = radius_km / (111.0 * abs(latitude))
-            
-            # Find craftsmen in the area with relevant skills
-            craftsmen = User.query.filter(
-                User.user_type == 'craftsman',
-                User.is_active == True,
-                User.latitude.between(latitude - lat_range, latitude + lat_range),
-                User.longitude.between(longitude - lng_range, longitude + lng_range)
-            ).all()
-            
-            # Filter by emergency type if possible
-            # TODO: Add skill matching based on emergency_type
-            
-            return craftsmen
+            from app.utils.emergency_dispatch import select_dispatch_candidates
+            
+            candidates = select_dispatch_candidates(
+                latitude, longitude, emergency_type, radius_km=radius_km, limit=limit
+            )
+            if not candidates:
+                return []
+            
+            user_ids = [candidate['user_id'] for candidate in candidates]
+            users = {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()}
+            return [users[user_id] for user_id in user_ids if user_id in users]
             
         except Exception as e:
             print(f"Failed to find nearby craftsmen: {e}")
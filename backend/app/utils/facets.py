@@ -0,0 +1,250 @@
+"""Incrementally maintained facet counts for craftsman search.
+
+Keeps city, district, rating bucket, price bucket, verified and portfolio
+counts (plus price/rating ranges) in memory so ``/api/search/filters``,
+``/locations`` and ``/districts`` read precomputed values instead of running
+aggregate and ``SELECT DISTINCT`` queries on every call. The per-craftsman
+facet values also let search responses report facet counts for the current
+result set without another database scan.
+
+Loading and incremental maintenance come from ``CraftsmanProjection``.
+"""
+
+import logging
+import math
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from app.utils.craftsman_projection import CraftsmanProjection
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the hourly rate buckets; anything above the last bound
+# falls into the open-ended bucket
+PRICE_BUCKET_BOUNDS = (100, 200, 300, 500)
+
+FACET_NAMES = ('city', 'district', 'rating', 'price', 'verified', 'has_portfolio')
+
+
+def rating_bucket(rating) -> Optional[str]:
+    """Whole-star bucket ('0'..'5') for an average rating."""
+    if rating is None:
+        return None
+    return str(min(5, max(0, int(math.floor(float(rating))))))
+
+
+def price_bucket(hourly_rate) -> Optional[str]:
+    """Hourly rate bucket label such as '100-200' or '500+'."""
+    if hourly_rate is None:
+        return None
+    rate = float(hourly_rate)
+    lower = 0
+    for upper in PRICE_BUCKET_BOUNDS:
+        if rate < upper:
+            return f'{lower}-{upper}'
+        lower = upper
+    return f'{lower}+'
+
+
+class _ValueRange:
+    """Min/max/avg over a multiset of values with O(1) amortized updates."""
+
+    def __init__(self):
+        self.values = Counter()
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, value):
+        self.values[value] += 1
+        self.total += value
+        self.count += 1
+
+    def remove(self, value):
+        self.values[value] -= 1
+        if self.values[value] <= 0:
+            del self.values[value]
+        self.total -= value
+        self.count -= 1
+
+    def summary(self) -> Optional[dict]:
+        if not self.count:
+            return None
+        return {
+            'min': min(self.values),
+            'max': max(self.values),
+            'avg': self.total / self.count,
+        }
+
+
+class CraftsmanFacetStore(CraftsmanProjection):
+    """Per-craftsman facet values with running aggregate counts."""
+
+    name = 'Craftsman facet store'
+    craftsman_columns = (
+        'city', 'district', 'average_rating', 'hourly_rate',
+        'is_verified', 'is_available', 'portfolio_images',
+    )
+    user_columns = ('is_active',)
+
+    def __init__(self):
+        self._facets: Dict[int, dict] = {}
+        self._active: Dict[int, bool] = {}
+        self._counts: Dict[str, Counter] = {}
+        self._districts: Dict[str, Counter] = {}
+        self._price_range = _ValueRange()
+        self._rating_range = _ValueRange()
+        super().__init__()
+        self._reset()
+
+    @staticmethod
+    def _facet_values(values: dict) -> dict:
+        hourly_rate = float(values['hourly_rate']) if values['hourly_rate'] is not None else None
+        average_rating = float(values['average_rating']) if values['average_rating'] is not None else None
+        return {
+            'city': values['city'] or None,
+            'district': values['district'] or None,
+            'rating': rating_bucket(average_rating),
+            'price': price_bucket(hourly_rate),
+            'verified': bool(values['is_verified']),
+            'has_portfolio': values['portfolio_images'] is not None,
+            'is_available': bool(values['is_available']),
+            'hourly_rate': hourly_rate,
+            'average_rating': average_rating,
+        }
+
+    def _count(self, facets: dict, delta: int):
+        for name in FACET_NAMES:
+            value = facets[name]
+            if value is None:
+                continue
+            self._counts[name][value] += delta
+            if self._counts[name][value] <= 0:
+                del self._counts[name][value]
+
+        if facets['city'] and facets['district']:
+            districts = self._districts.setdefault(facets['city'], Counter())
+            districts[facets['district']] += delta
+            if districts[facets['district']] <= 0:
+                del districts[facets['district']]
+                if not districts:
+                    del self._districts[facets['city']]
+
+        update = _ValueRange.add if delta > 0 else _ValueRange.remove
+        if facets['hourly_rate']:
+            update(self._price_range, facets['hourly_rate'])
+        if facets['average_rating']:
+            update(self._rating_range, facets['average_rating'])
+
+    def _apply(self, craftsman_id, craftsman_values, user_values):
+        if user_values is not None:
+            self._active[craftsman_id] = user_values['is_active'] is not False
+        if craftsman_values is None:
+            return
+        previous = self._facets.get(craftsman_id)
+        if previous is not None:
+            self._count(previous, -1)
+        facets = self._facet_values(craftsman_values)
+        self._facets[craftsman_id] = facets
+        self._count(facets, 1)
+
+    def _discard(self, craftsman_id):
+        previous = self._facets.pop(craftsman_id, None)
+        if previous is not None:
+            self._count(previous, -1)
+        self._active.pop(craftsman_id, None)
+
+    def _reset(self):
+        self._facets.clear()
+        self._active.clear()
+        self._counts = {name: Counter() for name in FACET_NAMES}
+        self._districts = {}
+        self._price_range = _ValueRange()
+        self._rating_range = _ValueRange()
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    def cities(self) -> List[str]:
+        with self._lock:
+            return sorted(self._counts['city'])
+
+    def districts(self, city: str) -> List[str]:
+        with self._lock:
+            return sorted(self._districts.get(city, ()))
+
+    def summary(self) -> dict:
+        """Totals and ranges over every craftsman, as used by /filters."""
+        with self._lock:
+            return {
+                'total': len(self._facets),
+                'verified': self._counts['verified'][True],
+                'with_portfolio': self._counts['has_portfolio'][True],
+                'price_range': self._price_range.summary(),
+                'rating_range': self._rating_range.summary(),
+                'facets': self._serialize(self._counts),
+            }
+
+    @staticmethod
+    def _serialize(counts: Dict[str, Counter]) -> dict:
+        return {
+            name: {str(value).lower() if isinstance(value, bool) else value: count
+                   for value, count in counter.most_common()}
+            for name, counter in counts.items()
+        }
+
+    def facet_counts(self, craftsman_ids: Optional[Iterable[int]] = None, filters: Optional[dict] = None) -> dict:
+        """Facet counts for listable craftsmen matching ``filters``.
+
+        ``craftsman_ids`` narrows the candidates (e.g. text search matches);
+        ``filters`` uses the SearchSchema keys. Each facet is counted with its
+        own filter left out, so the UI can show how many results picking
+        another value would give.
+        """
+        filters = filters or {}
+        with self._lock:
+            candidates = self._facets.keys() if craftsman_ids is None else craftsman_ids
+            rows = [
+                self._facets[craftsman_id] for craftsman_id in candidates
+                if craftsman_id in self._facets
+                and self._facets[craftsman_id]['is_available']
+                and self._active.get(craftsman_id, True)
+            ]
+
+        counts = {name: Counter() for name in FACET_NAMES}
+        for facets in rows:
+            failed = [name for name, check in _FACET_FILTERS.items() if not check(facets, filters)]
+            if len(failed) > 1:
+                continue
+            for name in FACET_NAMES:
+                if facets[name] is None or (failed and failed[0] != name):
+                    continue
+                counts[name][facets[name]] += 1
+        return self._serialize(counts)
+
+
+def _range_check(value, low, high) -> bool:
+    if low and (value is None or value < low):
+        return False
+    if high and (value is None or value > high):
+        return False
+    return True
+
+
+# Facet -> predicate applying the SearchSchema filter(s) for that facet
+_FACET_FILTERS = {
+    'city': lambda facets, f: not f.get('city') or facets['city'] == f['city'],
+    'district': lambda facets, f: not f.get('district') or facets['district'] == f['district'],
+    'rating': lambda facets, f: _range_check(facets['average_rating'], f.get('min_rating'), f.get('max_rating')),
+    'price': lambda facets, f: _range_check(facets['hourly_rate'], f.get('min_price'), f.get('max_price')),
+    'verified': lambda facets, f: f.get('is_verified') is None or facets['verified'] == f['is_verified'],
+    'has_portfolio': lambda facets, f: f.get('has_portfolio') is None or facets['has_portfolio'] == f['has_portfolio'],
+}
+
+
+craftsman_facet_store = CraftsmanFacetStore()
+
+
+def get_facet_store() -> CraftsmanFacetStore:
+    """Return the facet store, building or delta-syncing it as needed."""
+    craftsman_facet_store.sync()
+    return craftsman_facet_store
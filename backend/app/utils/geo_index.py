@@ -0,0 +1,269 @@
+"""Grid-cell spatial index over craftsman locations.
+
+Craftsman coordinates live on ``users.latitude``/``users.longitude``. "Near
+me" queries used to load every located craftsman and compute a flat-earth
+distance for each one. The index buckets coordinates into fixed-size
+latitude/longitude cells, so a radius query only looks at the cells
+overlapping the search circle and refines those candidates with the exact
+haversine distance. ``nearest`` expands rings of cells around the query point
+until the k closest craftsmen are known.
+
+Loading and incremental maintenance come from ``CraftsmanProjection``.
+"""
+
+import logging
+import math
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import case, null
+
+from app.models.craftsman import Craftsman
+from app.utils.craftsman_projection import CraftsmanProjection
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# ~11 km of latitude per cell: a 10 km "near me" query touches 3x3 cells
+CELL_SIZE_DEGREES = 0.1
+
+# Upper bound accepted for radius queries
+MAX_RADIUS_KM = 500
+
+# Distance-sorted searches rank at most this many nearest craftsmen within
+# the radius (default below when the client does not send one)
+MAX_DISTANCE_CANDIDATES = 1000
+DEFAULT_SEARCH_RADIUS_KM = 50
+
+Cell = Tuple[int, int]
+Match = Tuple[int, float]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_coordinates(latitude, longitude) -> Optional[Tuple[float, float]]:
+    """Validated ``(lat, lon)`` floats, or None when missing or out of range."""
+    try:
+        lat, lon = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """``(min_lat, max_lat, min_lon, max_lon)`` enclosing a circle of ``radius_km``.
+
+    The longitude span grows with 1/cos(latitude), taken at the edge of the
+    box nearest the pole.
+    """
+    lat_span = radius_km / KM_PER_DEGREE
+    lon_km = _lon_km_per_degree(lat - lat_span, lat + lat_span)
+    lon_span = min(180, radius_km / lon_km)
+    return max(-90, lat - lat_span), min(90, lat + lat_span), lon - lon_span, lon + lon_span
+
+
+def _cell_of(lat: float, lon: float) -> Cell:
+    return int(math.floor(lat / CELL_SIZE_DEGREES)), int(math.floor(lon / CELL_SIZE_DEGREES))
+
+
+def _lon_km_per_degree(*latitudes: float) -> float:
+    """Smallest km-per-degree of longitude over the given latitudes (poles excluded)."""
+    widest = min(89.9, max(abs(lat) for lat in latitudes))
+    return KM_PER_DEGREE * math.cos(math.radians(widest))
+
+
+class CraftsmanGeoIndex(CraftsmanProjection):
+    """Located craftsmen bucketed by latitude/longitude grid cell."""
+
+    name = 'Craftsman geo index'
+    craftsman_columns = ('is_available',)
+    user_columns = ('latitude', 'longitude', 'is_active')
+
+    def __init__(self):
+        self._points: Dict[int, Tuple[float, float]] = {}
+        self._cell_members: Dict[Cell, Set[int]] = {}
+        self._available: Dict[int, bool] = {}
+        self._active: Dict[int, bool] = {}
+        super().__init__()
+
+    def _move(self, craftsman_id: int, point: Optional[Tuple[float, float]]):
+        previous = self._points.pop(craftsman_id, None)
+        if previous is not None:
+            cell = _cell_of(*previous)
+            members = self._cell_members.get(cell)
+            if members is not None:
+                members.discard(craftsman_id)
+                if not members:
+                    del self._cell_members[cell]
+        if point is not None:
+            self._points[craftsman_id] = point
+            self._cell_members.setdefault(_cell_of(*point), set()).add(craftsman_id)
+
+    def _apply(self, craftsman_id, craftsman_values, user_values):
+        if craftsman_values is not None:
+            self._available[craftsman_id] = bool(craftsman_values['is_available'])
+        if user_values is not None:
+            self._active[craftsman_id] = user_values['is_active'] is not False
+            self._move(craftsman_id, parse_coordinates(user_values['latitude'], user_values['longitude']))
+
+    def _discard(self, craftsman_id):
+        self._move(craftsman_id, None)
+        self._available.pop(craftsman_id, None)
+        self._active.pop(craftsman_id, None)
+
+    def _reset(self):
+        self._points.clear()
+        self._cell_members.clear()
+        self._available.clear()
+        self._active.clear()
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+    def _listable(self, craftsman_id: int) -> bool:
+        return self._available.get(craftsman_id, False) and self._active.get(craftsman_id, True)
+
+    def _refine(self, cells, lat: float, lon: float, radius_km: Optional[float],
+                accept: Optional[Callable[[int], bool]], listable_only: bool,
+                out: Dict[int, float]):
+        for cell in cells:
+            for craftsman_id in self._cell_members.get(cell, ()):
+                if listable_only and not self._listable(craftsman_id):
+                    continue
+                if accept is not None and not accept(craftsman_id):
+                    continue
+                distance = haversine_km(lat, lon, *self._points[craftsman_id])
+                if radius_km is None or distance <= radius_km:
+                    out[craftsman_id] = distance
+
+    def within_radius(self, lat: float, lon: float, radius_km: float, limit: Optional[int] = None,
+                      accept: Optional[Callable[[int], bool]] = None,
+                      listable_only: bool = True) -> List[Match]:
+        """``(craftsman_id, distance_km)`` pairs within ``radius_km``, nearest first.
+
+        Only cells overlapping the bounding box of the search circle are
+        scanned. ``accept`` can narrow candidates further (e.g. to text search
+        matches) before distances are computed.
+        """
+        radius_km = min(float(radius_km), MAX_RADIUS_KM)
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+        low = _cell_of(min_lat, min_lon)
+        high = _cell_of(max_lat, max_lon)
+
+        found: Dict[int, float] = {}
+        with self._lock:
+            cell_count = (high[0] - low[0] + 1) * (high[1] - low[1] + 1)
+            if cell_count > len(self._cell_members):
+                # Sparse data or a huge radius: walking the occupied cells is cheaper
+                cells = [cell for cell in self._cell_members
+                         if low[0] <= cell[0] <= high[0] and low[1] <= cell[1] <= high[1]]
+            else:
+                cells = [(i, j) for i in range(low[0], high[0] + 1) for j in range(low[1], high[1] + 1)]
+            self._refine(cells, lat, lon, radius_km, accept, listable_only, found)
+
+        ranked = sorted(found.items(), key=lambda item: (item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+    def nearest(self, lat: float, lon: float, k: int, max_radius_km: Optional[float] = None,
+                accept: Optional[Callable[[int], bool]] = None,
+                listable_only: bool = True) -> List[Match]:
+        """The ``k`` closest craftsmen, optionally bounded by ``max_radius_km``.
+
+        Rings of cells are scanned outwards from the query cell until the k-th
+        best distance is no larger than the distance to the nearest unscanned
+        cell, so dense areas stop after a ring or two.
+        """
+        if k <= 0:
+            return []
+        if max_radius_km is not None:
+            max_radius_km = min(float(max_radius_km), MAX_RADIUS_KM)
+
+        center = _cell_of(lat, lon)
+        found: Dict[int, float] = {}
+        with self._lock:
+            if not self._cell_members:
+                return []
+            min_i = min(cell[0] for cell in self._cell_members)
+            max_i = max(cell[0] for cell in self._cell_members)
+            min_j = min(cell[1] for cell in self._cell_members)
+            max_j = max(cell[1] for cell in self._cell_members)
+
+            ring = 0
+            while True:
+                if ring == 0:
+                    cells = [center]
+                else:
+                    top, bottom = center[0] + ring, center[0] - ring
+                    left, right = center[1] - ring, center[1] + ring
+                    cells = [(i, j) for i in (bottom, top) for j in range(left, right + 1)]
+                    cells += [(i, j) for i in range(bottom + 1, top) for j in (left, right)]
+                self._refine(cells, lat, lon, max_radius_km, accept, listable_only, found)
+
+                # Lower bound on the distance to anything outside the scanned box
+                south = (center[0] - ring) * CELL_SIZE_DEGREES
+                north = (center[0] + ring + 1) * CELL_SIZE_DEGREES
+                west = (center[1] - ring) * CELL_SIZE_DEGREES
+                east = (center[1] + ring + 1) * CELL_SIZE_DEGREES
+                unscanned_km = min(
+                    (lat - south) * KM_PER_DEGREE,
+                    (north - lat) * KM_PER_DEGREE,
+                    min(lon - west, east - lon) * _lon_km_per_degree(south, north),
+                )
+
+                if len(found) >= k and sorted(found.values())[k - 1] <= unscanned_km:
+                    break
+                if max_radius_km is not None and unscanned_km > max_radius_km:
+                    break
+                if (center[0] - ring <= min_i and center[0] + ring >= max_i
+                        and center[1] - ring <= min_j and center[1] + ring >= max_j):
+                    break
+                ring += 1
+
+        return sorted(found.items(), key=lambda item: (item[1], item[0]))[:k]
+
+
+craftsman_geo_index = CraftsmanGeoIndex()
+
+
+def get_geo_index() -> CraftsmanGeoIndex:
+    """Return the geo index, building or delta-syncing it as needed."""
+    craftsman_geo_index.sync()
+    return craftsman_geo_index
+
+
+def rank_by_distance(coordinates: Tuple[float, float], radius_km: Optional[float] = None,
+                     candidate_ids: Optional[Set[int]] = None) -> List[Match]:
+    """Nearest listable craftsmen for a distance-sorted search.
+
+    ``candidate_ids`` restricts the ranking to e.g. text search matches.
+    """
+    return get_geo_index().nearest(
+        *coordinates, MAX_DISTANCE_CANDIDATES,
+        max_radius_km=radius_km or DEFAULT_SEARCH_RADIUS_KM,
+        accept=candidate_ids.__contains__ if candidate_ids is not None else None
+    )
+
+
+def distance_column(matches: List[Match]):
+    """SQL expression mapping ``craftsmen.id`` to its precomputed distance.
+
+    Lets distance-ranked candidates be ordered, keyset-paginated and returned
+    by an ordinary query; ids outside ``matches`` get NULL.
+    """
+    if not matches:
+        return null().label('distance')
+    return case(
+        {craftsman_id: round(distance, 3) for craftsman_id, distance in matches},
+        value=Craftsman.id,
+        else_=None,
+    ).label('distance')
@@ -7,6 +7,7 @@ from app.models.job import Job, JobMaterial, TimeEntry, JobProgressUpdate, Warra
 from app.models.job import JobStatus, JobPriority, MaterialStatus, TimeEntryType, WarrantyStatus
 from app.models.user import User
 from app.models.quote import Quote
+from app.utils.geo_index import bounding_box, haversine_km, parse_coordinates
 import json
 
 class JobTracker:
@@ -728,28 +729,25 @@ class EmergencyServiceManager:
         try:
             # Get craftsman location
             craftsman = User.query.get(craftsman_id)
-            if not craftsman or not hasattr(craftsman, 'latitude') or not craftsman.latitude:
+            location = parse_coordinates(craftsman.latitude, craftsman.longitude) if craftsman else None
+            if location is None:
                 return []
             
-            # Simple distance filter (for production, use PostGIS)
-            lat_range = max_distance_km / 111.0
-            lng_range = max_distance_km / (111.0 * abs(craftsman.latitude))
+            # Bounding box prefilter, then exact great-circle distance
+            min_lat, max_lat, min_lng, max_lng = bounding_box(*location, max_distance_km)
             
             emergencies = EmergencyService.query.filter(
                 and_(
                     EmergencyService.status == 'requested',
-                    EmergencyService.latitude.between(
-                        craftsman.latitude - lat_range, 
-                        craftsman.latitude + lat_range
-                    ),
-                    EmergencyService.longitude.between(
-                        craftsman.longitude - lng_range, 
-                        craftsman.longitude + lng_range
-                    )
+                    EmergencyService.latitude.between(min_lat, max_lat),
+                    EmergencyService.longitude.between(min_lng, max_lng)
                 )
             ).order_by(desc(EmergencyService.severity), asc(EmergencyService.requested_at)).all()
             
-            return emergencies
+            return [
+                emergency for emergency in emergencies
+                if haversine_km(*location, emergency.latitude, emergency.longitude) <= max_distance_km
+            ]
             
         except Exception as e:
             raise e
@@ -0,0 +1,118 @@
+"""Fast JSON encoding for API responses and analytics rows.
+
+Responses used to go through the stdlib encoder with Flask's defaults (sorted
+keys, ASCII escaping of every Turkish character, pretty printing in debug).
+Encoding now uses orjson when it is installed and a compact stdlib encoder
+otherwise, and both understand the types our payloads actually contain:
+
+* ``datetime`` / ``date`` / ``time`` as ISO 8601, matching the ``isoformat()``
+  strings the models already produce;
+* ``Decimal`` (``hourly_rate``, ``quoted_price``) as its exact string, which
+  is what Flask's encoder used to send;
+* ``Enum`` as its value; ``UUID`` as a string; sets as lists.
+
+``FastJSONProvider`` plugs this into ``flask.jsonify`` for the whole app,
+``jsonify`` here is a drop-in replacement usable without the provider, and
+``dumps_text`` is for JSON stored inside log rows.
+"""
+
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+from uuid import UUID
+
+from flask import current_app
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# Integer dict keys are common (per-id maps); orjson refuses them by default
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+MIMETYPE = 'application/json'
+
+
+def _default(obj: Any):
+    """Encode the types neither encoder handles on its own."""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode ``obj`` as compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # e.g. integers beyond 64 bits, which the stdlib encoder accepts
+            pass
+    return _stdlib_dumps(obj)
+
+
+def dumps_text(obj: Any) -> str:
+    """Encode ``obj`` as a JSON string (for JSON columns in log rows)."""
+    return dumps(obj).decode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _payload(args, kwargs):
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    if len(args) == 1:
+        return args[0]
+    return args or kwargs
+
+
+def jsonify(*args, **kwargs):
+    """Drop-in ``flask.jsonify`` that always uses the fast encoder."""
+    return current_app.response_class(dumps(_payload(args, kwargs)) + b'\n', mimetype=MIMETYPE)
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by :func:`dumps` / :func:`loads`.
+
+    Install with ``app.json = FastJSONProvider(app)``; ``flask.jsonify`` and
+    returning a dict from a view then use it.
+    """
+
+    mimetype = MIMETYPE
+
+    def dumps(self, obj: Any, **kwargs) -> str:
+        if kwargs:
+            kwargs.setdefault('default', _default)
+            kwargs.setdefault('ensure_ascii', False)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        return self._app.response_class(dumps(_payload(args, kwargs)) + b'\n', mimetype=self.mimetype)
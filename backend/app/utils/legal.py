@@ -5,9 +5,18 @@ Legal compliance utilities for GDPR/KVKK and legal document management
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Any
 from enum import Enum
+import gzip
+import hashlib
 import json
+import os
+import threading
 from app import db
 
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
 class ConsentType(Enum):
     """Types of user consent"""
     TERMS_OF_SERVICE = "terms_of_service"
@@ -719,4 +728,206 @@ GDPR_RIGHTS = [
     "right_to_data_portability",
     "right_to_object",
     "rights_related_to_automated_decision_making"
-]
\ No newline at end of file
+]
+
+
+# ------------------------------------------------------------------
+# Published legal documents
+# ------------------------------------------------------------------
+# The documents are static between version bumps, so each one is rendered to
+# JSON once per version and kept as identity, gzip and brotli blobs. Serving
+# a document is then a dictionary lookup plus a write of precompressed bytes.
+
+LEGAL_DOCUMENTS_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'legal_documents')
+LEGAL_DOCUMENTS_LAST_UPDATED = '2025-01-01'
+
+# Document id -> file, title, and the entry in the /documents/all listing
+LEGAL_DOCUMENTS = {
+    'terms_of_service': {
+        'file': 'kullanim_kosullari.md',
+        'title': 'Kullanım Koşulları',
+        'listing_title': 'Kullanım Koşulları',
+        'description': 'Portal kullanım şartları ve kuralları',
+        'endpoint': '/api/legal/documents/terms-of-service',
+        'required_for': ['registration', 'usage'],
+    },
+    'user_agreement': {
+        'file': 'bireysel_hesap_sozlesmesi.md',
+        'title': 'Bireysel Hesap Sözleşmesi',
+        'listing_title': 'Bireysel Hesap Sözleşmesi',
+        'description': 'Bireysel kullanıcılar için hesap sözleşmesi',
+        'endpoint': '/api/legal/documents/user-agreement',
+        'required_for': ['individual_registration'],
+    },
+    'corporate_agreement': {
+        'file': 'kurumsal_hesap_sozlesmesi.md',
+        'title': 'Kurumsal Hesap Sözleşmesi',
+        'listing_title': 'Kurumsal Hesap Sözleşmesi',
+        'description': 'Hizmet veren ustalar için kurumsal sözleşme',
+        'endpoint': '/api/legal/documents/corporate-agreement',
+        'required_for': ['craftsman_registration'],
+    },
+    'privacy_policy': {
+        'file': 'gizlilik_politikasi.md',
+        'title': 'Gizlilik Politikası',
+        'listing_title': 'Gizlilik Politikası',
+        'description': 'Kişisel verilerin işlenmesi ve gizlilik koşulları',
+        'endpoint': '/api/legal/documents/privacy-policy',
+        'required_for': ['registration', 'data_processing'],
+    },
+    'cookie_policy': {
+        'file': 'cerez_politikasi.md',
+        'title': 'Çerez Politikası',
+        'listing_title': 'Çerez Politikası',
+        'description': 'Çerez kullanımı ve veri işleme detayları',
+        'endpoint': '/api/legal/documents/cookie-policy',
+        'required_for': ['website_usage', 'app_usage'],
+    },
+    'cookie_preferences': {
+        'file': 'cerez_tercihleri_ozet.md',
+        'title': 'Çerez Tercihleri',
+        'listing_title': 'Çerez Tercihleri',
+        'description': 'Çerez tercih yönetimi ve özet bilgi',
+        'endpoint': '/api/legal/documents/cookie-preferences',
+        'required_for': ['cookie_management'],
+    },
+    'listing_rules': {
+        'file': 'ilan_verme_kurallari.md',
+        'title': 'İlan Verme Kuralları ve Yasaklı İlanlar',
+        'listing_title': 'İlan Verme Kuralları',
+        'description': 'İlan yayınlama kuralları ve yasaklı içerikler',
+        'endpoint': '/api/legal/documents/listing-rules',
+        'required_for': ['job_posting', 'service_listing'],
+    },
+    'kvkk_summary': {
+        'file': 'kvkk_aydinlatma_metni.md',
+        'title': 'KVKK Aydınlatma Metni',
+        'listing_title': 'KVKK Aydınlatma Özeti',
+        'description': 'Kişisel veri işleme özet bilgilendirmesi',
+        'endpoint': '/api/legal/documents/kvkk-summary',
+        'required_for': ['data_subject_rights'],
+    },
+}
+
+# Encodings every rendered document is stored in, in server preference order
+if brotli is not None:
+    DOCUMENT_ENCODINGS = ('br', 'gzip', 'identity')
+else:
+    DOCUMENT_ENCODINGS = ('gzip', 'identity')
+
+
+def legal_document_version(document_id: str) -> str:
+    """Published version of a document; bumping it re-renders the document."""
+    return LEGAL_DOCUMENT_VERSIONS.get(document_id, '1.0')
+
+
+class PrecompressedDocument:
+    """A rendered JSON body in every supported encoding with a strong ETag."""
+
+    __slots__ = ('digest', 'bodies')
+
+    def __init__(self, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.digest = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=11)
+
+    def etag(self, encoding: str) -> str:
+        """Strong ETag; each encoding is a different byte sequence, so gets its own tag"""
+        return f'"{self.digest}"' if encoding == 'identity' else f'"{self.digest}-{encoding}"'
+
+    def matched_encodings(self, if_none_match: str) -> List[str]:
+        """Encodings of this document whose ETag an If-None-Match header names"""
+        if if_none_match.strip() == '*':
+            return list(self.bodies)
+        matched = []
+        for candidate in if_none_match.split(','):
+            candidate = candidate.strip()
+            if candidate.startswith('W/'):
+                candidate = candidate[2:]
+            digest, _, encoding = candidate.strip('"').partition('-')
+            encoding = encoding or 'identity'
+            if digest == self.digest and encoding in self.bodies and encoding not in matched:
+                matched.append(encoding)
+        return matched
+
+
+_rendered_documents: Dict[Any, PrecompressedDocument] = {}
+_rendered_documents_lock = threading.Lock()
+
+
+def _render_once(key, build) -> PrecompressedDocument:
+    document = _rendered_documents.get(key)
+    if document is None:
+        with _rendered_documents_lock:
+            document = _rendered_documents.get(key)
+            if document is None:
+                document = PrecompressedDocument(build())
+                # Older versions of the same document are no longer served
+                for stale in [k for k in _rendered_documents if k[0] == key[0]]:
+                    del _rendered_documents[stale]
+                _rendered_documents[key] = document
+    return document
+
+
+def rendered_legal_document(document_id: str) -> PrecompressedDocument:
+    """The precompressed response body for one legal document.
+
+    Raises KeyError for unknown ids and FileNotFoundError when the document
+    file is missing.
+    """
+    meta = LEGAL_DOCUMENTS[document_id]
+    version = legal_document_version(document_id)
+
+    def build():
+        with open(os.path.join(LEGAL_DOCUMENTS_DIR, meta['file']), 'r', encoding='utf-8') as f:
+            content = f.read()
+        return {
+            'success': True,
+            'data': {
+                'title': meta['title'],
+                'content': content,
+                'version': version,
+                'last_updated': LEGAL_DOCUMENTS_LAST_UPDATED,
+                'type': document_id,
+            }
+        }
+
+    return _render_once((document_id, version), build)
+
+
+def rendered_legal_document_index() -> PrecompressedDocument:
+    """The precompressed /documents/all listing."""
+    versions = tuple(legal_document_version(document_id) for document_id in LEGAL_DOCUMENTS)
+
+    def build():
+        documents = [
+            {
+                'id': document_id,
+                'title': meta['listing_title'],
+                'description': meta['description'],
+                'endpoint': meta['endpoint'],
+                'required_for': meta['required_for'],
+                'version': legal_document_version(document_id),
+                'last_updated': LEGAL_DOCUMENTS_LAST_UPDATED,
+            }
+            for document_id, meta in LEGAL_DOCUMENTS.items()
+        ]
+        return {
+            'success': True,
+            'data': {
+                'documents': documents,
+                'total_count': len(documents),
+                'compliance_framework': 'KVKK (Turkish GDPR)',
+                'last_updated': LEGAL_DOCUMENTS_LAST_UPDATED,
+            }
+        }
+
+    return _render_once(('__index__', versions), build)
+
+
+def invalidate_legal_documents():
+    """Drop every rendered document (e.g. after editing the files in place)."""
+    with _rendered_documents_lock:
+        _rendered_documents.clear()
@@ -0,0 +1,115 @@
+"""Graceful shutdown for background telemetry.
+
+The BigQuery worker and metrics run on daemon threads, so whatever they
+still held when the process stopped (up to a flush interval of rows) used to
+be lost. ``ShutdownManager`` runs registered drain hooks exactly once when
+the process stops, within a shared deadline (``SHUTDOWN_DEADLINE_SECONDS``),
+and logs a report of what each hook flushed and what it spilled to disk for
+the next process.
+
+Spilled rows wait in the spool directory for a sibling worker, the
+collector or the next process on the instance. On App Engine standard the
+spool lives in the instance's in-memory ``/tmp``, so when the last process of
+a stopping instance spills rows nobody will ship them: the BigQuery hook
+reports those as ``lost`` (and pending load-job files as
+``lost_load_job_files``) rather than ``spilled``. ``BIGQUERY_SPOOL_EPHEMERAL``
+overrides whether the spool is treated as going away with the instance.
+
+Hooks run, in registration order, from whichever of these comes first:
+
+* gunicorn's ``worker_exit`` hook (``gunicorn.conf.py``), after the worker
+  has finished its requests;
+* SIGTERM, when nothing else (e.g. gunicorn) handles it: the dev server and
+  ``python run.py``;
+* interpreter exit (``atexit``).
+"""
+
+import atexit
+import logging
+import os
+import signal
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEADLINE_SECONDS = 10.0
+
+# hook(deadline) -> report; deadline is a time.monotonic() value
+DrainHook = Callable[[float], Optional[Dict[str, Any]]]
+
+
+class ShutdownManager:
+    """Runs drain hooks once, sharing one deadline"""
+
+    def __init__(self, deadline_seconds: float = DEFAULT_DEADLINE_SECONDS):
+        self.deadline_seconds = deadline_seconds
+        self._hooks: List[Tuple[str, DrainHook]] = []
+        self._lock = threading.Lock()
+        self._report: Optional[Dict[str, Any]] = None
+        self._installed = False
+
+    def register(self, name: str, hook: DrainHook):
+        with self._lock:
+            if all(existing != name for existing, _ in self._hooks):
+                self._hooks.append((name, hook))
+
+    def install(self):
+        """Run on interpreter exit, and on SIGTERM unless something else handles it"""
+        with self._lock:
+            if self._installed:
+                return
+            self._installed = True
+        atexit.register(self.shutdown, 'exit')
+        if threading.current_thread() is not threading.main_thread():
+            return
+        if signal.getsignal(signal.SIGTERM) in (signal.SIG_DFL, None):
+            signal.signal(signal.SIGTERM, self._on_sigterm)
+
+    def _on_sigterm(self, signum, frame):
+        self.shutdown('SIGTERM')
+        # Terminate the way SIGTERM would have without us
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+    def shutdown(self, reason: str = 'shutdown') -> Dict[str, Any]:
+        """Drain every hook until the deadline; later calls return the first report"""
+        with self._lock:
+            if self._report is not None:
+                return self._report
+            self._report = report = {}
+            hooks = list(self._hooks)
+
+        started = time.monotonic()
+        deadline = started + self.deadline_seconds
+        for name, hook in hooks:
+            try:
+                report[name] = hook(deadline)
+            except Exception as e:
+                logger.exception("Shutdown hook %s failed", name)
+                report[name] = {'error': str(e)}
+        overran = time.monotonic() > deadline
+        logger.info("Shutdown (%s) finished in %.1fs%s: %s", reason, time.monotonic() - started,
+                    ' past the deadline' if overran else '',
+                    ', '.join(f'{name}={result}' for name, result in report.items() if result is not None) or 'nothing to drain')
+        return report
+
+    @property
+    def done(self) -> bool:
+        return self._report is not None
+
+
+shutdown_manager = ShutdownManager()
+
+
+def init_lifecycle(app):
+    """Drain BigQuery telemetry, then metrics, when this process stops"""
+    from app.utils import metrics
+    from app.utils.bigquery_logger import bigquery_logger
+
+    shutdown_manager.deadline_seconds = app.config.get('SHUTDOWN_DEADLINE_SECONDS', DEFAULT_DEADLINE_SECONDS)
+    shutdown_manager.register('bigquery', bigquery_logger.shutdown)
+    shutdown_manager.register('metrics', metrics.shutdown)
+    shutdown_manager.install()
+    return shutdown_manager
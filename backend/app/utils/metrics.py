@@ -0,0 +1,465 @@
+"""In-process request metrics in the Prometheus text format.
+
+Latency used to be visible only as BigQuery rows, so p95/p99 per endpoint
+needed a query. Every request now lands in a latency histogram labelled by
+endpoint and status class, and ``/metrics`` serves the histograms together
+with the telemetry queue depth, DB pool usage, cache, compression and
+sampling counters.
+
+Histograms are HDR-style: log-linear buckets (two per power of two from 1 ms
+to ~65 s) whose index comes straight from the float exponent, so recording
+is a ``frexp`` plus two increments under an uncontended lock. Bucket bounds
+are fixed, so histograms from different workers merge by addition.
+
+Multi-process servers (gunicorn) set ``METRICS_DIR``: each worker writes its
+snapshot to ``worker-<pid>.json`` there at most every
+``METRICS_FLUSH_SECONDS`` and the worker that serves a scrape merges all of
+them. Counters and histograms of workers that have exited are folded into
+``archive.json`` so totals never go backwards; their gauges are dropped. As
+with other multi-process collectors the directory should start empty
+(e.g. under /tmp). Without ``METRICS_DIR`` only the serving process is
+reported.
+"""
+
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.utils.json_encoding import dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Log-linear buckets in milliseconds: [0, 1) then SUB_BUCKETS per octave
+# [2^k, 2^(k+1)) for k < OCTAVES, then an overflow bucket
+SUB_BUCKETS = 2
+OCTAVES = 16
+BUCKET_COUNT = 1 + OCTAVES * SUB_BUCKETS + 1
+
+DEFAULT_FLUSH_SECONDS = 5
+
+REQUEST_LATENCY = 'ustam_http_request_duration_seconds'
+
+HELP = {
+    REQUEST_LATENCY: 'Request latency by endpoint and status class',
+    'ustam_db_queries_total': 'SQL statements run by requests',
+    'ustam_db_time_seconds_total': 'Time requests spent in SQL statements',
+    'ustam_telemetry_queue_depth': 'BigQuery rows waiting in memory to be flushed',
+    'ustam_telemetry_queue_capacity': 'BigQuery queue capacity',
+    'ustam_telemetry_spool_bytes': 'BigQuery rows spooled on disk, in bytes',
+    'ustam_telemetry_spool_capacity_bytes': 'BigQuery spool size limit',
+    'ustam_telemetry_spool_rows_total': 'BigQuery rows appended to, shipped from and dropped by the spool',
+    'ustam_telemetry_flush_rows_total': 'BigQuery rows inserted, requeued, deferred by backoff, dead-lettered or lost',
+    'ustam_telemetry_tables_backing_off': 'BigQuery tables waiting to retry after a failed insert',
+    'ustam_telemetry_load_staged_bytes': 'Compressed rows staged for BigQuery load jobs',
+    'ustam_telemetry_load_jobs_total': 'BigQuery load job files loaded, retried and given up on',
+    'ustam_telemetry_rows_total': 'BigQuery rows by table and sampling outcome',
+    'ustam_telemetry_forwarded_rows_total': 'BigQuery rows forwarded to the collector, spooled meanwhile or dropped',
+    'ustam_telemetry_collector_rows_total': 'BigQuery rows the collector received, rejected or lost to torn/corrupt frames',
+    'ustam_telemetry_collector_connections': 'Worker connections to the telemetry collector',
+    'ustam_db_pool_checked_out': 'Database connections in use',
+    'ustam_db_pool_size': 'Database pool size',
+    'ustam_db_pool_overflow': 'Database connections opened beyond the pool size',
+    'ustam_cache_events_total': 'Application cache lookups, loads and evictions',
+    'ustam_cache_entries': 'Entries in the local application cache',
+    'ustam_compression_responses_total': 'Compressed responses by encoding',
+    'ustam_compression_skipped_total': 'Responses not compressed, by reason',
+    'ustam_compression_bytes_total': 'Response bytes before and after compression',
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Sample(NamedTuple):
+    """A value read from another module at collection time"""
+    kind: str  # 'counter' or 'gauge'
+    name: str
+    labels: Dict[str, str]
+    value: float
+
+
+Collector = Callable[[], Iterable[Sample]]
+
+
+def bucket_index(milliseconds: float) -> int:
+    if milliseconds < 1:
+        return 0
+    mantissa, exponent = math.frexp(milliseconds)  # 0.5 <= mantissa < 1
+    octave = exponent - 1
+    if octave >= OCTAVES:
+        return BUCKET_COUNT - 1
+    return 1 + octave * SUB_BUCKETS + int((mantissa * 2 - 1) * SUB_BUCKETS)
+
+
+def bucket_upper_bound(index: int) -> float:
+    """Upper bound of bucket ``index`` in seconds"""
+    if index == 0:
+        return 0.001
+    if index >= BUCKET_COUNT - 1:
+        return math.inf
+    octave, sub = divmod(index - 1, SUB_BUCKETS)
+    return (2 ** octave) * (1 + (sub + 1) / SUB_BUCKETS) / 1000
+
+
+def status_class(status_code: int) -> str:
+    return f'{status_code // 100}xx'
+
+
+def _key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class MetricsRegistry:
+    """Counters and histograms recorded by this process, plus collectors
+    that read gauges and counters kept elsewhere"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        # name -> labels -> [bucket counts, sum of seconds]
+        self._histograms: Dict[str, Dict[LabelKey, list]] = {}
+        self._collectors: List[Collector] = []
+
+    def register_collector(self, collector: Collector):
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        index = bucket_index(seconds * 1000)
+        key = _key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = [[0] * BUCKET_COUNT, 0.0]
+            entry[0][index] += 1
+            entry[1] += seconds
+
+    def _collect(self) -> Iterable[Sample]:
+        for collector in self._collectors:
+            try:
+                yield from collector()
+            except Exception as exc:
+                logger.warning("Metrics collector %s failed: %s", getattr(collector, '__name__', collector), exc)
+
+    def snapshot(self) -> dict:
+        """This process's metrics as a JSON-serializable dict"""
+        counters: Dict[str, list] = {}
+        gauges: Dict[str, list] = {}
+        for sample in self._collect():
+            target = counters if sample.kind == 'counter' else gauges
+            target.setdefault(sample.name, []).append([dict(sample.labels), sample.value])
+        with self._lock:
+            for name, series in self._counters.items():
+                counters.setdefault(name, []).extend([dict(key), value] for key, value in series.items())
+            histograms = {
+                name: [[dict(key), list(counts), total] for key, (counts, total) in series.items()]
+                for name, series in self._histograms.items()
+            }
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def merge_snapshots(snapshots: Iterable[dict], include_gauges: bool = True) -> dict:
+    """Sum snapshots series by series (gauges too: queue depth, pool usage)"""
+    counters: Dict[str, Dict[LabelKey, float]] = {}
+    gauges: Dict[str, Dict[LabelKey, float]] = {}
+    histograms: Dict[str, Dict[LabelKey, list]] = {}
+    for snapshot in snapshots:
+        for kind, target in (('counters', counters), ('gauges', gauges)):
+            if kind == 'gauges' and not include_gauges:
+                continue
+            for name, series in snapshot.get(kind, {}).items():
+                merged = target.setdefault(name, {})
+                for labels, value in series:
+                    key = _key(labels)
+                    merged[key] = merged.get(key, 0) + value
+        for name, series in snapshot.get('histograms', {}).items():
+            merged = histograms.setdefault(name, {})
+            for labels, counts, total in series:
+                key = _key(labels)
+                entry = merged.get(key)
+                if entry is None:
+                    merged[key] = [list(counts), total]
+                else:
+                    entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                    entry[1] += total
+    return {
+        'counters': {name: [[dict(key), value] for key, value in series.items()] for name, series in counters.items()},
+        'gauges': {name: [[dict(key), value] for key, value in series.items()] for name, series in gauges.items()},
+        'histograms': {
+            name: [[dict(key), counts, total] for key, (counts, total) in series.items()]
+            for name, series in histograms.items()
+        },
+    }
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Dict[str, str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in sorted(labels.items())]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(snapshot: dict) -> str:
+    """Prometheus text exposition of a snapshot"""
+    lines: List[str] = []
+    for kind, type_name in (('counters', 'counter'), ('gauges', 'gauge')):
+        for name in sorted(snapshot.get(kind, {})):
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} {type_name}')
+            for labels, value in snapshot[kind][name]:
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+
+    bounds = [f'le="{_number(bucket_upper_bound(index))}"' for index in range(BUCKET_COUNT)]
+    for name in sorted(snapshot.get('histograms', {})):
+        lines.append(f'# HELP {name} {HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, counts, total in snapshot['histograms'][name]:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class FileCollector:
+    """Shares snapshots between worker processes through a directory"""
+
+    ARCHIVE = 'archive.json'
+
+    def __init__(self, directory: str, flush_seconds: float = DEFAULT_FLUSH_SECONDS):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _worker_path(self, pid: int) -> str:
+        return os.path.join(self.directory, f'worker-{pid}.json')
+
+    def _write(self, path: str, snapshot: dict):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(dumps(snapshot))
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    @staticmethod
+    def _read(path: str) -> Optional[dict]:
+        try:
+            with open(path, 'rb') as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            return None
+        except ValueError as exc:
+            logger.warning("Ignoring unreadable metrics file %s: %s", path, exc)
+            return None
+
+    def flush(self, registry: MetricsRegistry, force: bool = False):
+        """Write this worker's snapshot if the last one is older than ``flush_seconds``"""
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_seconds:
+            return
+        if not self._flush_lock.acquire(blocking=force):
+            return
+        try:
+            self._last_flush = now
+            self._write(self._worker_path(os.getpid()), registry.snapshot())
+        finally:
+            self._flush_lock.release()
+
+    def collect(self, registry: MetricsRegistry) -> dict:
+        """Merged snapshot of every worker, current process included"""
+        self.flush(registry, force=True)
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            live, dead = [], []
+            for filename in os.listdir(self.directory):
+                if not (filename.startswith('worker-') and filename.endswith('.json')):
+                    continue
+                try:
+                    pid = int(filename[len('worker-'):-len('.json')])
+                except ValueError:
+                    continue
+                snapshot = self._read(os.path.join(self.directory, filename))
+                if snapshot is not None:
+                    (live if _pid_alive(pid) else dead).append((filename, snapshot))
+
+            archive_path = os.path.join(self.directory, self.ARCHIVE)
+            archive = self._read(archive_path) or {}
+            if dead:
+                archive = merge_snapshots([archive] + [snapshot for _, snapshot in dead], include_gauges=False)
+                self._write(archive_path, archive)
+                for filename, _ in dead:
+                    os.unlink(os.path.join(self.directory, filename))
+        return merge_snapshots([archive] + [snapshot for _, snapshot in live])
+
+
+registry = MetricsRegistry()
+_file_collector: Optional[FileCollector] = None
+
+if hasattr(os, 'register_at_fork'):
+    # A forked process starts from zero; otherwise its first snapshot would
+    # count the parent's requests a second time
+    os.register_at_fork(after_in_child=registry.clear)
+
+
+def record_request(event: dict):
+    """Instrumentation sink"""
+    labels = {'endpoint': event['endpoint'], 'status': status_class(event['status_code'])}
+    registry.observe(REQUEST_LATENCY, event['duration_seconds'], **labels)
+    if event.get('db_query_count'):
+        registry.inc('ustam_db_queries_total', event['db_query_count'], endpoint=event['endpoint'])
+        registry.inc('ustam_db_time_seconds_total', event['db_time_ms'] / 1000, endpoint=event['endpoint'])
+    if _file_collector is not None:
+        _file_collector.flush(registry)
+
+
+def shutdown(deadline: float) -> Optional[dict]:
+    """Write this process's last snapshot to METRICS_DIR (lifecycle hook)"""
+    if _file_collector is None:
+        return None
+    _file_collector.flush(registry, force=True)
+    return {'snapshot': 'written'}
+
+
+def collect() -> dict:
+    if _file_collector is not None:
+        return _file_collector.collect(registry)
+    return registry.snapshot()
+
+
+def telemetry_samples() -> Iterable[Sample]:
+    from app.utils.bigquery_logger import bigquery_logger
+
+    spool = bigquery_logger.spool
+    if bigquery_logger.collector is not None:
+        stats = bigquery_logger.collector.stats()
+        for outcome in ('forwarded', 'spooled', 'dropped'):
+            yield Sample('counter', 'ustam_telemetry_forwarded_rows_total', {'outcome': outcome}, stats[outcome])
+    elif spool is not None:
+        stats = spool.stats()
+        yield Sample('gauge', 'ustam_telemetry_spool_bytes', {}, stats['disk_bytes'])
+        yield Sample('gauge', 'ustam_telemetry_spool_capacity_bytes', {}, spool.max_bytes)
+        for outcome in ('appended', 'shipped', 'dropped'):
+            yield Sample('counter', 'ustam_telemetry_spool_rows_total', {'outcome': outcome}, stats[outcome])
+        if bigquery_logger.load_sink is not None:
+            stats = bigquery_logger.load_sink.stats()
+            yield Sample('gauge', 'ustam_telemetry_load_staged_bytes', {}, stats['staged_bytes'])
+            for outcome in ('loaded_files', 'retries', 'failed_files'):
+                yield Sample('counter', 'ustam_telemetry_load_jobs_total', {'outcome': outcome}, stats[outcome])
+    else:
+        yield Sample('gauge', 'ustam_telemetry_queue_depth', {}, bigquery_logger.log_queue.qsize())
+        yield Sample('gauge', 'ustam_telemetry_queue_capacity', {}, bigquery_logger.log_queue.maxsize)
+    if bigquery_logger.flusher is not None:
+        stats = bigquery_logger.flusher.stats()
+        for outcome in ('inserted', 'requeued', 'deferred', 'dead_lettered', 'lost'):
+            yield Sample('counter', 'ustam_telemetry_flush_rows_total', {'outcome': outcome}, stats[outcome])
+        yield Sample('gauge', 'ustam_telemetry_tables_backing_off', {}, len(stats['backing_off']))
+    for table, outcomes in bigquery_logger.sampler.stats().items():
+        for outcome, count in outcomes.items():
+            yield Sample('counter', 'ustam_telemetry_rows_total', {'table': table, 'outcome': outcome}, count)
+
+
+def db_pool_samples() -> Iterable[Sample]:
+    from app import db
+
+    pool = db.engine.pool
+    for name, method in (('ustam_db_pool_checked_out', 'checkedout'), ('ustam_db_pool_size', 'size'),
+                         ('ustam_db_pool_overflow', 'overflow')):
+        if hasattr(pool, method):  # SQLite pools report none of these
+            yield Sample('gauge', name, {}, getattr(pool, method)())
+
+
+def cache_samples() -> Iterable[Sample]:
+    from app.utils.cache import get_cache
+
+    stats = get_cache().stats()
+    for event in ('hits', 'shared_hits', 'misses', 'loads', 'load_errors', 'coalesced', 'evictions', 'expirations'):
+        yield Sample('counter', 'ustam_cache_events_total', {'event': event}, stats[event])
+    yield Sample('gauge', 'ustam_cache_entries', {}, stats['size'])
+
+
+def compression_samples() -> Iterable[Sample]:
+    from app.utils import compression
+
+    stats = compression.stats()
+    for encoding, count in stats['by_encoding'].items():
+        yield Sample('counter', 'ustam_compression_responses_total', {'encoding': encoding}, count)
+    for reason, count in stats['skipped'].items():
+        yield Sample('counter', 'ustam_compression_skipped_total', {'reason': reason}, count)
+    yield Sample('counter', 'ustam_compression_bytes_total', {'stage': 'in'}, stats['bytes_in'])
+    yield Sample('counter', 'ustam_compression_bytes_total', {'stage': 'out'}, stats['bytes_out'])
+
+
+def init_metrics(app):
+    """Record request metrics and share them across workers if ``METRICS_DIR`` is set"""
+    global _file_collector
+
+    if not app.config.get('METRICS_ENABLED', True):
+        logger.info("Request metrics disabled")
+        return None
+
+    from app.middleware.instrumentation import instrumentation
+
+    for collector in (telemetry_samples, db_pool_samples, cache_samples, compression_samples):
+        registry.register_collector(collector)
+    directory = app.config.get('METRICS_DIR')
+    if directory:
+        _file_collector = FileCollector(directory, app.config.get('METRICS_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS))
+    instrumentation.add_sink(record_request)
+    if app.config.get('METRICS_REQUIRE_TOKEN') and not app.config.get('METRICS_TOKEN'):
+        logger.warning("METRICS_TOKEN is not set; /metrics is not served on this deployment")
+    logger.info("Request metrics initialized (%s)", f'shared via {directory}' if directory else 'this process only')
+    return registry
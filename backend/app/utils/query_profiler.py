@@ -0,0 +1,180 @@
+"""Per-request SQL query profiling and N+1 detection.
+
+SQLAlchemy ``before/after_cursor_execute`` hooks on every engine count the
+statements a request runs and the time spent in the database, per distinct
+SQL text. The same statement executed many times with different parameters
+is the N+1 signature (a query per row of an earlier result), so statements
+repeated at least ``QUERY_PROFILER_N_PLUS_ONE_THRESHOLD`` times are reported.
+
+The request instrumentation pipeline adds the numbers to its event
+(``db_query_count``, ``db_time_ms``, ``n_plus_one``), which feeds the
+``performance_metrics`` rows, the per-endpoint stats below and, outside
+production, ``X-Query-Count`` / ``Server-Timing`` response headers.
+
+``count_queries()`` counts the statements run inside a block, for tests
+that pin an endpoint's query budget.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+
+# Statement text kept in reports; the full SQL can be long
+STATEMENT_PREVIEW_LENGTH = 300
+
+_START_TIMES_KEY = 'query_profiler_start_times'
+# The profile lives in the WSGI environ: g can outlive a request when an
+# app context was pushed around it (tests, CLI)
+_PROFILE_ENVIRON_KEY = 'ustam.query_profile'
+
+
+class QueryProfile:
+    """Statements run by one request"""
+
+    __slots__ = ('count', 'seconds', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # SQL text -> [executions, seconds]
+        self.statements: Dict[str, List] = {}
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.seconds += elapsed
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+
+    @property
+    def time_ms(self) -> float:
+        return self.seconds * 1000
+
+    def repeated(self, threshold: int = DEFAULT_N_PLUS_ONE_THRESHOLD) -> List[dict]:
+        """Statements executed at least ``threshold`` times, most frequent first"""
+        repeated = [
+            {'statement': statement[:STATEMENT_PREVIEW_LENGTH], 'count': count, 'time_ms': round(seconds * 1000, 2)}
+            for statement, (count, seconds) in self.statements.items() if count >= threshold
+        ]
+        repeated.sort(key=lambda item: item['count'], reverse=True)
+        return repeated
+
+
+class QueryCounter:
+    """Statements run inside a ``count_queries()`` block"""
+
+    def __init__(self):
+        self.profile = QueryProfile()
+
+    @property
+    def count(self) -> int:
+        return self.profile.count
+
+    @property
+    def statements(self) -> List[str]:
+        return list(self.profile.statements)
+
+
+_active_counters: ContextVar[Tuple[QueryCounter, ...]] = ContextVar('query_counters', default=())
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    counter = QueryCounter()
+    token = _active_counters.set(_active_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active_counters.reset(token)
+
+
+def current_profile() -> Optional[QueryProfile]:
+    """This request's profile, or None if it has not run a query"""
+    if not has_request_context():
+        return None
+    return request.environ.get(_PROFILE_ENVIRON_KEY)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_START_TIMES_KEY, []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get(_START_TIMES_KEY)
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+
+    for counter in _active_counters.get():
+        counter.profile.record(statement, elapsed)
+    if has_request_context():
+        profile = request.environ.get(_PROFILE_ENVIRON_KEY)
+        if profile is None:
+            profile = request.environ[_PROFILE_ENVIRON_KEY] = QueryProfile()
+        profile.record(statement, elapsed)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # Failed statements never reach after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None:
+        start_times = connection.info.get(_START_TIMES_KEY)
+        if start_times:
+            start_times.pop()
+
+
+class EndpointQueryStats:
+    """Query counts per endpoint for this process, to spot regressions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, float]] = {}
+
+    def __call__(self, event_data: dict):
+        """Instrumentation sink"""
+        count = event_data.get('db_query_count')
+        if count is None:
+            return
+        with self._lock:
+            stats = self._endpoints.setdefault(event_data['endpoint'], {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'db_time_ms': 0.0, 'n_plus_one': 0,
+            })
+            stats['requests'] += 1
+            stats['queries'] += count
+            stats['max_queries'] = max(stats['max_queries'], count)
+            stats['db_time_ms'] += event_data['db_time_ms']
+            stats['n_plus_one'] += int(bool(event_data['n_plus_one']))
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': stats['requests'],
+                    'avg_queries': round(stats['queries'] / stats['requests'], 2),
+                    'max_queries': stats['max_queries'],
+                    'avg_db_time_ms': round(stats['db_time_ms'] / stats['requests'], 2),
+                    'n_plus_one_requests': stats['n_plus_one'],
+                }
+                for endpoint, stats in self._endpoints.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+endpoint_query_stats = EndpointQueryStats()
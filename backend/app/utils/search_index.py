@@ -0,0 +1,208 @@
+"""In-process inverted index for craftsman text search.
+
+The index tokenizes business name, description, skills/specialties and the
+owner's first/last name with Turkish-aware case folding, and answers text
+queries by intersecting posting lists instead of scanning ``ILIKE '%term%'``
+predicates over the ``users`` and ``craftsmen`` tables.
+
+Loading and incremental maintenance (ORM write hooks plus a periodic delta
+sync for other processes) come from ``CraftsmanProjection``.
+"""
+
+import bisect
+import json
+import logging
+import re
+from typing import Dict, List, Optional, Set
+
+from app.utils.craftsman_projection import CraftsmanProjection
+
+logger = logging.getLogger(__name__)
+
+_TURKISH_LOWER = str.maketrans({'I': 'ı', 'İ': 'i'})
+_TURKISH_FOLD = str.maketrans({
+    'ı': 'i', 'ş': 's', 'ğ': 'g', 'ç': 'c', 'ö': 'o', 'ü': 'u',
+    'â': 'a', 'î': 'i', 'û': 'u', '̇': None,
+})
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Skill tokens are indexed a second time under this marker so category
+# filters can be restricted to the skills field
+SKILL_FIELD_MARKER = '#'
+
+
+def fold_turkish(text: Optional[str]) -> str:
+    """Lowercase with Turkish dotted/dotless I rules and strip diacritics."""
+    if not text:
+        return ''
+    return text.translate(_TURKISH_LOWER).lower().translate(_TURKISH_FOLD)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split folded text into search tokens."""
+    return _TOKEN_RE.findall(fold_turkish(text))
+
+
+def _skills_text(skills) -> str:
+    """Flatten the JSON skills column into plain text."""
+    if not skills:
+        return ''
+    if isinstance(skills, str):
+        try:
+            skills = json.loads(skills)
+        except (json.JSONDecodeError, TypeError):
+            return skills
+    if isinstance(skills, (list, tuple)):
+        return ' '.join(str(skill) for skill in skills)
+    return str(skills)
+
+
+def craftsman_document(business_name, description, skills, specialties) -> Set[str]:
+    """Tokens contributed by the craftsman row itself."""
+    skill_tokens = set(tokenize(f"{_skills_text(skills)} {specialties or ''}"))
+    tokens = set(tokenize(f"{business_name or ''} {description or ''}")) | skill_tokens
+    tokens.update(SKILL_FIELD_MARKER + token for token in skill_tokens)
+    return tokens
+
+
+def user_document(first_name, last_name) -> Set[str]:
+    """Tokens contributed by the owning user row."""
+    return set(tokenize(f"{first_name or ''} {last_name or ''}"))
+
+
+class CraftsmanSearchIndex(CraftsmanProjection):
+    """Token -> craftsman id posting lists with prefix lookup."""
+
+    name = 'Craftsman search index'
+    craftsman_columns = ('business_name', 'description', 'skills', 'specialties')
+    user_columns = ('first_name', 'last_name')
+
+    def __init__(self):
+        self._postings: Dict[str, Set[int]] = {}
+        self._vocabulary: List[str] = []
+        self._craftsman_tokens: Dict[int, Set[str]] = {}
+        self._user_tokens: Dict[int, Set[str]] = {}
+        self._bulk_loading = False
+        super().__init__()
+
+    def _add_token(self, token: str, craftsman_id: int):
+        ids = self._postings.get(token)
+        if ids is None:
+            ids = self._postings[token] = set()
+            if not self._bulk_loading:
+                bisect.insort(self._vocabulary, token)
+        ids.add(craftsman_id)
+
+    def _remove_token(self, token: str, craftsman_id: int):
+        ids = self._postings.get(token)
+        if ids is None:
+            return
+        ids.discard(craftsman_id)
+        if not ids:
+            del self._postings[token]
+            position = bisect.bisect_left(self._vocabulary, token)
+            if position < len(self._vocabulary) and self._vocabulary[position] == token:
+                del self._vocabulary[position]
+
+    def _tokens_for(self, craftsman_id: int) -> Set[str]:
+        return self._craftsman_tokens.get(craftsman_id, set()) | self._user_tokens.get(craftsman_id, set())
+
+    def _apply(self, craftsman_id, craftsman_values, user_values):
+        before = self._tokens_for(craftsman_id)
+        if craftsman_values is not None:
+            self._craftsman_tokens[craftsman_id] = craftsman_document(
+                craftsman_values['business_name'], craftsman_values['description'],
+                craftsman_values['skills'], craftsman_values['specialties']
+            )
+        if user_values is not None:
+            self._user_tokens[craftsman_id] = user_document(
+                user_values['first_name'], user_values['last_name']
+            )
+        after = self._tokens_for(craftsman_id)
+
+        for token in before - after:
+            self._remove_token(token, craftsman_id)
+        for token in after - before:
+            self._add_token(token, craftsman_id)
+
+    def _discard(self, craftsman_id):
+        for token in self._tokens_for(craftsman_id):
+            self._remove_token(token, craftsman_id)
+        self._craftsman_tokens.pop(craftsman_id, None)
+        self._user_tokens.pop(craftsman_id, None)
+
+    def _reset(self):
+        self._postings.clear()
+        self._vocabulary.clear()
+        self._craftsman_tokens.clear()
+        self._user_tokens.clear()
+
+    def _begin_rebuild(self):
+        # Sort the vocabulary once at the end instead of per new token
+        self._bulk_loading = True
+
+    def _finish_rebuild(self):
+        self._bulk_loading = False
+        self._vocabulary = sorted(self._postings)
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+    def _prefix_matches(self, prefix: str) -> Set[int]:
+        matches: Set[int] = set()
+        position = bisect.bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+            matches |= self._postings[self._vocabulary[position]]
+            position += 1
+        return matches
+
+    def search(self, text: str, skills_only: bool = False) -> Set[int]:
+        """Return ids of craftsmen whose documents match every query token.
+
+        Each query token matches indexed tokens it is a prefix of, so partially
+        typed words keep matching while the user types.
+        """
+        tokens = sorted(set(tokenize(text)), key=len, reverse=True)
+        if skills_only:
+            tokens = [SKILL_FIELD_MARKER + token for token in tokens]
+        if not tokens:
+            return set()
+
+        with self._lock:
+            result: Optional[Set[int]] = None
+            for token in tokens:
+                matches = self._prefix_matches(token)
+                result = matches if result is None else result & matches
+                if not result:
+                    return set()
+            return result
+
+
+craftsman_search_index = CraftsmanSearchIndex()
+
+
+def match_craftsman_ids(q: Optional[str] = None, category: Optional[str] = None) -> Optional[Set[int]]:
+    """Ids matching the free-text query and skill category, or None to fall back to SQL.
+
+    ``None`` is returned when there is nothing to match or the index cannot be
+    used. Large match sets are returned as well; ``craftsman_query.id_filter``
+    binds them as one parameter.
+    """
+    filters = [(text, skills_only) for text, skills_only in ((q, False), (category, True))
+               if text and text.strip()]
+    if not filters:
+        return None
+
+    try:
+        craftsman_search_index.sync()
+    except Exception as exc:
+        logger.warning("Craftsman search index unavailable, falling back to SQL: %s", exc)
+        return None
+
+    result: Optional[Set[int]] = None
+    for text, skills_only in filters:
+        matches = craftsman_search_index.search(text, skills_only=skills_only)
+        result = matches if result is None else result & matches
+        if not result:
+            return set()
+    return result
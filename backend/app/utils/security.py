@@ -31,17 +31,8 @@ def init_security_middleware(app):
 
     _configure_rate_limit_backend(app)
 
-    @app.before_request
-    def security_before_request():
-        """Security checks before each request"""
-        # Skip security for health checks and static files
-        if request.endpoint in ['health_check', 'static']:
-            return
-
-        # Add security headers
-        g.security_start_time = time.time()
-
-        # Rate limiting handled via decorators for sensitive routes
+    # Rate limiting handled via decorators for sensitive routes; request
+    # timing lives in app.middleware.instrumentation
 
     @app.after_request
     def security_after_request(response):
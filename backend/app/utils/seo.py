@@ -1,64 +1,29 @@
-from datetime import datetime, timezone
 from urllib.parse import quote
-from app.models.craftsman import Craftsman
 from app.models.category import Category
-from app.models.user import User
 from app import db
 
 class SEOManager:
     """SEO utilities for dynamic content generation"""
     
     @staticmethod
-    def generate_sitemap():
-        """Generate dynamic sitemap based on database content"""
-        base_url = "https://ustamapp.com"
-        urls = []
-        
-        # Static pages with high priority
-        static_pages = [
-            {"url": "/", "priority": 1.0, "changefreq": "daily"},
-            {"url": "/landing", "priority": 0.9, "changefreq": "weekly"},
-            {"url": "/search", "priority": 0.9, "changefreq": "daily"},
-            {"url": "/craftsmen", "priority": 0.8, "changefreq": "daily"},
-            {"url": "/about", "priority": 0.5, "changefreq": "monthly"},
-            {"url": "/contact", "priority": 0.5, "changefreq": "monthly"},
-            {"url": "/privacy", "priority": 0.3, "changefreq": "monthly"},
-            {"url": "/terms", "priority": 0.3, "changefreq": "monthly"},
-            {"url": "/help", "priority": 0.4, "changefreq": "monthly"},
+    def static_sitemap_urls():
+        """Static, category and location pages for the sitemap.
+
+        Craftsman pages are streamed into their own shards by
+        app.utils.sitemap.
+        """
+        urls = [
+            {"path": "/", "priority": 1.0, "changefreq": "daily"},
+            {"path": "/landing", "priority": 0.9, "changefreq": "weekly"},
+            {"path": "/search", "priority": 0.9, "changefreq": "daily"},
+            {"path": "/craftsmen", "priority": 0.8, "changefreq": "daily"},
+            {"path": "/about", "priority": 0.5, "changefreq": "monthly"},
+            {"path": "/contact", "priority": 0.5, "changefreq": "monthly"},
+            {"path": "/privacy", "priority": 0.3, "changefreq": "monthly"},
+            {"path": "/terms", "priority": 0.3, "changefreq": "monthly"},
+            {"path": "/help", "priority": 0.4, "changefreq": "monthly"},
         ]
         
-        for page in static_pages:
-            urls.append({
-                "loc": f"{base_url}{page['url']}",
-                "lastmod": datetime.now(timezone.utc).isoformat(),
-                "changefreq": page["changefreq"],
-                "priority": page["priority"]
-            })
-        
-        # Dynamic craftsman pages
-        try:
-            craftsmen = Craftsman.query.join(User).filter(
-                User.is_active == True
-            ).limit(1000).all()
-            
-            for craftsman in craftsmen:
-                urls.append({
-                    "loc": f"{base_url}/craftsman/{craftsman.id}",
-                    "lastmod": craftsman.updated_at.isoformat() if craftsman.updated_at else datetime.now(timezone.utc).isoformat(),
-                    "changefreq": "weekly",
-                    "priority": 0.7
-                })
-                
-                # Business profile pages
-                urls.append({
-                    "loc": f"{base_url}/craftsman/{craftsman.id}/business-profile",
-                    "lastmod": craftsman.updated_at.isoformat() if craftsman.updated_at else datetime.now(timezone.utc).isoformat(),
-                    "changefreq": "weekly",
-                    "priority": 0.6
-                })
-        except Exception as e:
-            print(f"Error generating craftsman URLs: {e}")
-        
         # Category pages
         categories = [
             "Elektrik", "Tesisat", "Boyama", "Temizlik", "Klima", 
@@ -67,8 +32,7 @@ class SEOManager:
         
         for category in categories:
             urls.append({
-                "loc": f"{base_url}/search?category={quote(category)}",
-                "lastmod": datetime.now(timezone.utc).isoformat(),
+                "path": f"/search?category={quote(category)}",
                 "changefreq": "weekly",
                 "priority": 0.8
             })
@@ -81,8 +45,7 @@ class SEOManager:
         
         for city in cities:
             urls.append({
-                "loc": f"{base_url}/search?city={quote(city)}",
-                "lastmod": datetime.now(timezone.utc).isoformat(),
+                "path": f"/search?city={quote(city)}",
                 "changefreq": "weekly",
                 "priority": 0.7
             })
@@ -94,8 +57,7 @@ class SEOManager:
         for category in high_value_categories:
             for city in high_value_cities:
                 urls.append({
-                    "loc": f"{base_url}/search?category={quote(category)}&city={quote(city)}",
-                    "lastmod": datetime.now(timezone.utc).isoformat(),
+                    "path": f"/search?category={quote(category)}&city={quote(city)}",
                     "changefreq": "weekly",
                     "priority": 0.8
                 })
@@ -103,29 +65,21 @@ class SEOManager:
         return urls
     
     @staticmethod
-    def generate_sitemap_xml():
-        """Generate XML sitemap"""
-        urls = SEOManager.generate_sitemap()
-        
-        xml_content = '''<?xml version="1.0" encoding="UTF-8"?>
-<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
-        xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1"
-        xsi:schemaLocation="http://www.sitemaps.org/schemas/sitemap/0.9
-        http://www.sitemaps.org/schemas/sitemap/0.9/sitemap.xsd">
-'''
-        
-        for url in urls:
-            xml_content += f'''
-  <url>
-    <loc>{url["loc"]}</loc>
-    <lastmod>{url["lastmod"]}</lastmod>
-    <changefreq>{url["changefreq"]}</changefreq>
-    <priority>{url["priority"]}</priority>
-  </url>'''
-        
-        xml_content += '\n</urlset>'
-        return xml_content
+    def generate_sitemap_xml(app=None, force_rebuild=False):
+        """Bring the sharded sitemap up to date and return the sitemap index XML.
+
+        Meant for cron jobs and scripts; requests serve the files through
+        ``get_sitemap_store(app).ensure_fresh`` instead, which never blocks.
+        """
+        from flask import current_app
+        from app.utils.sitemap import get_sitemap_store
+        
+        store = get_sitemap_store(app or current_app)
+        # Waits for a refresh another process is running rather than reading
+        # files it has not written yet
+        store.refresh(SEOManager.static_sitemap_urls(), force_rebuild=force_rebuild, wait=True)
+        with open(store.path('sitemap.xml'), 'r', encoding='utf-8') as f:
+            return f.read()
     
     @staticmethod
     def generate_robots_txt():
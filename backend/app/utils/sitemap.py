@@ -0,0 +1,364 @@
+"""Sharded sitemap files kept on disk and refreshed incrementally.
+
+``SEOManager.generate_sitemap_xml`` used to build one XML string by
+repeated concatenation on every ``/sitemap.xml`` hit and capped craftsmen at
+1000. The sitemap is now a sitemap index pointing at shard files:
+
+* ``pages.xml`` holds the static, category and city pages;
+* ``craftsmen-<n>.xml`` holds the craftsmen with ids in
+  ``[n * CRAFTSMEN_PER_SHARD, (n + 1) * CRAFTSMEN_PER_SHARD)``. Each craftsman
+  contributes two URLs, so a shard never exceeds the protocol's 50,000 URL
+  limit;
+* shards are written by streaming a ``yield_per`` query straight into a
+  temporary file that is then atomically renamed into place;
+* a refresh only rewrites the shards of craftsmen (or their users) updated
+  since the last one, plus shards of craftsmen deleted by this process; a
+  full rebuild runs every ``FULL_REBUILD_SECONDS`` to catch anything else.
+
+The files live in ``SITEMAP_DIR``, by default a directory under
+``tempfile.gettempdir()`` (the only writable path on App Engine), so a new
+instance starts without them: its first sitemap request builds them inline.
+After that requests only read files and stale sitemaps are refreshed by a
+background thread, so a crawler never triggers a table walk. Across worker
+processes a lock file makes sure only one of them regenerates at a time.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, Optional, Set
+from xml.sax.saxutils import escape
+
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.craftsman import Craftsman
+from app.models.user import User
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAX_URLS_PER_SHARD = 50000
+URLS_PER_CRAFTSMAN = 2
+CRAFTSMEN_PER_SHARD = MAX_URLS_PER_SHARD // URLS_PER_CRAFTSMAN
+
+DEFAULT_BASE_URL = 'https://ustamapp.com'
+DEFAULT_REFRESH_SECONDS = 300
+FULL_REBUILD_SECONDS = 24 * 3600
+YIELD_PER = 1000
+
+PAGES_SHARD = 'pages'
+MANIFEST_FILE = 'manifest.json'
+INDEX_FILE = 'sitemap.xml'
+LOCK_FILE = '.lock'
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'ustam-sitemaps')
+
+URLSET_OPEN = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+URLSET_CLOSE = '</urlset>\n'
+
+
+def _iso(moment: Optional[datetime]) -> str:
+    moment = moment or datetime.now(timezone.utc)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.isoformat(timespec='seconds')
+
+
+def _url_entry(loc: str, lastmod: str, changefreq: str, priority: float) -> str:
+    return (
+        f'  <url><loc>{escape(loc)}</loc><lastmod>{lastmod}</lastmod>'
+        f'<changefreq>{changefreq}</changefreq><priority>{priority}</priority></url>\n'
+    )
+
+
+def shard_name(shard: int) -> str:
+    return f'craftsmen-{shard}'
+
+
+def _craftsman_rows(query) -> Iterator:
+    return iter(query.order_by(Craftsman.id).yield_per(YIELD_PER))
+
+
+def _listed_craftsmen():
+    return db.session.query(
+        Craftsman.id, Craftsman.updated_at, User.updated_at.label('user_updated_at')
+    ).join(User, User.id == Craftsman.user_id).filter(User.is_active == True)
+
+
+# Craftsmen deleted by this process since the last refresh
+_deleted_craftsmen: Set[int] = set()
+_deleted_lock = threading.Lock()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_deleted_craftsmen(session, flush_context):
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Craftsman) and obj.id is not None]
+    if deleted:
+        with _deleted_lock:
+            _deleted_craftsmen.update(deleted)
+
+
+class SitemapStore:
+    """Sitemap index and shard files in ``directory``."""
+
+    def __init__(self, directory: str, base_url: str = DEFAULT_BASE_URL,
+                 refresh_seconds: float = DEFAULT_REFRESH_SECONDS):
+        self.directory = directory
+        self.base_url = base_url.rstrip('/')
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._refreshing = False
+        self._checked_at = 0.0
+
+    # ------------------------------------------------------------------
+    # Files
+    # ------------------------------------------------------------------
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def shard_path(self, name: str) -> Optional[str]:
+        """Path of an existing shard file, or None for unknown names."""
+        manifest = self.manifest()
+        if manifest is None or name not in manifest['shards']:
+            return None
+        return self.path(f'{name}.xml')
+
+    def index_path(self) -> Optional[str]:
+        path = self.path(INDEX_FILE)
+        return path if os.path.exists(path) else None
+
+    def manifest(self) -> Optional[dict]:
+        try:
+            with open(self.path(MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_atomic(self, name: str, chunks: Iterable[str], keep: Callable[[], bool] = lambda: True) -> bool:
+        """Write ``name`` through a temporary file and one rename.
+
+        If ``keep()`` is false once the chunks are written, the old file stays
+        and False is returned.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-', suffix='.xml')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            if not keep():
+                os.unlink(temp_path)
+                return False
+            os.replace(temp_path, self.path(name))
+            return True
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    # ------------------------------------------------------------------
+    # Shard generation
+    # ------------------------------------------------------------------
+    def _write_pages(self, static_urls) -> dict:
+        lastmod = _iso(None)
+        urls = list(static_urls)
+
+        def chunks():
+            yield URLSET_OPEN
+            for url in urls:
+                yield _url_entry(f"{self.base_url}{url['path']}", lastmod, url['changefreq'], url['priority'])
+            yield URLSET_CLOSE
+
+        self._write_atomic(f'{PAGES_SHARD}.xml', chunks())
+        return {'urls': len(urls), 'lastmod': lastmod}
+
+    def _write_craftsmen(self, shard: int, rows: Iterable) -> Optional[dict]:
+        """Stream one shard's rows into its file; None when the shard is empty."""
+        stats = {'urls': 0, 'lastmod': None}
+
+        def chunks():
+            yield URLSET_OPEN
+            for row in rows:
+                stamp = max(filter(None, [row.updated_at, row.user_updated_at]), default=None)
+                lastmod = _iso(stamp)
+                stats['lastmod'] = max(stats['lastmod'] or lastmod, lastmod)
+                stats['urls'] += URLS_PER_CRAFTSMAN
+                yield _url_entry(f'{self.base_url}/craftsman/{row.id}', lastmod, 'weekly', 0.7)
+                yield _url_entry(f'{self.base_url}/craftsman/{row.id}/business-profile', lastmod, 'weekly', 0.6)
+            yield URLSET_CLOSE
+
+        # An emptied shard keeps its old file until the index stops listing it
+        if not self._write_atomic(f'{shard_name(shard)}.xml', chunks(), keep=lambda: stats['urls'] > 0):
+            return None
+        return stats
+
+    def _write_index(self, manifest: dict):
+        def chunks():
+            yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+            yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+            for name in sorted(manifest['shards'], key=lambda n: (n != PAGES_SHARD, len(n), n)):
+                loc = escape(f'{self.base_url}/sitemaps/{name}.xml')
+                yield f"  <sitemap><loc>{loc}</loc><lastmod>{manifest['shards'][name]['lastmod']}</lastmod></sitemap>\n"
+            yield '</sitemapindex>\n'
+
+        self._write_atomic(INDEX_FILE, chunks())
+        self._save_manifest(manifest)
+        self._remove_unlisted_shards(manifest)
+
+    def _save_manifest(self, manifest: dict):
+        self._write_atomic(MANIFEST_FILE, [json.dumps(manifest)])
+
+    def _remove_unlisted_shards(self, manifest: dict):
+        """Delete craftsman shards the index no longer lists.
+
+        Runs after the index is replaced, so a shard only disappears once the
+        index stops listing it.
+        """
+        for name in os.listdir(self.directory):
+            if name.startswith(shard_name('')) and name.endswith('.xml') and name[:-4] not in manifest['shards']:
+                os.unlink(self.path(name))
+
+    def rebuild(self, static_urls) -> dict:
+        """Regenerate every shard in one ordered pass over the craftsmen.
+
+        Shards are replaced one by one while the old index keeps being
+        served; those left without craftsmen go once the new index is in.
+        """
+        started = time.time()
+        watermark = datetime.utcnow()
+        manifest = {'shards': {PAGES_SHARD: self._write_pages(static_urls)}}
+        rows = _craftsman_rows(_listed_craftsmen())
+        pending = next(rows, None)
+        while pending is not None:
+            shard = pending.id // CRAFTSMEN_PER_SHARD
+            upper = (shard + 1) * CRAFTSMEN_PER_SHARD
+
+            def shard_rows():
+                nonlocal pending
+                while pending is not None and pending.id < upper:
+                    yield pending
+                    pending = next(rows, None)
+
+            stats = self._write_craftsmen(shard, shard_rows())
+            if stats:
+                manifest['shards'][shard_name(shard)] = stats
+
+        manifest.update(watermark=watermark.isoformat(), rebuilt_at=time.time())
+        self._write_index(manifest)
+        logger.info("Sitemap rebuilt: %s shards in %.1f ms", len(manifest['shards']), (time.time() - started) * 1000)
+        return manifest
+
+    def update(self, manifest: dict) -> dict:
+        """Rewrite only the shards with craftsmen changed since the watermark."""
+        since = datetime.fromisoformat(manifest['watermark'])
+        watermark = datetime.utcnow()
+        changed = db.session.query(Craftsman.id).join(User, User.id == Craftsman.user_id).filter(or_(
+            Craftsman.updated_at > since, User.updated_at > since,
+        ))
+        shards = {row.id // CRAFTSMEN_PER_SHARD for row in changed}
+        with _deleted_lock:
+            shards |= {craftsman_id // CRAFTSMEN_PER_SHARD for craftsman_id in _deleted_craftsmen}
+            _deleted_craftsmen.clear()
+
+        for shard in sorted(shards):
+            lower, upper = shard * CRAFTSMEN_PER_SHARD, (shard + 1) * CRAFTSMEN_PER_SHARD
+            stats = self._write_craftsmen(shard, _craftsman_rows(
+                _listed_craftsmen().filter(Craftsman.id >= lower, Craftsman.id < upper)
+            ))
+            if stats:
+                manifest['shards'][shard_name(shard)] = stats
+            else:
+                manifest['shards'].pop(shard_name(shard), None)
+
+        manifest['watermark'] = watermark.isoformat()
+        if shards:
+            self._write_index(manifest)
+            logger.info("Sitemap updated: %s shards rewritten", len(shards))
+        else:
+            self._save_manifest(manifest)
+        return manifest
+
+    def refresh(self, static_urls, force_rebuild: bool = False, wait: bool = False) -> Optional[dict]:
+        """Bring the files up to date.
+
+        Returns None if another process is at it, unless ``wait`` is set: then
+        it waits for that process and brings the files up to date after it.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(LOCK_FILE), 'w') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return None
+            manifest = self.manifest()
+            if force_rebuild or manifest is None or time.time() - manifest.get('rebuilt_at', 0) >= FULL_REBUILD_SECONDS:
+                return self.rebuild(static_urls)
+            return self.update(manifest)
+
+    # ------------------------------------------------------------------
+    # Request path
+    # ------------------------------------------------------------------
+    def ensure_built(self, static_urls):
+        """Build the files inline when there are none yet (a new instance)."""
+        if self.index_path():
+            return
+        with self._build_lock:
+            if not self.index_path():
+                self.refresh(static_urls, wait=True)
+                with self._lock:
+                    self._checked_at = time.time()
+
+    def ensure_fresh(self, app, static_urls):
+        """Start a background refresh if the files are missing or due one.
+
+        Never blocks: the caller serves whatever is on disk.
+        """
+        now = time.time()
+        with self._lock:
+            if self._refreshing or (now - self._checked_at < self.refresh_seconds and self.index_path()):
+                return
+            self._refreshing = True
+            self._checked_at = now
+
+        def run():
+            try:
+                with app.app_context():
+                    self.refresh(static_urls)
+            except Exception as exc:
+                logger.error("Sitemap refresh failed: %s", exc)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name='sitemap-refresh', daemon=True).start()
+
+
+_stores: Dict[str, SitemapStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_sitemap_store(app) -> SitemapStore:
+    """The sitemap store configured for ``app`` (SITEMAP_DIR, SITEMAP_BASE_URL)."""
+    directory = app.config.get('SITEMAP_DIR') or DEFAULT_DIRECTORY
+    with _stores_lock:
+        store = _stores.get(directory)
+        if store is None:
+            store = _stores[directory] = SitemapStore(
+                directory,
+                base_url=app.config.get('SITEMAP_BASE_URL', DEFAULT_BASE_URL),
+                refresh_seconds=float(app.config.get('SITEMAP_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS)),
+            )
+        return store
@@ -0,0 +1,281 @@
+"""Prefix autocomplete over craftsmen, skills, categories and locations.
+
+The search box used to run a full craftsman search per keystroke. Suggestions
+are now answered from memory:
+
+* suggestion terms (business names, skills, category names, cities and
+  districts) carry a popularity weight and are kept up to date by
+  ``CraftsmanProjection`` (ORM write hooks plus periodic delta sync);
+  categories are reloaded on the same sync interval;
+* readers use an immutable snapshot of the terms, sorted by folded key so a
+  prefix is found with binary search, plus precomputed top lists for very
+  short prefixes. Once the index is built they take no lock: ``sync`` checks
+  its timestamps first, and writes only mark the snapshot stale and schedule
+  a rebuild on a background timer, at most once per
+  ``SNAPSHOT_REFRESH_SECONDS``. Only the first build happens on a request.
+"""
+
+import bisect
+import heapq
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.models.category import Category
+from app.utils.craftsman_projection import SYNC_INTERVAL_SECONDS, CraftsmanProjection
+from app.utils.search_index import fold_turkish, tokenize
+
+logger = logging.getLogger(__name__)
+
+SUGGESTION_TYPES = ('craftsman', 'skill', 'category', 'city', 'district')
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+# Prefixes up to this length get their top suggestions precomputed, since
+# their key ranges are too wide to scan per keystroke
+PRECOMPUTED_PREFIX_LENGTH = 2
+PRECOMPUTED_TOP = MAX_LIMIT * 2
+
+SNAPSHOT_REFRESH_SECONDS = 1.0
+
+# (type, folded text) identifies an aggregated term; craftsmen use their id
+TermKey = Tuple[str, object]
+
+
+def _search_keys(text: str) -> List[str]:
+    """Folded keys a term is found under: the whole text and each word suffix"""
+    words = tokenize(text)
+    return [' '.join(words[position:]) for position in range(len(words))]
+
+
+def _split_skills(skills) -> List[str]:
+    """Individual skill names from the JSON skills column (or comma separated text)"""
+    if not skills:
+        return []
+    if isinstance(skills, str):
+        try:
+            skills = json.loads(skills)
+        except (json.JSONDecodeError, TypeError):
+            skills = skills.split(',')
+    if not isinstance(skills, (list, tuple)):
+        skills = [skills]
+    return [str(skill).strip() for skill in skills if str(skill).strip()]
+
+
+class _Snapshot:
+    """Immutable sorted view of the suggestion terms"""
+
+    __slots__ = ('keys', 'entries', 'top')
+
+    def __init__(self, terms: Dict[TermKey, dict]):
+        rows = []
+        for term_key, term in terms.items():
+            if term['weight'] <= 0:
+                continue
+            for search_key in _search_keys(term['text']):
+                rows.append((search_key, term_key))
+        rows.sort()
+        self.keys = [row[0] for row in rows]
+        self.entries = [(term_key, terms[term_key]) for _, term_key in rows]
+
+        grouped = defaultdict(dict)
+        for search_key, (term_key, term) in zip(self.keys, self.entries):
+            for length in range(1, min(PRECOMPUTED_PREFIX_LENGTH, len(search_key)) + 1):
+                grouped[search_key[:length]][term_key] = term
+        self.top = {
+            prefix: heapq.nlargest(PRECOMPUTED_TOP, candidates.items(), key=lambda item: item[1]['weight'])
+            for prefix, candidates in grouped.items()
+        }
+
+    def lookup(self, prefix: str, full: bool = False) -> Iterable[Tuple[TermKey, dict]]:
+        """Terms under ``prefix``; short prefixes return their precomputed top list unless ``full``"""
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH and not full:
+            return self.top.get(prefix, [])
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff', start)
+        return self.entries[start:end]
+
+
+class SuggestionIndex(CraftsmanProjection):
+    """Weighted suggestion terms derived from craftsmen and categories"""
+
+    name = 'Suggestion index'
+    craftsman_columns = (
+        'business_name', 'skills', 'city', 'district',
+        'average_rating', 'total_reviews', 'is_available',
+    )
+    user_columns = ('is_active',)
+
+    def __init__(self):
+        self._terms: Dict[TermKey, dict] = {}
+        self._contributions: Dict[int, List[Tuple[TermKey, str, float]]] = {}
+        self._craftsman_values: Dict[int, dict] = {}
+        self._active: Dict[int, bool] = {}
+        self._snapshot: Optional[_Snapshot] = None
+        self._snapshot_stale = True
+        self._refresh_timer: Optional[threading.Timer] = None
+        self._categories_loaded_at = 0.0
+        super().__init__()
+
+    # ------------------------------------------------------------------
+    # Term bookkeeping
+    # ------------------------------------------------------------------
+    def _add_term(self, term_key: TermKey, text: str, weight: float, extra: dict):
+        term = self._terms.get(term_key)
+        if term is None:
+            term = self._terms[term_key] = {'text': text, 'weight': 0.0, **extra}
+        term['weight'] += weight
+
+    def _remove_term(self, term_key: TermKey, weight: float):
+        term = self._terms.get(term_key)
+        if term is None:
+            return
+        term['weight'] -= weight
+        if term['weight'] <= 1e-9:
+            del self._terms[term_key]
+
+    @staticmethod
+    def _craftsman_terms(craftsman_id: int, values: dict) -> List[Tuple[TermKey, str, float, dict]]:
+        terms = []
+        popularity = 1 + (values['total_reviews'] or 0) + float(values['average_rating'] or 0)
+        if values['business_name']:
+            terms.append((('craftsman', craftsman_id), values['business_name'], popularity, {'id': craftsman_id}))
+        for skill in _split_skills(values['skills']):
+            terms.append((('skill', fold_turkish(skill)), skill, 1, {}))
+        if values['city']:
+            terms.append((('city', fold_turkish(values['city'])), values['city'], 1, {}))
+            if values['district']:
+                terms.append((
+                    ('district', fold_turkish(f"{values['district']}|{values['city']}")),
+                    values['district'], 1, {'city': values['city']}
+                ))
+        return terms
+
+    def _refresh_contributions(self, craftsman_id: int):
+        for term_key, _, weight in self._contributions.pop(craftsman_id, []):
+            self._remove_term(term_key, weight)
+
+        values = self._craftsman_values.get(craftsman_id)
+        if values is None or not values['is_available'] or not self._active.get(craftsman_id, True):
+            self._mark_stale()
+            return
+
+        contributions = []
+        for term_key, text, weight, extra in self._craftsman_terms(craftsman_id, values):
+            self._add_term(term_key, text, weight, extra)
+            contributions.append((term_key, text, weight))
+        self._contributions[craftsman_id] = contributions
+        self._mark_stale()
+
+    def _apply(self, craftsman_id, craftsman_values, user_values):
+        if craftsman_values is not None:
+            self._craftsman_values[craftsman_id] = craftsman_values
+        if user_values is not None:
+            self._active[craftsman_id] = user_values['is_active'] is not False
+        self._refresh_contributions(craftsman_id)
+
+    def _discard(self, craftsman_id):
+        self._craftsman_values.pop(craftsman_id, None)
+        self._active.pop(craftsman_id, None)
+        self._refresh_contributions(craftsman_id)
+
+    def _reset(self):
+        self._terms.clear()
+        self._contributions.clear()
+        self._craftsman_values.clear()
+        self._active.clear()
+        self._snapshot = None
+        self._snapshot_stale = True
+        self._categories_loaded_at = 0.0
+
+    def _load_categories(self):
+        for term_key in [term_key for term_key in self._terms if term_key[0] == 'category']:
+            del self._terms[term_key]
+        for category in Category.query.filter(Category.is_active == True).all():
+            weight = 1 + (category.total_craftsmen or 0) + (category.total_jobs or 0) + (10 if category.is_featured else 0)
+            self._add_term(('category', category.id), category.name, weight, {'id': category.id})
+        self._categories_loaded_at = time.time()
+        self._mark_stale()
+
+    def sync(self, force: bool = False):
+        if not force and self._is_fresh() and time.time() - self._categories_loaded_at < SYNC_INTERVAL_SECONDS:
+            return
+        with self._lock:
+            super().sync(force)
+            if force or time.time() - self._categories_loaded_at >= SYNC_INTERVAL_SECONDS:
+                self._load_categories()
+            if self._snapshot is None:
+                self._build_snapshot()
+
+    # ------------------------------------------------------------------
+    # Snapshot
+    # ------------------------------------------------------------------
+    def _build_snapshot(self):
+        with self._lock:
+            self._snapshot_stale = False
+            self._snapshot = _Snapshot({
+                term_key: dict(term) for term_key, term in self._terms.items()
+            })
+
+    def _mark_stale(self):
+        """Schedule a background rebuild of the snapshot; callers hold the lock"""
+        self._snapshot_stale = True
+        if self._snapshot is None or self._refresh_timer is not None:
+            return
+        self._refresh_timer = threading.Timer(SNAPSHOT_REFRESH_SECONDS, self._refresh_snapshot)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _refresh_snapshot(self):
+        with self._lock:
+            self._refresh_timer = None
+            if self._snapshot is not None and self._snapshot_stale:
+                self._build_snapshot()
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    def _current_snapshot(self) -> _Snapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None:
+                self._build_snapshot()
+            return self._snapshot
+
+    def suggest(self, text: str, limit: int = DEFAULT_LIMIT,
+                types: Optional[Iterable[str]] = None) -> List[dict]:
+        """Most popular terms with a word starting with ``text``"""
+        prefix = ' '.join(tokenize(text))
+        if not prefix:
+            return []
+        wanted = set(types) if types else None
+
+        best: Dict[TermKey, dict] = {}
+        # Type filters can empty a short prefix's top list, so scan its range
+        for term_key, term in self._current_snapshot().lookup(prefix, full=wanted is not None):
+            if wanted is None or term_key[0] in wanted:
+                best[term_key] = term
+        ranked = heapq.nlargest(limit, best.items(), key=lambda item: (item[1]['weight'], item[1]['text']))
+
+        suggestions = []
+        for (kind, _), term in ranked:
+            suggestion = {'type': kind, 'text': term['text'], 'weight': round(term['weight'], 2)}
+            for field in ('id', 'city'):
+                if field in term:
+                    suggestion[field] = term[field]
+            suggestions.append(suggestion)
+        return suggestions
+
+
+suggestion_index = SuggestionIndex()
+
+
+def get_suggestion_index() -> SuggestionIndex:
+    """Return the suggestion index, building or delta-syncing it as needed."""
+    suggestion_index.sync()
+    return suggestion_index
@@ -0,0 +1,372 @@
+"""Cross-worker telemetry collector for multi-process servers.
+
+Without it every gunicorn worker runs its own BigQuery client, spool and
+shipping threads, and ships the rows of one process only. With
+``BIGQUERY_COLLECTOR_SOCKET`` set, workers instead forward rows to a single
+collector process over a Unix domain socket, and the collector spools and
+ships the rows of all workers:
+
+* segments, streaming inserts (up to ``COLLECTOR_CHUNK_ROWS`` rows per
+  request) and load-job files fill from every worker, so batches are larger
+  and fewer;
+* workers hold no BigQuery client or background thread, just one socket.
+
+Rows travel in the spool's length + CRC32 frames over a stream socket
+(datagram queues are only ``net.unix.max_dgram_qlen`` messages deep). A
+worker never waits on the collector for more than ``send_timeout``: while
+the collector is down or behind, rows go to a spool of the worker's own in
+the shared spool directory, and the worker unlocks it once the collector
+is reachable again. The collector adopts unlocked spool directories like
+those of exited processes, so those rows are shipped as well.
+
+The collector is off by default. To enable it, set
+``BIGQUERY_COLLECTOR_SOCKET`` to a socket path in the environment of the
+gunicorn master, e.g. under ``env_variables`` in ``app.yaml``::
+
+    BIGQUERY_COLLECTOR_SOCKET: /tmp/ustam-telemetry.sock
+
+The master then starts the collector (see ``gunicorn.conf.py``). It can also
+be run on its own::
+
+    python -m app.utils.telemetry_collector --socket /tmp/ustam-telemetry.sock
+
+On SIGTERM it stops listening, reads what workers still send and drains
+its spool within ``SHUTDOWN_DEADLINE_SECONDS`` (app.utils.lifecycle).
+"""
+
+import argparse
+import logging
+import os
+import selectors
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from app.utils.json_encoding import dumps, loads
+from app.utils.telemetry_spool import DiskSpool, encode_frame, split_frames
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEND_TIMEOUT = 0.05
+DEFAULT_RETRY_SECONDS = 5
+# BigQuery's recommended upper bound for rows per streaming insert
+COLLECTOR_CHUNK_ROWS = 500
+
+_RECV_BYTES = 256 * 1024
+
+
+class CollectorClient:
+    """Worker side: forwards rows to the collector, spools them while it is unreachable"""
+
+    def __init__(self, socket_path: str, open_spool: Callable[[], Optional[DiskSpool]],
+                 send_timeout: float = DEFAULT_SEND_TIMEOUT, retry_seconds: float = DEFAULT_RETRY_SECONDS):
+        self.socket_path = socket_path
+        self._open_spool = open_spool
+        self.send_timeout = send_timeout
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._socket: Optional[socket.socket] = None
+        self._next_connect_at = 0.0
+        self._spool: Optional[DiskSpool] = None
+        self._last_spooled_at = 0.0
+        self._counters = {'forwarded': 0, 'spooled': 0, 'dropped': 0}
+
+    def send(self, record: Dict[str, Any]) -> bool:
+        """Forward ``record``; False if it could neither be sent nor spooled"""
+        frame = encode_frame(dumps(record))
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the socket and spool belong to the parent
+                self._pid = os.getpid()
+                self._socket = None
+                self._spool = None
+            now = time.monotonic()
+            if self._socket is None and now >= self._next_connect_at:
+                self._connect(now)
+            if self._socket is not None:
+                try:
+                    self._socket.sendall(frame)
+                except OSError as e:  # socket.timeout included: the collector is behind
+                    self._disconnect(now, e)
+                else:
+                    self._counters['forwarded'] += 1
+                    if self._spool is not None and now - self._last_spooled_at >= self.retry_seconds:
+                        self._hand_over()
+                    return True
+            return self._spool_locally(record, now)
+
+    def _connect(self, now: float):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.send_timeout)
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            self._next_connect_at = now + self.retry_seconds
+            logger.warning("Telemetry collector unreachable at %s, spooling locally: %s", self.socket_path, e)
+            return
+        self._socket = sock
+
+    def _disconnect(self, now: float, error: Exception):
+        # A frame may have been cut short; closing the stream lets the
+        # collector discard it instead of misreading what follows
+        self._socket.close()
+        self._socket = None
+        self._next_connect_at = now + self.retry_seconds
+        logger.warning("Lost the telemetry collector at %s, spooling locally: %s", self.socket_path, error)
+
+    def _spool_locally(self, record: Dict[str, Any], now: float) -> bool:
+        if self._spool is None:
+            self._spool = self._open_spool()
+        if self._spool is None or not self._spool.append(record):
+            self._counters['dropped'] += 1
+            return False
+        self._counters['spooled'] += 1
+        self._last_spooled_at = now
+        return True
+
+    def _hand_over(self):
+        spool, self._spool = self._spool, None
+        try:
+            spool.hand_over()
+        except OSError as e:
+            logger.error("Could not hand spool %s over to the collector: %s", spool.directory, e)
+            return
+        logger.info("Telemetry collector is back; handed %s over to it", spool.directory)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['connected'] = self._socket is not None
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+            if self._spool is not None:
+                self._hand_over()
+
+
+class _Connection:
+    __slots__ = ('buffer',)
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+
+class TelemetryCollector:
+    """Collector side: accepts worker connections and passes their rows to ``sink``"""
+
+    def __init__(self, socket_path: str, sink: Callable[[Dict[str, Any]], Any]):
+        self.socket_path = socket_path
+        self._sink = sink
+        self._selector = selectors.DefaultSelector()
+        self._server: Optional[socket.socket] = None
+        self._lock_file = None
+        self._connections = 0
+        self._counters = {'received': 0, 'rejected': 0, 'torn': 0, 'corrupt': 0}
+
+    def bind(self):
+        """Listen on ``socket_path``; raises RuntimeError if another collector does"""
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(f'{self.socket_path}.lock', 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise RuntimeError(f'another telemetry collector is listening on {self.socket_path}')
+        try:
+            os.unlink(self.socket_path)  # left behind by a collector that died
+        except FileNotFoundError:
+            pass
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen(128)
+        server.setblocking(False)
+        self._server = server
+        self._selector.register(server, selectors.EVENT_READ, None)
+        logger.info("Telemetry collector listening on %s", self.socket_path)
+
+    def serve(self, stop: threading.Event, tick: Optional[Callable[[], Any]] = None):
+        """Receive rows until ``stop`` is set, calling ``tick`` about once a second"""
+        while not stop.is_set():
+            for key, _ in self._selector.select(timeout=1):
+                if key.data is None:
+                    self._accept()
+                else:
+                    self._receive(key.fileobj, key.data)
+            if tick is not None:
+                tick()
+
+    def drain(self, deadline: float) -> dict:
+        """Stop listening and read what connected workers still send until ``deadline``"""
+        received = self._counters['received']
+        if self._server is not None:
+            self._selector.unregister(self._server)
+            self._close_server()
+        while self._connections and time.monotonic() < deadline:
+            for key, _ in self._selector.select(timeout=min(0.2, max(0.0, deadline - time.monotonic()))):
+                self._receive(key.fileobj, key.data)
+        return {'received': self._counters['received'] - received, 'still_connected': self._connections}
+
+    def _accept(self):
+        try:
+            connection, _ = self._server.accept()
+        except BlockingIOError:
+            return
+        connection.setblocking(False)
+        self._selector.register(connection, selectors.EVENT_READ, _Connection())
+        self._connections += 1
+
+    def _receive(self, connection: socket.socket, state: _Connection):
+        try:
+            data = connection.recv(_RECV_BYTES)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            if state.buffer:
+                # The worker gave up half way through a frame
+                self._counters['torn'] += 1
+            self._drop(connection)
+            return
+        state.buffer += data
+        payloads, consumed, corrupt = split_frames(state.buffer)
+        del state.buffer[:consumed]
+        for payload in payloads:
+            self._deliver(payload)
+        if corrupt:
+            self._counters['corrupt'] += 1
+            logger.error("Corrupt frame from a telemetry worker; closing its connection")
+            self._drop(connection)
+
+    def _deliver(self, payload):
+        try:
+            record = loads(payload)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict) or 'table' not in record or 'data' not in record:
+            self._counters['rejected'] += 1
+            return
+        self._counters['received'] += 1
+        self._sink(record)
+
+    def _drop(self, connection: socket.socket):
+        self._selector.unregister(connection)
+        connection.close()
+        self._connections -= 1
+
+    def _close_server(self):
+        if self._server is None:
+            return
+        self._server.close()
+        self._server = None
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        stats = dict(self._counters)
+        stats['connections'] = self._connections
+        return stats
+
+    def close(self):
+        for key in list(self._selector.get_map().values()):
+            if key.data is not None:
+                self._drop(key.fileobj)
+        self._selector.close()
+        self._close_server()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def _metrics_file_collector(collector: TelemetryCollector):
+    """Share the collector's telemetry metrics through METRICS_DIR, like a worker"""
+    directory = os.environ.get('METRICS_DIR')
+    if not directory or os.environ.get('METRICS_ENABLED', 'true').lower() != 'true':
+        return None
+    from app.utils import metrics
+
+    def collector_samples() -> Iterable[metrics.Sample]:
+        stats = collector.stats()
+        for outcome in ('received', 'rejected', 'torn', 'corrupt'):
+            yield metrics.Sample('counter', 'ustam_telemetry_collector_rows_total', {'outcome': outcome},
+                                 stats[outcome])
+        yield metrics.Sample('gauge', 'ustam_telemetry_collector_connections', {}, stats['connections'])
+
+    metrics.registry.register_collector(metrics.telemetry_samples)
+    metrics.registry.register_collector(collector_samples)
+    return metrics.FileCollector(
+        directory, float(os.environ.get('METRICS_FLUSH_SECONDS', metrics.DEFAULT_FLUSH_SECONDS))
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Batch BigQuery telemetry rows from all app workers')
+    parser.add_argument('--socket', default=os.environ.get('BIGQUERY_COLLECTOR_SOCKET'),
+                        help='Unix socket to listen on (default: $BIGQUERY_COLLECTOR_SOCKET)')
+    args = parser.parse_args(argv)
+    if not args.socket:
+        parser.error('--socket or BIGQUERY_COLLECTOR_SOCKET is required')
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s telemetry-collector[%(process)d] %(levelname)s %(name)s: %(message)s')
+
+    # This process ships rows itself instead of forwarding them
+    os.environ.pop('BIGQUERY_COLLECTOR_SOCKET', None)
+    from app.utils import metrics
+    from app.utils.bigquery_logger import bigquery_logger
+    from app.utils.lifecycle import DEFAULT_DEADLINE_SECONDS, shutdown_manager
+
+    if not bigquery_logger.enabled:
+        logger.error("BigQuery logging is unavailable; not starting the telemetry collector")
+        return 1
+    bigquery_logger.flusher.chunk_rows = COLLECTOR_CHUNK_ROWS
+
+    collector = TelemetryCollector(args.socket, bigquery_logger.accept_forwarded)
+    try:
+        collector.bind()
+    except (OSError, RuntimeError) as e:
+        logger.error("Telemetry collector not started: %s", e)
+        return 1
+
+    file_collector = _metrics_file_collector(collector)
+    tick = None
+    # Connections first, so rows still in flight reach the spool before it drains
+    shutdown_manager.deadline_seconds = float(os.environ.get('SHUTDOWN_DEADLINE_SECONDS', DEFAULT_DEADLINE_SECONDS))
+    shutdown_manager.register('collector', collector.drain)
+    shutdown_manager.register('bigquery', bigquery_logger.shutdown)
+    if file_collector is not None:
+        tick = lambda: file_collector.flush(metrics.registry)
+        shutdown_manager.register('metrics', lambda deadline: file_collector.flush(metrics.registry, force=True))
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+    shutdown_manager.install()  # atexit only: SIGTERM is handled above
+    try:
+        collector.serve(stop, tick)
+        shutdown_manager.shutdown('SIGTERM')
+    finally:
+        collector.close()
+    logger.info("Telemetry collector stopped: %s", collector.stats())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Per-endpoint sampling for BigQuery telemetry rows.
+
+BigQueryLogger used to queue a row for every request, health checks and
+polling endpoints included, so under load its queue filled up and rows were
+dropped at random. Rows are now sampled before they are queued:
+
+* head-based: each (endpoint, event type) gets a keep rate from the first
+  matching rule (fnmatch patterns), falling back to the default rate. The
+  decision hashes the request id, so every row of a request is kept or
+  dropped together;
+* tail-based: rows for errors and for requests slower than
+  ``slow_request_ms`` are always kept, whatever the rate.
+
+Kept rows record the ``sample_rate`` they were kept at (1.0 for the
+always-keep cases), so dashboards can re-weight counts with
+``SUM(1 / sample_rate)``.
+"""
+
+import fnmatch
+import json
+import threading
+import zlib
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+DEFAULT_SLOW_REQUEST_MS = 1000
+
+# Event types that are never sampled
+UNSAMPLED_EVENTS = frozenset({'error_logs', 'payment_analytics'})
+
+
+class SamplingRule(NamedTuple):
+    endpoint: str
+    event: str
+    rate: float
+
+
+DEFAULT_RULES: Tuple[SamplingRule, ...] = (
+    SamplingRule('*health*', '*', 0.01),
+    SamplingRule('*.get_unread_count', '*', 0.05),
+    SamplingRule('mobile_api.incremental_sync', '*', 0.1),
+)
+
+
+def parse_rules(rules) -> Tuple[SamplingRule, ...]:
+    """Rules from config: a JSON string or a list of dicts/tuples.
+
+    ``[{"endpoint": "search.*", "event": "search_analytics", "rate": 0.2}]``;
+    ``event`` defaults to ``*``.
+    """
+    if rules is None:
+        return DEFAULT_RULES
+    if isinstance(rules, str):
+        rules = json.loads(rules) if rules.strip() else []
+    parsed = []
+    for rule in rules:
+        if isinstance(rule, dict):
+            rule = (rule['endpoint'], rule.get('event', '*'), rule['rate'])
+        endpoint, event, rate = rule
+        parsed.append(SamplingRule(endpoint, event, min(max(float(rate), 0.0), 1.0)))
+    return tuple(parsed)
+
+
+def _unit_interval(key: str) -> float:
+    """Deterministic position of ``key`` in [0, 1)"""
+    return zlib.crc32(key.encode('utf-8')) / 4294967296.0
+
+
+class TelemetrySampler:
+    """Decides whether a telemetry row is kept, and at which rate."""
+
+    def __init__(self, default_rate: float = 1.0, rules: Iterable[SamplingRule] = DEFAULT_RULES,
+                 slow_request_ms: Optional[int] = DEFAULT_SLOW_REQUEST_MS):
+        self.default_rate = min(max(float(default_rate), 0.0), 1.0)
+        self.rules = tuple(rules)
+        self.slow_request_ms = slow_request_ms
+        self._rates: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_config(cls, config) -> 'TelemetrySampler':
+        return cls(
+            default_rate=config.get('TELEMETRY_SAMPLE_RATE', 1.0),
+            rules=parse_rules(config.get('TELEMETRY_SAMPLING_RULES')),
+            slow_request_ms=config.get('TELEMETRY_SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS),
+        )
+
+    def rate_for(self, endpoint: Optional[str], event: str) -> float:
+        if event in UNSAMPLED_EVENTS:
+            return 1.0
+        endpoint = endpoint or ''
+        key = (endpoint, event)
+        rate = self._rates.get(key)
+        if rate is None:
+            rate = self.default_rate
+            for rule in self.rules:
+                if fnmatch.fnmatchcase(endpoint, rule.endpoint) and fnmatch.fnmatchcase(event, rule.event):
+                    rate = rule.rate
+                    break
+            self._rates[key] = rate
+        return rate
+
+    def sample(self, key: str, endpoint: Optional[str], event: str,
+               duration_ms: Optional[int] = None, error: bool = False) -> Optional[float]:
+        """The rate the row is kept at, or None if it is sampled out.
+
+        ``key`` should identify the request, so all its rows agree.
+        """
+        if error or (
+            self.slow_request_ms is not None and duration_ms is not None and duration_ms >= self.slow_request_ms
+        ):
+            kept_rate = 1.0
+        else:
+            rate = self.rate_for(endpoint, event)
+            kept_rate = rate if rate > 0 and (rate >= 1 or _unit_interval(key) < rate) else None
+        self._count(event, 'kept' if kept_rate is not None else 'sampled_out')
+        return kept_rate
+
+    def _count(self, event: str, outcome: str):
+        with self._lock:
+            counters = self._counters.setdefault(event, {'kept': 0, 'sampled_out': 0})
+            counters[outcome] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {event: dict(counters) for event, counters in self._counters.items()}
@@ -0,0 +1,364 @@
+"""Disk-backed spool for BigQuery telemetry rows.
+
+``BigQueryLogger`` used to buffer rows in a 1000-slot in-memory queue: rows
+were dropped whenever it was full and lost whenever the process exited. Rows
+are now appended to segment files on local disk and shipped from there.
+
+* Records are length-prefixed and checksummed (``>II`` length + CRC32, then
+  the JSON payload). A torn write at the end of a segment after a crash is
+  detected and skipped on replay.
+* The writer appends to one active segment with an unbuffered write, which
+  survives a process crash. It rotates to a new segment past
+  ``segment_bytes``. ``sync()`` fsyncs at most once per call, so the worker
+  batches fsyncs instead of paying one per row.
+* Each process spools into its own subdirectory and holds an ``flock`` on
+  it. Directories whose lock can be taken belong to processes that have
+  exited: the first process to take the lock keeps it, replays their
+  segments (the unsealed one included) and removes the directory.
+* Shipped segments are deleted. Past ``max_bytes`` on disk new rows are
+  dropped and counted.
+* On App Engine standard the only writable directory, ``/tmp``, is held in
+  the instance's memory and goes away with it. ``max_bytes`` therefore
+  defaults to 32 MB, and rows left in the spool outlive a process only while
+  another process on the same instance is alive to replay them
+  (``live_processes``).
+
+The same framing carries rows from workers to the cross-process collector
+(app.utils.telemetry_collector), see ``encode_frame`` and ``split_frames``.
+"""
+
+import logging
+import os
+import secrets
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from app.utils.json_encoding import dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_BYTES = 1024 * 1024
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+_HEADER = struct.Struct('>II')  # payload length, CRC32 of payload
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+_SEGMENT_PREFIX = 'segment-'
+_SEGMENT_SUFFIX = '.log'
+_LOCK_NAME = '.lock'
+
+# Seconds between "spool full" warnings
+_FULL_WARNING_INTERVAL = 60
+
+
+class Segment(NamedTuple):
+    path: str
+    # Segments of an exited process: the directory goes once they are shipped
+    orphaned: bool
+
+    @property
+    def key(self) -> str:
+        """``<process directory>/<segment>``, unique across processes and restarts"""
+        directory, name = os.path.split(self.path)
+        return f'{os.path.basename(directory)}/{name}'
+
+
+def _segment_name(sequence: int) -> str:
+    return f'{_SEGMENT_PREFIX}{sequence:012d}{_SEGMENT_SUFFIX}'
+
+
+def _segment_files(directory: str) -> List[str]:
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX))
+
+
+def _fsync_directory(directory: str):
+    if not hasattr(os, 'O_DIRECTORY'):  # pragma: no cover - Windows
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def encode_frame(payload: bytes) -> bytes:
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def split_frames(data: bytes) -> Tuple[List[bytes], int, bool]:
+    """Payloads of the complete frames at the start of ``data``.
+
+    Returns the payloads, the number of bytes they take and whether a frame
+    was corrupt (bad checksum or impossible length); an incomplete frame at
+    the end is left for the caller to complete.
+    """
+    payloads = []
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        length, checksum = _HEADER.unpack_from(data, offset)
+        if length > MAX_FRAME_BYTES:
+            return payloads, offset, True
+        start = offset + _HEADER.size
+        if start + length > len(data):
+            break
+        payload = data[start:start + length]
+        if zlib.crc32(payload) != checksum:
+            return payloads, offset, True
+        payloads.append(payload)
+        offset = start + length
+    return payloads, offset, False
+
+
+def read_segment(path: str) -> Iterator[Tuple[int, dict]]:
+    """``(offset, record)`` pairs of a segment, stopping at a torn tail"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        length, checksum = _HEADER.unpack_from(data, offset)
+        start = offset + _HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            break
+        yield offset, loads(payload)
+        offset = start + length
+    if offset < len(data):
+        logger.warning("Skipping %s torn bytes at the end of %s", len(data) - offset, path)
+
+
+def live_processes(root: str, exclude: Iterable[str] = ()) -> int:
+    """Process directories under ``root`` (other than ``exclude``) whose lock is held by a running process"""
+    if fcntl is None:
+        return 0
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return 0
+    excluded = {os.path.basename(path) for path in exclude}
+    live = 0
+    for name in names:
+        if not name.startswith('worker-') or name in excluded:
+            continue
+        try:
+            lock_file = open(os.path.join(root, name, _LOCK_NAME), 'a')
+        except OSError:
+            continue
+        try:
+            # Closing the file below releases the lock if we got it
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            live += 1
+        finally:
+            lock_file.close()
+    return live
+
+
+class ProcessDirectory:
+    """This process's subdirectory of ``root``, locked for its lifetime.
+
+    ``orphaned()`` adopts the subdirectories of processes that have exited:
+    their lock is free, and the adopting process keeps it until
+    ``release()`` so no other process replays the same files.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        # The random suffix keeps a recycled pid from reusing an old directory
+        self.path = os.path.join(root, f'worker-{os.getpid()}-{secrets.token_hex(4)}')
+        os.makedirs(self.path, exist_ok=True)
+        self._lock_file = open(os.path.join(self.path, _LOCK_NAME), 'a')
+        if fcntl is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Adopted directory -> its lock file, held open
+        self._adopted: Dict[str, object] = {}
+
+    def orphaned(self) -> List[str]:
+        if fcntl is None:
+            return []
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        for name in sorted(names):
+            directory = os.path.join(self.root, name)
+            if directory == self.path or directory in self._adopted or not name.startswith('worker-'):
+                continue
+            try:
+                lock_file = open(os.path.join(directory, _LOCK_NAME), 'a')
+            except OSError:  # not a directory, or removed meanwhile
+                continue
+            try:
+                # Held for as long as the owning (or adopting) process is alive
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            self._adopted[directory] = lock_file
+        return sorted(self._adopted)
+
+    def close(self):
+        """Give up this directory and the adopted ones; their files become orphans"""
+        for lock_file in self._adopted.values():
+            lock_file.close()
+        self._adopted.clear()
+        self._lock_file.close()
+
+    def release(self, directory: str):
+        """Remove an adopted directory whose files have all been replayed"""
+        try:
+            os.unlink(os.path.join(directory, _LOCK_NAME))
+            os.rmdir(directory)
+        except OSError:
+            pass
+        lock_file = self._adopted.pop(directory, None)
+        if lock_file is not None:
+            lock_file.close()
+
+
+class DiskSpool:
+    """Append-only segmented spool, one subdirectory per process"""
+
+    def __init__(self, directory: str, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self._process_directory = ProcessDirectory(directory)
+        self.directory = self._process_directory.path
+
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._active = None
+        self._active_name: Optional[str] = None
+        self._active_size = 0
+        self._active_opened = 0.0
+        self._dirty = False
+        self._disk_bytes = 0
+        self._last_full_warning = 0.0
+        self.appended = 0
+        self.dropped = 0
+        self.shipped = 0
+
+    # Writer side (request threads)
+
+    def append(self, record: dict) -> bool:
+        """Append one record; False if the spool is full"""
+        frame = encode_frame(dumps(record))
+        with self._lock:
+            if self._disk_bytes + len(frame) > self.max_bytes:
+                self.dropped += 1
+                now = time.monotonic()
+                if now - self._last_full_warning >= _FULL_WARNING_INTERVAL:
+                    self._last_full_warning = now
+                    logger.warning("BigQuery spool full (%s bytes), dropping rows", self._disk_bytes)
+                return False
+            if self._active is None or self._active_size >= self.segment_bytes:
+                self._open_segment()
+            self._active.write(frame)
+            self._active_size += len(frame)
+            self._disk_bytes += len(frame)
+            self._dirty = True
+            self.appended += 1
+        return True
+
+    def _open_segment(self):
+        self._close_active()
+        self._sequence += 1
+        self._active_name = _segment_name(self._sequence)
+        # Unbuffered: every append reaches the OS, so a process crash loses nothing
+        self._active = open(os.path.join(self.directory, self._active_name), 'ab', buffering=0)
+        self._active_size = 0
+        self._active_opened = time.monotonic()
+        _fsync_directory(self.directory)
+
+    def _close_active(self):
+        if self._active is not None:
+            if self._dirty:
+                os.fsync(self._active.fileno())
+                self._dirty = False
+            self._active.close()
+            self._active = None
+            self._active_name = None
+
+    # Worker side
+
+    def sync(self):
+        """fsync the active segment if anything was appended since the last call"""
+        with self._lock:
+            if self._active is None or not self._dirty:
+                return
+            # A duplicate descriptor stays valid if the segment rotates meanwhile,
+            # and appends do not wait for the fsync
+            fd = os.dup(self._active.fileno())
+            self._dirty = False
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def rotate(self, older_than: float = 0.0):
+        """Seal the active segment if it has data and was opened ``older_than`` seconds ago"""
+        with self._lock:
+            if self._active is not None and self._active_size and \
+                    time.monotonic() - self._active_opened >= older_than:
+                self._close_active()
+
+    def ready_segments(self) -> List[Segment]:
+        """Sealed segments of this process, then every segment of exited processes"""
+        with self._lock:
+            # Listed under the lock: a segment opened in between would pass for sealed
+            active = self._active_name
+            names = _segment_files(self.directory)
+        segments = [Segment(os.path.join(self.directory, name), False) for name in names if name != active]
+        for directory in self._process_directory.orphaned():
+            names = _segment_files(directory)
+            if not names:
+                self._process_directory.release(directory)
+            segments.extend(Segment(os.path.join(directory, name), True) for name in names)
+        return segments
+
+    def commit(self, segment: Segment, records: int = 0):
+        """Delete a shipped segment (and an exited process's emptied directory)"""
+        try:
+            size = os.path.getsize(segment.path)
+            os.unlink(segment.path)
+        except FileNotFoundError:
+            return
+        self.shipped += records
+        directory = os.path.dirname(segment.path)
+        if segment.orphaned:
+            if not _segment_files(directory):
+                self._process_directory.release(directory)
+        else:
+            with self._lock:
+                self._disk_bytes = max(0, self._disk_bytes - size)
+
+    def close(self):
+        with self._lock:
+            self._close_active()
+
+    def hand_over(self):
+        """Close the spool and unlock its directory, for another process to ship"""
+        with self._lock:
+            self._close_active()
+            self._process_directory.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'appended': self.appended,
+                'shipped': self.shipped,
+                'dropped': self.dropped,
+                'disk_bytes': self._disk_bytes,
+            }
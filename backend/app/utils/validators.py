@@ -1,7 +1,14 @@
+import base64
+import binascii
+import json
 import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
 from functools import wraps
-from flask import request, jsonify
+from flask import request
+from app.utils.json_encoding import jsonify
 from marshmallow import Schema, fields, ValidationError, validates, validates_schema
+from sqlalchemy import and_, false, or_
 
 class ResponseHelper:
     """Helper class for standardized API responses"""
@@ -153,6 +160,12 @@ class SearchSchema(Schema):
     sort_order = fields.Str(required=False, validate=lambda x: x in ['asc', 'desc'], missing='desc')
     page = fields.Int(required=False, validate=lambda x: x > 0, missing=1)
     per_page = fields.Int(required=False, validate=lambda x: 1 <= x <= 50, missing=20)
+    cursor = fields.Str(required=False)  # keyset pagination; pass empty to start
+    include_total = fields.Bool(required=False, missing=False)
+    include_facets = fields.Bool(required=False, missing=False)
+    latitude = fields.Float(required=False, validate=lambda x: -90 <= x <= 90)  # for sort_by=distance
+    longitude = fields.Float(required=False, validate=lambda x: -180 <= x <= 180)
+    radius = fields.Float(required=False, validate=lambda x: 0 < x <= 500)  # km
 
 # Decorator for request validation
 def validate_json(schema_class):
@@ -320,13 +333,20 @@ class PaginationHelper:
     """Helper for paginated responses"""
     
     @staticmethod
-    def paginate_query(query, page=1, per_page=20):
-        """Paginate a SQLAlchemy query"""
-        total = query.count()
+    def paginate_query(query, page=1, per_page=20, total=None, approximate=False, serialize=True):
+        """Paginate a SQLAlchemy query
+
+        Pass ``total`` (e.g. from app.utils.count_cache) to skip the COUNT
+        query; ``approximate`` is echoed in the pagination block.
+        """
+        if total is None:
+            total = query.count()
         items = query.offset((page - 1) * per_page).limit(per_page).all()
+        if serialize:
+            items = [item.to_dict() if hasattr(item, 'to_dict') else item for item in items]
         
         return {
-            'items': [item.to_dict() if hasattr(item, 'to_dict') else item for item in items],
+            'items': items,
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -336,5 +356,148 @@ class PaginationHelper:
                 'has_next': page * per_page < total,
                 'prev_page': page - 1 if page > 1 else None,
                 'next_page': page + 1 if page * per_page < total else None,
+                'approximate': approximate,
             }
-        }
\ No newline at end of file
+        }
+
+    @staticmethod
+    def encode_cursor(values, signature):
+        """Encode sort key values into an opaque, URL-safe cursor"""
+        payload = {
+            's': signature,
+            'k': [PaginationHelper._encode_cursor_value(value) for value in values],
+        }
+        raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor, signature):
+        """Decode a cursor produced by encode_cursor for the same sort"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            if payload.get('s') != signature:
+                raise ValueError('cursor belongs to a different sort order')
+            keys = payload['k']
+            # One value per sort key, tiebreaker included
+            if not isinstance(keys, list) or len(keys) != len(signature.split(',')):
+                raise ValueError('cursor does not match the sort keys')
+            return [PaginationHelper._decode_cursor_value(value) for value in keys]
+        except (ValueError, TypeError, KeyError, InvalidOperation, binascii.Error) as exc:
+            raise ValueError(f'Geçersiz sayfa imleci: {exc}') from exc
+
+    @staticmethod
+    def _encode_cursor_value(value):
+        if isinstance(value, datetime):
+            return {'dt': value.isoformat()}
+        if isinstance(value, Decimal):
+            return {'dec': str(value)}
+        return value
+
+    @staticmethod
+    def _decode_cursor_value(value):
+        if isinstance(value, dict):
+            if 'dt' in value:
+                return datetime.fromisoformat(value['dt'])
+            if 'dec' in value:
+                return Decimal(value['dec'])
+            raise ValueError('unknown cursor value')
+        if value is not None and not isinstance(value, (bool, int, float, str)):
+            raise ValueError('unknown cursor value')
+        return value
+
+    @staticmethod
+    def _match_sort_key(column, value):
+        """Check a decoded cursor value against its column's type (numbers may widen)"""
+        if value is None:
+            return None
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            return value
+        if isinstance(value, python_type):
+            return value
+        if python_type in (float, Decimal) and isinstance(value, (int, float, Decimal)) \
+                and not isinstance(value, bool):
+            return python_type(str(value)) if python_type is Decimal else python_type(value)
+        raise ValueError(f'Geçersiz sayfa imleci: {column.key} değeri uyuşmuyor')
+
+    @staticmethod
+    def _keyset_after(sort_keys, values):
+        """Predicate selecting rows strictly after ``values`` in sort order.
+
+        NULLs sort as the smallest value in both directions, matching the
+        ORDER BY emitted by paginate_keyset.
+        """
+        clauses = []
+        for position, ((column, direction), value) in enumerate(zip(sort_keys, values)):
+            if direction == 'asc':
+                after = column.isnot(None) if value is None else column > value
+            else:
+                after = false() if value is None else or_(column < value, column.is_(None))
+
+            equal_prefix = [
+                prev_column.is_(None) if prev_value is None else prev_column == prev_value
+                for (prev_column, _), prev_value in zip(sort_keys[:position], values[:position])
+            ]
+            clauses.append(and_(*equal_prefix, after))
+        return or_(*clauses)
+
+    @staticmethod
+    def paginate_keyset(query, sort_keys, tiebreaker, per_page=20, cursor=None,
+                        include_total=False, serialize=True):
+        """Paginate a SQLAlchemy query with an opaque keyset cursor.
+
+        ``sort_keys`` is a list of ``(column, 'asc'|'desc')`` pairs and
+        ``tiebreaker`` a unique column (usually the primary key) appended with
+        the direction of the last sort key. Every page costs the same indexed
+        range scan as the first one; the exact total is only counted when
+        ``include_total`` is set. Raises ValueError for malformed cursors.
+        """
+        sort_keys = list(sort_keys) + [(tiebreaker, sort_keys[-1][1] if sort_keys else 'asc')]
+        signature = ','.join(f"{column.key}:{direction}" for column, direction in sort_keys)
+
+        total = query.count() if include_total else None
+
+        if cursor:
+            values = [
+                PaginationHelper._match_sort_key(column, value)
+                for (column, _), value in zip(sort_keys, PaginationHelper.decode_cursor(cursor, signature))
+            ]
+            query = query.filter(PaginationHelper._keyset_after(sort_keys, values))
+
+        entity_query = len(query.column_descriptions) == 1 and query.column_descriptions[0]['entity'] is not None \
+            and query.column_descriptions[0]['expr'] is query.column_descriptions[0]['entity']
+        key_labels = [f'cursor_key_{position}' for position in range(len(sort_keys))]
+        query = query.add_columns(*[
+            column.label(label) for (column, _), label in zip(sort_keys, key_labels)
+        ]).order_by(None).order_by(*[
+            column.asc().nulls_first() if direction == 'asc' else column.desc().nulls_last()
+            for column, direction in sort_keys
+        ])
+
+        rows = query.limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+
+        next_cursor = None
+        if has_next and rows:
+            next_cursor = PaginationHelper.encode_cursor(
+                [getattr(rows[-1], label) for label in key_labels], signature
+            )
+
+        items = [row[0] for row in rows] if entity_query else rows
+        if serialize:
+            items = [item.to_dict() if hasattr(item, 'to_dict') else item for item in items]
+
+        return {
+            'items': items,
+            'pagination': {
+                'mode': 'cursor',
+                'per_page': per_page,
+                'total': total,
+                'has_prev': bool(cursor),
+                'has_next': has_next,
+                'next_cursor': next_cursor,
+            }
+        }
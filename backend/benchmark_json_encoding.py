@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+JSON encoding benchmark
+
+Serves the high-volume listing endpoints from a throwaway SQLite database,
+once with Flask's stdlib JSON provider and once with FastJSONProvider, and
+reports the share of request time spent serializing the response.
+
+    python benchmark_json_encoding.py [--craftsmen 500] [--requests 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('BIGQUERY_LOGGING_ENABLED', 'false')
+os.environ.setdefault('COMPRESSION_ENABLED', 'false')
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import create_app, db
+from app.models.craftsman import Craftsman
+from app.models.user import User
+from app.utils.json_encoding import FastJSONProvider, orjson
+
+ENDPOINTS = (
+    '/api/v2/search/craftsmen?per_page=50',
+    '/api/airbnb/craftsmen?per_page=100',
+    '/api/search/craftsmen?per_page=50',
+)
+
+
+def timed(provider_class):
+    """Subclass of ``provider_class`` that accumulates time spent in response()"""
+
+    class TimedProvider(provider_class):
+        seconds = 0.0
+
+        def response(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return super().response(*args, **kwargs)
+            finally:
+                TimedProvider.seconds += time.perf_counter() - started
+
+    return TimedProvider
+
+
+def seed(count):
+    cities = ['İstanbul', 'Ankara', 'İzmir', 'Bursa']
+    skills = [['Elektrik Tesisatı', 'Aydınlatma'], ['Su Tesisatı', 'Kombi Bakımı'], ['İç Cephe Boyası', 'Alçı']]
+    password = User()
+    password.set_password('benchmark')  # hashing is slow; share one hash
+    for i in range(count):
+        user = User(email=f'bench{i}@ustam.test', phone=f'555{i:07d}', first_name='Usta', last_name=f'Çalışkan {i}',
+                    user_type='craftsman', is_active=True)
+        user.password_hash = password.password_hash
+        db.session.add(Craftsman(
+            user=user, business_name=f'Çalışkan Usta {i}', description='Güvenilir ve hızlı hizmet ' * 5,
+            skills=json.dumps(skills[i % 3], ensure_ascii=False), city=cities[i % 4], district='Merkez',
+            hourly_rate=Decimal('150.00') + i, average_rating=4.5, total_reviews=i % 40, is_available=True,
+        ))
+    db.session.commit()
+
+
+def run(app, provider_class, requests_per_endpoint):
+    provider = timed(provider_class)
+    app.json = provider(app)
+    client = app.test_client()
+    for endpoint in ENDPOINTS:  # warm up caches and compiled queries
+        client.get(endpoint)
+
+    provider.seconds = 0.0
+    started = time.perf_counter()
+    for _ in range(requests_per_endpoint):
+        for endpoint in ENDPOINTS:
+            response = client.get(endpoint)
+            assert response.status_code == 200, (endpoint, response.status_code)
+    total = time.perf_counter() - started
+    count = requests_per_endpoint * len(ENDPOINTS)
+    return total / count * 1000, provider.seconds / count * 1000, provider.seconds / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--craftsmen', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_app('testing')
+    app.config.update(SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}')
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(args.craftsmen)
+            results = [
+                ('stdlib (Flask default)', run(app, DefaultJSONProvider, args.requests)),
+                ('orjson' if orjson is not None else 'stdlib compact', run(app, FastJSONProvider, args.requests)),
+            ]
+            db.session.remove()
+    finally:
+        os.unlink(path)
+
+    print(f"{'encoder':<24}{'request ms':>12}{'encode ms':>12}{'encode share':>14}")
+    for name, (request_ms, encode_ms, share) in results:
+        print(f"{name:<24}{request_ms:>12.2f}{encode_ms:>12.3f}{share:>13.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,14 @@ def _comma_separated_list(value: str, default: List[str]) -> List[str]:
     return items or default
 
 
+def _deployed() -> bool:
+    """Running on App Engine or with FLASK_ENV=production, whichever config is active."""
+    return (
+        os.environ.get('GAE_ENV', '').startswith('standard')
+        or os.environ.get('FLASK_ENV', '').lower() == 'production'
+    )
+
+
 def _build_production_db_uri() -> str:
     """Construct a SQLAlchemy URI for Cloud SQL Postgres if credentials exist."""
 
@@ -65,6 +73,49 @@ class Config:
     RATE_LIMIT_DEFAULT_REQUESTS = int(os.environ.get('RATE_LIMIT_DEFAULT_REQUESTS', 100))
     RATE_LIMIT_DEFAULT_WINDOW = int(os.environ.get('RATE_LIMIT_DEFAULT_WINDOW', 60))
 
+    # Listing performance
+    COUNT_CACHE_TTL_SECONDS = int(os.environ.get('COUNT_CACHE_TTL_SECONDS', 60))
+
+    # Application cache (app.utils.cache); the Redis tier is optional
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+    CACHE_DEFAULT_TTL_SECONDS = int(os.environ.get('CACHE_DEFAULT_TTL_SECONDS', 300))
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or os.environ.get('REDIS_URL')
+
+    # Sharded sitemap files (app.utils.sitemap); defaults to <tmp>/ustam-sitemaps
+    SITEMAP_DIR = os.environ.get('SITEMAP_DIR')
+    SITEMAP_BASE_URL = os.environ.get('SITEMAP_BASE_URL', 'https://ustamapp.com')
+    SITEMAP_REFRESH_SECONDS = int(os.environ.get('SITEMAP_REFRESH_SECONDS', 300))
+
+    # Response compression (app.utils.compression)
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+    COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+    COMPRESSION_MIMETYPES = os.environ.get('COMPRESSION_MIMETYPES')
+
+    # BigQuery telemetry sampling (app.utils.telemetry_sampling); rules are a
+    # JSON list of {"endpoint": pattern, "event": table pattern, "rate": 0-1}
+    TELEMETRY_SAMPLE_RATE = float(os.environ.get('TELEMETRY_SAMPLE_RATE', 1.0))
+    TELEMETRY_SLOW_REQUEST_MS = int(os.environ.get('TELEMETRY_SLOW_REQUEST_MS', 1000))
+    TELEMETRY_SAMPLING_RULES = os.environ.get('TELEMETRY_SAMPLING_RULES')
+
+    # SQL query profiling (app.utils.query_profiler); X-Query-Count and
+    # Server-Timing headers are opted into by the non-production configs
+    QUERY_PROFILER_HEADERS = os.environ.get('QUERY_PROFILER_HEADERS', 'false').lower() == 'true'
+    QUERY_PROFILER_N_PLUS_ONE_THRESHOLD = int(os.environ.get('QUERY_PROFILER_N_PLUS_ONE_THRESHOLD', 5))
+
+    # Prometheus metrics at /metrics (app.utils.metrics); set METRICS_DIR to
+    # merge gunicorn workers, METRICS_TOKEN to require a bearer token. Deployed
+    # instances require the token: without one /metrics is not served
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_REQUIRE_TOKEN = _deployed()
+
+    # Seconds a stopping process spends draining telemetry (app.utils.lifecycle)
+    SHUTDOWN_DEADLINE_SECONDS = float(os.environ.get('SHUTDOWN_DEADLINE_SECONDS', 10))
+
     # CORS
     CORS_ALLOWED_ORIGINS = _comma_separated_list(
         os.environ.get('CORS_ALLOWED_ORIGINS'), ['*']
@@ -86,6 +137,10 @@ class DevelopmentConfig(Config):
 
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///ustalar_dev.db'
+    # create_app() falls back to this config on App Engine too
+    QUERY_PROFILER_HEADERS = os.environ.get(
+        'QUERY_PROFILER_HEADERS', 'false' if _deployed() else 'true'
+    ).lower() == 'true'
     RUN_DB_CREATE_ALL = True
     ENABLE_INIT_DB_ENDPOINT = True
 
@@ -95,6 +150,7 @@ class TestingConfig(Config):
 
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    QUERY_PROFILER_HEADERS = os.environ.get('QUERY_PROFILER_HEADERS', 'true').lower() == 'true'
     RUN_DB_CREATE_ALL = False
     ENABLE_INIT_DB_ENDPOINT = False
 
@@ -104,6 +160,7 @@ class ProductionConfig(Config):
 
     DEBUG = False
     SQLALCHEMY_DATABASE_URI = _build_production_db_uri()
+    METRICS_REQUIRE_TOKEN = True
     RUN_DB_CREATE_ALL = False
     ENABLE_INIT_DB_ENDPOINT = False
     CORS_ALLOWED_ORIGINS = _comma_separated_list(
@@ -0,0 +1,56 @@
+"""Gunicorn server hooks (gunicorn reads ./gunicorn.conf.py by default).
+
+With BIGQUERY_COLLECTOR_SOCKET set, the master runs the telemetry collector
+(app.utils.telemetry_collector) next to the workers: it is started before
+the first worker, restarted when a worker is forked after it died, and
+stopped once the workers have exited. Workers spool rows locally while it
+is down.
+
+Each worker drains its telemetry when it exits (app.utils.lifecycle).
+"""
+
+import os
+import subprocess
+import sys
+
+_collector = None
+
+
+def _start_collector(server):
+    global _collector
+    socket_path = os.environ.get('BIGQUERY_COLLECTOR_SOCKET')
+    if not socket_path:
+        return
+    _collector = subprocess.Popen(
+        [sys.executable, '-m', 'app.utils.telemetry_collector', '--socket', socket_path],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    server.log.info("Started telemetry collector (pid %s) on %s", _collector.pid, socket_path)
+
+
+def on_starting(server):
+    _start_collector(server)
+
+
+def pre_fork(server, worker):
+    if _collector is not None and _collector.poll() is not None:
+        server.log.warning("Telemetry collector exited with %s, restarting it", _collector.returncode)
+        _start_collector(server)
+
+
+def worker_exit(server, worker):
+    from app.utils.lifecycle import shutdown_manager
+
+    shutdown_manager.shutdown('worker exit')
+
+
+def on_exit(server):
+    if _collector is None or _collector.poll() is not None:
+        return
+    _collector.terminate()
+    try:
+        # The collector drains within SHUTDOWN_DEADLINE_SECONDS
+        _collector.wait(timeout=float(os.environ.get('SHUTDOWN_DEADLINE_SECONDS', 10)) + 10)
+    except subprocess.TimeoutExpired:
+        server.log.error("Telemetry collector did not stop in time, killing it")
+        _collector.kill()
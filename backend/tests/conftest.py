@@ -14,6 +14,13 @@ def app():
     db_fd, db_path = tempfile.mkstemp()
     
     app = create_app()
+    # In-memory craftsman views and cached counts outlive a test database,
+    # whose temporary file name may also be recycled
+    from app.utils import count_cache
+    from app.utils.craftsman_projection import _projections
+    for projection in _projections:
+        projection.clear()
+    count_cache.clear()
     app.config.update({
         'TESTING': True,
         'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
@@ -100,6 +107,34 @@ def test_craftsman(app):
         
         return user
 
+@pytest.fixture
+def make_craftsman(app):
+    """Factory creating an active craftsman; returns the Craftsman"""
+    created = []
+
+    def make(business_name='Usta', first_name='Usta', last_name='Test', **fields):
+        number = len(created) + 1
+        user = User(
+            email=f'craftsman{number}@example.com',
+            phone=f'+90555000{number:04d}',
+            first_name=first_name,
+            last_name=last_name,
+            user_type=UserType.CRAFTSMAN,
+            is_active=True
+        )
+        user.set_password('craftsmanpass123')
+        db.session.add(user)
+        values = dict(city='İstanbul', district='Kadıköy', hourly_rate=100.0,
+                      average_rating=4.0, is_available=True)
+        values.update(fields)
+        craftsman = Craftsman(user=user, business_name=business_name, **values)
+        db.session.add(craftsman)
+        db.session.commit()
+        created.append(craftsman)
+        return craftsman
+
+    return make
+
 @pytest.fixture
 def auth_headers(app, test_user):
     """Create authentication headers"""
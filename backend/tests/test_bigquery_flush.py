@@ -0,0 +1,114 @@
+import json
+import os
+
+from app.utils.bigquery_flush import ParallelFlusher
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _FakeInsert:
+    """insert_rows_json stand-in: rows with ``bad`` set are invalid"""
+
+    def __init__(self):
+        self.tables = {}
+        self.requests = []
+        self.failing = set()
+
+    def __call__(self, table, rows, row_ids):
+        self.requests.append((table, len(rows)))
+        if table in self.failing:
+            raise ConnectionError('503 backend unavailable')
+        if any(row.get('bad') for row in rows):
+            return [{'index': index, 'errors': [{'reason': 'invalid' if row.get('bad') else 'stopped'}]}
+                    for index, row in enumerate(rows)]
+        self.tables.setdefault(table, []).extend(rows)
+        return []
+
+
+def _items(table, rows):
+    return [{'table': table, 'data': row} for row in rows]
+
+
+def _flusher(tmp_path, insert, requeued, **kwargs):
+    return ParallelFlusher(insert, lambda item: requeued.append(item) or True, str(tmp_path / 'dead-letter'),
+                           **kwargs)
+
+
+def _dead_letters(tmp_path, table):
+    with open(os.path.join(str(tmp_path / 'dead-letter'), f'{table}.ndjson')) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestParallelFlusher:
+    """Per-table inserts, poison rows and backoff"""
+
+    def test_poison_rows_are_dead_lettered_and_stopped_rows_resent(self, tmp_path):
+        insert, requeued = _FakeInsert(), []
+        flusher = _flusher(tmp_path, insert, requeued)
+
+        flusher.flush(_items('events', [{'n': 1}, {'n': 2, 'bad': True}, {'n': 3}]))
+
+        assert insert.tables['events'] == [{'n': 1}, {'n': 3}]
+        assert [line['row'] for line in _dead_letters(tmp_path, 'events')] == [{'n': 2, 'bad': True}]
+        assert _dead_letters(tmp_path, 'events')[0]['errors'] == [{'reason': 'invalid'}]
+        assert requeued == []
+        assert flusher.stats()['backing_off'] == []
+        flusher.shutdown()
+
+    def test_failing_table_backs_off_without_holding_up_others(self, tmp_path):
+        insert, requeued, clock = _FakeInsert(), [], _Clock()
+        flusher = _flusher(tmp_path, insert, requeued, clock=clock, backoff_seconds=10)
+        insert.failing.add('slow')
+
+        flusher.flush(_items('slow', [{'n': 1}]) + _items('fast', [{'n': 1}]))
+        assert insert.tables['fast'] == [{'n': 1}]
+        assert [item['attempts'] for item in requeued] == [1]
+        assert flusher.stats()['backing_off'] == ['slow']
+
+        # While backing off the table's rows are requeued without a request
+        requests = len(insert.requests)
+        flusher.flush(_items('slow', [{'n': 2}]) + _items('fast', [{'n': 2}]))
+        assert insert.requests[requests:] == [('fast', 1)]
+        assert flusher.stats()['deferred'] == 1
+
+        # The second failure in a row waits longer (jittered 50-100%)
+        clock.now += 10
+        flusher.flush(requeued[:1])
+        failures, next_attempt = flusher._backoff['slow']
+        assert failures == 2
+        assert 10 <= next_attempt - clock.now <= 20
+
+        insert.failing.clear()
+        clock.now += 20
+        flusher.flush(_items('slow', [{'n': 3}]))
+        assert insert.tables['slow'] == [{'n': 3}]
+        assert flusher.stats()['backing_off'] == []
+        flusher.shutdown()
+
+    def test_rows_are_dead_lettered_after_max_attempts(self, tmp_path):
+        insert, requeued, clock = _FakeInsert(), [], _Clock()
+        flusher = _flusher(tmp_path, insert, requeued, clock=clock, max_attempts=2)
+        insert.failing.add('events')
+
+        flusher.flush(_items('events', [{'n': 1}]))
+        clock.now += 3600
+        flusher.flush([requeued.pop()])
+
+        assert requeued == []
+        letter, = _dead_letters(tmp_path, 'events')
+        assert (letter['attempts'], letter['errors'][0]['reason']) == (2, 'max_attempts')
+        flusher.shutdown()
+
+    def test_flush_after_shutdown_runs_serially(self, tmp_path):
+        insert, requeued = _FakeInsert(), []
+        flusher = _flusher(tmp_path, insert, requeued)
+        flusher.shutdown()
+
+        flusher.flush(_items('a', [{'n': 1}]) + _items('b', [{'n': 1}]))
+        assert sorted(insert.tables) == ['a', 'b']
@@ -0,0 +1,100 @@
+import os
+import time
+
+from app.utils.bigquery_load_jobs import FakeLoadJobClient, LoadJobSink, TableThreshold
+
+TABLE = 'user_activity_logs'
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _rows(start, count):
+    return [{'n': n} for n in range(start, start + count)]
+
+
+def _sink(tmp_path, client, clock=None, **kwargs):
+    return LoadJobSink(client, 'ustam_analytics', str(tmp_path), [TABLE],
+                       thresholds={TABLE: TableThreshold(max_bytes=1)}, clock=clock or time.time, **kwargs)
+
+
+def _crash(sink):
+    """The process dies: its staging directory lock goes with it"""
+    sink._process_directory.close()
+
+
+class TestLoadJobSink:
+    """Staged files shipped as load jobs"""
+
+    def test_sealed_file_is_loaded_once(self, tmp_path):
+        client = FakeLoadJobClient()
+        sink = _sink(tmp_path, client)
+
+        sink.stage(TABLE, _rows(0, 3))
+        sink.tick()
+
+        assert client.tables[TABLE] == _rows(0, 3)
+        assert sink.stats()['loaded_rows'] == 3
+        assert os.listdir(sink.directory) == ['.lock']
+
+    def test_job_submitted_before_a_crash_is_resumed_not_reloaded(self, tmp_path):
+        client = FakeLoadJobClient()
+        crashed = _sink(tmp_path, client)
+        crashed.stage(TABLE, _rows(0, 3))
+        staged, = crashed._files.values()
+        # The load job was accepted, then the process died before deleting the file
+        with open(staged.path, 'rb') as f:
+            client.load_table_from_file(f, f'ustam_analytics.{TABLE}', job_id=crashed._job_id(staged))
+        _crash(crashed)
+
+        survivor = _sink(tmp_path, client)
+        survivor.tick()
+
+        assert client.tables[TABLE] == _rows(0, 3)
+        assert not os.path.exists(staged.path)
+        assert survivor.stats()['loaded_files'] == 1
+
+    def test_torn_member_is_cut_before_loading(self, tmp_path):
+        client = FakeLoadJobClient()
+        crashed = _sink(tmp_path, client)
+        crashed.stage(TABLE, _rows(0, 2))
+        staged, = crashed._files.values()
+        with open(staged.path, 'ab') as f:
+            f.write(b'\x1f\x8b\x08\x00torn')
+        _crash(crashed)
+
+        survivor = _sink(tmp_path, client)
+        survivor.tick()
+
+        assert client.tables[TABLE] == _rows(0, 2)
+
+    def test_failed_submissions_back_off_then_give_up(self, tmp_path):
+        client = FakeLoadJobClient()
+        clock = _Clock()
+        sink = _sink(tmp_path, client, clock=clock, max_attempts=3, backoff_seconds=10)
+        client.submit_errors = [RuntimeError('backend error')] * 3
+
+        sink.stage(TABLE, _rows(0, 1))
+        sink.tick()
+        staged, = sink._files.values()
+        assert staged.attempts == 1
+        assert 8 <= staged.next_attempt_at - clock.now <= 12
+
+        sink.tick()  # still backing off
+        assert len(client.submit_errors) == 2
+
+        clock.now = staged.next_attempt_at
+        sink.tick()
+        assert staged.attempts == 2
+        assert 16 <= staged.next_attempt_at - clock.now <= 24
+
+        clock.now = staged.next_attempt_at
+        sink.tick()
+        assert sink.stats()['failed_files'] == 1
+        assert len(os.listdir(sink.failed_directory)) == 1
+        assert TABLE not in client.tables
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+
+from app.utils.cache import Cache, FakeRedis, LocalLRU, RedisBackend
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLocalLRU:
+    """Bounded local cache tier"""
+
+    def test_entries_expire_after_ttl(self):
+        clock = _Clock()
+        lru = LocalLRU(clock=clock)
+        lru.set('key', 'value', ttl=10)
+
+        clock.now += 9
+        assert lru.get('key', None) == 'value'
+        clock.now += 1
+        assert lru.get('key', None) is None
+        assert lru.expirations == 1
+
+    def test_least_recently_used_entry_is_evicted(self):
+        lru = LocalLRU(max_entries=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        assert lru.get('b', None) is None
+        assert (lru.get('a'), lru.get('c')) == (1, 3)
+        assert lru.evictions == 1
+
+
+class TestSingleFlight:
+    """Concurrent misses of one key share a single load"""
+
+    def _load_concurrently(self, cache, loader, callers=8):
+        results, errors = [], []
+
+        def call():
+            try:
+                results.append(cache.get_or_load('key', loader))
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+
+    def test_loader_runs_once_for_concurrent_misses(self):
+        cache = Cache()
+        release = threading.Event()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            release.wait(5)
+            return {'total': 42}
+
+        threads, results, errors = self._load_concurrently(cache, loader)
+        while cache.stats()['coalesced'] < len(threads) - 1:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert len(calls) == 1
+        assert results == [{'total': 42}] * len(threads)
+        assert not errors
+        assert cache.get_or_load('key', lambda: pytest.fail('loaded again')) == {'total': 42}
+
+    def test_waiters_see_the_loader_error(self):
+        cache = Cache()
+        release = threading.Event()
+
+        def loader():
+            release.wait(5)
+            raise RuntimeError('database down')
+
+        threads, results, errors = self._load_concurrently(cache, loader, callers=4)
+        while cache.stats()['coalesced'] < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert results == []
+        assert [str(error) for error in errors] == ['database down'] * 4
+        assert cache.stats()['load_errors'] == 1
+        # A failed load is not cached
+        assert cache.get_or_load('key', lambda: 'recovered') == 'recovered'
+
+    def test_value_is_reloaded_after_ttl(self):
+        cache = Cache()
+        assert cache.get_or_load('key', lambda: 1, ttl=0.05) == 1
+        assert cache.get_or_load('key', lambda: 2, ttl=0.05) == 1
+        time.sleep(0.1)
+        assert cache.get_or_load('key', lambda: 3, ttl=0.05) == 3
+
+
+class TestSharedTier:
+    """Redis tier shared between processes (FakeRedis here)"""
+
+    def test_other_process_reads_the_shared_value(self):
+        client = FakeRedis()
+        writer = Cache(shared=RedisBackend(client))
+        reader = Cache(shared=RedisBackend(client))
+
+        writer.set('key', {'cities': ['Ankara']}, ttl=60)
+        assert reader.get_or_load('key', lambda: pytest.fail('shared value ignored')) == {'cities': ['Ankara']}
+        assert reader.stats()['shared_hits'] == 1
+
+    def test_shared_value_expires_with_its_ttl(self):
+        client = FakeRedis()
+        writer = Cache(shared=RedisBackend(client))
+        reader = Cache(shared=RedisBackend(client))
+
+        writer.set('key', 'old', ttl=0.05)
+        time.sleep(0.1)
+        assert reader.get('key') is None
+
+    def test_unserializable_values_stay_local(self):
+        client = FakeRedis()
+        cache = Cache(shared=RedisBackend(client))
+        value = object()
+
+        cache.set('key', value)
+        assert cache.get('key') is value
+        assert list(client.scan_iter()) == []
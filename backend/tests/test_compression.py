@@ -0,0 +1,198 @@
+import gzip
+
+import pytest
+from flask import Flask, Response, jsonify
+
+from app.utils import compression
+from app.utils.compression import STREAM_MIN_SIZE, ResponseCompressor
+
+BODY = b'{"craftsmen": [' + b'{"name": "Usta", "city": "Istanbul"}, ' * 200 + b'{}]}'
+
+
+@pytest.fixture
+def compressor():
+    compression._stats.reset()
+    return ResponseCompressor()
+
+
+@pytest.fixture
+def client(compressor):
+    """A bare app whose responses go through the compression stage"""
+    app = Flask(__name__)
+
+    @app.route('/json')
+    def json_body():
+        return Response(BODY, mimetype='application/json')
+
+    @app.route('/small')
+    def small_body():
+        return jsonify(ok=True)
+
+    @app.route('/exact/<int:size>')
+    def exact_body(size):
+        return Response(b'x' * size, mimetype='text/plain')
+
+    @app.route('/png')
+    def png_body():
+        return Response(b'\x89PNG' + b'\0' * 4096, mimetype='image/png')
+
+    @app.route('/encoded')
+    def encoded_body():
+        response = Response(gzip.compress(BODY), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    @app.route('/no-transform')
+    def no_transform_body():
+        response = Response(BODY, mimetype='application/json')
+        response.headers['Cache-Control'] = 'public, no-transform'
+        return response
+
+    @app.route('/not-modified')
+    def not_modified():
+        return Response(BODY, status=304, mimetype='application/json')
+
+    @app.route('/stream')
+    def streamed_body():
+        return Response((BODY[offset:offset + 500] for offset in range(0, len(BODY), 500)),
+                        mimetype='application/json')
+
+    @app.route('/large')
+    def large_body():
+        return Response(b'a' * (STREAM_MIN_SIZE + 1), mimetype='text/plain')
+
+    @app.route('/etag/<kind>')
+    def tagged_body(kind):
+        response = Response(BODY, mimetype='application/json')
+        response.set_etag('v1', weak=kind == 'weak')
+        return response
+
+    app.after_request(compressor.process)
+    return app.test_client()
+
+
+def _get(client, path, accept_encoding=None, **kwargs):
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding is not None else {}
+    return client.get(path, headers=headers, **kwargs)
+
+
+class TestNegotiation:
+    """Encoding picked from Accept-Encoding"""
+
+    @pytest.mark.parametrize('accept_encoding', ['gzip', 'gzip, deflate', 'deflate;q=1, gzip;q=0.5', '*'])
+    def test_gzip(self, client, accept_encoding):
+        response = _get(client, '/json', accept_encoding)
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.data) == BODY
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+    @pytest.mark.parametrize('accept_encoding', [None, '', 'identity', 'gzip;q=0', 'deflate', 'br;q=0, gzip;q=0'])
+    def test_identity(self, client, accept_encoding):
+        response = _get(client, '/json', accept_encoding)
+
+        assert 'Content-Encoding' not in response.headers
+        assert response.data == BODY
+        # Another client may get a compressed copy of the same URL
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert compression.stats()['skipped'] == {'not_accepted': 1}
+
+    @pytest.mark.skipif(compression.brotli is not None, reason='brotli is installed')
+    def test_gzip_when_brotli_is_missing(self, client):
+        response = _get(client, '/json', 'br, gzip;q=0.8')
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+
+    @pytest.mark.parametrize('accept_encoding, expected', [
+        ('br, gzip', 'br'),
+        ('gzip, br', 'br'),
+        ('gzip;q=1, br;q=0.5', 'gzip'),
+        ('br;q=0, gzip', 'gzip'),
+    ])
+    def test_brotli_preferred_on_ties(self, client, accept_encoding, expected):
+        brotli = pytest.importorskip('brotli')
+        response = _get(client, '/json', accept_encoding)
+
+        assert response.headers['Content-Encoding'] == expected
+        decode = brotli.decompress if expected == 'br' else gzip.decompress
+        assert decode(response.data) == BODY
+
+
+class TestWhatIsCompressed:
+    """Size threshold and responses passed through untouched"""
+
+    def test_bodies_under_min_size_are_sent_as_is(self, client):
+        response = _get(client, '/small', 'gzip')
+
+        assert 'Content-Encoding' not in response.headers
+        assert compression.stats()['skipped'] == {'small': 1}
+
+    def test_min_size_is_inclusive(self, client):
+        assert 'Content-Encoding' not in _get(client, '/exact/1023', 'gzip').headers
+        assert _get(client, '/exact/1024', 'gzip').headers['Content-Encoding'] == 'gzip'
+
+    @pytest.mark.parametrize('path, reason', [
+        ('/png', 'mimetype'),
+        ('/encoded', 'encoded'),
+        ('/no-transform', 'no_transform'),
+    ])
+    def test_passed_through(self, client, path, reason):
+        untouched = _get(client, path)
+        response = _get(client, path, 'gzip')
+
+        assert response.data == untouched.data
+        assert response.headers.get('Content-Encoding') == untouched.headers.get('Content-Encoding')
+        assert 'Vary' not in response.headers
+        assert compression.stats()['skipped'] == {reason: 2}
+
+    def test_not_modified_and_head_are_left_alone(self, client):
+        assert 'Content-Encoding' not in _get(client, '/not-modified', 'gzip').headers
+        assert 'Content-Encoding' not in client.head('/json', headers={'Accept-Encoding': 'gzip'}).headers
+        assert compression.stats()['compressed'] == 0
+
+    def test_repeated_bodies_are_compressed_once(self, client):
+        first = _get(client, '/json', 'gzip')
+        second = _get(client, '/json', 'gzip')
+
+        assert first.data == second.data
+        assert compression.stats()['cache_hits'] == 1
+
+
+class TestStreaming:
+    """Generators and large bodies are compressed while written"""
+
+    def test_generator_body(self, client):
+        response = _get(client, '/stream', 'gzip')
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Content-Length' not in response.headers
+        assert gzip.decompress(response.get_data()) == BODY
+        assert compression.stats()['streamed'] == 1
+
+    def test_bodies_past_stream_min_size(self, client):
+        response = _get(client, '/large', 'gzip')
+        data = response.get_data()
+
+        assert 'Content-Length' not in response.headers
+        assert gzip.decompress(data) == b'a' * (STREAM_MIN_SIZE + 1)
+        stats = compression.stats()
+        assert (stats['streamed'], stats['bytes_in'], stats['bytes_out']) == (1, STREAM_MIN_SIZE + 1, len(data))
+
+    def test_bodies_under_stream_min_size_are_buffered(self, client):
+        response = _get(client, '/json', 'gzip')
+
+        assert int(response.headers['Content-Length']) == len(response.data)
+        assert compression.stats()['streamed'] == 0
+
+
+class TestETags:
+    """Encoded bodies get weak validators"""
+
+    def test_strong_etag_becomes_weak(self, client):
+        assert _get(client, '/etag/strong', 'gzip').headers['ETag'] == 'W/"v1"'
+
+    def test_weak_etag_is_kept(self, client):
+        assert _get(client, '/etag/weak', 'gzip').headers['ETag'] == 'W/"v1"'
+
+    def test_identity_keeps_a_strong_etag(self, client):
+        assert _get(client, '/etag/strong', 'identity').headers['ETag'] == '"v1"'
@@ -0,0 +1,66 @@
+import json
+
+from app import db
+from app.models.category import Category
+from app.models.craftsman import Craftsman
+from app.utils.count_cache import cached_count
+
+
+def _count():
+    return cached_count('test', {'city': 'İstanbul'}, Craftsman.query.filter_by(city='İstanbul'), ['craftsmen'])
+
+
+class TestCountCache:
+    """Listing totals cached per filter signature"""
+
+    def test_second_count_is_served_from_cache(self, app, make_craftsman):
+        make_craftsman()
+        assert _count() == (1, False)
+        assert _count() == (1, True)
+
+    def test_commit_to_counted_table_invalidates(self, app, make_craftsman):
+        make_craftsman()
+        assert _count() == (1, False)
+
+        make_craftsman()
+        assert _count() == (2, False)
+
+    def test_update_invalidates(self, app, make_craftsman):
+        craftsman = make_craftsman()
+        assert _count() == (1, False)
+
+        craftsman.city = 'Ankara'
+        db.session.commit()
+        assert _count() == (0, False)
+
+    def test_rollback_keeps_cached_total(self, app, make_craftsman):
+        craftsman = make_craftsman()
+        assert _count() == (1, False)
+
+        craftsman.city = 'Ankara'
+        db.session.flush()
+        db.session.rollback()
+        assert _count() == (1, True)
+
+    def test_commit_to_other_table_keeps_cached_total(self, app, make_craftsman):
+        make_craftsman()
+        assert _count() == (1, False)
+
+        db.session.add(Category(name='Boya', slug='boya'))
+        db.session.commit()
+        assert _count() == (1, True)
+
+    def test_listing_flags_cached_totals_as_approximate(self, client, make_craftsman):
+        make_craftsman()
+        flags = []
+        for _ in range(2):
+            response = client.get('/api/search/craftsmen')
+            pagination = json.loads(response.data)['data']['pagination']
+            assert pagination['total'] == 1
+            flags.append(pagination['approximate'])
+        assert flags == [False, True]
+
+        make_craftsman()
+        response = client.get('/api/search/craftsmen')
+        pagination = json.loads(response.data)['data']['pagination']
+        assert (pagination['total'], pagination['approximate']) == (2, False)
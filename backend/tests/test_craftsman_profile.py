@@ -0,0 +1,38 @@
+import json
+from datetime import datetime
+
+from app import db
+from app.models.job import Job, JobStatus
+
+
+class TestBusinessProfile:
+    """GET /api/craftsmen/<id>/business-profile"""
+
+    def test_profile_lists_completed_jobs(self, client, test_user, make_craftsman):
+        craftsman = make_craftsman('Şişli Elektrik')
+        db.session.add(Job(
+            title='Priz değişimi', category='Elektrik', customer_id=test_user.id,
+            craftsman_id=craftsman.user_id, status=JobStatus.COMPLETED,
+            address='Halaskargazi Cad. 1', district='Şişli', city='İstanbul',
+            completed_at=datetime.utcnow(),
+        ))
+        db.session.commit()
+
+        response = client.get(f'/api/craftsmen/{craftsman.id}/business-profile')
+
+        assert response.status_code == 200
+        jobs = json.loads(response.data)['data']['completed_jobs']
+        assert [(job['title'], job['location']) for job in jobs] == [('Priz değişimi', 'Şişli, İstanbul')]
+
+    def test_unchanged_profile_is_not_modified(self, client, make_craftsman):
+        craftsman = make_craftsman()
+        response = client.get(f'/api/craftsmen/{craftsman.id}/business-profile')
+        assert response.status_code == 200
+
+        response = client.get(f'/api/craftsmen/{craftsman.id}/business-profile',
+                              headers={'If-None-Match': response.headers['ETag']})
+        assert response.status_code == 304
+
+    def test_unknown_craftsman_is_not_found(self, client):
+        response = client.get('/api/craftsmen/999/business-profile')
+        assert response.status_code == 404
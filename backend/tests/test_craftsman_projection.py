@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import text
+
+from app import db
+from app.models.user import User, UserType
+from app.utils.craftsman_projection import CraftsmanProjection
+from app.utils.search_index import craftsman_search_index
+
+
+class TestCraftsmanProjection:
+    """In-memory projections of the craftsmen table"""
+
+    def test_subclass_must_implement_hooks(self):
+        class Incomplete(CraftsmanProjection):
+            def _apply(self, row):
+                pass
+
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    def test_sync_reconciles_rows_changed_outside_the_orm(self, app, make_craftsman):
+        removed = make_craftsman(business_name='Silinen Tesisat')
+        make_craftsman(business_name='Kalan Tesisat')
+        craftsman_search_index.sync(force=True)
+        assert craftsman_search_index.search('tesisat') == {removed.id, removed.id + 1}
+
+        # Another instance deletes one row and inserts another with an old
+        # updated_at: the row count is unchanged and the delta misses it
+        user = User(email='other@example.com', phone='+905550009999', first_name='Yeni',
+                    last_name='Usta', user_type=UserType.CRAFTSMAN, is_active=True)
+        user.set_password('craftsmanpass123')
+        db.session.add(user)
+        db.session.commit()
+        db.session.execute(text('DELETE FROM craftsmen WHERE id = :id'), {'id': removed.id})
+        db.session.execute(
+            text("INSERT INTO craftsmen (user_id, business_name, city, is_available, updated_at) "
+                 "VALUES (:user_id, 'Yeni Tesisat', 'İzmir', 1, '2000-01-01 00:00:00')"),
+            {'user_id': user.id}
+        )
+        db.session.commit()
+        inserted_id = db.session.execute(
+            text('SELECT id FROM craftsmen WHERE user_id = :user_id'), {'user_id': user.id}
+        ).scalar()
+
+        craftsman_search_index.sync(force=True)
+        assert craftsman_search_index.search('tesisat') == {removed.id + 1, inserted_id}
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.models.craftsman import Craftsman
+from app.utils import craftsman_query
+from app.utils.craftsman_query import CraftsmanQuery, id_filter, plan_for
+
+
+@pytest.fixture
+def fresh_plans(monkeypatch):
+    plans = OrderedDict()
+    monkeypatch.setattr(craftsman_query, '_plans', plans)
+    return plans
+
+
+def _sql(clause, dialect):
+    return str(clause.compile(dialect=dialect))
+
+
+class TestIdFilter:
+    """Id sets bound as an IN list or as one array/JSON parameter"""
+
+    def test_small_sets_are_an_in_list(self, app):
+        clause = id_filter(Craftsman.id, range(craftsman_query.INLINE_ID_LIMIT))
+
+        sql = _sql(clause, sqlite.dialect())
+        assert 'IN (__[POSTCOMPILE_' in sql
+        assert 'json_each' not in sql
+
+    def test_sets_past_the_limit_use_json_each_on_sqlite(self, app):
+        clause = id_filter(Craftsman.id, range(craftsman_query.INLINE_ID_LIMIT + 1))
+
+        sql = _sql(clause, sqlite.dialect())
+        assert 'json_each' in sql
+        assert sql.count('?') == 1
+
+    def test_sets_past_the_limit_use_any_on_postgresql(self, app, monkeypatch):
+        monkeypatch.setattr(db.session, 'get_bind',
+                            lambda *args, **kwargs: SimpleNamespace(dialect=postgresql.dialect()))
+        clause = id_filter(Craftsman.id, range(craftsman_query.INLINE_ID_LIMIT + 1))
+
+        assert _sql(clause, postgresql.dialect()) == 'craftsmen.id = ANY (%(matched_ids)s::INTEGER[])'
+
+    @pytest.mark.parametrize('limit', [1, 1000])
+    def test_both_forms_select_the_same_rows(self, app, make_craftsman, monkeypatch, limit):
+        craftsmen = [make_craftsman(business_name=f'Usta {n}') for n in range(4)]
+        monkeypatch.setattr(craftsman_query, 'INLINE_ID_LIMIT', limit)
+        wanted = {craftsmen[0].id, craftsmen[2].id, craftsmen[3].id}
+
+        rows = db.session.query(Craftsman.id).filter(id_filter(Craftsman.id, wanted)).all()
+
+        assert {row.id for row in rows} == wanted
+
+
+class TestPlanFor:
+    """Plans are memoized per query shape"""
+
+    SHAPE = (('city',), False, 'rating', 'desc', False)
+
+    def test_same_shape_reuses_the_plan(self, fresh_plans):
+        plan = plan_for(self.SHAPE)
+
+        assert plan_for(tuple(self.SHAPE)) is plan
+        assert plan_for((('city',), False, 'rating', 'asc', False)) is not plan
+        assert len(fresh_plans) == 2
+
+    def test_least_recently_used_plan_is_evicted(self, fresh_plans, monkeypatch):
+        monkeypatch.setattr(craftsman_query, 'MAX_CACHED_PLANS', 2)
+        first = plan_for(self.SHAPE)
+        plan_for((('district',), False, None, 'desc', False))
+        plan_for(self.SHAPE)
+        plan_for((('city', 'district'), False, None, 'desc', False))
+
+        assert list(fresh_plans) == [self.SHAPE, (('city', 'district'), False, None, 'desc', False)]
+        assert plan_for(self.SHAPE) is first
+
+    def test_equivalent_requests_share_a_plan(self, app, fresh_plans):
+        first = CraftsmanQuery({'city': 'İstanbul', 'min_rating': '4', 'district': ''}, sort_by='rating')
+        second = CraftsmanQuery({'min_rating': 3.5, 'city': 'Ankara', 'is_verified': None}, sort_by='rating')
+
+        assert first.plan is second.plan
+        assert CraftsmanQuery({'city': 'Ankara'}, sort_by='rating').plan is not first.plan
+
+
+class TestDistanceFallback:
+    """sort_by=distance without coordinates"""
+
+    def test_sorts_by_city_ascending_whatever_the_order(self, app, fresh_plans):
+        for sort_order in ('asc', 'desc'):
+            query = CraftsmanQuery(sort_by='distance', sort_order=sort_order)
+            assert not query.by_distance
+            assert query.sort_keys == [(Craftsman.city, 'asc')]
+
+    def test_rows_come_by_city_then_id(self, app, make_craftsman, fresh_plans):
+        izmir = make_craftsman(city='İzmir')
+        ankara = make_craftsman(city='Ankara')
+        bursa = make_craftsman(city='Bursa')
+        second_ankara = make_craftsman(city='Ankara')
+
+        rows = CraftsmanQuery(sort_by='distance', sort_order='desc', latitude='', longitude=None).ordered().all()
+
+        assert [row.id for row in rows] == [ankara.id, second_ankara.id, bursa.id, izmir.id]
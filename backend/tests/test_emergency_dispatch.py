@@ -0,0 +1,118 @@
+import pytest
+
+from app import db
+from app.models.job import EmergencyService
+from app.utils import emergency_dispatch
+from app.utils.emergency_dispatch import select_dispatch_candidates
+from app.utils.geo_index import KM_PER_DEGREE, get_geo_index
+
+EMERGENCY = (40.9903, 29.0297)
+
+
+@pytest.fixture
+def make_located(make_craftsman, test_user):
+    """Craftsman ``km`` north of the emergency.
+
+    ``test_user`` takes the first user id, so craftsmen.id and users.id differ.
+    """
+    def make(km, specialties='Boya', **fields):
+        craftsman = make_craftsman(business_name=f'Usta {km}', specialties=specialties, **fields)
+        craftsman.user.latitude = EMERGENCY[0] + km / KM_PER_DEGREE
+        craftsman.user.longitude = EMERGENCY[1]
+        db.session.commit()
+        return craftsman
+
+    return make
+
+
+def _assign_emergency(craftsman, customer, status):
+    db.session.add(EmergencyService(
+        customer_id=customer.id, craftsman_id=craftsman.user_id, title='Su kaçağı',
+        description='Mutfakta su kaçağı', emergency_type='water_leak', severity=4,
+        address='Moda Cd. 1', city='İstanbul', contact_phone='+905551112233', status=status,
+    ))
+    db.session.commit()
+
+
+def _dispatch(emergency_type='electrical', **kwargs):
+    candidates = select_dispatch_candidates(*EMERGENCY, emergency_type, **kwargs)
+    return [(candidate['craftsman_id'], candidate['skill_match']) for candidate in candidates]
+
+
+class TestSelectDispatchCandidates:
+    """Who an emergency is sent to"""
+
+    def test_skill_matches_come_first_then_nearest_generalists(self, app, make_located):
+        generalists = [make_located(km) for km in (1, 2, 3)]
+        electricians = [make_located(km, specialties='Elektrik, Aydınlatma') for km in (6, 5)]
+
+        assert _dispatch() == [
+            (electricians[1].id, True), (electricians[0].id, True),
+            (generalists[0].id, False), (generalists[1].id, False), (generalists[2].id, False),
+        ]
+
+    def test_generalists_only_top_up_to_min_candidates(self, app, make_located, monkeypatch):
+        generalists = [make_located(km) for km in (1, 2)]
+        electrician = make_located(5, specialties='Elektrik')
+
+        monkeypatch.setattr(emergency_dispatch, 'MIN_CANDIDATES', 2)
+        assert _dispatch() == [(electrician.id, True), (generalists[0].id, False)]
+
+        monkeypatch.setattr(emergency_dispatch, 'MIN_CANDIDATES', 1)
+        assert _dispatch() == [(electrician.id, True)]
+
+    def test_fan_out_is_capped(self, app, make_located, monkeypatch):
+        electricians = [make_located(km, specialties='Elektrik') for km in (1, 2, 3, 4)]
+        monkeypatch.setattr(emergency_dispatch, 'MAX_FAN_OUT', 3)
+
+        assert _dispatch(limit=50) == [(craftsman.id, True) for craftsman in electricians[:3]]
+        assert _dispatch(limit=2) == [(craftsman.id, True) for craftsman in electricians[:2]]
+
+    def test_busy_craftsmen_are_excluded(self, app, make_located, test_user):
+        busy, finished, free = (make_located(km, specialties='Elektrik') for km in (1, 2, 3))
+        _assign_emergency(busy, test_user, 'en_route')
+        _assign_emergency(finished, test_user, 'completed')
+
+        assert _dispatch() == [(finished.id, True), (free.id, True)]
+
+    def test_unavailable_and_out_of_radius_craftsmen_are_skipped(self, app, make_located):
+        make_located(1, specialties='Elektrik', is_available=False)
+        make_located(30, specialties='Elektrik')
+        near = make_located(2, specialties='Elektrik')
+
+        assert _dispatch(radius_km=10) == [(near.id, True)]
+
+    def test_without_a_type_every_craftsman_qualifies(self, app, make_located):
+        craftsmen = [make_located(km, specialties=specialties)
+                     for km, specialties in ((2, 'Elektrik'), (1, 'Boya'))]
+
+        assert _dispatch(emergency_type=None) == [(craftsmen[1].id, False), (craftsmen[0].id, False)]
+
+    def test_candidates_carry_user_ids_and_distances(self, app, make_located):
+        craftsman = make_located(4, specialties='Elektrik')
+
+        candidate, = select_dispatch_candidates(*EMERGENCY, 'electrical')
+
+        assert craftsman.user_id != craftsman.id
+        assert candidate == {'craftsman_id': craftsman.id, 'user_id': craftsman.user_id,
+                             'distance_km': 4.0, 'skill_match': True}
+
+    def test_invalid_coordinates_dispatch_nobody(self, app, make_located):
+        make_located(1, specialties='Elektrik')
+
+        assert select_dispatch_candidates(None, EMERGENCY[1], 'electrical') == []
+        assert select_dispatch_candidates(95, EMERGENCY[1], 'electrical') == []
+
+
+class TestCraftsmanIdsForUsers:
+    """users.id -> craftsmen.id mapping used for busy craftsmen"""
+
+    def test_maps_user_ids_to_craftsman_ids(self, app, make_located, test_user):
+        first, second = make_located(1), make_located(2)
+        geo_index = get_geo_index()
+
+        assert first.user_id != first.id
+        assert geo_index.craftsman_ids_for_users({first.user_id, second.user_id}) == {first.id, second.id}
+        # A customer's user id maps to nothing, even when it equals a craftsman id
+        assert geo_index.craftsman_ids_for_users({test_user.id}) == set()
+        assert geo_index.user_ids_for([first.id, 999]) == {first.id: first.user_id}
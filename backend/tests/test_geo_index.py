@@ -0,0 +1,195 @@
+import math
+import random
+
+import pytest
+
+from app import db
+from app.utils import geo_index
+from app.utils.craftsman_projection import _projections
+from app.utils.geo_index import (
+    KM_PER_DEGREE, CraftsmanGeoIndex, bounding_box, haversine_km, rank_by_distance,
+)
+
+KADIKOY = (40.9903, 29.0297)
+
+
+def _north_of(point, km):
+    return point[0] + km / KM_PER_DEGREE, point[1]
+
+
+@pytest.fixture
+def make_index():
+    """Geo index over ``{craftsman_id: (lat, lon)}``, without a database"""
+    created = []
+
+    def make(points, unavailable=()):
+        index = CraftsmanGeoIndex()
+        for craftsman_id, (lat, lon) in points.items():
+            index._apply(craftsman_id, {'is_available': craftsman_id not in unavailable},
+                         {'latitude': lat, 'longitude': lon, 'is_active': True})
+        created.append(index)
+        return index
+
+    yield make
+    for index in created:
+        _projections.remove(index)
+
+
+@pytest.fixture
+def scattered_points():
+    generator = random.Random(7)
+    return {
+        craftsman_id: (KADIKOY[0] + generator.uniform(-1.5, 1.5), KADIKOY[1] + generator.uniform(-1.5, 1.5))
+        for craftsman_id in range(1, 301)
+    }
+
+
+def _brute_force(points, center, radius_km=None):
+    distances = sorted(
+        ((craftsman_id, haversine_km(*center, *point)) for craftsman_id, point in points.items()),
+        key=lambda item: (item[1], item[0])
+    )
+    return [match for match in distances if radius_km is None or match[1] <= radius_km]
+
+
+def _ids(matches):
+    return [craftsman_id for craftsman_id, _ in matches]
+
+
+class TestBoundingBox:
+    """Boxes enclosing a search circle"""
+
+    def test_equator_spans_are_equal(self):
+        min_lat, max_lat, min_lon, max_lon = bounding_box(0, 0, 100)
+
+        assert max_lat == pytest.approx(100 / KM_PER_DEGREE)
+        assert min_lat == pytest.approx(-max_lat)
+        assert max_lon == pytest.approx(max_lat, rel=1e-3)
+        assert min_lon == pytest.approx(-max_lon)
+
+    def test_longitude_span_uses_the_poleward_edge(self):
+        lat_span = 100 / KM_PER_DEGREE
+        min_lat, max_lat, min_lon, max_lon = bounding_box(60, 10, 100)
+
+        expected = 100 / (KM_PER_DEGREE * math.cos(math.radians(60 + lat_span)))
+        assert (max_lon - 10) == pytest.approx(expected)
+        assert (max_lon - 10) > 2 * lat_span
+        # The same in the southern hemisphere
+        assert bounding_box(-60, 10, 100)[3] == pytest.approx(max_lon)
+
+    def test_box_contains_the_circle(self):
+        for lat in (0, 41, 70, -55):
+            min_lat, max_lat, min_lon, max_lon = bounding_box(lat, 29, 50)
+            # The widest point of the circle is east of the centre
+            assert haversine_km(lat, 29, lat, max_lon) >= 50
+            assert haversine_km(lat, 29, max_lat, 29) == pytest.approx(50)
+
+    def test_spans_are_clamped_near_the_pole(self):
+        min_lat, max_lat, min_lon, max_lon = bounding_box(89.5, 0, 200)
+
+        assert max_lat == 90
+        assert (min_lon, max_lon) == (-180, 180)
+
+
+class TestWithinRadius:
+    """Radius queries over the grid"""
+
+    def test_nearest_first_within_the_radius(self, make_index):
+        index = make_index({1: _north_of(KADIKOY, 5), 2: _north_of(KADIKOY, 0.5), 3: _north_of(KADIKOY, 20)})
+
+        matches = index.within_radius(*KADIKOY, 10)
+
+        assert _ids(matches) == [2, 1]
+        assert [round(distance, 1) for _, distance in matches] == [0.5, 5.0]
+        assert _ids(index.within_radius(*KADIKOY, 10, limit=1)) == [2]
+
+    def test_unlisted_and_rejected_craftsmen_are_skipped(self, make_index):
+        index = make_index({1: _north_of(KADIKOY, 1), 2: _north_of(KADIKOY, 2), 3: _north_of(KADIKOY, 3)},
+                           unavailable={1})
+
+        assert _ids(index.within_radius(*KADIKOY, 10)) == [2, 3]
+        assert _ids(index.within_radius(*KADIKOY, 10, accept={3}.__contains__)) == [3]
+        assert _ids(index.within_radius(*KADIKOY, 10, listable_only=False)) == [1, 2, 3]
+
+    @pytest.mark.parametrize('radius_km', [0.5, 3, 12, 40, 400])
+    def test_matches_a_full_scan(self, make_index, scattered_points, radius_km):
+        # Small radii walk the covered cells, large ones the occupied cells
+        index = make_index(scattered_points)
+
+        assert index.within_radius(*KADIKOY, radius_km) == _brute_force(scattered_points, KADIKOY, radius_km)
+
+
+class TestNearest:
+    """k-nearest queries expanding rings of cells"""
+
+    @pytest.fixture
+    def scanned_rings(self, monkeypatch):
+        calls = []
+        refine = CraftsmanGeoIndex._refine
+
+        def counting_refine(index, cells, *args):
+            calls.append(cells)
+            return refine(index, cells, *args)
+
+        monkeypatch.setattr(CraftsmanGeoIndex, '_refine', counting_refine)
+        return calls
+
+    @pytest.mark.parametrize('k', [1, 5, 40])
+    def test_matches_a_full_scan(self, make_index, scattered_points, k):
+        index = make_index(scattered_points)
+        center = (KADIKOY[0] + 0.37, KADIKOY[1] - 0.21)
+
+        assert index.nearest(*center, k) == _brute_force(scattered_points, center)[:k]
+
+    def test_empty_index_scans_nothing(self, make_index, scanned_rings):
+        assert make_index({}).nearest(*KADIKOY, 5) == []
+        assert scanned_rings == []
+
+    def test_stops_once_the_kth_match_beats_unscanned_cells(self, make_index, scanned_rings):
+        cell = geo_index._cell_of(*KADIKOY)
+        cell_center = ((cell[0] + 0.5) * geo_index.CELL_SIZE_DEGREES, (cell[1] + 0.5) * geo_index.CELL_SIZE_DEGREES)
+        index = make_index({1: cell_center, 2: (cell_center[0] + 3, cell_center[1] + 3)})
+
+        assert _ids(index.nearest(*cell_center, 1)) == [1]
+        assert len(scanned_rings) == 1
+
+    def test_stops_at_the_max_radius(self, make_index, scanned_rings):
+        index = make_index({1: (KADIKOY[0] + 3, KADIKOY[1] + 3)})
+
+        assert index.nearest(*KADIKOY, 1, max_radius_km=15) == []
+        assert len(scanned_rings) <= 3
+
+    def test_stops_once_every_occupied_cell_is_scanned(self, make_index, scanned_rings):
+        far = (KADIKOY[0] + 0.45, KADIKOY[1])
+        index = make_index({1: far})
+
+        # Fewer craftsmen than k: the ring covering the last occupied cell ends it
+        assert _ids(index.nearest(*KADIKOY, 5)) == [1]
+        assert len(scanned_rings) == 6
+
+
+class TestRankByDistance:
+    """Distance-sorted search candidates"""
+
+    def _locate(self, craftsman, point):
+        craftsman.user.latitude, craftsman.user.longitude = point
+        db.session.commit()
+
+    def test_ranking_is_capped(self, app, make_craftsman, monkeypatch):
+        monkeypatch.setattr(geo_index, 'MAX_DISTANCE_CANDIDATES', 2)
+        craftsmen = [make_craftsman(business_name=f'Usta {km}') for km in (3, 1, 2, 4)]
+        for craftsman, km in zip(craftsmen, (3, 1, 2, 4)):
+            self._locate(craftsman, _north_of(KADIKOY, km))
+
+        matches = rank_by_distance(KADIKOY)
+
+        assert _ids(matches) == [craftsmen[1].id, craftsmen[2].id]
+
+    def test_radius_and_candidates_narrow_the_ranking(self, app, make_craftsman):
+        near, far, other = (make_craftsman(business_name=name) for name in ('Yakın', 'Uzak', 'Diğer'))
+        self._locate(near, _north_of(KADIKOY, 2))
+        self._locate(far, _north_of(KADIKOY, 30))
+        self._locate(other, _north_of(KADIKOY, 1))
+
+        assert _ids(rank_by_distance(KADIKOY, radius_km=10)) == [other.id, near.id]
+        assert _ids(rank_by_distance(KADIKOY, candidate_ids={near.id, far.id})) == [near.id, far.id]
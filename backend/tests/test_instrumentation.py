@@ -0,0 +1,182 @@
+import json
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from app.middleware import instrumentation as instrumentation_module
+from app.middleware.instrumentation import REQUEST_ID_HEADER, RequestInstrumentation, classify_user_agent
+from app.utils.bigquery_logger import BigQueryLogger
+
+ANDROID_PHONE = 'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36'
+IPHONE = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148'
+IPAD = 'Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Safari/604.1'
+FIREFOX_OS = 'Mozilla/5.0 (Mobile; rv:109.0) Gecko/109.0 Firefox/109.0'
+DESKTOP_CHROME = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36'
+
+
+class TestClassifyUserAgent:
+    """(platform, device_type) from the User-Agent"""
+
+    @pytest.mark.parametrize('user_agent, expected', [
+        (ANDROID_PHONE, ('android', 'mobile')),
+        (IPHONE, ('ios', 'mobile')),
+        (IPAD, ('ios', 'tablet')),
+        (FIREFOX_OS, ('mobile_web', 'mobile')),
+        ('Opera/9.80 (Tablet; Linux)', ('web', 'tablet')),
+        (DESKTOP_CHROME, ('web', 'desktop')),
+        ('', ('web', 'desktop')),
+    ])
+    def test_classification(self, user_agent, expected):
+        assert classify_user_agent(user_agent) == expected
+
+
+@pytest.fixture
+def events():
+    return []
+
+
+@pytest.fixture
+def pipeline(events):
+    """A bare app with the instrumentation hooks and a recording sink"""
+    app = Flask(__name__)
+
+    @app.route('/ping')
+    def ping():
+        return {'ok': True}
+
+    @app.route('/health')
+    def health_check():
+        return {'status': 'healthy'}
+
+    instrumentation = RequestInstrumentation()
+    instrumentation.add_sink(events.append)
+    instrumentation.init_app(app)
+    return app, instrumentation
+
+
+class TestRequestInstrumentation:
+    """One event per request, handed to every sink"""
+
+    def test_one_event_per_request(self, pipeline, events):
+        app, _ = pipeline
+
+        response = app.test_client().get('/ping?page=2', headers={'User-Agent': IPHONE})
+
+        assert response.status_code == 200
+        assert len(events) == 1
+        event = events[0]
+        assert (event['endpoint'], event['method'], event['status_code']) == ('ping', 'GET', 200)
+        assert event['query_params'] == {'page': '2'}
+        assert (event['platform'], event['device_type']) == ('ios', 'mobile')
+        assert event['error'] is None
+
+    def test_skipped_endpoints_produce_no_event(self, pipeline, events):
+        app, _ = pipeline
+
+        response = app.test_client().get('/health')
+
+        assert response.status_code == 200
+        assert events == []
+        assert REQUEST_ID_HEADER not in response.headers
+
+    def test_a_failing_sink_does_not_break_the_response(self, pipeline, events):
+        app, instrumentation = pipeline
+
+        def broken_sink(event):
+            raise RuntimeError('sink is down')
+
+        instrumentation.sinks.insert(0, broken_sink)
+
+        response = app.test_client().get('/ping')
+
+        assert response.status_code == 200
+        assert response.get_json() == {'ok': True}
+        assert len(events) == 1
+
+    def test_request_ids_are_generated_server_side(self, pipeline, events):
+        app, _ = pipeline
+        client = app.test_client()
+
+        responses = [client.get('/ping', headers={REQUEST_ID_HEADER: 'client-abc'}) for _ in range(2)]
+
+        # A client reusing its X-Request-ID gets it echoed back, but the rows
+        # and the sampling key use ids of our own
+        assert [response.headers[REQUEST_ID_HEADER] for response in responses] == ['client-abc', 'client-abc']
+        assert [event['correlation_id'] for event in events] == ['client-abc', 'client-abc']
+        request_ids = [event['request_id'] for event in events]
+        assert 'client-abc' not in request_ids
+        assert request_ids[0] != request_ids[1]
+
+    def test_correlation_id_defaults_to_the_request_id(self, pipeline, events):
+        app, _ = pipeline
+
+        response = app.test_client().get('/ping')
+
+        assert events[0]['correlation_id'] == events[0]['request_id'] == response.headers[REQUEST_ID_HEADER]
+
+    def test_long_client_ids_are_truncated(self, pipeline, events):
+        app, _ = pipeline
+
+        app.test_client().get('/ping', headers={REQUEST_ID_HEADER: 'x' * 500})
+
+        assert events[0]['correlation_id'] == 'x' * instrumentation_module.MAX_REQUEST_ID_LENGTH
+
+
+class TestApplicationHooks:
+    """The hooks registered by create_app"""
+
+    def test_one_event_per_request(self, app, client):
+        events = []
+        app.add_url_rule('/api/_ping', 'ping', lambda: {'ok': True})
+        instrumentation_module.instrumentation.add_sink(events.append)
+        try:
+            response = client.get('/api/_ping')
+        finally:
+            instrumentation_module.instrumentation.sinks.remove(events.append)
+
+        assert response.status_code == 200
+        assert len(events) == 1
+        assert response.headers[REQUEST_ID_HEADER] == events[0]['request_id']
+
+
+class TestRequestEventRows:
+    """BigQuery rows built from a request event"""
+
+    @pytest.fixture
+    def bigquery_logger(self, monkeypatch):
+        monkeypatch.setenv('BIGQUERY_LOGGING_ENABLED', 'false')
+        bigquery_logger = BigQueryLogger()
+        bigquery_logger.enabled = True
+        return bigquery_logger
+
+    def _event(self, **fields):
+        event = {
+            'request_id': 'a1b2c3', 'correlation_id': 'client-abc', 'session_id': 'a1b2c3',
+            'timestamp': datetime(2026, 1, 1, 12, 0), 'duration_ms': 12, 'duration_seconds': 0.012,
+            'method': 'GET', 'endpoint': 'search.search_craftsmen', 'path': '/api/search/craftsmen',
+            'url': 'http://localhost/api/search/craftsmen', 'referrer': None, 'query_params': {},
+            'has_json_body': False, 'user_agent': IPHONE, 'ip_address': '127.0.0.1',
+            'platform': 'ios', 'device_type': 'mobile', 'user_id': None, 'user_type': None,
+            'location_city': None, 'status_code': 200, 'success': True, 'content_length': 2,
+            'business_event': None, 'error': None, 'db_query_count': 3, 'db_time_ms': 4.2, 'n_plus_one': [],
+        }
+        event.update(fields)
+        return event
+
+    def _queued(self, bigquery_logger):
+        rows = []
+        while not bigquery_logger.log_queue.empty():
+            rows.append(bigquery_logger.log_queue.get_nowait())
+        return rows
+
+    def test_rows_use_the_server_request_id(self, bigquery_logger):
+        bigquery_logger.log_request_event(self._event())
+
+        rows = {row['table']: row['data'] for row in self._queued(bigquery_logger)}
+
+        assert set(rows) == {'user_activity_logs', 'performance_metrics'}
+        activity = rows['user_activity_logs']
+        assert activity['log_id'] == rows['performance_metrics']['metric_id'] == 'a1b2c3'
+        details = json.loads(activity['action_details'])
+        assert (details['request_id'], details['correlation_id']) == ('a1b2c3', 'client-abc')
@@ -0,0 +1,191 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import inspect, text
+
+from app import db
+from app.models.job import Job, JobSkill, JobStatus
+from app.utils.geo_index import KM_PER_DEGREE, bounding_box, haversine_km
+from upgrade_job_schema import upgrade_job_schema
+
+KADIKOY = (40.9903, 29.0297)
+
+
+@pytest.fixture
+def make_job(app, test_user):
+    """Open job posted by ``test_user``; later jobs are newer"""
+    created = []
+
+    def make(title=None, skills=(), location=None, **fields):
+        values = dict(title=title or f'İş {len(created) + 1}', category='Elektrik', customer_id=test_user.id,
+                      created_at=datetime(2026, 1, 1) + timedelta(minutes=len(created)))
+        if location is not None:
+            values['latitude'], values['longitude'] = location
+        values.update(fields)
+        job = Job(**values)
+        job.required_skills = list(skills)
+        db.session.add(job)
+        db.session.commit()
+        created.append(job)
+        return job
+
+    return make
+
+
+def _north_of(point, km):
+    return point[0] + km / KM_PER_DEGREE, point[1]
+
+
+def _search(client, **params):
+    response = client.get('/api/jobs/search', query_string=params)
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    return [job['id'] for job in data['jobs']], data['pagination']
+
+
+def _newest_first(jobs):
+    return [job.id for job in reversed(jobs)]
+
+
+class TestRequiredSkills:
+    """Job.required_skills, backed by the job_skills table"""
+
+    def test_names_are_normalized_and_deduplicated(self, make_job):
+        job = make_job(skills=['Su Tesisatı', 'su tesisati', ' Elektrik ', '', None, 'SU  TESİSATI'])
+
+        assert job.required_skills == ['Su Tesisatı', 'Elektrik']
+        assert sorted(skill.skill for skill in job.skills) == ['elektrik', 'su tesisati']
+
+        db.session.expire_all()
+        # Loaded back ordered by name
+        assert db.session.get(Job, job.id).required_skills == ['Elektrik', 'Su Tesisatı']
+
+    def test_reassigning_keeps_matching_rows_and_drops_the_rest(self, make_job):
+        job = make_job(skills=['Su Tesisatı', 'Elektrik'])
+        kept = job.skills[0]
+
+        job.required_skills = ['su tesisati', 'Boya']
+        db.session.commit()
+
+        assert job.skills[0] is kept
+        assert job.required_skills == ['Su Tesisatı', 'Boya']
+        rows = db.session.query(JobSkill.skill).filter_by(job_id=job.id).order_by(JobSkill.skill).all()
+        assert [row.skill for row in rows] == ['boya', 'su tesisati']
+
+    def test_none_clears_the_skills(self, make_job):
+        job = make_job(skills=['Elektrik'])
+        job.required_skills = None
+        db.session.commit()
+
+        assert job.required_skills == []
+        assert db.session.query(JobSkill).count() == 0
+
+
+class TestSkillFilter:
+    """Skill filters run in SQL, before pagination"""
+
+    @pytest.fixture
+    def jobs(self, make_job):
+        return [make_job(skills=['Elektrik'] if n % 3 == 0 else ['Boya']) for n in range(14)]
+
+    def test_pages_are_full(self, client, jobs):
+        electrical = [job for job in jobs if job.required_skills == ['Elektrik']]
+
+        seen = []
+        for page in (1, 2, 3):
+            ids, pagination = _search(client, skills='ELEKTRİK', per_page=2, page=page)
+            assert len(ids) == (2 if page < 3 else 1)
+            seen += ids
+
+        assert pagination['total'] == len(electrical) == 5
+        assert seen == _newest_first(electrical)
+
+    def test_any_of_several_skills_matches(self, client, jobs, make_job):
+        plumbing = make_job(skills=['Su Tesisatı'])
+
+        ids, pagination = _search(client, skills=['su tesisati', 'boya'], per_page=50)
+
+        assert pagination['total'] == 10
+        assert ids[0] == plumbing.id
+        assert set(ids) == {plumbing.id} | {job.id for job in jobs if job.required_skills == ['Boya']}
+
+    def test_listing_for_craftsmen_filters_open_jobs(self, client, make_job, make_craftsman):
+        craftsman = make_craftsman()
+        jobs = [make_job(skills=['Elektrik']) for _ in range(3)]
+        make_job(skills=['Elektrik'], craftsman_id=craftsman.user_id, status=JobStatus.ACCEPTED)
+        make_job(skills=['Boya'])
+        token = create_access_token(identity=str(craftsman.user_id))
+
+        response = client.get('/api/jobs/', query_string={'skills': 'elektrik', 'per_page': 2},
+                              headers={'Authorization': f'Bearer {token}'})
+        data = json.loads(response.data)
+
+        assert response.status_code == 200
+        assert [job['id'] for job in data['jobs']] == _newest_first(jobs)[:2]
+        assert data['pagination']['total'] == 3
+
+
+class TestSearchRadius:
+    """Job search around a lat/lng point"""
+
+    def test_only_jobs_inside_the_circle_are_returned(self, client, make_job):
+        inside = [make_job(location=_north_of(KADIKOY, km)) for km in (1, 4, 9)]
+        make_job(location=_north_of(KADIKOY, 11))
+        # Inside the bounding box but outside the circle
+        min_lat, max_lat, min_lng, max_lng = bounding_box(*KADIKOY, 10)
+        corner = (KADIKOY[0] + 0.9 * (max_lat - KADIKOY[0]), KADIKOY[1] + 0.9 * (max_lng - KADIKOY[1]))
+        assert haversine_km(*KADIKOY, *corner) > 10
+        make_job(location=corner)
+        make_job()
+
+        ids, pagination = _search(client, lat=KADIKOY[0], lng=KADIKOY[1], radius=10)
+
+        assert ids == _newest_first(inside)
+        assert pagination['total'] == 3
+        assert pagination['approximate'] is False
+
+    def test_radius_results_are_paginated(self, client, make_job):
+        inside = [make_job(location=_north_of(KADIKOY, km)) for km in (1, 2, 3, 4, 5)]
+        make_job(location=_north_of(KADIKOY, 30))
+
+        pages = [_search(client, lat=KADIKOY[0], lng=KADIKOY[1], radius=10, per_page=2, page=page)
+                 for page in (1, 2, 3)]
+
+        assert [ids for ids, _ in pages] == [_newest_first(inside)[:2], _newest_first(inside)[2:4],
+                                            _newest_first(inside)[4:]]
+        assert [pagination['has_next'] for _, pagination in pages] == [True, True, False]
+        assert pages[0][1]['total'] == 5
+
+    def test_radius_combines_with_skill_filter(self, client, make_job):
+        wanted = make_job(skills=['Elektrik'], location=_north_of(KADIKOY, 2))
+        make_job(skills=['Boya'], location=_north_of(KADIKOY, 1))
+        make_job(skills=['Elektrik'], location=_north_of(KADIKOY, 40))
+
+        ids, _ = _search(client, lat=KADIKOY[0], lng=KADIKOY[1], radius=10, skills='elektrik')
+
+        assert ids == [wanted.id]
+
+    def test_assigned_jobs_are_not_searched(self, client, make_job, make_craftsman):
+        make_job(location=KADIKOY, craftsman_id=make_craftsman().user_id)
+        open_job = make_job(location=KADIKOY)
+
+        ids, _ = _search(client, lat=KADIKOY[0], lng=KADIKOY[1])
+
+        assert ids == [open_job.id]
+
+
+class TestUpgradeJobSchema:
+    """upgrade_job_schema.py on a database created before the job indexes"""
+
+    def test_missing_table_and_indexes_are_created_once(self, app):
+        db.session.execute(text('DROP TABLE job_skills'))
+        db.session.execute(text('DROP INDEX idx_job_status_created'))
+        db.session.commit()
+
+        assert upgrade_job_schema(db.engine) == ['idx_job_status_created', 'job_skills']
+        inspector = inspect(db.engine)
+        assert 'idx_job_status_created' in {index['name'] for index in inspector.get_indexes('jobs')}
+        assert 'idx_job_skill_skill_job' in {index['name'] for index in inspector.get_indexes('job_skills')}
+        assert upgrade_job_schema(db.engine) == []
@@ -0,0 +1,125 @@
+import enum
+import json
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+from flask import Flask, jsonify as flask_jsonify
+
+from app.utils import json_encoding
+from app.utils.json_encoding import FastJSONProvider, dumps, dumps_text, jsonify, loads
+
+
+class Status(enum.Enum):
+    PENDING = 'pending'
+    DONE = 'done'
+
+
+class Priority(enum.IntEnum):
+    HIGH = 3
+
+
+ISTANBUL = timezone(timedelta(hours=3))
+
+
+@pytest.fixture(params=['orjson', 'stdlib'])
+def encoder(request, monkeypatch):
+    """Run a test with orjson and with the stdlib fallback"""
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(json_encoding, 'orjson', None)
+    return request.param
+
+
+class TestDumps:
+    """Types in our payloads encode the same with either encoder"""
+
+    @pytest.mark.parametrize('value, expected', [
+        (Decimal('150.50'), '"150.50"'),
+        (Decimal('1E+2'), '"1E+2"'),
+        (Status.PENDING, '"pending"'),
+        (Priority.HIGH, '3'),
+        (datetime(2026, 1, 2, 3, 4, 5), '"2026-01-02T03:04:05"'),
+        (datetime(2026, 1, 2, 3, 4, 5, 6), '"2026-01-02T03:04:05.000006"'),
+        (datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc), '"2026-01-02T03:04:05+00:00"'),
+        (datetime(2026, 1, 2, 3, 4, 5, tzinfo=ISTANBUL), '"2026-01-02T03:04:05+03:00"'),
+        (date(2026, 1, 2), '"2026-01-02"'),
+        (time(9, 30), '"09:30:00"'),
+        (UUID('12345678-1234-5678-1234-567812345678'), '"12345678-1234-5678-1234-567812345678"'),
+        ({'İstanbul'}, '["İstanbul"]'),
+        (frozenset([1]), '[1]'),
+        ('Şişli, Kadıköy', '"Şişli, Kadıköy"'),
+        (2 ** 70, str(2 ** 70)),
+    ])
+    def test_value(self, encoder, value, expected):
+        assert dumps(value) == expected.encode('utf-8')
+
+    def test_non_str_keys(self, encoder):
+        assert dumps({1: 'a', 2.5: 'b', False: 'c', None: 'd'}) == b'{"1":"a","2.5":"b","false":"c","null":"d"}'
+
+    def test_nested_payload(self, encoder):
+        payload = {
+            'id': 7, 'rate': Decimal('99.9'), 'status': Status.DONE,
+            'tags': {'boya'}, 'created_at': datetime(2026, 5, 1, 12, 0),
+            'reviews': [{'rating': 5, 'comment': None}], 'by_id': {3: [1.5, False]},
+        }
+
+        assert json.loads(dumps(payload)) == {
+            'id': 7, 'rate': '99.9', 'status': 'done', 'tags': ['boya'],
+            'created_at': '2026-05-01T12:00:00', 'reviews': [{'rating': 5, 'comment': None}],
+            'by_id': {'3': [1.5, False]},
+        }
+
+    def test_keys_keep_insertion_order(self, encoder):
+        assert dumps({'b': 1, 'a': 2}) == b'{"b":1,"a":2}'
+
+    def test_unknown_types_raise(self, encoder):
+        with pytest.raises(TypeError):
+            dumps(object())
+
+    def test_text_and_round_trip(self, encoder):
+        assert dumps_text({'city': 'İzmir'}) == '{"city":"İzmir"}'
+        assert loads(dumps({'a': [1, 'ç']})) == {'a': [1, 'ç']}
+
+
+class TestFastJSONProvider:
+    """flask.jsonify and dict views through the provider"""
+
+    @pytest.fixture
+    def app(self):
+        app = Flask(__name__)
+        app.json = FastJSONProvider(app)
+
+        @app.route('/flask')
+        def flask_view():
+            return flask_jsonify(rate=Decimal('10.00'), city='Muğla')
+
+        @app.route('/dict')
+        def dict_view():
+            return {'status': Status.PENDING, 'at': datetime(2026, 1, 1)}
+
+        @app.route('/ours')
+        def our_view():
+            return jsonify([1, 2])
+
+        return app
+
+    def test_responses_are_compact_utf8(self, app, encoder):
+        client = app.test_client()
+
+        response = client.get('/flask')
+        assert response.mimetype == 'application/json'
+        assert response.data == '{"rate":"10.00","city":"Muğla"}\n'.encode('utf-8')
+        assert client.get('/dict').data == b'{"status":"pending","at":"2026-01-01T00:00:00"}\n'
+        assert client.get('/ours').data == b'[1,2]\n'
+
+    def test_keyword_arguments_use_the_stdlib_encoder(self, app):
+        assert app.json.dumps({'a': Decimal('1.5')}, indent=1) == '{\n "a": "1.5"\n}'
+        assert app.json.dumps({'a': 'ğ'}, sort_keys=True) == '{"a": "ğ"}'
+
+    def test_loads(self, app, encoder):
+        assert app.json.loads('{"a": [1, "ş"]}') == {'a': [1, 'ş']}
+        assert app.json.loads(b'{"a": 1.5}') == {'a': 1.5}
+        assert app.json.loads('{"a": 1.5}', parse_float=Decimal) == {'a': Decimal('1.5')}
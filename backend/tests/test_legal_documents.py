@@ -0,0 +1,44 @@
+import gzip
+import json
+
+import pytest
+
+URL = '/api/legal/documents/privacy-policy'
+
+
+class TestLegalDocuments:
+    """Precompressed legal documents and their validators"""
+
+    def test_gzip_variant_is_served_when_accepted(self, client):
+        response = client.get(URL, headers={'Accept-Encoding': 'gzip'})
+
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['ETag'].endswith('-gzip"')
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert json.loads(gzip.decompress(response.data))['success'] is True
+
+    @pytest.mark.parametrize('accept_encoding', ['gzip', 'identity'])
+    def test_not_modified_keeps_the_matched_variant_etag(self, client, accept_encoding):
+        etag = client.get(URL, headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+
+        response = client.get(URL, headers={'Accept-Encoding': accept_encoding, 'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        assert response.headers['Vary'] == 'Accept-Encoding'
+
+    def test_not_modified_prefers_the_negotiated_variant(self, client):
+        identity = client.get(URL, headers={'Accept-Encoding': 'identity'}).headers['ETag']
+        compressed = client.get(URL, headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+
+        response = client.get(URL, headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'{identity}, {compressed}'})
+
+        assert response.status_code == 304
+        assert response.headers['ETag'] == compressed
+
+    def test_stale_etag_gets_the_document(self, client):
+        response = client.get(URL, headers={'Accept-Encoding': 'identity', 'If-None-Match': '"stale-gzip"'})
+
+        assert response.status_code == 200
+        assert 'Content-Encoding' not in response.headers
@@ -0,0 +1,29 @@
+from app.utils import metrics
+from config import config as config_module
+
+
+class TestMetricsEndpoint:
+    """Access to the Prometheus scrape endpoint"""
+
+    def test_open_locally_without_a_token(self, app, client):
+        app.config.update(METRICS_TOKEN=None, METRICS_REQUIRE_TOKEN=False)
+
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.content_type == metrics.CONTENT_TYPE
+        assert b'ustam_telemetry_queue_depth' in response.data
+
+    def test_token_is_required_when_configured(self, app, client):
+        app.config.update(METRICS_TOKEN='scrape-secret', METRICS_REQUIRE_TOKEN=True)
+
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+
+    def test_not_served_when_a_required_token_is_missing(self, app, client):
+        app.config.update(METRICS_TOKEN=None, METRICS_REQUIRE_TOKEN=True)
+
+        assert client.get('/metrics').status_code == 404
+
+    def test_production_requires_a_token(self):
+        assert config_module.ProductionConfig.METRICS_REQUIRE_TOKEN is True
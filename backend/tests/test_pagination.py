@@ -0,0 +1,106 @@
+import base64
+import json
+
+import pytest
+
+
+def _decode(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+
+
+def _encode(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _walk(client, **params):
+    """Follow next_cursor from the first page; returns the ids of every page"""
+    pages, cursor = [], ''
+    while True:
+        response = client.get('/api/search/craftsmen', query_string=dict(params, cursor=cursor, per_page=2))
+        assert response.status_code == 200
+        data = json.loads(response.data)['data']
+        pages.append([card['id'] for card in data['craftsmen']])
+        cursor = data['pagination']['next_cursor']
+        if not cursor:
+            return pages
+        assert len(pages) < 10, 'cursor did not advance'
+
+
+class TestKeysetPagination:
+    """Cursor mode of /api/search/craftsmen"""
+
+    @pytest.fixture
+    def craftsmen(self, make_craftsman):
+        # Ties and NULL sort keys, so the tiebreaker and NULL ordering matter
+        ratings = [None, 4.5, 4.5, None, 3.0, 5.0, 4.5]
+        return [make_craftsman(f'Usta {number}', average_rating=rating).id
+                for number, rating in enumerate(ratings)]
+
+    @pytest.mark.parametrize('sort_order', ['desc', 'asc'])
+    def test_cursor_round_trip_matches_offset_order(self, client, craftsmen, sort_order):
+        """Walking the cursors visits every craftsman once, in offset-pagination order"""
+        pages = _walk(client, sort_by='rating', sort_order=sort_order)
+        walked = [craftsman_id for page in pages for craftsman_id in page]
+
+        response = client.get('/api/search/craftsmen', query_string={
+            'sort_by': 'rating', 'sort_order': sort_order, 'per_page': 50,
+        })
+        offset_order = [card['id'] for card in json.loads(response.data)['data']['craftsmen']]
+
+        assert sorted(walked) == sorted(craftsmen)
+        assert walked == offset_order
+        assert all(len(page) == 2 for page in pages[:-1])
+
+    def test_cursor_carries_null_sort_keys(self, client, craftsmen):
+        """A page ending on a NULL rating continues into the remaining NULLs"""
+        pages = _walk(client, sort_by='rating', sort_order='desc')
+        walked = [craftsman_id for page in pages for craftsman_id in page]
+        assert walked[-2:] == sorted([craftsmen[0], craftsmen[3]], reverse=True)
+
+    @pytest.mark.parametrize('keys', [
+        [[1, 2], 3],            # not a scalar
+        'ab',                   # not a list
+        [4.5],                  # too few values
+        [4.5, 2, 3],            # too many values
+        ['high', 2],            # wrong type for the rating column
+        [{'dt': 'yesterday'}, 2],
+        [{'dec': 'abc'}, 2],
+    ])
+    def test_tampered_cursor_is_rejected(self, client, craftsmen, keys):
+        """Edited cursors with the right sort tag fail validation instead of erroring"""
+        response = client.get('/api/search/craftsmen', query_string={'sort_by': 'rating', 'cursor': '', 'per_page': 2})
+        signature = _decode(json.loads(response.data)['data']['pagination']['next_cursor'])['s']
+
+        response = client.get('/api/search/craftsmen', query_string={
+            'sort_by': 'rating', 'per_page': 2, 'cursor': _encode({'s': signature, 'k': keys}),
+        })
+        assert response.status_code == 400
+        assert 'cursor' in json.loads(response.data)['details']
+
+    def test_cursor_from_another_sort_is_rejected(self, client, craftsmen):
+        response = client.get('/api/search/craftsmen', query_string={'sort_by': 'rating', 'cursor': '', 'per_page': 2})
+        cursor = json.loads(response.data)['data']['pagination']['next_cursor']
+
+        response = client.get('/api/search/craftsmen', query_string={'sort_by': 'price', 'cursor': cursor})
+        assert response.status_code == 400
+
+    def test_garbage_cursor_is_rejected(self, client, craftsmen):
+        response = client.get('/api/search/craftsmen', query_string={'cursor': 'not base64!'})
+        assert response.status_code == 400
+
+
+class TestSortOrder:
+    """Ordering of /api/search/craftsmen listings"""
+
+    def test_distance_without_coordinates_lists_cities_ascending(self, client, make_craftsman):
+        for city in ('İzmir', 'Ankara', 'Bursa'):
+            make_craftsman(f'{city} Usta', city=city)
+
+        response = client.get('/api/search/craftsmen', query_string={'sort_by': 'distance', 'sort_order': 'desc'})
+        assert response.status_code == 200
+        cards = json.loads(response.data)['data']['craftsmen']
+        assert [card['city'] for card in cards] == ['Ankara', 'Bursa', 'İzmir']
+
+        # The cursor walk follows the same fallback order
+        pages = _walk(client, sort_by='distance', sort_order='desc')
+        assert [craftsman_id for page in pages for craftsman_id in page] == [card['id'] for card in cards]
@@ -0,0 +1,64 @@
+import pytest
+
+from app.models.craftsman import Craftsman
+from app.utils import count_cache
+from app.utils.query_profiler import count_queries
+from config import config as config_module
+
+
+def _search_queries(client):
+    count_cache.clear()
+    with count_queries() as counter:
+        response = client.get('/api/search/craftsmen', query_string={'per_page': 50})
+    assert response.status_code == 200
+    return counter.count
+
+
+class TestQueryProfiler:
+    """SQL statement counting and the profiler response headers"""
+
+    def test_count_queries_counts_statements_in_block(self, app, make_craftsman):
+        make_craftsman()
+        with count_queries() as outer:
+            Craftsman.query.all()
+            with count_queries() as inner:
+                Craftsman.query.count()
+
+        assert outer.count == 2
+        assert inner.count == 1
+        assert 'craftsmen' in inner.statements[0]
+
+    def test_search_query_count_does_not_grow_with_results(self, client, make_craftsman):
+        make_craftsman()
+        baseline = _search_queries(client)
+
+        for number in range(5):
+            make_craftsman(f'Usta {number}')
+        assert _search_queries(client) == baseline
+
+    def test_headers_report_query_count(self, app, client):
+        app.config['QUERY_PROFILER_HEADERS'] = True
+        response = client.get('/api/search/craftsmen')
+
+        assert int(response.headers['X-Query-Count']) >= 1
+        assert 'db;dur=' in response.headers['Server-Timing']
+
+    def test_headers_are_off_unless_enabled(self, app, client):
+        app.config['QUERY_PROFILER_HEADERS'] = False
+        response = client.get('/api/search/craftsmen')
+
+        assert 'X-Query-Count' not in response.headers
+        assert 'Server-Timing' not in response.headers
+
+    @pytest.mark.parametrize('env', [{'GAE_ENV': 'standard'}, {'FLASK_ENV': 'production'}])
+    def test_deployed_environments_are_detected(self, monkeypatch, env):
+        monkeypatch.delenv('GAE_ENV', raising=False)
+        monkeypatch.delenv('FLASK_ENV', raising=False)
+        assert not config_module._deployed()
+
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        assert config_module._deployed()
+
+    def test_production_config_has_no_profiler_headers(self):
+        assert config_module.ProductionConfig.QUERY_PROFILER_HEADERS is False
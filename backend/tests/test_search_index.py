@@ -0,0 +1,47 @@
+import json
+
+from app.utils import craftsman_query
+from app.utils.craftsman_query import CraftsmanQuery
+from app.utils.search_index import fold_turkish, match_craftsman_ids
+
+
+class TestTurkishSearch:
+    """Text search through the in-process inverted index"""
+
+    def test_fold_turkish(self):
+        """Dotted/dotless I and diacritics fold to plain ASCII letters"""
+        assert fold_turkish('IŞIK') == 'isik'
+        assert fold_turkish('İstanbul') == 'istanbul'
+        assert fold_turkish('Güçlü Çözüm') == 'guclu cozum'
+
+    def test_search_matches_across_case_and_diacritics(self, client, make_craftsman):
+        """Queries match regardless of Turkish casing, diacritics and word completion"""
+        craftsman = make_craftsman('Işık Elektrik')
+        make_craftsman('Deniz Boya')
+
+        for query in ('IŞIK', 'ışık', 'isik', 'elek'):
+            response = client.get('/api/search/craftsmen', query_string={'query': query})
+            assert response.status_code == 200
+            ids = [card['id'] for card in json.loads(response.data)['data']['craftsmen']]
+            assert ids == [craftsman.id], query
+
+    def test_every_query_token_must_match(self, app, make_craftsman):
+        """Tokens are intersected, not unioned"""
+        make_craftsman('Işık Elektrik')
+        make_craftsman('Işık Boya')
+
+        assert len(match_craftsman_ids('ışık')) == 2
+        assert len(match_craftsman_ids('ışık boya')) == 1
+
+    def test_large_match_sets_stay_on_the_index(self, app, make_craftsman, monkeypatch):
+        """Broad matches are bound as one parameter instead of falling back to ILIKE"""
+        monkeypatch.setattr(craftsman_query, 'INLINE_ID_LIMIT', 1)
+        expected = {make_craftsman(f'Boya Ustası {number}').id for number in range(3)}
+        make_craftsman('Elektrik')
+
+        query = CraftsmanQuery({'q': 'boya'})
+        assert query.matched_ids == expected
+        assert 'json_each' in str(query.query().statement)
+        page = query.page(1, 10)
+        assert {row.id for row in page['items']} == expected
+        assert page['pagination']['total'] == 3
@@ -0,0 +1,139 @@
+import time
+
+import pytest
+
+from app.utils.bigquery_logger import BigQueryLogger
+from app.utils.lifecycle import ShutdownManager
+from app.utils.telemetry_spool import DiskSpool
+
+TABLE = 'user_activity_logs'
+
+
+class _FakeBigQueryClient:
+    """The insert subset of the BigQuery client"""
+
+    def __init__(self, failing=False):
+        self.failing = failing
+        self.rows = []
+
+    def dataset(self, dataset_id):
+        return self
+
+    def table(self, table_name):
+        return table_name
+
+    def insert_rows_json(self, table, rows, row_ids=None, ignore_unknown_values=False):
+        if self.failing:
+            raise ConnectionError('503 backend unavailable')
+        self.rows.extend(rows)
+        return []
+
+
+@pytest.fixture
+def make_logger(tmp_path, monkeypatch):
+    monkeypatch.setenv('BIGQUERY_LOGGING_ENABLED', 'false')
+    monkeypatch.setenv('BIGQUERY_SPOOL_DIR', str(tmp_path / 'spool'))
+    loggers = []
+
+    def make(client, ephemeral=False):
+        bigquery_logger = BigQueryLogger()
+        bigquery_logger.client = client
+        bigquery_logger.enabled = True
+        bigquery_logger.spool_ephemeral = ephemeral
+        bigquery_logger._start_background_worker()
+        loggers.append(bigquery_logger)
+        return bigquery_logger
+
+    yield make
+    for bigquery_logger in loggers:
+        bigquery_logger.shutdown(time.monotonic())
+
+
+def _log_rows(bigquery_logger, count):
+    for n in range(count):
+        bigquery_logger._queue_log(TABLE, {'n': n})
+
+
+class TestShutdownManager:
+    """Drain hooks run once within a shared deadline"""
+
+    def test_hooks_run_once_in_order(self):
+        manager = ShutdownManager(deadline_seconds=5)
+        calls = []
+        manager.register('first', lambda deadline: calls.append('first') or {'flushed': 1})
+        manager.register('second', lambda deadline: calls.append('second'))
+        manager.register('first', lambda deadline: pytest.fail('registered twice'))
+
+        report = manager.shutdown('test')
+
+        assert calls == ['first', 'second']
+        assert report == {'first': {'flushed': 1}, 'second': None}
+        assert manager.shutdown('again') is report
+        assert calls == ['first', 'second']
+
+    def test_hooks_share_one_deadline(self):
+        manager = ShutdownManager(deadline_seconds=5)
+        deadlines = []
+        manager.register('a', deadlines.append)
+        manager.register('b', deadlines.append)
+
+        started = time.monotonic()
+        manager.shutdown()
+
+        assert deadlines[0] == deadlines[1]
+        assert started + 4 < deadlines[0] <= time.monotonic() + 5
+
+    def test_failing_hook_is_reported_and_others_still_run(self):
+        manager = ShutdownManager()
+        manager.register('broken', lambda deadline: 1 / 0)
+        manager.register('metrics', lambda deadline: {'flushed': True})
+
+        report = manager.shutdown()
+
+        assert 'division by zero' in report['broken']['error']
+        assert report['metrics'] == {'flushed': True}
+
+
+class TestBigQueryDrainReport:
+    """What BigQueryLogger.shutdown() reports"""
+
+    def test_spooled_rows_are_flushed(self, make_logger):
+        client = _FakeBigQueryClient()
+        bigquery_logger = make_logger(client)
+        _log_rows(bigquery_logger, 5)
+
+        report = bigquery_logger.shutdown(time.monotonic() + 5)
+
+        assert len(client.rows) == 5
+        assert (report['flushed'], report['spilled'], report['refused']) == (5, 0, 0)
+
+        _log_rows(bigquery_logger, 1)
+        assert bigquery_logger.refused == 1
+
+    def test_unshipped_rows_are_spilled_for_a_sibling(self, make_logger, tmp_path):
+        sibling = DiskSpool(str(tmp_path / 'spool'))
+        bigquery_logger = make_logger(_FakeBigQueryClient(failing=True), ephemeral=True)
+        _log_rows(bigquery_logger, 3)
+
+        report = bigquery_logger.shutdown(time.monotonic() + 5)
+
+        assert (report['flushed'], report['spilled']) == (0, 3)
+        assert 'lost' not in report
+        sibling.hand_over()
+
+    def test_rows_spilled_by_the_last_process_are_lost(self, make_logger):
+        bigquery_logger = make_logger(_FakeBigQueryClient(failing=True), ephemeral=True)
+        _log_rows(bigquery_logger, 3)
+
+        report = bigquery_logger.shutdown(time.monotonic() + 5)
+
+        assert (report['flushed'], report['lost']) == (0, 3)
+        assert 'spilled' not in report
+
+    def test_persistent_spool_keeps_rows_for_the_next_process(self, make_logger):
+        bigquery_logger = make_logger(_FakeBigQueryClient(failing=True), ephemeral=False)
+        _log_rows(bigquery_logger, 3)
+
+        report = bigquery_logger.shutdown(time.monotonic() + 5)
+
+        assert report['spilled'] == 3
@@ -0,0 +1,112 @@
+import fcntl
+import os
+import re
+import tempfile
+import threading
+
+import pytest
+
+from app import db
+from app.utils import sitemap
+from app.utils.seo import SEOManager
+from app.utils.sitemap import get_sitemap_store
+
+
+class TestSitemap:
+    """Sharded sitemap served from SITEMAP_DIR"""
+
+    def test_first_request_builds_the_sitemap(self, app, client, make_craftsman, tmp_path):
+        app.config['SITEMAP_DIR'] = str(tmp_path)
+        craftsman = make_craftsman()
+
+        response = client.get('/sitemap.xml')
+        assert response.status_code == 200
+        assert b'<sitemapindex' in response.data
+        assert b'/sitemaps/craftsmen-0.xml' in response.data
+
+        response = client.get('/sitemaps/craftsmen-0.xml')
+        assert response.status_code == 200
+        assert f'/craftsman/{craftsman.id}<'.encode() in response.data
+
+    def test_unknown_shard_is_not_found(self, app, client, tmp_path):
+        app.config['SITEMAP_DIR'] = str(tmp_path)
+
+        response = client.get('/sitemaps/craftsmen-99.xml')
+        assert response.status_code == 404
+
+    def test_default_directory_is_under_the_temp_dir(self, app):
+        app.config['SITEMAP_DIR'] = None
+
+        directory = get_sitemap_store(app).directory
+        assert os.path.dirname(directory) == tempfile.gettempdir()
+
+
+class TestSitemapRefresh:
+    """Shard files stay in place while the sitemap is regenerated"""
+
+    @pytest.fixture
+    def store(self, app, tmp_path, monkeypatch):
+        monkeypatch.setattr(sitemap, 'CRAFTSMEN_PER_SHARD', 2)
+        app.config['SITEMAP_DIR'] = str(tmp_path)
+        return get_sitemap_store(app)
+
+    def _shard_files(self, store):
+        return sorted(name for name in os.listdir(store.directory) if name.startswith('craftsmen-'))
+
+    def _listed_shards(self, store):
+        with open(store.path('sitemap.xml'), encoding='utf-8') as f:
+            return sorted(re.findall(r'/sitemaps/(craftsmen-\d+\.xml)', f.read()))
+
+    def test_rebuild_keeps_listed_shards_until_the_index_is_replaced(self, store, make_craftsman, monkeypatch):
+        craftsmen = [make_craftsman(business_name=f'Usta {n}') for n in range(5)]
+        store.refresh([], force_rebuild=True)
+        assert self._listed_shards(store) == ['craftsmen-0.xml', 'craftsmen-1.xml', 'craftsmen-2.xml']
+
+        write_craftsmen = store._write_craftsmen
+        missing = []
+
+        def checked_write(shard, rows):
+            missing.extend(set(self._listed_shards(store)) - set(self._shard_files(store)))
+            return write_craftsmen(shard, rows)
+
+        monkeypatch.setattr(store, '_write_craftsmen', checked_write)
+        # Craftsmen 4 and 5 share the last shard
+        for craftsman in craftsmen[3:]:
+            db.session.delete(craftsman)
+        db.session.commit()
+        store.refresh([], force_rebuild=True)
+
+        assert missing == []
+        assert self._listed_shards(store) == self._shard_files(store) == ['craftsmen-0.xml', 'craftsmen-1.xml']
+
+    def test_update_drops_an_emptied_shard_after_the_index(self, store, make_craftsman):
+        craftsmen = [make_craftsman(business_name=f'Usta {n}') for n in range(3)]
+        store.refresh([], force_rebuild=True)
+
+        db.session.delete(craftsmen[2])
+        db.session.commit()
+        store.refresh([])
+
+        assert self._listed_shards(store) == self._shard_files(store) == ['craftsmen-0.xml', 'craftsmen-1.xml']
+
+    def test_generate_sitemap_xml_waits_for_another_process(self, app, store, make_craftsman):
+        make_craftsman()
+        os.makedirs(store.directory, exist_ok=True)
+        # Another worker process in the middle of a refresh
+        lock_file = open(store.path('.lock'), 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        results = []
+
+        def generate():
+            with app.app_context():
+                results.append(SEOManager.generate_sitemap_xml(app))
+
+        thread = threading.Thread(target=generate)
+        thread.start()
+        thread.join(0.3)
+        assert thread.is_alive()
+
+        lock_file.close()
+        thread.join(10)
+        assert '<sitemapindex' in results[0]
+        assert 'craftsmen-0.xml' in results[0]
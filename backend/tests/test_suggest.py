@@ -0,0 +1,49 @@
+import json
+import threading
+import time
+
+from app.utils import suggest
+from app.utils.suggest import get_suggestion_index, suggestion_index
+
+
+def _texts(response):
+    return [item['text'] for item in json.loads(response.data)['data']['suggestions']]
+
+
+class TestSuggestions:
+    """Autocomplete served from the in-memory snapshot"""
+
+    def test_prefix_matches_folded_words(self, client, make_craftsman):
+        make_craftsman(business_name='Şahin Elektrik')
+
+        response = client.get('/api/search/suggest?q=sahin')
+        assert response.status_code == 200
+        assert 'Şahin Elektrik' in _texts(response)
+
+    def test_readers_do_not_wait_for_the_lock(self, app, make_craftsman):
+        make_craftsman(business_name='Kilit Tesisat')
+        get_suggestion_index()
+        results = []
+
+        def read():
+            with app.app_context():
+                results.append(get_suggestion_index().suggest('kilit'))
+
+        with suggestion_index._lock:
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join(timeout=2)
+        assert not reader.is_alive()
+        assert [item['text'] for item in results[0]] == ['Kilit Tesisat']
+
+    def test_commit_refreshes_snapshot_in_background(self, app, make_craftsman, monkeypatch):
+        monkeypatch.setattr(suggest, 'SNAPSHOT_REFRESH_SECONDS', 0.05)
+        make_craftsman(business_name='Eski Boya')
+        index = get_suggestion_index()
+        assert index.suggest('yeni') == []
+
+        make_craftsman(business_name='Yeni Boya')
+        deadline = time.time() + 2
+        while not index.suggest('yeni') and time.time() < deadline:
+            time.sleep(0.01)
+        assert [item['text'] for item in index.suggest('yeni')] == ['Yeni Boya']
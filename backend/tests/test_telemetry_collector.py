@@ -0,0 +1,98 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from app.utils.telemetry_collector import CollectorClient, TelemetryCollector
+from app.utils.telemetry_spool import DiskSpool, encode_frame, read_segment
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def _row(n):
+    return {'table': 'user_activity_logs', 'data': {'n': n}}
+
+
+@pytest.fixture
+def collector(tmp_path):
+    received = []
+    collector = TelemetryCollector(str(tmp_path / 'c.sock'), received.append)
+    collector.received = received
+    stop = threading.Event()
+    thread = None
+
+    def start():
+        nonlocal thread
+        collector.bind()
+        thread = threading.Thread(target=collector.serve, args=(stop,), daemon=True)
+        thread.start()
+
+    collector.start = start
+    yield collector
+    stop.set()
+    if thread is not None:
+        thread.join(5)
+    collector.close()
+
+
+class TestTelemetryCollector:
+    """Rows forwarded from workers to the collector process"""
+
+    def test_rows_round_trip(self, tmp_path, collector):
+        collector.start()
+        client = CollectorClient(collector.socket_path, lambda: DiskSpool(str(tmp_path / 'spool')))
+
+        for n in range(100):
+            assert client.send(_row(n))
+
+        assert _wait_for(lambda: len(collector.received) == 100)
+        assert collector.received == [_row(n) for n in range(100)]
+        assert client.stats()['forwarded'] == 100
+        client.close()
+        assert _wait_for(lambda: collector.stats()['connections'] == 0)
+
+    def test_rows_spool_while_collector_is_down_and_are_handed_over(self, tmp_path, collector):
+        spool_root = str(tmp_path / 'spool')
+        client = CollectorClient(collector.socket_path, lambda: DiskSpool(spool_root), retry_seconds=0)
+
+        assert client.send(_row(0))
+        assert client.stats() == {'forwarded': 0, 'spooled': 1, 'dropped': 0, 'connected': False}
+
+        collector.start()
+        assert client.send(_row(1))
+        assert _wait_for(lambda: collector.received == [_row(1)])
+
+        # The worker's spool is unlocked, for the collector to adopt
+        adopter = DiskSpool(spool_root)
+        segments = adopter.ready_segments()
+        assert [record for segment in segments for _, record in read_segment(segment.path)] == [_row(0)]
+        adopter.hand_over()
+        client.close()
+
+    def test_torn_and_corrupt_frames_are_discarded(self, collector):
+        collector.start()
+        frame = encode_frame(b'{"table": "t", "data": {}}')
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as torn:
+            torn.connect(collector.socket_path)
+            torn.sendall(frame + frame[:7])
+        assert _wait_for(lambda: collector.stats()['torn'] == 1)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as corrupt:
+            corrupt.connect(collector.socket_path)
+            corrupt.sendall(frame[:-1] + b'!')
+            assert _wait_for(lambda: collector.stats()['corrupt'] == 1)
+
+        assert collector.received == [{'table': 't', 'data': {}}]
+
+    def test_second_collector_on_the_socket_is_refused(self, tmp_path, collector):
+        collector.start()
+
+        with pytest.raises(RuntimeError):
+            TelemetryCollector(collector.socket_path, lambda record: None).bind()
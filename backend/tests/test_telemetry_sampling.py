@@ -0,0 +1,178 @@
+import zlib
+from datetime import datetime
+
+import pytest
+
+from app.utils.bigquery_logger import BigQueryLogger
+from app.utils.telemetry_sampling import DEFAULT_RULES, SamplingRule, TelemetrySampler, parse_rules
+
+KEYS = [f'request-{n}' for n in range(1000)]
+
+
+def _position(key):
+    return zlib.crc32(key.encode('utf-8')) / 2 ** 32
+
+
+class TestRates:
+    """The keep rate for an (endpoint, event) pair"""
+
+    def test_first_matching_rule_wins(self):
+        sampler = TelemetrySampler(default_rate=0.5, rules=[
+            SamplingRule('search.*', 'search_analytics', 0.2),
+            SamplingRule('search.*', '*', 0.3),
+            SamplingRule('*', 'search_analytics', 0.9),
+        ])
+
+        assert sampler.rate_for('search.search_craftsmen', 'search_analytics') == 0.2
+        assert sampler.rate_for('search.search_craftsmen', 'user_activity_logs') == 0.3
+        assert sampler.rate_for('job.list_jobs', 'search_analytics') == 0.9
+        assert sampler.rate_for('job.list_jobs', 'user_activity_logs') == 0.5
+        assert sampler.rate_for(None, 'user_activity_logs') == 0.5
+
+    def test_default_rules(self):
+        sampler = TelemetrySampler()
+
+        assert sampler.rate_for('health_check', 'performance_metrics') == 0.01
+        assert sampler.rate_for('notification.get_unread_count', 'user_activity_logs') == 0.05
+        assert sampler.rate_for('search.search_craftsmen', 'user_activity_logs') == 1.0
+
+    def test_unsampled_events_ignore_the_rules(self):
+        sampler = TelemetrySampler(default_rate=0, rules=[SamplingRule('*', '*', 0)])
+
+        assert sampler.rate_for('payment.create', 'payment_analytics') == 1.0
+        assert sampler.sample('request-1', 'payment.create', 'error_logs') == 1.0
+
+    def test_default_rate_is_clamped(self):
+        assert TelemetrySampler(default_rate=3).default_rate == 1.0
+        assert TelemetrySampler(default_rate=-1).default_rate == 0.0
+
+
+class TestSample:
+    """Keep decisions"""
+
+    def test_decision_is_deterministic_per_key(self):
+        sampler = TelemetrySampler(default_rate=0.25, rules=())
+
+        decisions = [sampler.sample(key, 'job.list_jobs', 'user_activity_logs') for key in KEYS]
+
+        assert decisions == [0.25 if _position(key) < 0.25 else None for key in KEYS]
+        assert decisions == [sampler.sample(key, 'job.list_jobs', 'user_activity_logs') for key in KEYS]
+        assert 200 < decisions.count(0.25) < 300
+
+    def test_rates_zero_and_one(self):
+        assert TelemetrySampler(default_rate=0, rules=()).sample('request-1', 'a', 'user_activity_logs') is None
+        assert TelemetrySampler(default_rate=1, rules=()).sample('request-1', 'a', 'user_activity_logs') == 1.0
+
+    def test_errors_and_slow_requests_are_always_kept(self):
+        sampler = TelemetrySampler(default_rate=0, rules=(), slow_request_ms=500)
+
+        assert sampler.sample('request-1', 'a', 'user_activity_logs', duration_ms=10, error=True) == 1.0
+        assert sampler.sample('request-1', 'a', 'user_activity_logs', duration_ms=500) == 1.0
+        assert sampler.sample('request-1', 'a', 'user_activity_logs', duration_ms=499) is None
+        assert sampler.sample('request-1', 'a', 'user_activity_logs') is None
+
+    def test_slow_request_keep_can_be_disabled(self):
+        sampler = TelemetrySampler(default_rate=0, rules=(), slow_request_ms=None)
+
+        assert sampler.sample('request-1', 'a', 'user_activity_logs', duration_ms=60000) is None
+
+    def test_outcomes_are_counted_per_event(self):
+        sampler = TelemetrySampler(default_rate=0, rules=[SamplingRule('*', 'performance_metrics', 1)])
+        sampler.sample('request-1', 'a', 'user_activity_logs')
+        sampler.sample('request-2', 'a', 'user_activity_logs')
+        sampler.sample('request-1', 'a', 'performance_metrics')
+
+        assert sampler.stats() == {
+            'user_activity_logs': {'kept': 0, 'sampled_out': 2},
+            'performance_metrics': {'kept': 1, 'sampled_out': 0},
+        }
+
+
+class TestParseRules:
+    """TELEMETRY_SAMPLING_RULES"""
+
+    def test_json(self):
+        rules = parse_rules('[{"endpoint": "search.*", "event": "search_analytics", "rate": 0.2},'
+                            ' {"endpoint": "*health*", "rate": 0}]')
+
+        assert rules == (SamplingRule('search.*', 'search_analytics', 0.2), SamplingRule('*health*', '*', 0.0))
+
+    def test_rates_are_clamped(self):
+        assert parse_rules([('a', '*', 7), {'endpoint': 'b', 'rate': '-0.5'}]) == (
+            SamplingRule('a', '*', 1.0), SamplingRule('b', '*', 0.0),
+        )
+
+    @pytest.mark.parametrize('value, expected', [(None, DEFAULT_RULES), ('', ()), ('  ', ()), ('[]', ())])
+    def test_unset_and_empty(self, value, expected):
+        assert parse_rules(value) == expected
+
+    def test_from_config(self):
+        sampler = TelemetrySampler.from_config({
+            'TELEMETRY_SAMPLE_RATE': 0.5,
+            'TELEMETRY_SAMPLING_RULES': '[{"endpoint": "job.*", "rate": 0.1}]',
+            'TELEMETRY_SLOW_REQUEST_MS': 250,
+        })
+
+        assert sampler.rate_for('job.list_jobs', 'user_activity_logs') == 0.1
+        assert sampler.rate_for('search.search_craftsmen', 'user_activity_logs') == 0.5
+        assert sampler.slow_request_ms == 250
+
+
+class TestRequestEventSampling:
+    """BigQueryLogger.log_request_event samples each table on the request id"""
+
+    @pytest.fixture
+    def bigquery_logger(self, monkeypatch):
+        monkeypatch.setenv('BIGQUERY_LOGGING_ENABLED', 'false')
+        bigquery_logger = BigQueryLogger()
+        bigquery_logger.enabled = True
+        return bigquery_logger
+
+    def _log(self, bigquery_logger, request_id, **fields):
+        event = {
+            'request_id': request_id, 'correlation_id': request_id, 'session_id': request_id,
+            'timestamp': datetime(2026, 1, 1, 12, 0), 'duration_ms': 12, 'duration_seconds': 0.012,
+            'method': 'GET', 'endpoint': 'job.list_jobs', 'path': '/api/jobs/', 'url': 'http://localhost/api/jobs/',
+            'referrer': None, 'query_params': {}, 'has_json_body': False, 'user_agent': '',
+            'ip_address': '127.0.0.1', 'platform': 'web', 'device_type': 'desktop', 'user_id': None,
+            'user_type': None, 'location_city': None, 'status_code': 200, 'success': True, 'content_length': 2,
+            'business_event': None, 'error': None, 'db_query_count': 0, 'db_time_ms': 0.0, 'n_plus_one': [],
+        }
+        event.update(fields)
+        bigquery_logger.log_request_event(event)
+        rows = []
+        while not bigquery_logger.log_queue.empty():
+            rows.append(bigquery_logger.log_queue.get_nowait())
+        return {row['table']: row['data'] for row in rows}
+
+    def test_performance_rules_apply_to_request_events(self, bigquery_logger):
+        bigquery_logger.sampler = TelemetrySampler(rules=[SamplingRule('job.*', 'performance_metrics', 0)])
+
+        rows = self._log(bigquery_logger, 'request-1')
+
+        assert set(rows) == {'user_activity_logs'}
+        assert rows['user_activity_logs']['sample_rate'] == 1.0
+
+    def test_each_row_records_its_own_rate(self, bigquery_logger):
+        bigquery_logger.sampler = TelemetrySampler(rules=[
+            SamplingRule('job.*', 'user_activity_logs', 0.2),
+            SamplingRule('job.*', 'performance_metrics', 0.6),
+        ])
+
+        logged = [self._log(bigquery_logger, key) for key in KEYS[:200]]
+
+        activity = [rows['user_activity_logs'] for rows in logged if 'user_activity_logs' in rows]
+        performance = [rows['performance_metrics'] for rows in logged if 'performance_metrics' in rows]
+        assert {row['sample_rate'] for row in activity} == {0.2}
+        assert {row['sample_rate'] for row in performance} == {0.6}
+        assert len(activity) < len(performance)
+        # Same key for both tables: requests kept at the lower rate are kept at the higher one
+        assert {row['log_id'] for row in activity} <= {row['metric_id'] for row in performance}
+
+    def test_failed_requests_keep_both_rows(self, bigquery_logger):
+        bigquery_logger.sampler = TelemetrySampler(default_rate=0, rules=())
+
+        rows = self._log(bigquery_logger, 'request-1', status_code=503, success=False)
+
+        assert set(rows) == {'user_activity_logs', 'performance_metrics'}
+        assert rows['performance_metrics']['error_count'] == 1
@@ -0,0 +1,118 @@
+import os
+import threading
+
+from app.utils import telemetry_spool
+from app.utils.json_encoding import dumps
+from app.utils.telemetry_spool import DiskSpool, encode_frame, live_processes, read_segment, split_frames
+
+
+def _rows(count):
+    return [{'table': 'user_activity_logs', 'data': {'n': n}} for n in range(count)]
+
+
+def _records(segment):
+    return [record for _, record in read_segment(segment.path)]
+
+
+class TestDiskSpool:
+    """Crash-safe spool segments and their replay"""
+
+    def test_torn_tail_is_skipped_on_read(self, tmp_path):
+        spool = DiskSpool(str(tmp_path))
+        for row in _rows(3):
+            assert spool.append(row)
+        spool.rotate()
+        segment, = spool.ready_segments()
+
+        with open(segment.path, 'ab') as f:
+            f.write(encode_frame(dumps({'table': 'user_activity_logs', 'data': {'n': 3}}))[:-4])
+
+        assert _records(segment) == _rows(3)
+        spool.hand_over()
+
+    def test_corrupt_frame_ends_the_segment(self, tmp_path):
+        spool = DiskSpool(str(tmp_path))
+        for row in _rows(2):
+            spool.append(row)
+        spool.rotate()
+        segment, = spool.ready_segments()
+
+        with open(segment.path, 'r+b') as f:
+            f.seek(os.path.getsize(segment.path) - 2)
+            f.write(b'!!')
+
+        assert _records(segment) == _rows(1)
+        spool.hand_over()
+
+    def test_crashed_process_segments_are_replayed(self, tmp_path):
+        crashed = DiskSpool(str(tmp_path))
+        for row in _rows(3):
+            crashed.append(row)
+        # The process dies mid-write: the active segment is never sealed and
+        # its lock goes with the process
+        crashed._active.write(encode_frame(b'{"table": "user_activity_logs"')[:10])
+        crashed._active.close()
+        crashed._active = None
+        crashed._process_directory.close()
+
+        survivor = DiskSpool(str(tmp_path))
+        assert live_processes(str(tmp_path)) == 1
+        segments = survivor.ready_segments()
+        assert [segment.orphaned for segment in segments] == [True]
+        assert _records(segments[0]) == _rows(3)
+
+        survivor.commit(segments[0], records=3)
+        assert survivor.ready_segments() == []
+        assert os.listdir(str(tmp_path)) == [os.path.basename(survivor.directory)]
+        survivor.hand_over()
+        assert live_processes(str(tmp_path)) == 0
+
+    def test_segment_opened_while_listing_is_not_ready(self, tmp_path, monkeypatch):
+        spool = DiskSpool(str(tmp_path))
+        list_segments = telemetry_spool._segment_files
+        writers = []
+
+        def list_while_appending(directory):
+            # The first append opens a segment while the shipper scans
+            writer = threading.Thread(target=spool.append, args=(_rows(1)[0],))
+            writer.start()
+            writer.join(0.2)
+            writers.append(writer)
+            return list_segments(directory)
+
+        monkeypatch.setattr(telemetry_spool, '_segment_files', list_while_appending)
+        ready = spool.ready_segments()
+        writers[0].join()
+        monkeypatch.undo()
+
+        assert ready == []
+        spool.rotate()
+        segment, = spool.ready_segments()
+        assert _records(segment) == _rows(1)
+        spool.hand_over()
+
+    def test_rows_past_max_bytes_are_dropped(self, tmp_path):
+        spool = DiskSpool(str(tmp_path), max_bytes=100)
+        results = [spool.append(row) for row in _rows(5)]
+
+        assert results[0] is True
+        assert results[-1] is False
+        assert spool.stats()['dropped'] == results.count(False)
+        assert spool.stats()['disk_bytes'] <= 100
+        spool.hand_over()
+
+
+class TestFrames:
+    """Frames shared by the spool and the collector socket"""
+
+    def test_incomplete_frame_is_left_for_the_next_read(self):
+        first, second = encode_frame(b'{"a":1}'), encode_frame(b'{"b":2}')
+
+        payloads, consumed, corrupt = split_frames(first + second[:5])
+        assert (payloads, consumed, corrupt) == ([b'{"a":1}'], len(first), False)
+
+    def test_bad_checksum_is_reported(self):
+        frame = bytearray(encode_frame(b'{"a":1}'))
+        frame[-1] ^= 0xFF
+
+        assert split_frames(bytes(frame)) == ([], 0, True)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Bring an existing database up to the current job schema
+
+db.create_all() only creates missing tables: it adds job_skills, but not
+the indexes declared since on the jobs table (idx_job_status_created,
+idx_job_craftsman_status_updated). This script creates whatever of those is
+missing and is safe to run repeatedly.
+"""
+
+from sqlalchemy import inspect
+
+from app import create_app, db
+from app.models.job import Job, JobSkill
+
+
+def upgrade_job_schema(engine):
+    """Create the missing job_skills table and job indexes; returns their names"""
+    created = []
+    for table in (Job.__table__, JobSkill.__table__):
+        inspector = inspect(engine)
+        if not inspector.has_table(table.name):
+            # New table, created together with its indexes
+            table.create(engine)
+            created.append(table.name)
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(engine)
+                created.append(index.name)
+    return created
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        created = upgrade_job_schema(db.engine)
+        print(f"✅ Created: {', '.join(created)}" if created else "✅ Job schema is up to date")